@@ -1,6 +1,6 @@
 import os
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -84,6 +84,83 @@ else:
     }
 
 
+# Cache
+# CACHE_BACKEND : locmem (par processus, dev), file (partagé entre les workers d'un hôte)
+# ou redis (partagé entre plusieurs nœuds)
+CACHE_BACKEND = config('CACHE_BACKEND', default='locmem')
+# locmem et file évincent au-delà de MAX_ENTRIES (300 par défaut) : le cache des scans
+# y range une clé par billet préchauffé
+CACHE_MAX_ENTREES = config('CACHE_MAX_ENTREES', default=100000, cast=int)
+
+if CACHE_BACKEND == 'redis':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': config('REDIS_URL', default='redis://127.0.0.1:6379/1'),
+        }
+    }
+elif CACHE_BACKEND == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': config('CACHE_DIR', default=os.path.join(BASE_DIR, 'cache')),
+            'OPTIONS': {'MAX_ENTRIES': CACHE_MAX_ENTREES},
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'ticket-master',
+            'OPTIONS': {'MAX_ENTRIES': CACHE_MAX_ENTREES},
+        }
+    }
+
+# Cache des réponses publiques du catalogue (événements, tickets)
+CATALOGUE_CACHE_ENABLED = config('CATALOGUE_CACHE_ENABLED', default='True', cast=bool)
+CATALOGUE_CACHE_TIMEOUT = config('CATALOGUE_CACHE_TIMEOUT', default=300, cast=int)
+
+# Réservations de places : secondes avant le retour au stock
+RESERVATION_DUREE = config('RESERVATION_DUREE', default=600, cast=int)
+RESERVATION_QUANTITE_MAX = config('RESERVATION_QUANTITE_MAX', default=10, cast=int)  # places par réservation
+RESERVATION_ACTIVES_MAX = config('RESERVATION_ACTIVES_MAX', default=5, cast=int)  # réservations actives par utilisateur
+
+# Salle d'attente des mises en vente (voir tickets/utils/file_attente.py)
+# Stockage partagé, exigé à l'activation : StockageCache (cache Django ci-dessus, CACHE_BACKEND=redis)
+# ou tickets.utils.file_attente.StockageRedis (FILE_ATTENTE_REDIS_URL)
+FILE_ATTENTE_STOCKAGE = config('FILE_ATTENTE_STOCKAGE', default='tickets.utils.file_attente.StockageCache')
+FILE_ATTENTE_REDIS_URL = config('FILE_ATTENTE_REDIS_URL', default='redis://127.0.0.1:6379/2')
+FILE_ATTENTE_FENETRE = config('FILE_ATTENTE_FENETRE', default=300, cast=int)  # secondes pour acheter une fois admis
+
+# En-tête Idempotency-Key des POST d'achat et de dépôt (voir tickets/utils/idempotence.py)
+IDEMPOTENCE_DUREE = config('IDEMPOTENCE_DUREE', default=86400, cast=int)  # conservation des réponses
+IDEMPOTENCE_ATTENTE = config('IDEMPOTENCE_ATTENTE', default=10, cast=float)  # attente d'un doublon simultané (PostgreSQL)
+
+# Images QR rendues à la demande (voir tickets/utils/cache_qr.py)
+QR_CORRECTION = config('QR_CORRECTION', default='H')  # L, M, Q ou H (?correction=)
+QR_TAILLE = config('QR_TAILLE', default=10, cast=int)  # pixels par module (?taille=)
+QR_CACHE_MEMOIRE = config('QR_CACHE_MEMOIRE', default=16 * 1024 * 1024, cast=int)  # LRU par processus, octets
+QR_CACHE_DISQUE = config('QR_CACHE_DISQUE', default=256 * 1024 * 1024, cast=int)  # cache disque borné, octets
+QR_CACHE_DOSSIER = config('QR_CACHE_DOSSIER', default=os.path.join(BASE_DIR, 'cache', 'qr'))
+# True : un fichier PNG par achat sous MEDIA_ROOT, rendu par le worker generer_qr
+QR_IMAGES_STOCKEES = config('QR_IMAGES_STOCKEES', default=False, cast=bool)
+
+# Jetons signés (Ed25519) encodés dans les QR codes, vérifiables hors ligne (voir tickets/utils/jeton_qr.py)
+QR_JETON_CLE = config('QR_JETON_CLE', default='')  # graine privée de 32 octets en base64 (vide : dérivée de SECRET_KEY)
+QR_JETON_CLES_PRECEDENTES = config('QR_JETON_CLES_PRECEDENTES', default='', cast=Csv())  # clés publiques après rotation
+QR_JETON_MARGE = config('QR_JETON_MARGE', default=6 * 3600, cast=int)  # validité après la fin du jour de l'événement
+
+# Cache des scans préchauffé avant l'ouverture des portes (voir tickets/utils/cache_scan.py)
+SCAN_CACHE_DUREE = config('SCAN_CACHE_DUREE', default=12 * 3600, cast=int)  # secondes, au plus
+
+# Compteurs de fréquentation en direct (voir tickets/utils/frequentation.py)
+FREQUENTATION_ECRITURE = config('FREQUENTATION_ECRITURE', default=1.0, cast=float)  # secondes entre deux reports
+FREQUENTATION_FLUX_INTERVALLE = config('FREQUENTATION_FLUX_INTERVALLE', default=2.0, cast=float)  # secondes entre deux événements SSE
+# Chaque flux ouvert occupe un thread (ou un worker synchrone) pendant toute sa durée :
+# serveur threadé ou ASGI requis, sinon sonder frequentation/
+FREQUENTATION_FLUX_DUREE = config('FREQUENTATION_FLUX_DUREE', default=30, cast=int)  # secondes avant reconnexion du client
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -166,6 +243,8 @@ CORS_ALLOW_HEADERS = [
 CORS_EXPOSE_HEADERS = [
     'content-type',
     'authorization',
+    'etag',
+    'last-modified',
 ]
 
 # Allow CORS preflight caching for 1 hour
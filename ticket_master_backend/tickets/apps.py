@@ -1,5 +1,11 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class TicketsConfig(AppConfig):
     name = 'tickets'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .utils.recherche import assurer_index_recherche
+        post_migrate.connect(assurer_index_recherche, sender=self)
@@ -0,0 +1,116 @@
+"""
+Latence de /api/evenements/rechercher/ (index plein texte contre icontains)
+et de /api/evenements/suggest/ (p99 visé : moins de 20 ms).
+
+    python manage.py benchmark_recherche --evenements 100000
+
+Les événements générés sont insérés dans une transaction annulée à la fin
+(sauf --conserver), l'index étant alimenté par les triggers comme en production.
+"""
+import random
+import statistics
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+
+from ...models.evenements import Evenement
+from ...utils import suggestions
+from ...utils.recherche import rechercher_evenements
+
+TITRES = ['Festival', 'Concert', 'Soirée', 'Gala', 'Conférence', 'Théâtre', 'Exposition', 'Marché', 'Tournoi', 'Nuit']
+THEMES = ['jazz', 'afrobeat', 'gospel', 'reggae', 'humour', 'cinéma', 'gastronomie', 'mode', 'littérature', 'danse']
+LIEUX = ['Lomé', 'Kara', 'Sokodé', 'Kpalimé', 'Atakpamé', 'Aného', 'Dapaong', 'Tsévié', 'Bassar', 'Notsé']
+TYPES = ['Concert', 'Festival', 'Sport', 'Théâtre', 'Conférence', 'Exposition']
+REQUETES = ['lome', 'Lomé', 'concert jazz', 'theatre kpalime', 'fest', 'soirée gospel aného', 'introuvable']
+SAISIES = ['co', 'conc', 'théât', 'festivl', 'soiree gos', 'nuit regae', 'zzzz']
+PAGE = 20
+
+
+class Annulation(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Mesurer la latence de la recherche plein texte sur un grand catalogue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--evenements', type=int, default=100000)
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--conserver', action='store_true', help='Ne pas supprimer les événements générés')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.generer(options['evenements'])
+                self.mesurer(options['iterations'])
+                self.mesurer_suggestions(options['iterations'])
+                if not options['conserver']:
+                    raise Annulation
+        except Annulation:
+            self.stdout.write('Événements générés supprimés (transaction annulée).')
+
+    def generer(self, nombre):
+        aleatoire = random.Random(42)
+        debut = time.perf_counter()
+        lot = []
+        for i in range(nombre):
+            lot.append(Evenement(
+                titre_evenement=f'{aleatoire.choice(TITRES)} {aleatoire.choice(THEMES)} {i}',
+                date=date.today() + timedelta(days=aleatoire.randint(-365, 365)),
+                lieu=aleatoire.choice(LIEUX),
+                type_evenement=aleatoire.choice(TYPES),
+            ))
+            if len(lot) == 2000:
+                Evenement.objects.bulk_create(lot)
+                lot = []
+        Evenement.objects.bulk_create(lot)
+        self.stdout.write(
+            f'{nombre} événements insérés et indexés en {time.perf_counter() - debut:.1f} s ({connection.vendor})'
+        )
+
+    def mesurer(self, iterations):
+        self.stdout.write(f"{'requête':<22}{'résultats':>10}{'index p50':>12}{'index p95':>12}"
+                          f"{'icontains p50':>15}{'icontains p95':>15}")
+        for texte in REQUETES:
+            index, total = self.chronometrer(lambda: rechercher_evenements(Evenement.objects.all(), texte), iterations)
+            filtre = Q(titre_evenement__icontains=texte) | Q(lieu__icontains=texte) | Q(type_evenement__icontains=texte)
+            sequentiel, _ = self.chronometrer(lambda: Evenement.objects.filter(filtre).order_by('-date'), iterations)
+            self.stdout.write(
+                f'{texte:<22}{total:>10}{_ms(index, 50):>12}{_ms(index, 95):>12}'
+                f'{_ms(sequentiel, 50):>15}{_ms(sequentiel, 95):>15}'
+            )
+
+    def mesurer_suggestions(self, iterations):
+        if connection.vendor != 'postgresql':
+            debut = time.perf_counter()
+            suggestions.reconstruire()
+            self.stdout.write(f'Trie de suggestions construit en {time.perf_counter() - debut:.2f} s')
+        self.stdout.write(f"{'saisie':<22}{'suggestions':>12}{'p50':>12}{'p99':>12}")
+        for texte in SAISIES:
+            durees = []
+            for _ in range(max(iterations, 100)):
+                debut = time.perf_counter()
+                resultat = suggestions.suggerer(texte)
+                durees.append(time.perf_counter() - debut)
+            self.stdout.write(f'{texte:<22}{len(resultat):>12}{_ms(durees, 50):>12}{_ms(durees, 99):>12}')
+
+    def chronometrer(self, fabrique, iterations):
+        """Durées d'une page de résultats + COUNT, comme la pagination de la vue"""
+        durees = []
+        total = 0
+        for _ in range(iterations):
+            debut = time.perf_counter()
+            queryset = fabrique()
+            total = queryset.count()
+            list(queryset[:PAGE])
+            durees.append(time.perf_counter() - debut)
+        return durees, total
+
+
+def _ms(durees, centile):
+    if len(durees) < 2:
+        return f'{durees[0] * 1000:.1f} ms'
+    return f'{statistics.quantiles(durees, n=100)[centile - 1] * 1000:.1f} ms'
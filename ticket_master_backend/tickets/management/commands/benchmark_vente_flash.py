@@ -0,0 +1,205 @@
+"""
+Ouverture de billetterie : des milliers de POST /api/achats/ simultanés sur un même
+Ticket, répartis sur plusieurs processus (chacun avec sa connexion à la base).
+
+    python manage.py benchmark_vente_flash --stock 500 --requetes 2000 --processus 16
+    python manage.py benchmark_vente_flash --url http://127.0.0.1:8000   # serveur lancé à part
+    python manage.py benchmark_vente_flash --fractions 0,16              # ligne unique contre stock fractionné
+    python manage.py benchmark_vente_flash --asynchrone                  # mise en file (202) puis worker
+
+Rapporte le débit, les latences p50 / p99, les réponses par statut et la survente
+(tickets vendus au-delà du stock initial), qui doit être nulle, ainsi que la cohérence
+stock / soldes. Les données générées sont supprimées à la fin (sauf --conserver).
+La comparaison des modes de stock n'a de sens que sur PostgreSQL : SQLite sérialise
+toutes les écritures sur un verrou de base, fractionné ou non.
+Avec --asynchrone, le débit mesuré est celui de la mise en file ; la file est ensuite
+vidée par traiter_commandes dans ce processus et sa durée rapportée à part.
+"""
+import json
+import multiprocessing
+import statistics
+import time
+import urllib.error
+import urllib.request
+from decimal import Decimal
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Sum
+from django.test import Client
+
+from ...models.achat import Achat
+from ...models.commande import Commande
+from ...models.evenements import Evenement
+from ...models.ticket import Ticket
+from ...models.utilisateurs import Utilisateur
+from ...utils.authentication import generate_jwt_token
+from ...utils.commandes import traiter_commandes
+from ...utils.inventaire import repartir_stock
+
+PRIX = Decimal('1000')
+EMAIL = 'vente-flash-{}@benchmark.local'
+
+
+def _client_http(url, entetes):
+    def envoyer(corps, jeton):
+        requete = urllib.request.Request(
+            f'{url.rstrip("/")}/api/achats/', data=json.dumps(corps).encode(), method='POST',
+            headers={'Content-Type': 'application/json', 'Authorization': f'Bearer {jeton}', **entetes},
+        )
+        try:
+            with urllib.request.urlopen(requete, timeout=60) as reponse:
+                return reponse.status
+        except urllib.error.HTTPError as e:
+            return e.code
+    return envoyer
+
+
+def _client_django(entetes):
+    client = Client()
+
+    def envoyer(corps, jeton):
+        return client.post(
+            '/api/achats/', corps, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {jeton}', headers=entetes,
+        ).status_code
+    return envoyer
+
+
+def _travailleur(depart, envois, url, entetes, resultats):
+    """Processus client : envoie sa part des requêtes dès que tous sont prêts"""
+    connections.close_all()  # jamais la connexion héritée du parent
+    envoyer = _client_http(url, entetes) if url else _client_django(entetes)
+    mesures = []
+    depart.wait()
+    for corps, jeton in envois:
+        debut = time.perf_counter()
+        try:
+            statut = envoyer(corps, jeton)
+        except Exception:
+            statut = 0
+        mesures.append((statut, time.perf_counter() - debut))
+    resultats.put(mesures)
+
+
+class Command(BaseCommand):
+    help = "Mesurer l'achat concurrent d'un même ticket (débit, p99, survente)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stock', type=int, default=500)
+        parser.add_argument('--requetes', type=int, default=2000)
+        parser.add_argument('--processus', type=int, default=16)
+        parser.add_argument('--utilisateurs', type=int, default=200)
+        parser.add_argument('--quantite', type=int, default=1, help='Tickets par achat')
+        parser.add_argument('--fractions', default='0',
+                            help='Nombres de fractions de stock à comparer, séparés par des virgules (0 : ligne unique)')
+        parser.add_argument('--asynchrone', action='store_true',
+                            help='Achats asynchrones (Prefer: respond-async), file vidée ensuite par traiter_commandes')
+        parser.add_argument('--url', help='Serveur à viser (sinon client de test Django dans chaque processus)')
+        parser.add_argument('--conserver', action='store_true', help='Ne pas supprimer les données générées')
+
+    def handle(self, *args, **options):
+        debits = {}
+        for fractions in [int(n) for n in options['fractions'].split(',')]:
+            ticket, utilisateurs = self.preparer(options)
+            try:
+                if fractions:
+                    ticket = repartir_stock(ticket, fractions)
+                mesures, duree = self.lancer(ticket, utilisateurs, options)
+                self.stdout.write(f"--- {f'{fractions} fractions' if fractions else 'ligne unique'}")
+                self.rapporter(ticket, utilisateurs, options, mesures, duree)
+                debits[fractions] = len(mesures) / duree
+            finally:
+                if not options['conserver']:
+                    self.nettoyer(ticket, utilisateurs)
+        if len(debits) > 1:
+            reference = next(iter(debits.values()))
+            self.stdout.write('Débits : ' + ', '.join(
+                f'{n or "ligne unique"} -> {debit:.0f} req/s (x{debit / reference:.2f})' for n, debit in debits.items()
+            ))
+
+    def preparer(self, options):
+        # Chaque utilisateur peut acheter bien plus que sa part : seul le stock limite
+        solde = PRIX * options['quantite'] * options['requetes']
+        evenement = Evenement.objects.create(
+            titre_evenement='Vente flash (benchmark)', date=date.today() + timedelta(days=30),
+            lieu='Lomé', type_evenement='Concert',
+        )
+        ticket = Ticket.objects.create(type='Standard', prix=PRIX, stock=options['stock'], id_evenement=evenement)
+        Utilisateur.objects.bulk_create([
+            Utilisateur(nom='Flash', prenom=str(i), email=EMAIL.format(i), mot_de_passe='!', tel='0', solde=solde)
+            for i in range(options['utilisateurs'])
+        ])
+        utilisateurs = list(Utilisateur.objects.filter(email__in=[EMAIL.format(i) for i in range(options['utilisateurs'])]))
+        return ticket, utilisateurs
+
+    def lancer(self, ticket, utilisateurs, options):
+        jetons = [generate_jwt_token(u.id_utilisateur, u.email, 'user')[0] for u in utilisateurs]
+        corps = {'id_ticket': ticket.id_ticket, 'quantite': options['quantite']}
+        envois = [(corps, jetons[i % len(jetons)]) for i in range(options['requetes'])]
+        entetes = {'Prefer': 'respond-async'} if options['asynchrone'] else {}
+        nombre = options['processus']
+
+        contexte = multiprocessing.get_context('fork')
+        depart = contexte.Barrier(nombre + 1)
+        resultats = contexte.Queue()
+        connections.close_all()  # les processus ouvrent chacun leur connexion
+        processus = [
+            contexte.Process(target=_travailleur, args=(depart, envois[i::nombre], options['url'], entetes, resultats))
+            for i in range(nombre)
+        ]
+        for p in processus:
+            p.start()
+        depart.wait()
+        debut = time.perf_counter()
+        mesures = [mesure for _ in processus for mesure in resultats.get()]
+        duree = time.perf_counter() - debut
+        for p in processus:
+            p.join()
+        if options['asynchrone']:
+            debut = time.perf_counter()
+            acceptees, refusees = traiter_commandes()
+            self.stdout.write(f'File vidée en {time.perf_counter() - debut:.2f} s : '
+                              f'{acceptees} commande(s) acceptée(s), {refusees} refusée(s)')
+        return mesures, duree
+
+    def rapporter(self, ticket, utilisateurs, options, mesures, duree):
+        durees = [d for _, d in mesures]
+        statuts = {}
+        for statut, _ in mesures:
+            statuts[statut] = statuts.get(statut, 0) + 1
+
+        ticket = Ticket.objects.get(pk=ticket.pk)
+        vendus = Achat.objects.filter(id_ticket=ticket).aggregate(total=Sum('quantite'))['total'] or 0
+        solde_initial = PRIX * options['quantite'] * options['requetes'] * len(utilisateurs)
+        soldes = Utilisateur.objects.filter(pk__in=[u.pk for u in utilisateurs]).aggregate(total=Sum('solde'))['total']
+        survente = max(0, vendus - options['stock'])
+
+        self.stdout.write(f"{options['requetes']} requêtes, {options['processus']} processus, "
+                          f"stock initial {options['stock']} ({connections['default'].vendor})")
+        self.stdout.write(f'Débit : {len(mesures) / duree:.0f} requêtes/s en {duree:.2f} s')
+        self.stdout.write(f'Latence : p50 {_ms(durees, 50)}, p99 {_ms(durees, 99)}')
+        self.stdout.write('Statuts : ' + ', '.join(f'{s or "erreur"}={n}' for s, n in sorted(statuts.items())))
+        self.stdout.write(f'Vendus : {vendus}, stock final : {ticket.stock_disponible}')
+        servis = (Commande.objects.filter(id_ticket=ticket, statut=Commande.ACCEPTEE).count()
+                  if options['asynchrone'] else statuts.get(201, 0))
+        coherent = (ticket.stock_disponible == options['stock'] - vendus and solde_initial - soldes == vendus * PRIX
+                    and servis * options['quantite'] == vendus)
+        style = self.style.SUCCESS if survente == 0 and coherent else self.style.ERROR
+        self.stdout.write(style(f'Survente : {survente}, stock et soldes cohérents : {"oui" if coherent else "NON"}'))
+
+    def nettoyer(self, ticket, utilisateurs):
+        for achat in Achat.objects.filter(id_ticket=ticket).exclude(qr_image=''):
+            achat.qr_image.delete(save=False)
+        Achat.objects.filter(id_ticket=ticket).delete()
+        evenement = ticket.id_evenement
+        ticket.delete()
+        evenement.delete()
+        Utilisateur.objects.filter(pk__in=[u.pk for u in utilisateurs]).delete()
+        self.stdout.write('Données générées supprimées.')
+
+
+def _ms(durees, centile):
+    if len(durees) < 2:
+        return f'{durees[0] * 1000:.1f} ms'
+    return f'{statistics.quantiles(durees, n=100)[centile - 1] * 1000:.1f} ms'
@@ -0,0 +1,40 @@
+"""
+Écrire en base les passages admis par le cache des scans (écriture différée, voir
+utils/cache_scan.py).
+
+    python manage.py ecrire_passages            # une fois
+    python manage.py ecrire_passages --boucle   # worker permanent, pendant les ouvertures de portes
+
+Rejouer des passages déjà écrits est sans effet : relancé après un arrêt, le worker
+réécrit les admissions encore dans le cache.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from ...utils.cache_scan import ecrire_passages
+from ...utils.validation import LOT_MAX
+
+
+class Command(BaseCommand):
+    help = 'Écrire en base les passages admis par le cache des scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lot', type=int, default=LOT_MAX, help='Passages écrits par requête')
+        parser.add_argument('--boucle', action='store_true', help='Recommencer indéfiniment')
+        parser.add_argument('--intervalle', type=float, default=2.0, help='Secondes entre deux écritures')
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            ecrits, conflits = ecrire_passages(lot=options['lot'])
+            if ecrits or not options['boucle']:
+                self.stdout.write(self.style.SUCCESS(f'{ecrits} passage(s) écrit(s) en base.'))
+            if conflits:
+                self.stdout.write(self.style.WARNING(
+                    f'{conflits} billet(s) déjà validé(s) en base par une autre porte.'
+                ))
+            if not options['boucle']:
+                return
+            time.sleep(options['intervalle'])
@@ -0,0 +1,50 @@
+"""
+Rendre les images QR en attente (voir utils/taches_qr.py).
+
+    python manage.py generer_qr                          # vider la file une fois
+    python manage.py generer_qr --boucle --processus 4   # worker permanent, rendu sur 4 processus
+    python manage.py generer_qr --rattrapage             # achats existants sans image, en parallèle
+
+Sans objet quand QR_IMAGES_STOCKEES est désactivé (images rendues à la demande) : la
+commande s'arrête en erreur.
+"""
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from ...utils.taches_qr import LOT, pool_rendu, rattraper, traiter_taches
+
+
+class Command(BaseCommand):
+    help = 'Rendre les images QR des achats en attente, par lots et sur plusieurs processus'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lot', type=int, default=LOT, help='Tâches traitées par transaction')
+        parser.add_argument('--processus', type=int, default=os.cpu_count() or 1, help='Processus de rendu')
+        parser.add_argument('--rattrapage', action='store_true',
+                            help="Planifier d'abord les achats existants sans image QR")
+        parser.add_argument('--boucle', action='store_true', help='Recommencer indéfiniment')
+        parser.add_argument('--intervalle', type=float, default=1, help='Secondes d\'attente quand la file est vide')
+
+    def handle(self, *args, **options):
+        if not settings.QR_IMAGES_STOCKEES:
+            raise CommandError('QR_IMAGES_STOCKEES est désactivé : les images QR sont rendues à la demande.')
+        if options['rattrapage']:
+            self.stdout.write(f'{rattraper()} achat(s) sans image QR planifié(s).')
+        executeur = pool_rendu(options['processus'])
+        try:
+            while True:
+                close_old_connections()
+                debut = time.perf_counter()
+                nombre = traiter_taches(lot=options['lot'], executeur=executeur)
+                if nombre or not options['boucle']:
+                    self.stdout.write(f'{nombre} image(s) QR rendue(s) en {time.perf_counter() - debut:.2f} s.')
+                if not options['boucle']:
+                    return
+                time.sleep(options['intervalle'])
+        finally:
+            if executeur:
+                executeur.shutdown()
@@ -0,0 +1,31 @@
+"""
+Rendre au stock les réservations expirées (voir utils/reservations.py).
+
+    python manage.py liberer_reservations                   # un passage (cron)
+    python manage.py liberer_reservations --boucle          # balayeur permanent
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from ...utils.reservations import LOT, liberer_expirees
+
+
+class Command(BaseCommand):
+    help = 'Rendre au stock les réservations expirées, par lots'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lot', type=int, default=LOT, help='Réservations libérées par transaction')
+        parser.add_argument('--boucle', action='store_true', help='Recommencer indéfiniment')
+        parser.add_argument('--intervalle', type=float, default=15, help='Secondes entre deux passages (--boucle)')
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            nombre = liberer_expirees(lot=options['lot'])
+            if nombre or not options['boucle']:
+                self.stdout.write(f'{nombre} réservation(s) expirée(s) remise(s) en stock.')
+            if not options['boucle']:
+                return
+            time.sleep(options['intervalle'])
@@ -0,0 +1,39 @@
+"""
+Charger les billets d'un événement dans le cache des scans avant l'ouverture des portes
+(voir utils/cache_scan.py).
+
+    python manage.py prechauffer_scan 12               # tout l'événement 12
+    python manage.py prechauffer_scan 12 --session 3   # une seule session
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models.evenements import Evenement
+from ...models.session import Session
+from ...utils.cache_scan import CachePartageRequis, prechauffer
+
+
+class Command(BaseCommand):
+    help = 'Précharger les billets d\'un événement (ou d\'une session) dans le cache des scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('id_evenement', type=int)
+        parser.add_argument('--session', type=int, help='Id de la session (par défaut : tout l\'événement)')
+        parser.add_argument('--duree', type=int, help='Secondes de validité (au plus SCAN_CACHE_DUREE)')
+
+    def handle(self, *args, **options):
+        evenement = Evenement.objects.filter(pk=options['id_evenement']).first()
+        if evenement is None:
+            raise CommandError(f"Événement {options['id_evenement']} introuvable.")
+        session = None
+        if options['session']:
+            session = Session.objects.filter(pk=options['session'], evenement=evenement).first()
+            if session is None:
+                raise CommandError(f"Session {options['session']} introuvable pour cet événement.")
+
+        try:
+            nombre, expiration = prechauffer(evenement, session, options['duree'])
+        except CachePartageRequis as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f'{nombre} billet(s) chargé(s) dans le cache des scans, jusqu\'à {expiration:%Y-%m-%d %H:%M} UTC.'
+        ))
@@ -0,0 +1,15 @@
+"""
+Supprimer les réponses Idempotency-Key expirées (voir utils/idempotence.py).
+
+    python manage.py purger_idempotence     # à lancer par cron, par exemple toutes les heures
+"""
+from django.core.management.base import BaseCommand
+
+from ...utils.idempotence import purger_expirees
+
+
+class Command(BaseCommand):
+    help = 'Supprimer les réponses Idempotency-Key expirées'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{purger_expirees()} clé(s) d\'idempotence expirée(s) supprimée(s).')
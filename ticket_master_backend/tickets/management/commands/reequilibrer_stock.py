@@ -0,0 +1,43 @@
+"""
+Stock fractionné des tickets très demandés (voir utils/inventaire.py).
+
+    python manage.py reequilibrer_stock --ticket 12 --fractions 16   # activer / changer N
+    python manage.py reequilibrer_stock --ticket 12 --fractions 0    # revenir à une ligne
+    python manage.py reequilibrer_stock                              # rééquilibrer tous les tickets fractionnés
+
+Au fil des ventes les fractions se vident inégalement ; un achat tombant sur une fraction
+vide doit alors essayer ses sœurs. Le rééquilibrage redistribue le stock restant à parts
+égales (à lancer périodiquement pendant une mise en vente).
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models.ticket import Ticket
+from ...utils.inventaire import repartir_stock
+
+
+class Command(BaseCommand):
+    help = 'Activer, désactiver ou rééquilibrer le stock fractionné des tickets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ticket', type=int, help='Ticket à traiter (défaut : tous les tickets fractionnés)')
+        parser.add_argument('--fractions', type=int, help='Nombre de fractions (0 : stock sur une seule ligne)')
+
+    def handle(self, *args, **options):
+        if options['fractions'] is not None:
+            if options['ticket'] is None:
+                raise CommandError('--fractions exige --ticket.')
+            if not 0 <= options['fractions'] <= 256:
+                raise CommandError('--fractions doit être compris entre 0 et 256.')
+
+        tickets = Ticket.objects.all()
+        if options['ticket'] is not None:
+            tickets = tickets.filter(pk=options['ticket'])
+            if not tickets.exists():
+                raise CommandError(f"Ticket {options['ticket']} introuvable.")
+        else:
+            tickets = tickets.filter(nombre_fractions__gt=0)
+
+        for ticket in tickets.order_by('id_ticket'):
+            nombre = options['fractions'] if options['fractions'] is not None else ticket.nombre_fractions
+            ticket = repartir_stock(ticket, nombre)
+            self.stdout.write(f'{ticket} : stock {ticket.stock_disponible} sur {nombre or 1} ligne(s)')
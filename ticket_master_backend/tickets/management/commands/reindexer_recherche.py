@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from ...utils import recherche
+
+
+class Command(BaseCommand):
+    help = "Réinstaller les triggers et reconstruire l'index de recherche plein texte des événements"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if not recherche.est_supporte(connection):
+            self.stdout.write(self.style.WARNING(
+                f'Moteur {connection.vendor} : pas d\'index plein texte (recherche par icontains).'
+            ))
+            return
+        recherche.installer(connection, forcer=True)
+        self.stdout.write(self.style.SUCCESS('Index de recherche reconstruit.'))
@@ -0,0 +1,41 @@
+"""
+Rembourser les achats des événements et sessions annulés (voir utils/annulations.py).
+
+    python manage.py traiter_annulations            # traiter les annulations en cours une fois
+    python manage.py traiter_annulations --boucle   # worker permanent
+
+Chaque lot est validé d'un bloc avec la progression de son annulation : relancée après
+un arrêt, la commande reprend aux achats restants.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from ...utils.annulations import LOT, traiter_annulations
+
+
+class Command(BaseCommand):
+    help = 'Rembourser par lots les achats des événements et sessions annulés'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lot', type=int, default=LOT, help='Achats remboursés par transaction')
+        parser.add_argument('--boucle', action='store_true', help='Recommencer indéfiniment')
+        parser.add_argument('--intervalle', type=float, default=2.0, help='Secondes d\'attente sans annulation en cours')
+
+    def progression(self, annulation):
+        self.stdout.write(
+            f'Annulation {annulation.id_annulation} : {annulation.achats_rembourses}/{annulation.achats_total} '
+            f'achat(s) remboursé(s), {annulation.montant_rembourse} FCFA ({annulation.statut}).'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            total = traiter_annulations(lot=options['lot'], progression=self.progression)
+            if total or not options['boucle']:
+                self.stdout.write(self.style.SUCCESS(f'{total} achat(s) remboursé(s).'))
+            if not options['boucle']:
+                return
+            if not total:
+                time.sleep(options['intervalle'])
@@ -0,0 +1,53 @@
+"""
+Traiter les commandes asynchrones en attente (voir utils/commandes.py).
+
+    python manage.py traiter_commandes                          # vider la file une fois
+    python manage.py traiter_commandes --boucle --processus 4   # pool de workers permanent
+
+Les workers d'un pool se partagent la file par FOR UPDATE SKIP LOCKED (PostgreSQL) ;
+sur SQLite, qui sérialise les écritures, un seul processus suffit.
+"""
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from ...utils import frequentation
+from ...utils.commandes import LOT, traiter_commandes
+
+
+def _worker(options, sortie):
+    connections.close_all()  # jamais la connexion héritée du parent
+    while True:
+        close_old_connections()
+        acceptees, refusees = traiter_commandes(lot=options['lot'])
+        frequentation.ecrire()  # avant une fin de processus : rien ne reste en mémoire
+        if acceptees or refusees or not options['boucle']:
+            sortie.write(f'{acceptees} commande(s) acceptée(s), {refusees} refusée(s).')
+        if not options['boucle']:
+            return
+        if not acceptees and not refusees:
+            time.sleep(options['intervalle'])
+
+
+class Command(BaseCommand):
+    help = 'Traiter les commandes asynchrones en attente, par lots'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lot', type=int, default=LOT, help='Commandes traitées par transaction')
+        parser.add_argument('--boucle', action='store_true', help='Recommencer indéfiniment')
+        parser.add_argument('--intervalle', type=float, default=0.2, help='Secondes d\'attente quand la file est vide')
+        parser.add_argument('--processus', type=int, default=1, help='Nombre de workers')
+
+    def handle(self, *args, **options):
+        if options['processus'] <= 1:
+            return _worker(options, self.stdout)
+
+        contexte = multiprocessing.get_context('fork')
+        connections.close_all()
+        processus = [contexte.Process(target=_worker, args=(options, self.stdout)) for _ in range(options['processus'])]
+        for p in processus:
+            p.start()
+        for p in processus:
+            p.join()
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0014_date_modification'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='achat',
+            index=models.Index(fields=['-date_achat', '-id_achat'], name='achat_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='achat',
+            index=models.Index(fields=['id_utilisateur', '-date_achat', '-id_achat'], name='achat_utilisateur_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='evenement',
+            index=models.Index(fields=['date', 'id_evenement'], name='evenement_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='favori',
+            index=models.Index(fields=['utilisateur', '-date_ajout', '-id_favori'], name='favori_utilisateur_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['id_utilisateur', '-date_transaction', '-id_transaction'], name='transaction_util_date_idx'),
+        ),
+    ]
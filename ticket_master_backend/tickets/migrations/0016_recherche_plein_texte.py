@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from tickets.utils import recherche
+
+
+def installer(apps, schema_editor):
+    recherche.installer(schema_editor.connection, forcer=True)
+
+
+def desinstaller(apps, schema_editor):
+    recherche.desinstaller(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0015_index_pagination_keyset'),
+    ]
+
+    operations = [
+        migrations.RunPython(installer, desinstaller),
+    ]
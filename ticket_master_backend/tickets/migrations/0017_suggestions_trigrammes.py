@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from tickets.utils import suggestions
+
+
+def installer(apps, schema_editor):
+    suggestions.installer(schema_editor.connection)
+
+
+def desinstaller(apps, schema_editor):
+    suggestions.desinstaller(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0016_recherche_plein_texte'),
+    ]
+
+    operations = [
+        migrations.RunPython(installer, desinstaller),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0017_suggestions_trigrammes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='evenement',
+            index=models.Index(fields=['latitude', 'longitude'], name='evenement_coords_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0018_index_coordonnees'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticket',
+            name='nombre_fractions',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='FractionStock',
+            fields=[
+                ('id_fraction', models.AutoField(primary_key=True, serialize=False)),
+                ('numero', models.PositiveSmallIntegerField()),
+                ('stock', models.IntegerField(default=0)),
+                ('date_modification', models.DateTimeField(auto_now=True)),
+                ('ticket', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fractions_stock', to='tickets.ticket')),
+            ],
+            options={
+                'ordering': ['ticket', 'numero'],
+                'unique_together': {('ticket', 'numero')},
+            },
+        ),
+    ]
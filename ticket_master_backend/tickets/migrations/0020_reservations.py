@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0019_stock_fractionne'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reservation',
+            fields=[
+                ('id_reservation', models.AutoField(primary_key=True, serialize=False)),
+                ('quantite', models.IntegerField()),
+                ('statut', models.CharField(choices=[('active', 'Active'), ('convertie', 'Convertie en achat'), ('expiree', 'Expirée'), ('annulee', 'Annulée')], default='active', max_length=20)),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+                ('date_expiration', models.DateTimeField()),
+                ('id_ticket', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tickets.ticket')),
+                ('id_utilisateur', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tickets.utilisateur')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['statut', 'date_expiration'], name='reservation_expiration_idx'), models.Index(fields=['id_utilisateur', 'statut'], name='reservation_utilisateur_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0020_reservations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Commande',
+            fields=[
+                ('id_commande', models.AutoField(primary_key=True, serialize=False)),
+                ('quantite', models.IntegerField()),
+                ('statut', models.CharField(choices=[('en_attente', 'En attente'), ('acceptee', 'Acceptée'), ('refusee', 'Refusée')], default='en_attente', max_length=20)),
+                ('motif', models.CharField(blank=True, help_text='Raison du refus', max_length=255)),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+                ('date_traitement', models.DateTimeField(blank=True, null=True)),
+                ('id_achat', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='commande', to='tickets.achat')),
+                ('id_ticket', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tickets.ticket')),
+                ('id_utilisateur', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tickets.utilisateur')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['statut', 'id_commande'], name='commande_attente_idx'), models.Index(fields=['id_utilisateur', '-date_creation'], name='commande_utilisateur_idx')],
+            },
+        ),
+    ]
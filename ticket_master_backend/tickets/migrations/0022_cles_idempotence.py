@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:17
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0021_commandes_asynchrones'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CleIdempotence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('portee', models.CharField(help_text='Compte authentifié (type:id)', max_length=64)),
+                ('cle', models.CharField(max_length=255)),
+                ('empreinte', models.CharField(help_text='SHA-256 de la méthode, du chemin et du corps', max_length=64)),
+                ('statut', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('reponse', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True)),
+                ('entetes', models.JSONField(blank=True, default=dict)),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+                ('date_expiration', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('portee', 'cle'), name='cle_idempotence_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0022_cles_idempotence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TacheQR',
+            fields=[
+                ('id_tache', models.AutoField(primary_key=True, serialize=False)),
+                ('url_base', models.CharField(blank=True, help_text="Hôte de l'URL de vérification encodée", max_length=200)),
+                ('statut', models.CharField(choices=[('en_attente', 'En attente'), ('terminee', 'Terminée'), ('echec', 'Échec')], default='en_attente', max_length=20)),
+                ('tentatives', models.PositiveSmallIntegerField(default=0)),
+                ('erreur', models.CharField(blank=True, max_length=255)),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+                ('date_traitement', models.DateTimeField(blank=True, null=True)),
+                ('id_achat', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='tache_qr', to='tickets.achat')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['statut', 'id_tache'], name='tache_qr_attente_idx')],
+            },
+        ),
+    ]
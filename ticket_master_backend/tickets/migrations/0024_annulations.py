@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0023_taches_qr'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transaction',
+            name='type_transaction',
+            field=models.CharField(choices=[('depot', 'Dépôt'), ('achat', 'Achat de ticket'), ('bonus_parrainage', 'Bonus parrainage'), ('remboursement', 'Remboursement')], max_length=50),
+        ),
+        migrations.CreateModel(
+            name='Annulation',
+            fields=[
+                ('id_annulation', models.AutoField(primary_key=True, serialize=False)),
+                ('motif', models.CharField(blank=True, max_length=255)),
+                ('statut', models.CharField(choices=[('en_cours', 'En cours'), ('terminee', 'Terminée')], default='en_cours', max_length=20)),
+                ('achats_total', models.IntegerField(default=0, help_text='Achats à rembourser à la création')),
+                ('achats_rembourses', models.IntegerField(default=0)),
+                ('montant_rembourse', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+                ('date_fin', models.DateTimeField(blank=True, null=True)),
+                ('evenement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='annulations', to='tickets.evenement')),
+                ('session', models.ForeignKey(blank=True, help_text="Session annulée (vide : tout l'événement)", null=True, on_delete=django.db.models.deletion.CASCADE, related_name='annulations', to='tickets.session')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['statut', 'id_annulation'], name='annulation_statut_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0024_annulations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='achat',
+            name='porte_validation',
+            field=models.CharField(blank=True, help_text='Porte (scanner) qui a validé le ticket', max_length=50),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0025_porte_validation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='evenement',
+            name='est_annule',
+            field=models.BooleanField(default=False, help_text='Annulé : plus de ventes ni de réservations'),
+        ),
+        migrations.AddField(
+            model_name='session',
+            name='est_annule',
+            field=models.BooleanField(default=False, help_text='Annulée : plus de ventes pour cette session'),
+        ),
+        migrations.AddConstraint(
+            model_name='annulation',
+            constraint=models.UniqueConstraint(condition=models.Q(('statut', 'en_cours')), fields=('evenement', 'session'), name='annulation_session_en_cours_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='annulation',
+            constraint=models.UniqueConstraint(condition=models.Q(('session__isnull', True), ('statut', 'en_cours')), fields=('evenement',), name='annulation_evenement_en_cours_unique'),
+        ),
+    ]
@@ -5,6 +5,12 @@ from .ticket import Ticket
 from .achat import Achat
 from .favori import Favori
 from .session import Session
+from .fraction_stock import FractionStock
+from .reservation import Reservation
+from .commande import Commande
+from .cle_idempotence import CleIdempotence
+from .tache_qr import TacheQR
+from .annulation import Annulation
 
 __all__ = [
     'Utilisateur',
@@ -14,4 +20,10 @@ __all__ = [
     'Achat',
     'Favori',
     'Session',
+    'FractionStock',
+    'Reservation',
+    'Commande',
+    'CleIdempotence',
+    'TacheQR',
+    'Annulation',
 ]
@@ -12,6 +12,8 @@ class Achat(models.Model):
     date_achat = models.DateTimeField(auto_now_add=True)
     est_utilise = models.BooleanField(default=False)
     date_utilisation = models.DateTimeField(null=True, blank=True, help_text="Date et heure de validation du ticket")
+    porte_validation = models.CharField(max_length=50, blank=True, help_text="Porte (scanner) qui a validé le ticket")
+    date_modification = models.DateTimeField(auto_now=True, db_index=True)
     
     # Champs pour le QR code
     code_qr = models.CharField(max_length=255, unique=True, null=True, blank=True, 
@@ -19,6 +21,13 @@ class Achat(models.Model):
     qr_image = models.ImageField(upload_to='qr_codes/', null=True, blank=True,
                                   help_text="Image PNG du QR code")
 
+    class Meta:
+        indexes = [
+            # Clés de la pagination keyset (voir tickets/pagination.py)
+            models.Index(fields=['-date_achat', '-id_achat'], name='achat_date_idx'),
+            models.Index(fields=['id_utilisateur', '-date_achat', '-id_achat'], name='achat_utilisateur_date_idx'),
+        ]
+
     def __str__(self):
         return f"Achat {self.id_achat} - Utilisateur {self.id_utilisateur} - Ticket {self.id_ticket}"
     
@@ -0,0 +1,60 @@
+from django.db import models
+from django.db.models import Q
+
+
+class Annulation(models.Model):
+    """
+    Annulation d'un événement (ou d'une seule de ses sessions) par un administrateur :
+    ses achats sont remboursés par lots par le worker traiter_annulations (voir
+    utils/annulations.py). Les compteurs avancent avec chaque lot validé : la progression
+    est lisible pendant le traitement et un worker arrêté reprend là où il en était.
+    """
+    EN_COURS = 'en_cours'
+    TERMINEE = 'terminee'
+    STATUTS = [
+        (EN_COURS, 'En cours'),
+        (TERMINEE, 'Terminée'),
+    ]
+
+    id_annulation = models.AutoField(primary_key=True)
+    evenement = models.ForeignKey('Evenement', on_delete=models.CASCADE, related_name='annulations')
+    session = models.ForeignKey(
+        'Session', on_delete=models.CASCADE, null=True, blank=True, related_name='annulations',
+        help_text="Session annulée (vide : tout l'événement)"
+    )
+    motif = models.CharField(max_length=255, blank=True)
+    statut = models.CharField(max_length=20, choices=STATUTS, default=EN_COURS)
+    achats_total = models.IntegerField(default=0, help_text="Achats à rembourser à la création")
+    achats_rembourses = models.IntegerField(default=0)
+    montant_rembourse = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    date_creation = models.DateTimeField(auto_now_add=True)
+    date_fin = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # File du worker : annulations en cours dans l'ordre d'arrivée
+            models.Index(fields=['statut', 'id_annulation'], name='annulation_statut_idx'),
+        ]
+        constraints = [
+            # Une seule annulation en cours par portée (session NULL : contrainte à part,
+            # deux NULL ne se heurtant pas dans un index unique)
+            models.UniqueConstraint(
+                fields=['evenement', 'session'], condition=Q(statut='en_cours'),
+                name='annulation_session_en_cours_unique',
+            ),
+            models.UniqueConstraint(
+                fields=['evenement'], condition=Q(statut='en_cours', session__isnull=True),
+                name='annulation_evenement_en_cours_unique',
+            ),
+        ]
+
+    def filtre_achats(self):
+        """Achats concernés encore à rembourser (remboursés = supprimés)"""
+        filtre = Q(id_ticket__id_evenement_id=self.evenement_id)
+        if self.session_id:
+            filtre &= Q(session_id=self.session_id)
+        return filtre
+
+    def __str__(self):
+        portee = f"session {self.session_id}" if self.session_id else "événement"
+        return f"Annulation {self.id_annulation} - Événement {self.evenement_id} ({portee}, {self.statut})"
@@ -0,0 +1,26 @@
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+
+
+class CleIdempotence(models.Model):
+    """
+    Réponse enregistrée d'une requête POST portant l'en-tête Idempotency-Key (voir
+    utils/idempotence.py). Insérée et complétée dans la transaction de la requête d'origine :
+    une entrée validée a toujours sa réponse.
+    """
+    portee = models.CharField(max_length=64, help_text="Compte authentifié (type:id)")
+    cle = models.CharField(max_length=255)
+    empreinte = models.CharField(max_length=64, help_text="SHA-256 de la méthode, du chemin et du corps")
+    statut = models.PositiveSmallIntegerField(null=True, blank=True)
+    reponse = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    entetes = models.JSONField(default=dict, blank=True)
+    date_creation = models.DateTimeField(auto_now_add=True)
+    date_expiration = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['portee', 'cle'], name='cle_idempotence_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.portee} {self.cle} ({self.statut or 'en cours'})"
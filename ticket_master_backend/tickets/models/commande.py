@@ -0,0 +1,39 @@
+from django.db import models
+
+
+class Commande(models.Model):
+    """
+    Intention d'achat mise en file par POST /api/achats/ (en-tête Prefer: respond-async) :
+    la requête répond 202 dès l'insertion, un worker traite les commandes par lots
+    (voir utils/commandes.py) et les passe à 'acceptee' (avec l'Achat créé) ou 'refusee'.
+    """
+    EN_ATTENTE = 'en_attente'
+    ACCEPTEE = 'acceptee'
+    REFUSEE = 'refusee'
+    STATUTS = [
+        (EN_ATTENTE, 'En attente'),
+        (ACCEPTEE, 'Acceptée'),
+        (REFUSEE, 'Refusée'),
+    ]
+
+    id_commande = models.AutoField(primary_key=True)
+    id_utilisateur = models.ForeignKey('Utilisateur', on_delete=models.CASCADE)
+    id_ticket = models.ForeignKey('Ticket', on_delete=models.CASCADE)
+    quantite = models.IntegerField()
+    statut = models.CharField(max_length=20, choices=STATUTS, default=EN_ATTENTE)
+    motif = models.CharField(max_length=255, blank=True, help_text="Raison du refus")
+    id_achat = models.OneToOneField(
+        'Achat', on_delete=models.SET_NULL, null=True, blank=True, related_name='commande'
+    )
+    date_creation = models.DateTimeField(auto_now_add=True)
+    date_traitement = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Lots du worker : commandes en attente dans l'ordre d'arrivée
+            models.Index(fields=['statut', 'id_commande'], name='commande_attente_idx'),
+            models.Index(fields=['id_utilisateur', '-date_creation'], name='commande_utilisateur_idx'),
+        ]
+
+    def __str__(self):
+        return f"Commande {self.id_commande} - Ticket {self.id_ticket_id} x{self.quantite} ({self.statut})"
@@ -1,4 +1,22 @@
 from django.db import models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+class EvenementQuerySet(models.QuerySet):
+    def avec_catalogue(self):
+        """Annoter le stock total et le nombre de types de tickets, précharger les sessions"""
+        from .fraction_stock import FractionStock
+        # Stock des tickets fractionnés : sous-requête (une jointure multiplierait Sum('ticket__stock'))
+        fractions = (
+            FractionStock.objects.filter(ticket__id_evenement=OuterRef('pk')).order_by()
+            .values('ticket__id_evenement').annotate(total=Sum('stock')).values('total')
+        )
+        return self.annotate(
+            stock_disponible=Coalesce(Sum('ticket__stock'), 0) + Coalesce(Subquery(fractions), 0),
+            nombre_types_tickets=Count('ticket'),
+        ).prefetch_related('sessions')
+
 
 class Evenement(models.Model):
     id_evenement = models.AutoField(primary_key=True)
@@ -11,6 +29,23 @@ class Evenement(models.Model):
     longitude = models.FloatField(null=True, blank=True)
     heure_debut = models.TimeField(null=True, blank=True)
     heure_fin = models.TimeField(null=True, blank=True)
+    est_annule = models.BooleanField(default=False, help_text="Annulé : plus de ventes ni de réservations")
+    date_modification = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = EvenementQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date', 'id_evenement'], name='evenement_date_idx'),
+            models.Index(fields=['latitude', 'longitude'], name='evenement_coords_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Position lue en base : les signaux invalident aussi les tuiles de carte de l'ancienne position
+        instance._position_chargee = (instance.__dict__.get('latitude'), instance.__dict__.get('longitude'))
+        return instance
 
     def __str__(self):
-        return self.titre_evenement
\ No newline at end of file
+        return self.titre_evenement
@@ -13,6 +13,9 @@ class Favori(models.Model):
     class Meta:
         unique_together = ('utilisateur', 'evenement')  # Un utilisateur ne peut pas favoriser deux fois le même événement
         ordering = ['-date_ajout']  # Les plus récents en premier
+        indexes = [
+            models.Index(fields=['utilisateur', '-date_ajout', '-id_favori'], name='favori_utilisateur_date_idx'),
+        ]
     
     def __str__(self):
         return f"{self.utilisateur.prenom} {self.utilisateur.nom} - {self.evenement.titre_evenement}"
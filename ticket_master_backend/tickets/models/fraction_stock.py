@@ -0,0 +1,22 @@
+from django.db import models
+from .ticket import Ticket
+
+
+class FractionStock(models.Model):
+    """
+    Part du stock d'un ticket en mode fractionné (Ticket.nombre_fractions > 0).
+    Les achats décrémentent une fraction tirée au hasard : des ventes simultanées
+    verrouillent des lignes différentes au lieu de toutes attendre la ligne du ticket.
+    """
+    id_fraction = models.AutoField(primary_key=True)
+    ticket = models.ForeignKey(Ticket, on_delete=models.CASCADE, related_name='fractions_stock')
+    numero = models.PositiveSmallIntegerField()
+    stock = models.IntegerField(default=0)
+    date_modification = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('ticket', 'numero')
+        ordering = ['ticket', 'numero']
+
+    def __str__(self):
+        return f"Ticket {self.ticket_id} - fraction {self.numero} ({self.stock})"
@@ -0,0 +1,37 @@
+from django.db import models
+
+
+class Reservation(models.Model):
+    """
+    Places mises de côté pour un utilisateur pendant une durée limitée : la quantité est
+    retirée du stock du ticket à la création, rendue si la réservation expire ou est
+    annulée, et convertie en Achat par POST /api/achats/ {"id_reservation": ...}.
+    """
+    ACTIVE = 'active'
+    CONVERTIE = 'convertie'
+    EXPIREE = 'expiree'
+    ANNULEE = 'annulee'
+    STATUTS = [
+        (ACTIVE, 'Active'),
+        (CONVERTIE, 'Convertie en achat'),
+        (EXPIREE, 'Expirée'),
+        (ANNULEE, 'Annulée'),
+    ]
+
+    id_reservation = models.AutoField(primary_key=True)
+    id_utilisateur = models.ForeignKey('Utilisateur', on_delete=models.CASCADE)
+    id_ticket = models.ForeignKey('Ticket', on_delete=models.CASCADE)
+    quantite = models.IntegerField()
+    statut = models.CharField(max_length=20, choices=STATUTS, default=ACTIVE)
+    date_creation = models.DateTimeField(auto_now_add=True)
+    date_expiration = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # Balayage des réservations expirées (voir utils/reservations.py)
+            models.Index(fields=['statut', 'date_expiration'], name='reservation_expiration_idx'),
+            models.Index(fields=['id_utilisateur', 'statut'], name='reservation_utilisateur_idx'),
+        ]
+
+    def __str__(self):
+        return f"Réservation {self.id_reservation} - Ticket {self.id_ticket_id} x{self.quantite} ({self.statut})"
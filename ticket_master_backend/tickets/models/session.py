@@ -7,6 +7,8 @@ class Session(models.Model):
     id_session = models.AutoField(primary_key=True)
     evenement = models.ForeignKey(Evenement, on_delete=models.CASCADE, related_name='sessions')
     date_heure = models.DateTimeField(null=False, blank=False)
+    est_annule = models.BooleanField(default=False, help_text="Annulée : plus de ventes pour cette session")
+    date_modification = models.DateTimeField(auto_now=True, db_index=True)
     
     class Meta:
         ordering = ['date_heure']  # Sessions triées par date/heure
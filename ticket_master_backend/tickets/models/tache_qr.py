@@ -0,0 +1,33 @@
+from django.db import models
+
+
+class TacheQR(models.Model):
+    """
+    Rendu en attente de l'image QR d'un achat (file durable, voir utils/taches_qr.py) :
+    créée dans la transaction de l'achat, traitée par la commande generer_qr.
+    """
+    EN_ATTENTE = 'en_attente'
+    TERMINEE = 'terminee'
+    ECHEC = 'echec'
+    STATUTS = [
+        (EN_ATTENTE, 'En attente'),
+        (TERMINEE, 'Terminée'),
+        (ECHEC, 'Échec'),
+    ]
+
+    id_tache = models.AutoField(primary_key=True)
+    id_achat = models.OneToOneField('Achat', on_delete=models.CASCADE, related_name='tache_qr')
+    url_base = models.CharField(max_length=200, blank=True, help_text="Hôte de l'URL de vérification encodée")
+    statut = models.CharField(max_length=20, choices=STATUTS, default=EN_ATTENTE)
+    tentatives = models.PositiveSmallIntegerField(default=0)
+    erreur = models.CharField(max_length=255, blank=True)
+    date_creation = models.DateTimeField(auto_now_add=True)
+    date_traitement = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['statut', 'id_tache'], name='tache_qr_attente_idx'),
+        ]
+
+    def __str__(self):
+        return f"Tâche QR {self.id_tache} - Achat {self.id_achat_id} ({self.statut})"
@@ -1,4 +1,36 @@
+from decimal import Decimal
+
 from django.db import models
+from django.db.models import OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+class TicketQuerySet(models.QuerySet):
+    def avec_ventes(self):
+        """Annoter les quantités vendues/validées et le chiffre d'affaires de chaque ticket"""
+        return self.annotate(
+            quantite_vendue=Coalesce(Sum('achat__quantite'), 0),
+            quantite_validee=Coalesce(Sum('achat__quantite', filter=Q(achat__est_utilise=True)), 0),
+            revenus=Coalesce(
+                Sum('achat__montant_total'),
+                Value(Decimal('0.00')),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2),
+            ),
+        )
+
+    def avec_stock(self):
+        """Annoter le stock des fractions (évite une requête par ticket fractionné pour stock_disponible)"""
+        from .fraction_stock import FractionStock
+        fractions = (
+            FractionStock.objects.filter(ticket=OuterRef('pk')).order_by()
+            .values('ticket').annotate(total=Sum('stock')).values('total')
+        )
+        return self.annotate(stock_fractions=Coalesce(Subquery(fractions), 0))
+
+    def en_stock(self):
+        """Tickets ayant au moins une place disponible, en ligne unique ou dans une fraction"""
+        return self.filter(Q(stock__gt=0) | Q(fractions_stock__stock__gt=0))
+
 
 class Ticket(models.Model):
     id_ticket = models.AutoField(primary_key=True)
@@ -7,6 +39,22 @@ class Ticket(models.Model):
     date_creation = models.DateTimeField(auto_now_add=True)
     stock = models.IntegerField()
     id_evenement = models.ForeignKey('Evenement', on_delete=models.CASCADE)
+    date_modification = models.DateTimeField(auto_now=True, db_index=True)
+    # 0 : stock sur la ligne du ticket. N > 0 : stock réparti sur N FractionStock,
+    # `stock` ne garde que la réserve non répartie (voir utils/inventaire.py)
+    nombre_fractions = models.PositiveSmallIntegerField(default=0)
+
+    objects = TicketQuerySet.as_manager()
+
+    @property
+    def stock_disponible(self):
+        """Stock vendable : ligne du ticket plus ses fractions"""
+        if not self.nombre_fractions:
+            return self.stock
+        fractions = self.__dict__.get('stock_fractions')
+        if fractions is None:
+            fractions = self.fractions_stock.aggregate(total=Coalesce(Sum('stock'), 0))['total']
+        return self.stock + fractions
 
     def __str__(self):
         return f"Ticket {self.id_ticket} - {self.type}"
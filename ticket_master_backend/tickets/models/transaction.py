@@ -7,6 +7,7 @@ class Transaction(models.Model):
         ('depot', 'Dépôt'),
         ('achat', 'Achat de ticket'),
         ('bonus_parrainage', 'Bonus parrainage'),
+        ('remboursement', 'Remboursement'),
     ]
     
     MOYEN_PAIEMENT_CHOICES = [
@@ -52,10 +53,13 @@ class Transaction(models.Model):
         super().save(*args, **kwargs)
     
     def __str__(self):
-        signe = "+" if self.type_transaction in ['depot', 'bonus_parrainage'] else "-"
+        signe = "+" if self.type_transaction in ['depot', 'bonus_parrainage', 'remboursement'] else "-"
         return f"{self.reference} | {signe}{self.montant} FCFA | {self.get_type_transaction_display()}"
     
     class Meta:
         ordering = ['-date_transaction']
         verbose_name = "Transaction"
-        verbose_name_plural = "Transactions"
\ No newline at end of file
+        verbose_name_plural = "Transactions"
+        indexes = [
+            models.Index(fields=['id_utilisateur', '-date_transaction', '-id_transaction'], name='transaction_util_date_idx'),
+        ]
\ No newline at end of file
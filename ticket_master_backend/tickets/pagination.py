@@ -0,0 +1,193 @@
+"""
+Pagination par clé (keyset) avec curseur opaque.
+
+Au lieu de COUNT(*) + OFFSET, chaque page reprend après la dernière ligne de la page
+précédente : WHERE (date_achat, id_achat) < (:date, :id) ORDER BY date_achat DESC,
+id_achat DESC LIMIT n. Le coût d'une page ne dépend plus de sa profondeur tant que
+l'ordre est couvert par un index.
+
+L'ordre est celui du queryset (order_by ou Meta.ordering), complété par la clé
+primaire pour rendre la clé unique. Le mode page (?page=N, avec count) reste
+disponible pour l'interface admin.
+"""
+import base64
+import datetime
+import decimal
+import json
+import uuid
+from collections import OrderedDict
+
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    page_query_param = 'page'
+    invalid_cursor_message = 'Curseur invalide.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        # Mode page : opt-in explicite via ?page=
+        if request.query_params.get(self.page_query_param) is not None:
+            self.page_number = PageNumberPagination()
+            self.page_number.page_size = self.page_size
+            self.page_number.page_size_query_param = self.page_size_query_param
+            self.page_number.max_page_size = self.max_page_size
+            return self.page_number.paginate_queryset(queryset, request, view)
+        self.page_number = None
+
+        self.limite = self.get_page_size(request)
+        self.champs = self.get_ordering(queryset)
+        curseur = self.decode_cursor(request, queryset.model)
+        self.inverse = bool(curseur and curseur['inverse'])
+
+        queryset = queryset.order_by(*self.ordre_sql(inverse=self.inverse))
+        if curseur:
+            queryset = queryset.filter(self.filtre_apres(curseur['valeurs'], self.inverse))
+
+        lignes = list(queryset[:self.limite + 1])
+        encore = len(lignes) > self.limite
+        lignes = lignes[:self.limite]
+        if self.inverse:
+            lignes.reverse()
+
+        if self.inverse:
+            self.a_precedent = encore
+            self.a_suivant = True
+        else:
+            self.a_precedent = curseur is not None
+            self.a_suivant = encore
+        self.lignes = lignes
+        return lignes
+
+    def get_paginated_response(self, data):
+        if self.page_number is not None:
+            return self.page_number.get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_page_size(self, request):
+        try:
+            taille = int(request.query_params[self.page_size_query_param])
+            if taille > 0:
+                return min(taille, self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
+
+    def get_ordering(self, queryset):
+        """Liste de (champ modèle, décroissant) terminée par la clé primaire"""
+        ordre = list(queryset.query.order_by) or list(queryset.model._meta.ordering)
+        meta = queryset.model._meta
+        champs = []
+        for element in ordre:
+            if not isinstance(element, str) or '__' in element or element.lstrip('-') == '?':
+                raise ImproperlyConfigured(
+                    f'KeysetPagination : ordre non supporté {element!r} (champs directs uniquement).'
+                )
+            nom = element.lstrip('-')
+            champ = meta.pk if nom == 'pk' else meta.get_field(nom)
+            if champ.null:
+                raise ImproperlyConfigured(
+                    f'KeysetPagination : le champ {champ.name} est nullable et ne peut pas servir de clé.'
+                )
+            champs.append((champ, element.startswith('-')))
+        if not any(champ.primary_key for champ, _ in champs):
+            decroissant = champs[-1][1] if champs else False
+            champs.append((meta.pk, decroissant))
+        return champs
+
+    def ordre_sql(self, inverse=False):
+        return [
+            ('-' if decroissant != inverse else '') + champ.name
+            for champ, decroissant in self.champs
+        ]
+
+    def filtre_apres(self, valeurs, inverse=False):
+        """(a, b, c) après (x, y, z) : a > x OU (a = x ET b > y) OU (a = x ET b = y ET c > z)"""
+        filtre = Q()
+        egalites = {}
+        for (champ, decroissant), valeur in zip(self.champs, valeurs):
+            operateur = 'lt' if decroissant != inverse else 'gt'
+            filtre |= Q(**egalites, **{f'{champ.name}__{operateur}': valeur})
+            egalites[champ.name] = valeur
+        return filtre
+
+    # Curseurs
+
+    def decode_cursor(self, request, model):
+        brut = request.query_params.get(self.cursor_query_param)
+        if not brut:
+            return None
+        try:
+            contenu = json.loads(base64.urlsafe_b64decode(brut.encode('ascii')).decode('utf-8'))
+            valeurs = contenu['v']
+            if len(valeurs) != len(self.champs):
+                raise ValueError
+            return {
+                'valeurs': [champ.to_python(v) for (champ, _), v in zip(self.champs, valeurs)],
+                'inverse': bool(contenu.get('r')),
+            }
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, instance, inverse):
+        valeurs = [_serialiser(getattr(instance, champ.attname)) for champ, _ in self.champs]
+        contenu = json.dumps({'v': valeurs, 'r': 1 if inverse else 0}, separators=(',', ':'))
+        curseur = base64.urlsafe_b64encode(contenu.encode('utf-8')).decode('ascii')
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, curseur)
+
+    def get_next_link(self):
+        if not self.a_suivant or not self.lignes:
+            return None
+        return self.encode_cursor(self.lignes[-1], inverse=False)
+
+    def get_previous_link(self):
+        if not self.a_precedent:
+            return None
+        if not self.lignes:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.encode_cursor(self.lignes[0], inverse=True)
+
+
+def _serialiser(valeur):
+    """Représentation JSON sans perte (to_python() la relit), microsecondes comprises"""
+    if isinstance(valeur, (datetime.datetime, datetime.date, datetime.time)):
+        return valeur.isoformat()
+    if isinstance(valeur, (decimal.Decimal, uuid.UUID)):
+        return str(valeur)
+    return valeur
+
+
+def reponse_paginee(view, queryset, serializer_class, cle='results', context=None, **extra):
+    """
+    Paginer et sérialiser un queryset dans une action personnalisée.
+    Les clés supplémentaires (extra) sont ajoutées à l'enveloppe ; `cle` permet de
+    conserver le nom historique de la liste (ex. 'achats').
+    """
+    context = context if context is not None else {'request': view.request}
+    page = view.paginate_queryset(queryset)
+    if page is None:
+        data = serializer_class(queryset, many=True, context=context).data
+        return Response(OrderedDict([*extra.items(), ('count', len(data)), (cle, data)]))
+
+    data = serializer_class(page, many=True, context=context).data
+    response = view.get_paginated_response(data)
+    enveloppe = OrderedDict(extra)
+    for nom, valeur in response.data.items():
+        enveloppe[cle if nom == 'results' else nom] = valeur
+    response.data = enveloppe
+    return response
@@ -2,14 +2,17 @@ from .ticket_serializers import (
     TicketSerializer,
     TicketCreateSerializer,
     TicketUpdateSerializer,
-    TicketListSerializer
+    TicketListSerializer,
+    TicketSnapshotSerializer
 )
 from .evenement_serializers import (
     EvenementSerializer,
     EvenementCreateSerializer,
     EvenementUpdateSerializer,
     EvenementListSerializer,
-    EvenementDetailSerializer
+    EvenementDetailSerializer,
+    EvenementSnapshotSerializer,
+    EvenementProcheSerializer
 )
 from .utilisateur_serializers import (
     UtilisateurSerializer,
@@ -31,8 +34,23 @@ from .achat_serializers import (
     AchatCreateSerializer,
     AchatListSerializer,
     AchatDetailSerializer,
-    AchatStatistiquesSerializer
+    AchatStatistiquesSerializer,
+    PanierSerializer,
+    ValidationLotSerializer
 )
+from .reservation_serializers import (
+    ReservationSerializer,
+    ReservationCreateSerializer
+)
+from .commande_serializers import (
+    CommandeSerializer,
+    CommandeCreateSerializer
+)
+from .annulation_serializers import (
+    AnnulationSerializer,
+    AnnulationCreateSerializer
+)
+from .scan_serializers import PrechauffageScanSerializer
 from .loginSerializers import (
     LoginAdministrateurSerializer,
     LoginUtilisateurSerializer,
@@ -46,11 +64,14 @@ __all__ = [
     'TicketCreateSerializer',
     'TicketUpdateSerializer',
     'TicketListSerializer',
+    'TicketSnapshotSerializer',
     'EvenementSerializer',
     'EvenementCreateSerializer',
     'EvenementUpdateSerializer',
     'EvenementListSerializer',
     'EvenementDetailSerializer',
+    'EvenementSnapshotSerializer',
+    'EvenementProcheSerializer',
     'UtilisateurSerializer',
     'UtilisateurCreateSerializer',
     'UtilisateurUpdateSerializer',
@@ -67,6 +88,15 @@ __all__ = [
     'AchatListSerializer',
     'AchatDetailSerializer',
     'AchatStatistiquesSerializer',
+    'PanierSerializer',
+    'ValidationLotSerializer',
+    'ReservationSerializer',
+    'ReservationCreateSerializer',
+    'CommandeSerializer',
+    'CommandeCreateSerializer',
+    'AnnulationSerializer',
+    'AnnulationCreateSerializer',
+    'PrechauffageScanSerializer',
     'LoginAdministrateurSerializer',
     'LoginUtilisateurSerializer',
     'UtilisateurRegisterResponseSerializer',
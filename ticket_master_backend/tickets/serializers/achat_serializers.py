@@ -1,9 +1,23 @@
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.utils import timezone
 from rest_framework import serializers
 from ..models.achat import Achat
 from ..models.utilisateurs import Utilisateur
 from ..models.ticket import Ticket
+from ..models.reservation import Reservation
+from ..models.session import Session
 from .utilisateur_serializers import UtilisateurListSerializer
 from .ticket_serializers import TicketListSerializer
+from ..utils.annulations import EVENEMENT_ANNULE, SESSION_ANNULEE
+from ..utils.inventaire import avec_reprises, debiter_solde, decrementer_stock
+from ..utils.reservations import convertir
+from ..utils.qr_generator import get_qr_url
+from ..utils.taches_qr import planifier
+from ..utils import frequentation
+from ..utils.validation import LOT_MAX, valider_lot
 
 
 class AchatSerializer(serializers.ModelSerializer):
@@ -12,13 +26,8 @@ class AchatSerializer(serializers.ModelSerializer):
     qr_code_url = serializers.SerializerMethodField()
     
     def get_qr_code_url(self, obj):
-        """Retourner l'URL absolue du QR code"""
-        request = self.context.get('request')
-        if obj.qr_image and request:
-            return request.build_absolute_uri(obj.qr_image.url)
-        elif obj.qr_image:
-            return obj.qr_image.url
-        return None
+        """Retourner l'URL absolue du QR code (image rendue ou en cours de rendu)"""
+        return get_qr_url(obj, self.context.get('request'))
     
     class Meta:
         model = Achat
@@ -30,11 +39,18 @@ class AchatSerializer(serializers.ModelSerializer):
 
 
 class AchatCreateSerializer(serializers.ModelSerializer):
-    """Serializer pour la création d'achats - L'utilisateur est automatiquement défini depuis le JWT"""
+    """
+    Serializer pour la création d'achats - L'utilisateur est automatiquement défini depuis le JWT.
+    Avec id_reservation, le ticket et la quantité sont ceux de la réservation (places déjà
+    retirées du stock) : l'achat ne fait plus que débiter le solde.
+    """
+    id_reservation = serializers.IntegerField(required=False, write_only=True)
+    
     class Meta:
         model = Achat
-        fields = ['id_ticket', 'quantite']  # id_utilisateur removed - set from request.user
+        fields = ['id_ticket', 'quantite', 'id_reservation']  # id_utilisateur removed - set from request.user
         extra_kwargs = {
+            'id_ticket': {'required': False, 'queryset': Ticket.objects.select_related('id_evenement')},
             'quantite': {'min_value': 1, 'default': 1}
         }
     
@@ -52,10 +68,8 @@ class AchatCreateSerializer(serializers.ModelSerializer):
     
     def validate(self, data):
         """Validation globale - vérifier le stock et le solde disponible"""
-        ticket = data['id_ticket']
         # Get user from JWT token context
         utilisateur = self.context['request'].user
-        quantite = data.get('quantite', 1)
         
         # Vérifier que l'utilisateur est actif
         if utilisateur.statut != 'actif':
@@ -63,10 +77,29 @@ class AchatCreateSerializer(serializers.ModelSerializer):
                 'utilisateur': "Votre compte est inactif. Veuillez contacter l'administrateur."
             })
         
-        # Vérifier le stock disponible
-        if ticket.stock < quantite:
+        if data.get('id_reservation') is not None:
+            reservation = Reservation.objects.select_related('id_ticket__id_evenement').filter(
+                id_reservation=data['id_reservation'], id_utilisateur=utilisateur
+            ).first()
+            if reservation is None:
+                raise serializers.ValidationError({'id_reservation': 'Réservation introuvable.'})
+            if reservation.statut != Reservation.ACTIVE or reservation.date_expiration <= timezone.now():
+                raise serializers.ValidationError({'id_reservation': 'Réservation expirée ou déjà utilisée.'})
+            data['id_ticket'] = reservation.id_ticket
+            data['quantite'] = reservation.quantite
+        elif 'id_ticket' not in data:
+            raise serializers.ValidationError({'id_ticket': 'Ce champ est obligatoire.'})
+        
+        ticket = data['id_ticket']
+        quantite = data.get('quantite', 1)
+        if ticket.id_evenement.est_annule:
+            raise serializers.ValidationError({'id_ticket': EVENEMENT_ANNULE})
+        
+        # Vérifier le stock disponible (places déjà réservées sinon)
+        stock = ticket.stock_disponible
+        if data.get('id_reservation') is None and stock < quantite:
             raise serializers.ValidationError({
-                'quantite': f'Stock insuffisant. Seulement {ticket.stock} ticket(s) disponible(s).'
+                'quantite': f'Stock insuffisant. Seulement {stock} ticket(s) disponible(s).'
             })
         
         # Vérifier que l'utilisateur a assez de solde
@@ -80,8 +113,6 @@ class AchatCreateSerializer(serializers.ModelSerializer):
     
     
     def create(self, validated_data):
-        from django.db import transaction
-        
         quantite = validated_data['quantite']
         ticket = validated_data['id_ticket']
         # Get user from JWT token context (SECURITY: prevents user ID manipulation)
@@ -91,20 +122,200 @@ class AchatCreateSerializer(serializers.ModelSerializer):
         montant_total = ticket.prix * quantite
         validated_data['montant_total'] = montant_total
         validated_data['id_utilisateur'] = utilisateur  # Set user from JWT token
+        id_reservation = validated_data.pop('id_reservation', None)
+        
+        base = validated_data.pop('url_base', '')  # serializer.save(url_base=...) : hôte des QR codes
         
-        # CRITICAL: Wrap in atomic transaction to prevent race conditions (Bug #1 fix)
-        with transaction.atomic():
-            achat = Achat.objects.create(**validated_data)
-            
-            # Déduire le montant du solde de l'utilisateur
-            utilisateur.solde -= montant_total
-            utilisateur.save()
-            
-            # Décrémenter le stock du ticket
-            ticket.stock -= quantite
-            ticket.save()
+        achat = self._acheter(ticket, utilisateur, quantite, montant_total, validated_data, id_reservation, base)
         
+        # Valeurs écrites par la base (la réponse affiche le stock et le solde à jour)
+        ticket.refresh_from_db(fields=['stock', 'nombre_fractions', 'date_modification'])
+        utilisateur.refresh_from_db(fields=['solde'])
         return achat
+    
+    @staticmethod
+    @avec_reprises
+    def _acheter(ticket, utilisateur, quantite, montant_total, validated_data, id_reservation=None, base=''):
+        """
+        Stock (ou réservation) puis solde, chacun par un UPDATE conditionnel : validate()
+        n'a fait qu'une lecture, seule la base tranche entre des achats simultanés. Un refus
+        annule la transaction entière (le stock retiré est rendu, la réservation reste active).
+        """
+        if id_reservation is not None:
+            if convertir(id_reservation, utilisateur) is None:
+                raise serializers.ValidationError({
+                    'id_reservation': 'Réservation expirée ou déjà utilisée.'
+                })
+        elif not decrementer_stock(ticket, quantite):
+            raise serializers.ValidationError({
+                'quantite': 'Stock insuffisant. Les derniers tickets viennent d\'être vendus.'
+            })
+        if not debiter_solde(utilisateur.pk, montant_total):
+            raise serializers.ValidationError({
+                'solde': f'Solde insuffisant. Nécessaire: {montant_total}'
+            })
+        achat = Achat.objects.create(**validated_data)
+        planifier([achat], base)  # image QR rendue par le worker (voir utils/taches_qr.py)
+        frequentation.vendre([achat])
+        return achat
+
+
+class LignePanierSerializer(serializers.Serializer):
+    id_ticket = serializers.IntegerField()
+    quantite = serializers.IntegerField(min_value=1, default=1)
+    session = serializers.IntegerField(required=False, allow_null=True)
+
+
+class PanierSerializer(serializers.Serializer):
+    """
+    Achat de plusieurs lignes (ticket, quantité, session) en une transaction : tickets et
+    sessions lus en une requête chacun, stock retiré ticket par ticket dans l'ordre des ids
+    (ordre de verrouillage stable), solde débité une seule fois, achats et rendus QR créés
+    par bulk_create.
+    Tout ou rien : une ligne refusée annule le panier entier.
+    """
+    lignes = LignePanierSerializer(many=True)
+    
+    def validate_lignes(self, lignes):
+        if not lignes:
+            raise serializers.ValidationError('Le panier est vide.')
+        if len(lignes) > 20:
+            raise serializers.ValidationError('20 lignes au maximum par panier.')
+        return lignes
+    
+    def validate(self, data):
+        utilisateur = self.context['request'].user
+        if utilisateur.statut != 'actif':
+            raise serializers.ValidationError({
+                'utilisateur': "Votre compte est inactif. Veuillez contacter l'administrateur."
+            })
+        
+        lignes = data['lignes']
+        tickets = Ticket.objects.avec_stock().select_related('id_evenement').in_bulk({ligne['id_ticket'] for ligne in lignes})
+        sessions = Session.objects.in_bulk({ligne['session'] for ligne in lignes if ligne.get('session')})
+        erreurs = {}
+        quantites = defaultdict(int)
+        for i, ligne in enumerate(lignes):
+            ticket = tickets.get(ligne['id_ticket'])
+            if ticket is None:
+                erreurs[i] = "Le ticket spécifié n'existe pas."
+                continue
+            if ticket.id_evenement.est_annule:
+                erreurs[i] = EVENEMENT_ANNULE
+                continue
+            if ligne.get('session'):
+                session = sessions.get(ligne['session'])
+                if session is None or session.evenement_id != ticket.id_evenement_id:
+                    erreurs[i] = "Cette session n'appartient pas à l'événement du ticket."
+                    continue
+                if session.est_annule:
+                    erreurs[i] = SESSION_ANNULEE
+                    continue
+                ligne['session'] = session
+            ligne['id_ticket'] = ticket
+            quantites[ticket.pk] += ligne['quantite']
+        if erreurs:
+            raise serializers.ValidationError({'lignes': erreurs})
+        
+        for id_ticket, quantite in quantites.items():
+            stock = tickets[id_ticket].stock_disponible
+            if stock < quantite:
+                raise serializers.ValidationError({
+                    'lignes': f'Stock insuffisant pour {tickets[id_ticket]}. Seulement {stock} ticket(s) disponible(s).'
+                })
+        montant_total = sum(ligne['id_ticket'].prix * ligne['quantite'] for ligne in lignes)
+        if utilisateur.solde < montant_total:
+            raise serializers.ValidationError({
+                'solde': f'Solde insuffisant. Nécessaire: {montant_total}, Disponible: {utilisateur.solde}'
+            })
+        data['montant_total'] = montant_total
+        return data
+    
+    def create(self, validated_data):
+        utilisateur = self.context['request'].user
+        achats = self._acheter(
+            utilisateur, validated_data['lignes'], validated_data['montant_total'], validated_data.get('url_base', '')
+        )
+        utilisateur.refresh_from_db(fields=['solde'])
+        return achats
+    
+    @staticmethod
+    @avec_reprises
+    def _acheter(utilisateur, lignes, montant_total, base=''):
+        quantites = defaultdict(int)
+        tickets = {}
+        for ligne in lignes:
+            quantites[ligne['id_ticket'].pk] += ligne['quantite']
+            tickets[ligne['id_ticket'].pk] = ligne['id_ticket']
+        # Sessions verrouillées d'abord : une annulation de session simultanée attend la fin
+        # de l'achat (recensé par son worker) ou l'a précédé (session relue annulée)
+        sessions = {ligne['session'].pk for ligne in lignes if ligne.get('session')}
+        if sessions and len(Session.objects.select_for_update().filter(
+            pk__in=sessions, est_annule=False
+        ).order_by('pk').values_list('pk', flat=True)) < len(sessions):
+            raise serializers.ValidationError({'lignes': SESSION_ANNULEE})
+        # Ticket puis utilisateur, tickets par id croissant : deux paniers ne s'interbloquent pas
+        for id_ticket in sorted(quantites):
+            if not decrementer_stock(tickets[id_ticket], quantites[id_ticket]):
+                raise serializers.ValidationError({
+                    'lignes': f'Stock insuffisant pour {tickets[id_ticket]}. Les derniers tickets viennent d\'être vendus.'
+                })
+        if not debiter_solde(utilisateur.pk, montant_total):
+            raise serializers.ValidationError({
+                'solde': f'Solde insuffisant. Nécessaire: {montant_total}'
+            })
+        achats = Achat.objects.bulk_create([
+            Achat(
+                id_utilisateur=utilisateur,
+                id_ticket=ligne['id_ticket'],
+                session=ligne.get('session'),
+                quantite=ligne['quantite'],
+                montant_total=ligne['id_ticket'].prix * ligne['quantite'],
+                code_qr=str(uuid.uuid4()),
+            )
+            for ligne in lignes
+        ])
+        planifier(achats, base)
+        frequentation.vendre(achats)
+        return achats
+
+
+class PassageSerializer(serializers.Serializer):
+    """Passage d'un billet à une porte, tel que synchronisé par un scanner"""
+    code_qr = serializers.CharField(max_length=255)
+    scanned_at = serializers.DateTimeField(required=False)
+    gate_id = serializers.CharField(max_length=50)
+    
+    def validate(self, data):
+        maintenant = timezone.now()
+        data.setdefault('scanned_at', maintenant)
+        if data['scanned_at'] > maintenant + timedelta(minutes=5):
+            raise serializers.ValidationError({'scanned_at': "L'heure de scan est dans le futur."})
+        return data
+
+
+class ValidationLotSerializer(serializers.Serializer):
+    """
+    Lot de passages d'un scanner (voir utils/validation.py). Un passage mal formé n'annule
+    pas le lot : il reçoit le résultat 'invalide', les autres sont appliqués.
+    """
+    id_evenement = serializers.IntegerField(required=False)
+    passages = serializers.ListField(child=serializers.JSONField(), allow_empty=False, max_length=LOT_MAX)
+    
+    def create(self, validated_data):
+        passages, invalides = [], {}
+        for i, brut in enumerate(validated_data['passages']):
+            passage = PassageSerializer(data=brut)
+            if passage.is_valid():
+                passages.append(passage.validated_data)
+            else:
+                invalides[i] = {
+                    'code_qr': brut.get('code_qr') if isinstance(brut, dict) else None,
+                    'statut': 'invalide',
+                    'erreurs': passage.errors,
+                }
+        resultats = iter(valider_lot(passages, validated_data.get('id_evenement')))
+        return [invalides[i] if i in invalides else next(resultats) for i in range(len(validated_data['passages']))]
 
 
 class AchatListSerializer(serializers.ModelSerializer):
@@ -124,13 +335,8 @@ class AchatListSerializer(serializers.ModelSerializer):
     qr_code_url = serializers.SerializerMethodField()
     
     def get_qr_code_url(self, obj):
-        """Retourner l'URL absolue du QR code"""
-        request = self.context.get('request')
-        if obj.qr_image and request:
-            return request.build_absolute_uri(obj.qr_image.url)
-        elif obj.qr_image:
-            return obj.qr_image.url
-        return None
+        """Retourner l'URL absolue du QR code (image rendue ou en cours de rendu)"""
+        return get_qr_url(obj, self.context.get('request'))
     
     class Meta:
         model = Achat
@@ -170,13 +376,8 @@ class AchatDetailSerializer(serializers.ModelSerializer):
         return EvenementListSerializer(obj.id_ticket.id_evenement).data
     
     def get_qr_code_url(self, obj):
-        """Retourner l'URL absolue du QR code"""
-        request = self.context.get('request')
-        if obj.qr_image and request:
-            return request.build_absolute_uri(obj.qr_image.url)
-        elif obj.qr_image:
-            return obj.qr_image.url
-        return None
+        """Retourner l'URL absolue du QR code (image rendue ou en cours de rendu)"""
+        return get_qr_url(obj, self.context.get('request'))
     
     class Meta:
         model = Achat
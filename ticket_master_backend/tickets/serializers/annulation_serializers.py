@@ -0,0 +1,33 @@
+from rest_framework import serializers
+from ..models.annulation import Annulation
+from ..models.session import Session
+
+
+class AnnulationSerializer(serializers.ModelSerializer):
+    """Annulation d'un événement et progression de ses remboursements"""
+    progression = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Annulation
+        fields = [
+            'id_annulation', 'evenement', 'session', 'motif', 'statut', 'achats_total',
+            'achats_rembourses', 'montant_rembourse', 'progression', 'date_creation', 'date_fin'
+        ]
+        read_only_fields = fields
+    
+    def get_progression(self, obj):
+        """Pourcentage des achats remboursés (100 une fois terminée)"""
+        if obj.statut == Annulation.TERMINEE or not obj.achats_total:
+            return 100 if obj.statut == Annulation.TERMINEE else 0
+        return min(99, obj.achats_rembourses * 100 // obj.achats_total)
+
+
+class AnnulationCreateSerializer(serializers.Serializer):
+    """Annulation de tout l'événement, ou d'une seule de ses sessions (`session`)"""
+    session = serializers.PrimaryKeyRelatedField(queryset=Session.objects.all(), required=False, allow_null=True)
+    motif = serializers.CharField(max_length=255, required=False, allow_blank=True, default='')
+    
+    def validate_session(self, session):
+        if session is not None and session.evenement_id != self.context['evenement'].id_evenement:
+            raise serializers.ValidationError("Cette session n'appartient pas à l'événement.")
+        return session
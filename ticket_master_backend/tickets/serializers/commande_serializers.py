@@ -0,0 +1,53 @@
+from rest_framework import serializers
+from ..models.commande import Commande
+from ..models.ticket import Ticket
+from ..utils.annulations import EVENEMENT_ANNULE
+from .achat_serializers import AchatListSerializer
+
+
+class CommandeSerializer(serializers.ModelSerializer):
+    """Commande asynchrone de l'utilisateur, avec l'achat créé une fois acceptée"""
+    achat = AchatListSerializer(source='id_achat', read_only=True)
+    
+    class Meta:
+        model = Commande
+        fields = [
+            'id_commande', 'id_ticket', 'quantite', 'statut', 'motif', 'date_creation', 'date_traitement',
+            'id_achat', 'achat'
+        ]
+        read_only_fields = fields
+
+
+class CommandeCreateSerializer(serializers.ModelSerializer):
+    """
+    Mise en file d'un achat - validation sans requête supplémentaire (le ticket est lu par
+    la validation du champ) : stock et solde sont vérifiés pour de bon par le worker.
+    """
+    class Meta:
+        model = Commande
+        fields = ['id_ticket', 'quantite']
+        extra_kwargs = {
+            'id_ticket': {'queryset': Ticket.objects.select_related('id_evenement')},
+            'quantite': {'min_value': 1, 'default': 1}
+        }
+    
+    def validate(self, data):
+        utilisateur = self.context['request'].user
+        if utilisateur.statut != 'actif':
+            raise serializers.ValidationError({
+                'utilisateur': "Votre compte est inactif. Veuillez contacter l'administrateur."
+            })
+        ticket = data['id_ticket']
+        quantite = data.get('quantite', 1)
+        if ticket.id_evenement.est_annule:
+            raise serializers.ValidationError({'id_ticket': EVENEMENT_ANNULE})
+        # Refus immédiats évidents : inutile d'encombrer la file après l'épuisement du stock
+        if not ticket.nombre_fractions and ticket.stock < quantite:
+            raise serializers.ValidationError({
+                'quantite': f'Stock insuffisant. Seulement {ticket.stock} ticket(s) disponible(s).'
+            })
+        if utilisateur.solde < ticket.prix * quantite:
+            raise serializers.ValidationError({
+                'solde': f'Solde insuffisant. Nécessaire: {ticket.prix * quantite}, Disponible: {utilisateur.solde}'
+            })
+        return data
@@ -1,7 +1,46 @@
 from rest_framework import serializers
 from datetime import date
+from decimal import Decimal
 from ..models.evenements import Evenement
+from ..models.favori import Favori
+from ..models.utilisateurs import Utilisateur
 from ..utils.geocoding import geocode_address
+from .session_serializers import SessionSerializer
+
+
+def get_favoris_ids(context):
+    """
+    Retourner l'ensemble des id_evenement favoris de l'utilisateur de la requête.
+    Le résultat est mémorisé dans le contexte du serializer : une seule requête
+    par sérialisation, quel que soit le nombre d'événements.
+    """
+    if 'favoris_ids' not in context:
+        request = context.get('request')
+        user = getattr(request, 'user', None)
+        # Seuls les utilisateurs (pas les administrateurs) ont des favoris
+        if isinstance(user, Utilisateur):
+            context['favoris_ids'] = set(
+                Favori.objects.filter(utilisateur=user).values_list('evenement_id', flat=True)
+            )
+        else:
+            context['favoris_ids'] = set()
+    return context['favoris_ids']
+
+
+def get_stock_disponible(obj):
+    """Stock total de l'événement, depuis l'annotation avec_catalogue() si présente"""
+    stock = getattr(obj, 'stock_disponible', None)
+    if stock is None:
+        stock = sum(ticket.stock_disponible for ticket in obj.ticket_set.all())
+    return stock
+
+
+def get_nombre_types_tickets(obj):
+    """Nombre de types de tickets, depuis l'annotation avec_catalogue() si présente"""
+    nombre = getattr(obj, 'nombre_types_tickets', None)
+    if nombre is None:
+        nombre = len(obj.ticket_set.all())
+    return nombre
 
 
 class EvenementSerializer(serializers.ModelSerializer):
@@ -16,24 +55,15 @@ class EvenementSerializer(serializers.ModelSerializer):
     
     def get_nombre_tickets(self, obj):
         """Retourner le nombre de tickets associés à cet événement"""
-        return obj.ticket_set.count()
+        return get_nombre_types_tickets(obj)
     
     def get_sessions(self, obj):
-        """Retourner toutes les sessions associées à cet événement"""
-        from .session_serializers import SessionSerializer
-        sessions = obj.sessions.all()
-        return SessionSerializer(sessions, many=True).data
+        """Retourner toutes les sessions associées à cet événement (préchargées si possible)"""
+        return SessionSerializer(obj.sessions.all(), many=True).data
     
     def get_is_favorite(self, obj):
         """Vérifier si l'utilisateur actuel a favorisé cet événement"""
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            from ..models.favori import Favori
-            from ..models.utilisateurs import Utilisateur
-            # Vérifier que c'est un utilisateur et non un administrateur
-            if isinstance(request.user, Utilisateur):
-                return Favori.objects.filter(utilisateur=request.user, evenement=obj).exists()
-        return False
+        return obj.id_evenement in get_favoris_ids(self.context)
     
     def validate_titre_evenement(self, value):
         """Validation du titre de l'événement"""
@@ -178,24 +208,26 @@ class EvenementListSerializer(serializers.ModelSerializer):
     
     def get_nombre_tickets_disponibles(self, obj):
         """Retourner le nombre total de tickets disponibles"""
-        return sum(ticket.stock for ticket in obj.ticket_set.all())
+        return get_stock_disponible(obj)
     
     def get_sessions(self, obj):
-        """Retourner toutes les sessions associées à cet événement"""
-        from .session_serializers import SessionSerializer
-        sessions = obj.sessions.all()
-        return SessionSerializer(sessions, many=True).data
+        """Retourner toutes les sessions associées à cet événement (préchargées si possible)"""
+        return SessionSerializer(obj.sessions.all(), many=True).data
     
     def get_is_favorite(self, obj):
         """Vérifier si l'utilisateur actuel a favorisé cet événement"""
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            from ..models.favori import Favori
-            from ..models.utilisateurs import Utilisateur
-            # Vérifier que c'est un utilisateur et non un administrateur
-            if isinstance(request.user, Utilisateur):
-                return Favori.objects.filter(utilisateur=request.user, evenement=obj).exists()
-        return False
+        return obj.id_evenement in get_favoris_ids(self.context)
+
+
+class EvenementProcheSerializer(EvenementListSerializer):
+    """Événement de liste avec sa distance à la position demandée (annotation distance_km)"""
+    distance_km = serializers.SerializerMethodField()
+    
+    class Meta(EvenementListSerializer.Meta):
+        fields = EvenementListSerializer.Meta.fields + ['distance_km']
+    
+    def get_distance_km(self, obj):
+        return round(obj.distance_km, 3)
 
 
 class EvenementDetailSerializer(serializers.ModelSerializer):
@@ -221,27 +253,59 @@ class EvenementDetailSerializer(serializers.ModelSerializer):
         return TicketListSerializer(tickets, many=True).data
     
     def get_sessions(self, obj):
-        """Retourner toutes les sessions associées à cet événement"""
-        from .session_serializers import SessionSerializer
-        sessions = obj.sessions.all()
-        return SessionSerializer(sessions, many=True).data
+        """Retourner toutes les sessions associées à cet événement (préchargées si possible)"""
+        return SessionSerializer(obj.sessions.all(), many=True).data
     
     def get_nombre_tickets_total(self, obj):
         """Retourner le nombre de types de tickets différents"""
-        return obj.ticket_set.count()
+        return get_nombre_types_tickets(obj)
     
     def get_stock_total(self, obj):
         """Retourner le stock total de tous les tickets"""
-        return sum(ticket.stock for ticket in obj.ticket_set.all())
+        return get_stock_disponible(obj)
     
     def get_is_favorite(self, obj):
         """Vérifier si l'utilisateur actuel a favorisé cet événement"""
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            from ..models.favori import Favori
-            from ..models.utilisateurs import Utilisateur
-            # Vérifier que c'est un utilisateur et non un administrateur
-            if isinstance(request.user, Utilisateur):
-                return Favori.objects.filter(utilisateur=request.user, evenement=obj).exists()
-        return False 
+        return obj.id_evenement in get_favoris_ids(self.context) 
+
 
+
+class EvenementSnapshotSerializer(serializers.ModelSerializer):
+    """
+    Snapshot d'un événement pour le tableau de bord admin : tickets, sessions et totaux de ventes.
+    Attend un queryset avec_catalogue() dont ticket_set est préchargé avec avec_ventes().
+    """
+    tickets = serializers.SerializerMethodField()
+    sessions = serializers.SerializerMethodField()
+    stock_total = serializers.SerializerMethodField()
+    quantite_vendue = serializers.SerializerMethodField()
+    quantite_validee = serializers.SerializerMethodField()
+    revenus_total = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Evenement
+        fields = [
+            'id_evenement', 'titre_evenement', 'date', 'lieu',
+            'image', 'type_evenement', 'latitude', 'longitude', 'heure_debut', 'heure_fin',
+            'tickets', 'sessions', 'stock_total', 'quantite_vendue', 'quantite_validee', 'revenus_total'
+        ]
+    
+    def get_tickets(self, obj):
+        from .ticket_serializers import TicketSnapshotSerializer
+        return TicketSnapshotSerializer(obj.ticket_set.all(), many=True).data
+    
+    def get_sessions(self, obj):
+        return SessionSerializer(obj.sessions.all(), many=True).data
+    
+    def get_stock_total(self, obj):
+        return get_stock_disponible(obj)
+    
+    def get_quantite_vendue(self, obj):
+        return sum(ticket.quantite_vendue for ticket in obj.ticket_set.all())
+    
+    def get_quantite_validee(self, obj):
+        return sum(ticket.quantite_validee for ticket in obj.ticket_set.all())
+    
+    def get_revenus_total(self, obj):
+        total = sum((ticket.revenus for ticket in obj.ticket_set.all()), Decimal('0.00'))
+        return f"{total:.2f}"
@@ -0,0 +1,50 @@
+from django.conf import settings
+from rest_framework import serializers
+from ..models.reservation import Reservation
+from ..models.ticket import Ticket
+from ..utils.annulations import EVENEMENT_ANNULE
+from .ticket_serializers import TicketListSerializer
+
+
+class ReservationSerializer(serializers.ModelSerializer):
+    """Réservation de l'utilisateur, avec le ticket réservé"""
+    ticket_details = TicketListSerializer(source='id_ticket', read_only=True)
+    montant_total = serializers.SerializerMethodField()
+    
+    def get_montant_total(self, obj):
+        return str(obj.id_ticket.prix * obj.quantite)
+    
+    class Meta:
+        model = Reservation
+        fields = [
+            'id_reservation', 'id_ticket', 'quantite', 'statut', 'date_creation', 'date_expiration',
+            'montant_total', 'ticket_details'
+        ]
+        read_only_fields = fields
+
+
+class ReservationCreateSerializer(serializers.ModelSerializer):
+    """
+    Création d'une réservation - L'utilisateur est défini depuis le JWT. Le nombre de
+    réservations actives et le solde sont vérifiés par reserver(), sous verrou.
+    """
+    class Meta:
+        model = Reservation
+        fields = ['id_ticket', 'quantite']
+        extra_kwargs = {
+            'id_ticket': {'queryset': Ticket.objects.select_related('id_evenement')},
+            'quantite': {'min_value': 1, 'default': 1}
+        }
+    
+    def validate(self, data):
+        if self.context['request'].user.statut != 'actif':
+            raise serializers.ValidationError({
+                'utilisateur': "Votre compte est inactif. Veuillez contacter l'administrateur."
+            })
+        if data['id_ticket'].id_evenement.est_annule:
+            raise serializers.ValidationError({'id_ticket': EVENEMENT_ANNULE})
+        if data.get('quantite', 1) > settings.RESERVATION_QUANTITE_MAX:
+            raise serializers.ValidationError({
+                'quantite': f'{settings.RESERVATION_QUANTITE_MAX} places au maximum par réservation.'
+            })
+        return data
@@ -0,0 +1,19 @@
+from django.conf import settings
+from rest_framework import serializers
+from ..models.session import Session
+
+
+class PrechauffageScanSerializer(serializers.Serializer):
+    """Préchauffage du cache des scans : tout l'événement, ou une seule session (`session`)"""
+    session = serializers.PrimaryKeyRelatedField(queryset=Session.objects.all(), required=False, allow_null=True)
+    duree = serializers.IntegerField(required=False, min_value=60, help_text='Secondes (au plus SCAN_CACHE_DUREE)')
+    
+    def validate_session(self, session):
+        if session is not None and session.evenement_id != self.context['evenement'].id_evenement:
+            raise serializers.ValidationError("Cette session n'appartient pas à l'événement.")
+        return session
+    
+    def validate_duree(self, duree):
+        if duree > settings.SCAN_CACHE_DUREE:
+            raise serializers.ValidationError(f'Au plus {settings.SCAN_CACHE_DUREE} secondes.')
+        return duree
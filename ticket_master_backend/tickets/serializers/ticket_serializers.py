@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from ..models.ticket import Ticket
 from ..models.evenements import Evenement
+from ..utils.inventaire import repartir_stock
 from .evenement_serializers import EvenementSerializer
 
 
@@ -13,6 +14,11 @@ class TicketSerializer(serializers.ModelSerializer):
         fields = ['id_ticket', 'type', 'prix', 'date_creation', 'stock', 'id_evenement', 'evenement_details']
         read_only_fields = ['id_ticket', 'date_creation']
     
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data['stock'] = instance.stock_disponible
+        return data
+    
     def validate_prix(self, value):
         if value <= 0:
             raise serializers.ValidationError("Le prix doit être supérieur à 0.")
@@ -54,12 +60,34 @@ class TicketUpdateSerializer(serializers.ModelSerializer):
             'prix': {'required': False},
             'stock': {'required': False},
         }
+    
+    def update(self, instance, validated_data):
+        # Ticket fractionné : le stock saisi est réparti sur les fractions
+        stock = validated_data.pop('stock', None) if instance.nombre_fractions else None
+        instance = super().update(instance, validated_data)
+        if stock is not None:
+            repartir_stock(instance, instance.nombre_fractions, stock=stock)
+            instance.refresh_from_db()
+        return instance
 
 
 class TicketListSerializer(serializers.ModelSerializer):
     """Serializer simplifié pour lister les tickets"""
     evenement_nom = serializers.CharField(source='id_evenement.titre_evenement', read_only=True)
+    stock = serializers.IntegerField(source='stock_disponible', read_only=True)
+    
+    class Meta:
+        model = Ticket
+        fields = ['id_ticket', 'type', 'prix', 'stock', 'date_creation', 'evenement_nom','id_evenement']
+
+
+class TicketSnapshotSerializer(serializers.ModelSerializer):
+    """Ticket avec ses ventes, pour le snapshot du tableau de bord (queryset avec_ventes())"""
+    quantite_vendue = serializers.IntegerField(read_only=True)
+    quantite_validee = serializers.IntegerField(read_only=True)
+    revenus = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+    stock = serializers.IntegerField(source='stock_disponible', read_only=True)
     
     class Meta:
         model = Ticket
-        fields = ['id_ticket', 'type', 'prix', 'stock', 'date_creation', 'evenement_nom','id_evenement']
\ No newline at end of file
+        fields = ['id_ticket', 'type', 'prix', 'stock', 'quantite_vendue', 'quantite_validee', 'revenus']
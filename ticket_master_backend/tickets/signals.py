@@ -0,0 +1,96 @@
+"""
+Invalidation du cache du catalogue (voir utils/cache_catalogue.py).
+
+Portées :
+- 'catalogue'      : listes d'événements (list, a_venir, passes)
+- 'evenement:<id>' : détail d'un événement
+- 'tickets'        : liste des tickets
+- 'ticket:<id>'    : détail d'un ticket (inclut son événement)
+- 'suggestions'    : autocomplétion (titres, types et dates des événements)
+- 'tuile:<z>:<x>:<y>' : clusters de carte d'une tuile (utils/clusters.py)
+
+Un achat supprimé (annulation) emporte aussi son image QR stockée, le cas échéant, et
+n'est plus admis aux portes par le cache des scans (utils/cache_scan.py).
+
+L'invalidation est différée après le commit : un worker qui reconstruirait la réponse
+entre le signal et le commit relirait sinon l'ancien état sous la nouvelle version.
+"""
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models.achat import Achat
+from .models.evenements import Evenement
+from .models.favori import Favori
+from .models.session import Session
+from .models.ticket import Ticket
+from .utils.cache_catalogue import invalider, invalider_favoris
+from .utils import cache_scan, file_attente
+from .utils.clusters import invalider_position
+
+
+def invalider_evenement(id_evenement):
+    """Invalider un événement et tout ce qui l'embarque (listes, détails de ses tickets)"""
+    transaction.on_commit(lambda: _invalider_evenement(id_evenement))
+
+
+def _invalider_evenement(id_evenement):
+    ids_tickets = Ticket.objects.filter(id_evenement_id=id_evenement).values_list('id_ticket', flat=True)
+    invalider(
+        'catalogue',
+        'tickets',
+        f'evenement:{id_evenement}',
+        *[f'ticket:{id_ticket}' for id_ticket in ids_tickets],
+    )
+
+
+def invalider_ticket(id_ticket, id_evenement):
+    """Invalider un ticket : stock et prix apparaissent dans les listes et le détail de l'événement"""
+    transaction.on_commit(
+        lambda: invalider('catalogue', 'tickets', f'evenement:{id_evenement}', f'ticket:{id_ticket}')
+    )
+
+
+@receiver([post_save, post_delete], sender=Evenement)
+def evenement_modifie(sender, instance, **kwargs):
+    invalider_evenement(instance.id_evenement)
+    # Tuiles de l'ancienne position (si l'événement a bougé) et de la nouvelle
+    positions = {getattr(instance, '_position_chargee', (None, None)), (instance.latitude, instance.longitude)}
+    instance._position_chargee = (instance.latitude, instance.longitude)
+
+    def invalider_recherche_et_carte():
+        invalider('suggestions')
+        for latitude, longitude in positions:
+            invalider_position(latitude, longitude)
+
+    transaction.on_commit(invalider_recherche_et_carte)
+
+
+@receiver([post_save, post_delete], sender=Ticket)
+def ticket_modifie(sender, instance, **kwargs):
+    invalider_ticket(instance.id_ticket, instance.id_evenement_id)
+    if kwargs.get('created'):
+        # Nouveau ticket d'un événement en salle d'attente : protégé lui aussi
+        id_ticket, id_evenement = instance.id_ticket, instance.id_evenement_id
+        transaction.on_commit(lambda: file_attente.ajouter_ticket(id_evenement, id_ticket))
+
+
+@receiver([post_save, post_delete], sender=Session)
+def session_modifiee(sender, instance, **kwargs):
+    invalider_evenement(instance.evenement_id)
+
+
+@receiver([post_save, post_delete], sender=Favori)
+def favori_modifie(sender, instance, **kwargs):
+    id_utilisateur = instance.utilisateur_id
+    transaction.on_commit(lambda: invalider_favoris(id_utilisateur))
+
+
+@receiver(post_delete, sender=Achat)
+def achat_supprime(sender, instance, **kwargs):
+    if instance.qr_image:
+        storage, nom = instance.qr_image.storage, instance.qr_image.name
+        transaction.on_commit(lambda: storage.delete(nom))
+    if instance.code_qr:
+        code_qr = instance.code_qr
+        transaction.on_commit(lambda: cache_scan.annuler_billet(code_qr))
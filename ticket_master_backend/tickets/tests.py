@@ -1,3 +1,1733 @@
-from django.test import TestCase
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+import json
+import tempfile
+import sys
+import threading
+from types import SimpleNamespace
+from unittest.mock import patch
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from .models import (
+    Achat, Administrateur, Annulation, CleIdempotence, Commande, Evenement, Favori, FractionStock, Reservation, Session, TacheQR,
+    Ticket, Utilisateur,
+)
+from .models.transaction import Transaction
+from .serializers import AchatCreateSerializer, PanierSerializer
+from .utils.annulations import _traiter_lot as traiter_lot_annulation, annuler, traiter_annulations
+from .utils.authentication import generate_jwt_token
+from .utils import cache_scan, file_attente, frequentation
+from .utils.cache_qr import CacheDisque, CacheMemoire
+from .utils.commandes import traiter_commandes
+from .utils.geo import haversine_km
+from .utils.inventaire import decrementer_stock, repartir_stock
+from .utils.jeton_qr import JetonInvalide, extraire_jeton, signer, verifier
+from .utils.qr_generator import contenu_qr
+from .utils.reservations import liberer_expirees
+from .utils.taches_qr import rattraper, traiter_taches
+from .utils.validation import valider_billet, valider_lot
+
+
+def creer_evenements(nombre, decalage_jours=10):
+    """Créer des événements avec deux types de tickets et deux sessions chacun"""
+    evenements = []
+    for i in range(nombre):
+        evenement = Evenement.objects.create(
+            titre_evenement=f'Concert {i}',
+            date=date.today() + timedelta(days=decalage_jours + i),
+            lieu='Lomé',
+            type_evenement='Concert',
+        )
+        Ticket.objects.create(type='Standard', prix=Decimal('5000'), stock=100, id_evenement=evenement)
+        Ticket.objects.create(type='VIP', prix=Decimal('15000'), stock=20, id_evenement=evenement)
+        for heure in (18, 21):
+            Session.objects.create(
+                evenement=evenement,
+                date_heure=timezone.make_aware(datetime.combine(evenement.date, datetime.min.time()) + timedelta(hours=heure)),
+            )
+        evenements.append(evenement)
+    return evenements
+
+
+def auth_utilisateur(utilisateur):
+    """En-têtes d'authentification d'un utilisateur"""
+    token, _ = generate_jwt_token(utilisateur.id_utilisateur, utilisateur.email, 'user')
+    return {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+
+def creer_acheteur(solde='0', email='acheteur@example.com'):
+    """Créer un acheteur ; (utilisateur, en-têtes d'authentification)"""
+    utilisateur = Utilisateur.objects.create(
+        nom='Test', prenom='Acheteur', email=email, mot_de_passe='x', tel='000', solde=Decimal(solde),
+    )
+    return utilisateur, auth_utilisateur(utilisateur)
+
+
+def creer_admin():
+    """Créer un administrateur ; en-têtes d'authentification"""
+    admin = Administrateur.objects.create(nom='Admin', prenom='Root', email='admin@example.com', mot_de_passe='x', role='admin')
+    token, _ = generate_jwt_token(admin.id_admin, admin.email, 'admin')
+    return {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+
+def simuler_cache_partage(test):
+    """Un seul processus de test : son locmem tient lieu de cache partagé (ETags du catalogue)"""
+    partage = patch('tickets.utils.conditionnel.cache_partage', return_value=True)
+    partage.start()
+    test.addCleanup(partage.stop)
+
+
+@override_settings(CATALOGUE_CACHE_ENABLED=False)
+class CatalogueQueryBudgetTests(APITestCase):
+    """Les lectures du catalogue doivent coûter un nombre fixe de requêtes, quelle que soit la page"""
+
+    def setUp(self):
+        cache.clear()
+        simuler_cache_partage(self)
+        self.utilisateur, self.auth = creer_acheteur('100000')
+
+    def assert_budget_constant(self, url, budget, authentifie=True):
+        """Vérifier le budget avec une page partielle puis une page pleine"""
+        headers = self.auth if authentifie else {}
+        creer_evenements(2)
+        with self.assertNumQueries(budget):
+            response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 200)
+        creer_evenements(10, decalage_jours=30)
+        cache.clear()  # favoris des validateurs relus, comme au premier appel
+        with self.assertNumQueries(budget):
+            response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_list(self):
+        # auth + favoris des validateurs (mis en cache) + count + page + sessions + favoris
+        response = self.assert_budget_constant('/api/evenements/', 6)
+        premier = response.data['results'][0]
+        self.assertEqual(premier['nombre_tickets_disponibles'], 120)
+        self.assertEqual(len(premier['sessions']), 2)
+
+    def test_list_anonyme(self):
+        # count + page + sessions (validateurs lus dans le cache)
+        self.assert_budget_constant('/api/evenements/', 3, authentifie=False)
+
+    def test_a_venir(self):
+        # Pagination keyset : pas de COUNT(*)
+        response = self.assert_budget_constant('/api/evenements/a_venir/', 5)
+        self.assertEqual(len(response.data['results']), 10)
+        suite = self.client.get(response.data['next'], **self.auth)
+        self.assertEqual(len(suite.data['results']), 2)
+        self.assertIsNone(suite.data['next'])
+
+    def test_passes(self):
+        Evenement.objects.create(titre_evenement='Ancien', date=date.today() - timedelta(days=3), lieu='Kara', type_evenement='Expo')
+        # Aucune session à précharger quand aucun événement passé n'en a : budget identique
+        response = self.assert_budget_constant('/api/evenements/passes/', 5)
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_rechercher(self):
+        response = self.assert_budget_constant('/api/evenements/rechercher/?q=concert', 5)
+        self.assertEqual(response.data['query'], 'concert')
+
+    def test_retrieve(self):
+        evenement = creer_evenements(1)[0]
+        Favori.objects.create(utilisateur=self.utilisateur, evenement=evenement)
+        # auth + favoris des validateurs (mis en cache) + événement + sessions + tickets + favoris
+        with self.assertNumQueries(6):
+            response = self.client.get(f'/api/evenements/{evenement.id_evenement}/', **self.auth)
+        self.assertEqual(response.data['stock_total'], 120)
+        self.assertEqual(response.data['nombre_tickets_total'], 2)
+        self.assertEqual(len(response.data['tickets']), 2)
+        self.assertTrue(response.data['is_favorite'])
+
+    def test_tickets_list(self):
+        # count + page (événement joint)
+        self.assert_budget_constant('/api/tickets/', 2, authentifie=False)
+
+
+class SnapshotTests(APITestCase):
+
+    def setUp(self):
+        self.auth = creer_admin()
+        self.utilisateur, _ = creer_acheteur()
+
+    def test_snapshot_budget_et_totaux(self):
+        evenements = creer_evenements(8)
+        vip = evenements[0].ticket_set.get(type='VIP')
+        Achat.objects.create(id_utilisateur=self.utilisateur, id_ticket=vip, quantite=3, montant_total=Decimal('45000'), est_utilise=True)
+        Achat.objects.create(id_utilisateur=self.utilisateur, id_ticket=vip, quantite=1, montant_total=Decimal('15000'))
+        # auth + événements + sessions + tickets avec ventes
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/evenements/snapshot/', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 8)
+        snapshot = next(e for e in response.data['results'] if e['id_evenement'] == evenements[0].id_evenement)
+        self.assertEqual(snapshot['quantite_vendue'], 4)
+        self.assertEqual(snapshot['quantite_validee'], 3)
+        self.assertEqual(snapshot['revenus_total'], '60000.00')
+        self.assertEqual(len(snapshot['tickets']), 2)
+        self.assertEqual(len(snapshot['sessions']), 2)
+
+    def test_snapshot_filtres(self):
+        evenements = creer_evenements(5)
+        ids = f'{evenements[0].id_evenement},{evenements[1].id_evenement}'
+        response = self.client.get(f'/api/evenements/snapshot/?ids={ids}', **self.auth)
+        self.assertEqual(response.data['count'], 2)
+        debut = (date.today() + timedelta(days=12)).isoformat()
+        response = self.client.get(f'/api/evenements/snapshot/?date_debut={debut}', **self.auth)
+        self.assertEqual(response.data['count'], 3)
+        response = self.client.get('/api/evenements/snapshot/?ids=a,b', **self.auth)
+        self.assertEqual(response.status_code, 400)
+
+    def test_snapshot_reserve_aux_admins(self):
+        response = self.client.get('/api/evenements/snapshot/')
+        self.assertIn(response.status_code, (401, 403))
+
+
+class CatalogueCacheTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        simuler_cache_partage(self)
+        self.utilisateur, self.auth = creer_acheteur()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.evenement = creer_evenements(1)[0]
+
+    def test_hit_sans_requete(self):
+        self.assertEqual(self.client.get('/api/evenements/')['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/evenements/')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.data['results'][0]['nombre_tickets_disponibles'], 120)
+
+    def test_invalidation_sur_modification_du_stock(self):
+        url = f'/api/evenements/{self.evenement.id_evenement}/'
+        self.client.get(url)
+        self.client.get('/api/evenements/')
+        autre = self.client.get('/api/tickets/')
+        self.assertEqual(autre['X-Cache'], 'MISS')
+        with self.captureOnCommitCallbacks(execute=True):
+            Ticket.objects.filter(type='VIP').update(stock=0)
+            ticket = Ticket.objects.get(type='VIP')
+            ticket.save()
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['stock_total'], 100)
+        self.assertEqual(self.client.get('/api/evenements/')['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(f'/api/tickets/{ticket.id_ticket}/')['X-Cache'], 'MISS')
+
+    def test_invalidation_precise(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            autre = creer_evenements(1, decalage_jours=40)[0]
+        self.client.get(f'/api/evenements/{self.evenement.id_evenement}/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Session.objects.create(evenement=autre, date_heure=timezone.now() + timedelta(days=50))
+        response = self.client.get(f'/api/evenements/{self.evenement.id_evenement}/')
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+    def test_is_favorite_par_utilisateur(self):
+        self.client.get('/api/evenements/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Favori.objects.create(utilisateur=self.utilisateur, evenement=self.evenement)
+        response = self.client.get('/api/evenements/', **self.auth)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertTrue(response.data['results'][0]['is_favorite'])
+        # La version partagée reste anonyme
+        self.assertFalse(self.client.get('/api/evenements/').data['results'][0]['is_favorite'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Favori.objects.all().delete()
+        self.assertFalse(self.client.get('/api/evenements/', **self.auth).data['results'][0]['is_favorite'])
+
+
+@override_settings(CATALOGUE_CACHE_ENABLED=False)
+class ConditionalGetTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        simuler_cache_partage(self)
+        self.utilisateur, self.auth = creer_acheteur()
+        self.evenement = creer_evenements(3)[0]
+
+    def assert_revalidation(self, url, requetes=3, last_modified=True):
+        response = self.client.get(url, **self.auth)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('"'))
+        self.assertEqual('Last-Modified' in response, last_modified)
+        # auth + validateurs, aucune sérialisation
+        with self.assertNumQueries(requetes):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag, **self.auth)
+        self.assertEqual(response.status_code, 304)
+        return etag
+
+    def assert_revalidation_catalogue(self, url):
+        # Versions et favoris lus dans le cache : seule l'authentification touche la base
+        return self.assert_revalidation(url, requetes=1, last_modified=False)
+
+    def test_liste_et_detail(self):
+        for url in ('/api/evenements/', f'/api/evenements/{self.evenement.id_evenement}/',
+                    '/api/evenements/a_venir/'):
+            etag = self.assert_revalidation_catalogue(url)
+            ticket = self.evenement.ticket_set.first()
+            ticket.stock -= 1
+            with self.captureOnCommitCallbacks(execute=True):
+                ticket.save()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag, **self.auth)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_achat_change_etag(self):
+        url = f'/api/evenements/{self.evenement.id_evenement}/'
+        etag = self.assert_revalidation_catalogue(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            decrementer_stock(self.evenement.ticket_set.first(), 1)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag, **self.auth).status_code, 200)
+
+    def test_cache_par_processus(self):
+        url = f'/api/evenements/{self.evenement.id_evenement}/'
+        with patch('tickets.utils.conditionnel.cache_partage', return_value=False):
+            # auth + agrégats des événements + favoris ; Last-Modified envoyé
+            etag = self.assert_revalidation(url)
+            # Vente d'un autre processus : les versions de ce locmem n'avancent pas, l'ETag si
+            decrementer_stock(self.evenement.ticket_set.first(), 1)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag, **self.auth).status_code, 200)
+
+    def test_favori_change_etag_liste(self):
+        etag = self.assert_revalidation_catalogue('/api/evenements/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Favori.objects.create(utilisateur=self.utilisateur, evenement=self.evenement)
+        response = self.client.get('/api/evenements/', HTTP_IF_NONE_MATCH=etag, **self.auth)
+        self.assertEqual(response.status_code, 200)
+
+    def test_suppression_change_etag(self):
+        etag = self.assert_revalidation_catalogue('/api/evenements/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.evenement.sessions.first().delete()
+        response = self.client.get('/api/evenements/', HTTP_IF_NONE_MATCH=etag, **self.auth)
+        self.assertEqual(response.status_code, 200)
+
+    def test_achats_par_utilisateur(self):
+        ticket = self.evenement.ticket_set.first()
+        achat = Achat.objects.create(id_utilisateur=self.utilisateur, id_ticket=ticket, quantite=1, montant_total=ticket.prix)
+        url = f'/api/achats/par_utilisateur/?id_utilisateur={self.utilisateur.id_utilisateur}'
+        etag = self.assert_revalidation(url)
+        achat.est_utilise = True
+        achat.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag, **self.auth).status_code, 200)
+
+    def test_favoris(self):
+        Favori.objects.create(utilisateur=self.utilisateur, evenement=self.evenement)
+        etag = self.assert_revalidation('/api/favorites/', requetes=2)
+        self.client.post('/api/favorites/toggle/', {'id_evenement': self.evenement.id_evenement}, **self.auth)
+        self.assertEqual(self.client.get('/api/favorites/', HTTP_IF_NONE_MATCH=etag, **self.auth).status_code, 200)
+
+
+class KeysetPaginationTests(APITestCase):
+
+    def setUp(self):
+        self.utilisateur, self.auth = creer_acheteur()
+        ticket = creer_evenements(1)[0].ticket_set.first()
+        # Dates identiques par paquets : l'id départage les égalités
+        instant = timezone.now()
+        achats = [
+            Achat.objects.create(id_utilisateur=self.utilisateur, id_ticket=ticket, quantite=1, montant_total=ticket.prix)
+            for _ in range(25)
+        ]
+        for i, achat in enumerate(achats):
+            Achat.objects.filter(pk=achat.pk).update(date_achat=instant - timedelta(minutes=i // 4))
+        self.ids = [a.id_achat for a in sorted(achats, key=lambda a: a.id_achat)]
+
+    def parcourir(self, url):
+        ids, pages = [], 0
+        while url:
+            response = self.client.get(url, **self.auth)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            ids += [a['id_achat'] for a in response.data['results']]
+            url = response.data['next']
+            pages += 1
+        return ids, pages
+
+    def test_parcours_complet_sans_doublon(self):
+        ids, pages = self.parcourir('/api/achats/?page_size=10')
+        self.assertEqual(pages, 3)
+        self.assertEqual(sorted(ids), self.ids)
+        self.assertEqual(len(set(ids)), 25)
+
+    def test_precedent(self):
+        premiere = self.client.get('/api/achats/?page_size=10', **self.auth).data
+        self.assertIsNone(premiere['previous'])
+        seconde = self.client.get(premiere['next'], **self.auth).data
+        retour = self.client.get(seconde['previous'], **self.auth).data
+        self.assertEqual(
+            [a['id_achat'] for a in retour['results']],
+            [a['id_achat'] for a in premiere['results']],
+        )
+
+    def test_action_par_utilisateur(self):
+        url = f'/api/achats/par_utilisateur/?id_utilisateur={self.utilisateur.id_utilisateur}&page_size=10'
+        response = self.client.get(url, **self.auth)
+        self.assertEqual(response.data['utilisateur'], 'Acheteur Test')
+        self.assertEqual(len(response.data['achats']), 10)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_mode_page_opt_in(self):
+        response = self.client.get('/api/achats/?page=2', **self.auth)
+        self.assertEqual(response.data['count'], 25)
+        self.assertEqual(len(response.data['results']), 10)
+
+    def test_curseur_invalide(self):
+        response = self.client.get('/api/achats/?cursor=pas-un-curseur', **self.auth)
+        self.assertEqual(response.status_code, 404)
+
+    def test_actions_paginees(self):
+        evenement = Evenement.objects.get()
+        for url, cle in (
+            (f'/api/achats/par_evenement/?id_evenement={evenement.id_evenement}', 'achats'),
+            ('/api/achats/recents/', 'achats'),
+            ('/api/transactions/historique/', 'transactions'),
+            ('/api/transactions/', 'results'),
+            ('/api/utilisateurs/', 'results'),
+            ('/api/favorites/list_by_user/', 'results'),
+        ):
+            response = self.client.get(url, **self.auth)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertIn(cle, response.data)
+            self.assertIn('next', response.data)
+
+
+@override_settings(CATALOGUE_CACHE_ENABLED=False)
+class RechercheTests(APITestCase):
+    """Recherche plein texte : accents, classement, index tenu à jour par la base"""
+
+    def setUp(self):
+        self.titre = Evenement.objects.create(
+            titre_evenement='Festival de Lomé', date=date.today(), lieu='Kara', type_evenement='Festival',
+        )
+        self.lieu = Evenement.objects.create(
+            titre_evenement='Soirée jazz', date=date.today(), lieu='Lomé', type_evenement='Concert',
+        )
+        Evenement.objects.create(
+            titre_evenement='Théâtre classique', date=date.today(), lieu='Kpalimé', type_evenement='Théâtre',
+        )
+
+    def rechercher(self, q):
+        response = self.client.get('/api/evenements/rechercher/', {'q': q})
+        self.assertEqual(response.status_code, 200)
+        return [e['id_evenement'] for e in response.data['results']]
+
+    def test_insensible_aux_accents_et_classee(self):
+        # Le titre pèse plus que le lieu
+        self.assertEqual(self.rechercher('lome'), [self.titre.id_evenement, self.lieu.id_evenement])
+        self.assertEqual(self.rechercher('LOMÉ'), [self.titre.id_evenement, self.lieu.id_evenement])
+        self.assertEqual(len(self.rechercher('theatre')), 1)
+
+    def test_prefixe_et_tous_les_mots(self):
+        self.assertEqual(self.rechercher('soir jaz'), [self.lieu.id_evenement])
+        self.assertEqual(self.rechercher('jazz kara'), [])
+        self.assertEqual(self.rechercher('"*) OR ('), [])
+
+    def test_index_incremental(self):
+        self.lieu.titre_evenement = 'Nuit du blues'
+        self.lieu.save()
+        Evenement.objects.filter(pk=self.titre.pk).update(titre_evenement='Marché artisanal')
+        self.assertEqual(self.rechercher('blues'), [self.lieu.id_evenement])
+        self.assertEqual(self.rechercher('jazz'), [])
+        self.assertEqual(self.rechercher('artisanal'), [self.titre.id_evenement])
+        self.titre.delete()
+        self.assertEqual(self.rechercher('artisanal'), [])
+
+
+class SuggestTests(APITestCase):
+    """Autocomplétion : préfixes sans accents, une faute tolérée, réponse minimale et en cache"""
+
+    def setUp(self):
+        cache.clear()
+        # Reconstruction du trie dans le thread de la requête : le test voit ses propres données
+        patcher = patch('tickets.utils.suggestions._lancer', side_effect=lambda reconstruction: reconstruction())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.festival = Evenement.objects.create(
+            titre_evenement='Festival de Lomé', date=date.today(), lieu='Kara', type_evenement='Festival',
+        )
+        self.jazz = Evenement.objects.create(
+            titre_evenement='Soirée jazz', date=date.today(), lieu='Lomé', type_evenement='Concert',
+        )
+        Evenement.objects.create(
+            titre_evenement='Théâtre classique', date=date.today(), lieu='Kpalimé', type_evenement='Théâtre',
+        )
+
+    def suggerer(self, q):
+        response = self.client.get('/api/evenements/suggest/', {'q': q})
+        self.assertEqual(response.status_code, 200)
+        return [s['titre_evenement'] for s in response.data['suggestions']]
+
+    def test_prefixes_sans_accents(self):
+        self.assertEqual(self.suggerer('lom'), ['Festival de Lomé'])
+        self.assertEqual(self.suggerer('THEAT'), ['Théâtre classique'])
+        self.assertEqual(self.suggerer('soiree ja'), ['Soirée jazz'])
+        self.assertEqual(self.suggerer('soiree lome'), [])
+        self.assertEqual(self.suggerer('f'), [])
+
+    def test_faute_de_frappe(self):
+        self.assertEqual(self.suggerer('festivl'), ['Festival de Lomé'])
+        self.assertEqual(self.suggerer('jazs'), ['Soirée jazz'])
+
+    def test_reponse_minimale_et_en_cache(self):
+        response = self.client.get('/api/evenements/suggest/?q=jazz')
+        self.assertEqual(response.data['suggestions'], [
+            {'id_evenement': self.jazz.id_evenement, 'titre_evenement': 'Soirée jazz', 'type_evenement': 'Concert'},
+        ])
+        self.assertIn('max-age=60', response['Cache-Control'])
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/evenements/suggest/?q=jazz')
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+    def test_index_reconstruit_apres_modification(self):
+        self.assertEqual(self.suggerer('blues'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.jazz.titre_evenement = 'Nuit du blues'
+            self.jazz.save()
+        self.assertEqual(self.suggerer('blues'), ['Nuit du blues'])
+        self.assertEqual(self.suggerer('jazz'), [])
+
+    @override_settings(CATALOGUE_CACHE_ENABLED=False)
+    def test_ancien_index_pendant_la_reconstruction(self):
+        self.assertEqual(self.suggerer('jazz'), ['Soirée jazz'])
+        reconstructions = []
+        with patch('tickets.utils.suggestions._lancer', side_effect=reconstructions.append):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.jazz.titre_evenement = 'Nuit du blues'
+                self.jazz.save()
+            # Reconstruction lancée une seule fois, l'ancien index répond sans attendre
+            self.assertEqual(self.suggerer('jazz'), ['Soirée jazz'])
+            self.assertEqual(self.suggerer('blues'), [])
+            self.assertEqual(len(reconstructions), 1)
+            reconstructions[0]()
+        self.assertEqual(self.suggerer('blues'), ['Nuit du blues'])
+
+
+@override_settings(CATALOGUE_CACHE_ENABLED=False)
+class ProchesTests(APITestCase):
+    """Événements proches : boîte englobante puis distance exacte, triés et paginés"""
+
+    def creer(self, titre, lat, lon, decalage_jours=10, type_evenement='Concert'):
+        return Evenement.objects.create(
+            titre_evenement=titre, date=date.today() + timedelta(days=decalage_jours), lieu=titre,
+            type_evenement=type_evenement, latitude=lat, longitude=lon,
+        )
+
+    def setUp(self):
+        self.lome = self.creer('Lomé', 6.1319, 1.2228)
+        self.kpalime = self.creer('Kpalimé', 6.9000, 0.6333, decalage_jours=40, type_evenement='Festival')
+        self.kara = self.creer('Kara', 9.5511, 1.1861)
+        Evenement.objects.create(titre_evenement='Sans coordonnées', date=date.today(), lieu='?', type_evenement='Concert')
+
+    def proches(self, **params):
+        return self.client.get('/api/evenements/proches/', {'lat': 6.1375, 'lon': 1.2123, **params})
+
+    def test_tries_par_distance(self):
+        response = self.proches(rayon_km=150)
+        self.assertEqual(response.status_code, 200)
+        resultats = response.data['results']
+        self.assertEqual([e['id_evenement'] for e in resultats], [self.lome.id_evenement, self.kpalime.id_evenement])
+        self.assertEqual(response.data['count'], 2)
+        self.assertAlmostEqual(resultats[1]['distance_km'], haversine_km(6.1375, 1.2123, 6.9, 0.6333), places=2)
+        self.assertLess(resultats[0]['distance_km'], 2)
+
+    def test_filtres_type_et_dates(self):
+        ids = lambda r: [e['id_evenement'] for e in r.data['results']]
+        self.assertEqual(ids(self.proches(rayon_km=500, type='festival')), [self.kpalime.id_evenement])
+        fin = (date.today() + timedelta(days=20)).isoformat()
+        self.assertEqual(ids(self.proches(rayon_km=500, date_fin=fin)), [self.lome.id_evenement, self.kara.id_evenement])
+
+    def test_antimeridien(self):
+        evenement = self.creer('Fidji', -16.5, 179.9)
+        response = self.client.get('/api/evenements/proches/', {'lat': -16.5, 'lon': -179.9, 'rayon_km': 50})
+        self.assertEqual([e['id_evenement'] for e in response.data['results']], [evenement.id_evenement])
+
+    def test_parametres_invalides(self):
+        for params in ({'lat': 'x'}, {'lat': 95}, {'rayon_km': 0}, {'rayon_km': 10000}, {'date_debut': 'hier'}):
+            self.assertEqual(self.proches(**params).status_code, 400, params)
+        self.assertEqual(self.client.get('/api/evenements/proches/').status_code, 400)
+
+
+class ClustersTests(APITestCase):
+    """Clusters de carte : agrégation par tuile, cache par tuile, invalidation au déplacement"""
+    TOGO = {'bbox': '-0.2,5.9,1.9,11.2', 'zoom': 6}
+
+    def setUp(self):
+        cache.clear()
+        self.lome = [
+            Evenement.objects.create(
+                titre_evenement=f'Lomé {i}', date=date.today() + timedelta(days=10 - i), lieu='Lomé',
+                type_evenement='Concert', latitude=6.13 + i * 0.001, longitude=1.22,
+            )
+            for i in range(5)
+        ]
+        self.kara = [
+            Evenement.objects.create(
+                titre_evenement=f'Kara {i}', date=date.today() + timedelta(days=5), lieu='Kara',
+                type_evenement='Concert', latitude=9.55, longitude=1.19,
+            )
+            for i in range(2)
+        ]
+        Evenement.objects.create(
+            titre_evenement='Passé', date=date.today() - timedelta(days=1), lieu='Lomé',
+            type_evenement='Concert', latitude=6.13, longitude=1.22,
+        )
+        Evenement.objects.create(titre_evenement='Sans position', date=date.today(), lieu='?', type_evenement='Concert')
+
+    def nombres(self, response):
+        return sorted(cluster['nombre'] for cluster in response.data['clusters'])
+
+    def test_regroupement_par_zoom(self):
+        response = self.client.get('/api/evenements/clusters/', self.TOGO)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 7)
+        self.assertEqual(self.nombres(response), [2, 5])
+        lome = max(response.data['clusters'], key=lambda cluster: cluster['nombre'])
+        self.assertEqual(lome['evenement']['id_evenement'], self.lome[4].id_evenement)
+        self.assertAlmostEqual(lome['latitude'], 6.132, places=6)
+
+        response = self.client.get('/api/evenements/clusters/', {'bbox': '1.219,6.129,1.221,6.135', 'zoom': 18})
+        self.assertEqual(self.nombres(response), [1, 1, 1, 1, 1])
+
+    def test_cache_par_tuile_et_invalidation(self):
+        self.client.get('/api/evenements/clusters/', self.TOGO)
+        with self.assertNumQueries(0):
+            self.client.get('/api/evenements/clusters/', self.TOGO)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            deplace = Evenement.objects.get(pk=self.kara[0].pk)
+            deplace.latitude, deplace.longitude = 6.131, 1.22
+            deplace.save()
+        self.assertEqual(self.nombres(self.client.get('/api/evenements/clusters/', self.TOGO)), [1, 6])
+
+    def test_parametres_invalides(self):
+        for params in ({'zoom': 6}, {'bbox': '1,2,3', 'zoom': 6}, {'bbox': '0,10,1,5', 'zoom': 6},
+                       {'bbox': '-0.2,5.9,1.9,11.2', 'zoom': 25}, {'bbox': '-0.2,5.9,1.9,11.2', 'zoom': 14}):
+            self.assertEqual(self.client.get('/api/evenements/clusters/', params).status_code, 400, params)
+
+
+@override_settings(CATALOGUE_CACHE_ENABLED=False)
+class FacettesTests(APITestCase):
+    """Filtrage à facettes : nombres par valeur hors filtre de la même dimension, une requête groupée"""
+
+    def creer(self, titre, type_evenement, lieu, prix, stock, heure, decalage_jours=10):
+        evenement = Evenement.objects.create(
+            titre_evenement=titre, date=date.today() + timedelta(days=decalage_jours),
+            lieu=lieu, type_evenement=type_evenement,
+        )
+        Ticket.objects.create(type='Standard', prix=Decimal(prix), stock=stock, id_evenement=evenement)
+        Session.objects.create(
+            evenement=evenement,
+            date_heure=timezone.make_aware(datetime.combine(evenement.date, datetime.min.time()) + timedelta(hours=heure)),
+        )
+        return evenement
+
+    def setUp(self):
+        self.a = self.creer('A', 'Concert', 'Lomé', 3000, 10, 20)
+        self.b = self.creer('B', 'Concert', 'Kara', 20000, 0, 10)
+        self.c = self.creer('C', 'Festival', 'Lomé', 60000, 5, 20)
+        self.creer('Passé', 'Festival', 'Lomé', 3000, 5, 20, decalage_jours=-10)
+
+    def filtrer(self, **params):
+        response = self.client.get('/api/evenements/filtrer/', {'date_debut': date.today().isoformat(), **params})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    @staticmethod
+    def nombres(facette):
+        return {element['valeur']: element['nombre'] for element in facette}
+
+    def test_facettes_sans_filtre(self):
+        # facettes (une requête groupée) + count + page + sessions
+        with self.assertNumQueries(4):
+            response = self.filtrer()
+        facettes = response.data['facettes']
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(self.nombres(facettes['type_evenement']), {'Concert': 2, 'Festival': 1})
+        self.assertEqual(self.nombres(facettes['lieu']), {'Lomé': 2, 'Kara': 1})
+        self.assertEqual(self.nombres(facettes['prix']), {'0-5000': 1, '5000-15000': 0, '15000-50000': 1, '50000+': 1})
+        self.assertEqual(self.nombres(facettes['en_stock']), {True: 2, False: 1})
+        self.assertEqual(self.nombres(facettes['moment']), {'matin': 1, 'apres_midi': 0, 'soir': 2, 'nuit': 0})
+
+    def test_dimension_propre_exclue(self):
+        response = self.filtrer(type='Concert')
+        self.assertEqual([e['id_evenement'] for e in response.data['results']], [self.a.id_evenement, self.b.id_evenement])
+        self.assertEqual(self.nombres(response.data['facettes']['type_evenement']), {'Concert': 2, 'Festival': 1})
+        self.assertEqual(self.nombres(response.data['facettes']['lieu']), {'Lomé': 1, 'Kara': 1})
+
+        response = self.filtrer(en_stock='true', moment='soir,matin', prix_max='10000')
+        self.assertEqual([e['id_evenement'] for e in response.data['results']], [self.a.id_evenement])
+        facettes = response.data['facettes']
+        self.assertEqual(self.nombres(facettes['prix']), {'0-5000': 1, '5000-15000': 0, '15000-50000': 0, '50000+': 1})
+        self.assertEqual(self.nombres(facettes['moment'])['soir'], 1)
+        self.assertEqual(self.nombres(facettes['en_stock']), {True: 1, False: 0})
+
+    def test_parametres_invalides(self):
+        for params in ({'moment': 'aube'}, {'prix_min': 'abc'}, {'prix_max': '-1'}, {'en_stock': 'peut-etre'},
+                       {'date_fin': '2026-13-01'}):
+            self.assertEqual(self.client.get('/api/evenements/filtrer/', params).status_code, 400, params)
+
+
+class AchatConcurrenceTests(APITestCase):
+    """Stock et solde modifiés par UPDATE conditionnels : une vente concurrente ne peut pas survendre"""
+
+    def setUp(self):
+        evenement = creer_evenements(1)[0]
+        self.ticket = Ticket.objects.get(id_evenement=evenement, type='Standard')
+        self.utilisateur, auth = creer_acheteur('20000')
+        self.client.credentials(**auth)
+
+    def serializer_valide(self, quantite):
+        serializer = AchatCreateSerializer(
+            data={'id_ticket': self.ticket.id_ticket, 'quantite': quantite},
+            context={'request': SimpleNamespace(user=self.utilisateur)},
+        )
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        return serializer
+
+    def test_achat_et_annulation(self):
+        response = self.client.post('/api/achats/', {'id_ticket': self.ticket.id_ticket, 'quantite': 2}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.ticket.refresh_from_db()
+        self.utilisateur.refresh_from_db()
+        self.assertEqual(self.ticket.stock, 98)
+        self.assertEqual(self.utilisateur.solde, Decimal('10000'))
+
+        response = self.client.delete(f"/api/achats/{response.data['achat']['id_achat']}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['nouveau_solde'], '20000.00')
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.stock, 100)
+
+    def test_stock_vendu_entre_validation_et_achat(self):
+        serializer = self.serializer_valide(2)
+        Ticket.objects.filter(pk=self.ticket.pk).update(stock=1)  # vente concurrente
+        with self.assertRaises(ValidationError):
+            serializer.save()
+        self.assertFalse(Achat.objects.exists())
+        self.utilisateur.refresh_from_db()
+        self.assertEqual(self.utilisateur.solde, Decimal('20000'))
+
+    def test_solde_depense_entre_validation_et_achat(self):
+        serializer = self.serializer_valide(2)
+        Utilisateur.objects.filter(pk=self.utilisateur.pk).update(solde=Decimal('5000'))
+        with self.assertRaises(ValidationError):
+            serializer.save()
+        # Le stock déjà retiré est rendu avec l'annulation de la transaction
+        self.assertFalse(Achat.objects.exists())
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.stock, 100)
+
+
+@override_settings(CATALOGUE_CACHE_ENABLED=False)
+class StockFractionneTests(APITestCase):
+    """Ticket au stock réparti sur plusieurs fractions : achats, lectures agrégées, rééquilibrage"""
+
+    def setUp(self):
+        self.evenement = creer_evenements(1)[0]
+        self.ticket = repartir_stock(Ticket.objects.get(id_evenement=self.evenement, type='Standard'), 4)
+        self.utilisateur, auth = creer_acheteur('1000000')
+        self.client.credentials(**auth)
+
+    def stocks(self):
+        return list(FractionStock.objects.filter(ticket=self.ticket).values_list('stock', flat=True))
+
+    def test_repartition(self):
+        self.assertEqual(self.ticket.stock, 0)
+        self.assertEqual(self.stocks(), [25, 25, 25, 25])
+        self.assertEqual(self.ticket.stock_disponible, 100)
+
+    def test_achat_et_lectures_agregees(self):
+        response = self.client.post('/api/achats/', {'id_ticket': self.ticket.id_ticket, 'quantite': 3}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(sum(self.stocks()), 97)
+        self.assertEqual(response.data['achat']['ticket']['stock'], 97)
+
+        self.assertEqual(self.client.get(f'/api/tickets/{self.ticket.id_ticket}/').data['stock'], 97)
+        detail = self.client.get(f'/api/evenements/{self.evenement.id_evenement}/').data
+        self.assertEqual(detail['stock_total'], 97 + 20)
+        liste = self.client.get('/api/evenements/').data['results']
+        self.assertEqual(liste[0]['nombre_tickets_disponibles'], 97 + 20)
+
+    def test_fractions_soeurs_puis_morcelees(self):
+        FractionStock.objects.filter(ticket=self.ticket).update(stock=0)
+        FractionStock.objects.filter(ticket=self.ticket, numero=2).update(stock=5)
+        for _ in range(5):
+            self.assertTrue(decrementer_stock(self.ticket, 1))
+        self.assertFalse(decrementer_stock(self.ticket, 1))
+
+        # Aucune fraction ne suffit seule : prélèvement sur plusieurs
+        FractionStock.objects.filter(ticket=self.ticket).update(stock=2)
+        self.assertTrue(decrementer_stock(self.ticket, 7))
+        self.assertEqual(sum(self.stocks()), 1)
+        self.assertFalse(decrementer_stock(self.ticket, 2))
+
+    def test_stock_fixe_et_retour_ligne_unique(self):
+        response = self.client.post(f'/api/tickets/{self.ticket.id_ticket}/update_stock/', {'stock': 10}, **creer_admin())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['stock'], 10)
+        self.assertEqual(self.stocks(), [3, 3, 2, 2])
+
+        call_command('reequilibrer_stock', ticket=self.ticket.id_ticket, fractions=0, stdout=StringIO())
+        self.ticket.refresh_from_db()
+        self.assertEqual((self.ticket.stock, self.ticket.nombre_fractions), (10, 0))
+        self.assertEqual(self.stocks(), [])
+
+
+@override_settings(CATALOGUE_CACHE_ENABLED=False)
+@override_settings(RESERVATION_QUANTITE_MAX=20)
+class ReservationTests(APITestCase):
+    """Réservations : places retirées du stock, converties par l'achat, rendues à expiration"""
+
+    def setUp(self):
+        self.evenement = creer_evenements(1)[0]
+        self.ticket = Ticket.objects.get(id_evenement=self.evenement, type='VIP')  # stock 20
+        self.utilisateur, auth = creer_acheteur('400000')
+        self.client.credentials(**auth)
+
+    def reserver(self, quantite):
+        return self.client.post('/api/reservations/', {'id_ticket': self.ticket.id_ticket, 'quantite': quantite}, format='json')
+
+    def stock(self):
+        self.ticket.refresh_from_db()
+        return self.ticket.stock
+
+    def test_reservation_puis_achat(self):
+        response = self.reserver(3)
+        self.assertEqual(response.status_code, 201)
+        id_reservation = response.data['reservation']['id_reservation']
+        self.assertEqual(self.stock(), 17)
+        detail = self.client.get(f'/api/evenements/{self.evenement.id_evenement}/').data
+        self.assertEqual(detail['stock_total'], 100 + 17)
+
+        response = self.client.post('/api/achats/', {'id_reservation': id_reservation}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['achat']['quantite'], 3)
+        self.assertEqual(self.stock(), 17)
+        self.utilisateur.refresh_from_db()
+        self.assertEqual(self.utilisateur.solde, Decimal('355000'))
+        self.assertEqual(Reservation.objects.get(pk=id_reservation).statut, Reservation.CONVERTIE)
+
+        response = self.client.post('/api/achats/', {'id_reservation': id_reservation}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Achat.objects.count(), 1)
+
+    def test_stock_insuffisant_et_annulation(self):
+        self.assertEqual(self.reserver(21).status_code, 400)
+        id_reservation = self.reserver(20).data['reservation']['id_reservation']
+        self.assertEqual(self.stock(), 0)
+        self.assertEqual(self.client.delete(f'/api/reservations/{id_reservation}/').status_code, 200)
+        self.assertEqual(self.stock(), 20)
+        self.assertEqual(self.client.delete(f'/api/reservations/{id_reservation}/').status_code, 400)
+        self.assertEqual(self.stock(), 20)
+
+    def test_expiration(self):
+        ids = [self.reserver(4).data['reservation']['id_reservation'] for _ in range(5)]
+        self.assertEqual(self.stock(), 0)
+        Reservation.objects.filter(pk__in=ids[:3]).update(date_expiration=timezone.now() - timedelta(seconds=1))
+
+        response = self.client.post('/api/achats/', {'id_reservation': ids[0]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        self.assertEqual(liberer_expirees(lot=2), 3)
+        self.assertEqual(self.stock(), 12)
+        self.assertEqual(liberer_expirees(), 0)
+        self.assertEqual(Reservation.objects.filter(statut=Reservation.EXPIREE).count(), 3)
+
+    def test_reservation_libere_les_expirees_du_ticket(self):
+        id_reservation = self.reserver(20).data['reservation']['id_reservation']
+        Reservation.objects.filter(pk=id_reservation).update(date_expiration=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.reserver(5).status_code, 201)
+        self.assertEqual(self.stock(), 15)
+
+    @override_settings(RESERVATION_QUANTITE_MAX=4, RESERVATION_ACTIVES_MAX=2)
+    def test_plafonds(self):
+        self.assertEqual(self.reserver(5).status_code, 400)
+        ids = [self.reserver(2).data['reservation']['id_reservation'] for _ in range(2)]
+        response = self.reserver(1)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('réservations actives', response.data['error'])
+        self.assertEqual(self.stock(), 16)  # refus : rien retiré du stock
+
+        # Solde : 400000 couvre 26 places VIP au total
+        self.assertEqual(self.client.delete(f'/api/reservations/{ids[0]}/').status_code, 200)
+        Utilisateur.objects.filter(pk=self.utilisateur.pk).update(solde=Decimal('44999'))
+        response = self.reserver(1)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Solde insuffisant', response.data['error'])
+        self.assertEqual(self.stock(), 18)
+
+    def test_annulation_apres_conversion(self):
+        id_reservation = self.reserver(1).data['reservation']['id_reservation']
+        reservation = Reservation.objects.get(pk=id_reservation)
+        with patch('tickets.views.gestion_reservation.ReservationViewSet.get_object', return_value=reservation):
+            Reservation.objects.filter(pk=id_reservation).update(statut=Reservation.CONVERTIE)
+            response = self.client.delete(f'/api/reservations/{id_reservation}/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'La réservation est déjà convertie en achat.')
+
+
+class FileAttenteTests(APITestCase):
+    """Salle d'attente : admission au débit du seau à jetons, refus sans lecture en base"""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)  # l'état de la file vit dans le cache, pas dans la base
+        # Un seul processus de test : son locmem est partagé par tous les « workers »
+        partage = patch('tickets.utils.cache_scan.cache_partage', return_value=True)
+        partage.start()
+        self.addCleanup(partage.stop)
+        self.evenement = creer_evenements(1)[0]
+        self.ticket = Ticket.objects.get(id_evenement=self.evenement, type='Standard')
+        self.auths = [creer_acheteur('100000', email=f'file{i}@example.com')[1] for i in range(2)]
+        self.auth_admin = creer_admin()
+        response = self.client.post(f'/api/file-attente/{self.evenement.id_evenement}/activer/',
+                                    {'debit': 1, 'rafale': 1}, **self.auth_admin)
+        self.assertEqual(response.status_code, 200)
+
+    def acheter(self, utilisateur, jeton=None):
+        headers = dict(self.auths[utilisateur])
+        if jeton:
+            headers['HTTP_X_FILE_ATTENTE'] = jeton
+        return self.client.post('/api/achats/', {'id_ticket': self.ticket.id_ticket, 'quantite': 1}, format='json', **headers)
+
+    def rejoindre(self, utilisateur):
+        response = self.client.post(f'/api/file-attente/{self.evenement.id_evenement}/rejoindre/',
+                                    **self.auths[utilisateur])
+        self.assertEqual(response.status_code, 201)
+        return response.data
+
+    def test_refus_sans_base_de_donnees(self):
+        with self.assertNumQueries(0):
+            response = self.acheter(0)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(response.data['file_attente'], f'/api/file-attente/{self.evenement.id_evenement}/rejoindre/')
+
+    def test_identifiants_textes(self):
+        auth = self.auths[0]
+        for url, donnees in (('/api/achats/', {'id_ticket': str(self.ticket.id_ticket)}),
+                             ('/api/achats/panier/', {'lignes': [{'id_ticket': f' {self.ticket.id_ticket}'}]})):
+            response = self.client.post(url, donnees, format='json', **auth)
+            self.assertEqual(response.status_code, 429)
+        for invalide in ('abc', [self.ticket.id_ticket], True):
+            response = self.client.post('/api/achats/panier/', {'lignes': [{'id_ticket': invalide}]}, format='json', **auth)
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(Achat.objects.exists())
+        self.assertEqual(self.client.post('/api/file-attente/abc/rejoindre/', **auth).status_code, 404)
+
+    def test_admission_au_debit(self):
+        with patch('tickets.utils.file_attente.time.time', return_value=1000.0):
+            premier = self.rejoindre(0)
+            second = self.rejoindre(1)
+            self.assertTrue(premier['admis'])
+            self.assertEqual((second['position'], second['devant'], second['admis']), (2, 1, False))
+
+            with self.assertNumQueries(0):
+                statut = self.client.get('/api/file-attente/statut/', {'jeton': second['jeton']}).data
+            self.assertFalse(statut['admis'])
+            with self.assertNumQueries(0):
+                self.assertEqual(self.acheter(1, second['jeton']).status_code, 429)
+            self.assertEqual(self.acheter(0, premier['jeton']).status_code, 201)
+            # Jeton admis d'un autre utilisateur
+            self.assertEqual(self.acheter(1, premier['jeton']).status_code, 403)
+
+        with patch('tickets.utils.file_attente.time.time', return_value=1001.0):
+            self.assertTrue(self.client.get('/api/file-attente/statut/', {'jeton': second['jeton']}).data['admis'])
+            self.assertEqual(self.acheter(1, second['jeton']).status_code, 201)
+
+    def test_cache_par_processus(self):
+        autre = creer_evenements(1, decalage_jours=40)[0]
+        with patch('tickets.utils.cache_scan.cache_partage', return_value=False):
+            response = self.client.post(f'/api/file-attente/{autre.id_evenement}/activer/', {'debit': 1}, **self.auth_admin)
+        self.assertEqual(response.status_code, 503)
+        self.assertIsNone(file_attente.configuration(autre.id_evenement))
+
+    def test_stockage_incomplet(self):
+        class StockageIncomplet(file_attente.StockageFile):
+            def get(self, cle):
+                return None
+
+        with self.assertRaises(TypeError):  # dès l'instanciation, pas en pleine mise en vente
+            StockageIncomplet()
+
+    def test_autres_evenements_libres(self):
+        autre = Ticket.objects.create(type='Standard', prix=Decimal('5000'), stock=10,
+                                      id_evenement=creer_evenements(1, decalage_jours=40)[0])
+        response = self.client.post('/api/achats/', {'id_ticket': autre.id_ticket, 'quantite': 1}, format='json',
+                                    **self.auths[0])
+        self.assertEqual(response.status_code, 201)
+        # Ticket créé après l'activation : protégé aussi
+        with self.captureOnCommitCallbacks(execute=True):
+            nouveau = Ticket.objects.create(type='Balcon', prix=Decimal('5000'), stock=10, id_evenement=self.evenement)
+        response = self.client.post('/api/achats/', {'id_ticket': nouveau.id_ticket, 'quantite': 1}, format='json',
+                                    **self.auths[0])
+        self.assertEqual(response.status_code, 429)
+
+
+class CommandeTests(APITestCase):
+    """Achats asynchrones : 202 à la mise en file, lots traités par le worker"""
+
+    def setUp(self):
+        evenement = creer_evenements(1)[0]
+        self.ticket = Ticket.objects.get(id_evenement=evenement, type='Standard')  # 5000
+        Ticket.objects.filter(pk=self.ticket.pk).update(stock=3)
+        self.jetons = {}
+        for nom, solde in (('a', '20000'), ('b', '5000')):
+            self.jetons[nom] = creer_acheteur(solde, email=f'{nom}@example.com')
+
+    def commander(self, nom):
+        return self.client.post('/api/achats/', {'id_ticket': self.ticket.id_ticket, 'quantite': 1}, format='json',
+                                **self.jetons[nom][1], HTTP_PREFER='respond-async')
+
+    def test_lot_stock_et_soldes(self):
+        reponses = [self.commander(nom) for nom in ('a', 'a', 'b', 'b', 'a')]
+        self.assertEqual([r.status_code for r in reponses], [202] * 5)
+        self.assertFalse(Achat.objects.exists())
+        url = reponses[0]['Location']
+        response = self.client.get(url, **self.jetons['a'][1])
+        self.assertEqual(response.data['statut'], Commande.EN_ATTENTE)
+        self.assertEqual(response['Retry-After'], '1')
+
+        self.assertEqual(traiter_commandes(lot=10), (3, 2))
+        statuts = [Commande.objects.get(pk=r.data['commande']['id_commande']) for r in reponses]
+        self.assertEqual([c.statut for c in statuts], ['acceptee', 'acceptee', 'acceptee', 'refusee', 'refusee'])
+        self.assertIn('Solde', statuts[3].motif)
+        self.assertIn('Stock', statuts[4].motif)
+
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.stock, 0)
+        self.assertEqual(Utilisateur.objects.get(pk=self.jetons['a'][0].pk).solde, Decimal('10000'))
+        self.assertEqual(Utilisateur.objects.get(pk=self.jetons['b'][0].pk).solde, Decimal('0'))
+        self.assertFalse(TacheQR.objects.exists())  # images QR rendues à la demande
+
+        response = self.client.get(url, **self.jetons['a'][1])
+        self.assertEqual(response.data['statut'], Commande.ACCEPTEE)
+        self.assertEqual(response.data['achat']['code_qr'], statuts[0].id_achat.code_qr)
+        # Commande d'un autre utilisateur : invisible
+        self.assertEqual(self.client.get(url, **self.jetons['b'][1]).status_code, 404)
+
+        # Stock épuisé : refus immédiat, sans passer par la file
+        self.assertEqual(self.commander('a').status_code, 400)
+        self.assertEqual(traiter_commandes(), (0, 0))
+
+
+class PanierTests(APITestCase):
+    """Panier : plusieurs lignes achetées en une transaction, tout ou rien"""
+
+    def setUp(self):
+        self.evenement, autre = creer_evenements(2)
+        self.standard = Ticket.objects.get(id_evenement=self.evenement, type='Standard')  # 5000, stock 100
+        self.vip = Ticket.objects.get(id_evenement=self.evenement, type='VIP')  # 15000, stock 20
+        self.session = self.evenement.sessions.first()
+        self.autre_session = autre.sessions.first()
+        self.utilisateur, auth = creer_acheteur('100000')
+        self.client.credentials(**auth)
+
+    def lignes(self, vip=2, standard=3, session=None):
+        return [
+            {'id_ticket': self.vip.id_ticket, 'quantite': vip, 'session': (session or self.session).id_session},
+            {'id_ticket': self.standard.id_ticket, 'quantite': standard},
+        ]
+
+    def stocks(self):
+        return list(Ticket.objects.filter(pk__in=[self.vip.pk, self.standard.pk]).order_by('pk').values_list('stock', flat=True))
+
+    def test_panier(self):
+        response = self.client.post('/api/achats/panier/', {'lignes': self.lignes()}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['montant_total'], '45000.00')
+        self.assertEqual(response.data['nouveau_solde'], '55000.00')
+        self.assertEqual(len(response.data['achats']), 2)
+        self.assertTrue(all(achat['qr_code_url'] for achat in response.data['achats']))
+        self.assertEqual(self.stocks(), [97, 18])
+        self.assertEqual(Achat.objects.get(id_ticket=self.vip).session, self.session)
+
+    def test_refus_sans_effet(self):
+        for lignes in (self.lignes(vip=21), self.lignes(session=self.autre_session), self.lignes(vip=7)):
+            response = self.client.post('/api/achats/panier/', {'lignes': lignes}, format='json')
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.stocks(), [100, 20])
+        self.assertFalse(Achat.objects.exists())
+
+    def test_ligne_vendue_entre_validation_et_achat(self):
+        serializer = PanierSerializer(data={'lignes': self.lignes()}, context={'request': SimpleNamespace(user=self.utilisateur)})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        Ticket.objects.filter(pk=self.vip.pk).update(stock=1)  # vente concurrente
+        with self.assertRaises(ValidationError):
+            serializer.save()
+        # Le stock Standard déjà retiré est rendu avec l'annulation de la transaction
+        self.assertEqual(self.stocks(), [100, 1])
+        self.assertFalse(Achat.objects.exists())
+        self.utilisateur.refresh_from_db()
+        self.assertEqual(self.utilisateur.solde, Decimal('100000'))
+
+
+class IdempotenceTests(APITestCase):
+    """Idempotency-Key : un POST renvoyé rejoue la première réponse sans refaire la transaction"""
+
+    def setUp(self):
+        evenement = creer_evenements(1)[0]
+        self.ticket = Ticket.objects.get(id_evenement=evenement, type='Standard')
+        self.utilisateur, auth = creer_acheteur('20000')
+        self.client.credentials(**auth)
+
+    def acheter(self, cle, quantite=1):
+        return self.client.post('/api/achats/', {'id_ticket': self.ticket.id_ticket, 'quantite': quantite},
+                                format='json', HTTP_IDEMPOTENCY_KEY=cle)
+
+    def test_achat_rejoue(self):
+        premiere = self.acheter('achat-1')
+        self.assertEqual(premiere.status_code, 201)
+        seconde = self.acheter('achat-1')
+        self.assertEqual(seconde.status_code, 201)
+        self.assertEqual(seconde['Idempotent-Replayed'], 'true')
+        self.assertEqual(seconde.data['achat']['id_achat'], premiere.data['achat']['id_achat'])
+        self.assertEqual(Achat.objects.count(), 1)
+        self.ticket.refresh_from_db()
+        self.utilisateur.refresh_from_db()
+        self.assertEqual((self.ticket.stock, self.utilisateur.solde), (99, Decimal('15000')))
+
+        self.assertEqual(self.acheter('achat-1', quantite=2).status_code, 422)
+        self.assertEqual(self.acheter('achat-2').status_code, 201)
+        self.assertEqual(Achat.objects.count(), 2)
+
+    def test_depot_et_recharge_rejoues(self):
+        for _ in range(2):
+            response = self.client.post('/api/transactions/depot/', {'montant': '1000', 'moyen_paiement': 'mobile_money'},
+                                        format='json', HTTP_IDEMPOTENCY_KEY='depot-1')
+            self.assertEqual(response.status_code, 201)
+            response = self.client.post(f'/api/utilisateurs/{self.utilisateur.id_utilisateur}/recharger/', {'montant': '500'},
+                                        format='json', HTTP_IDEMPOTENCY_KEY='recharge-1')
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(Transaction.objects.filter(id_utilisateur=self.utilisateur).count(), 1)
+        self.utilisateur.refresh_from_db()
+        self.assertEqual(self.utilisateur.solde, Decimal('21500'))
+
+    def test_echec_annule_cle_et_debit(self):
+        # Exception après le débit : ni clé, ni achat, ni débit validés
+        with patch('tickets.serializers.achat_serializers.planifier', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.acheter('achat-1')
+        self.assertFalse(CleIdempotence.objects.exists())
+        self.assertFalse(Achat.objects.exists())
+        self.utilisateur.refresh_from_db()
+        self.assertEqual(self.utilisateur.solde, Decimal('20000'))
+
+        response = self.acheter('achat-1')
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(CleIdempotence.objects.get().statut, 201)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+@override_settings(QR_IMAGES_STOCKEES=True)
+class TachesQRTests(APITestCase):
+    """Images QR stockées : rendues hors de la requête d'achat, par la file TacheQR"""
+
+    def setUp(self):
+        evenement = creer_evenements(1)[0]
+        self.ticket = Ticket.objects.get(id_evenement=evenement, type='Standard')
+        self.utilisateur, auth = creer_acheteur('20000')
+        self.client.credentials(**auth)
+
+    def test_rendu_differe(self):
+        response = self.client.post('/api/achats/', {'id_ticket': self.ticket.id_ticket, 'quantite': 1}, format='json')
+        self.assertEqual(response.status_code, 201)
+        code_qr = response.data['achat']['code_qr']
+        self.assertEqual(response.data['qr_code_url'], f'http://testserver/api/achats/qr/{code_qr}.png')
+        self.assertEqual(TacheQR.objects.get().url_base, 'http://testserver')
+
+        response = self.client.get(f'/api/achats/qr/{code_qr}/')
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].endswith(f'/api/achats/qr/{code_qr}.png'))
+        self.assertEqual(traiter_taches(), 1)
+        response = self.client.get(f'/api/achats/qr/{code_qr}/')
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].endswith(f'/media/qr_codes/qr_{code_qr}.png'))
+        self.assertEqual(TacheQR.objects.get().statut, TacheQR.TERMINEE)
+        self.assertEqual(traiter_taches(), 0)
+
+        achat = Achat.objects.get()
+        stockage, nom = achat.qr_image.storage, achat.qr_image.name
+        self.assertTrue(stockage.exists(nom))
+        with self.captureOnCommitCallbacks(execute=True):
+            achat.delete()
+        self.assertFalse(stockage.exists(nom))
+
+    def test_rattrapage(self):
+        Achat.objects.create(id_utilisateur=self.utilisateur, id_ticket=self.ticket, quantite=1, montant_total=Decimal('5000'))
+        self.assertEqual(rattraper(), 1)
+        self.assertEqual(rattraper(), 0)
+        self.assertEqual(traiter_taches(), 1)
+        self.assertTrue(Achat.objects.get().qr_image)
+
+    def test_rattrapage_par_lots(self):
+        for _ in range(5):
+            Achat.objects.create(id_utilisateur=self.utilisateur, id_ticket=self.ticket, quantite=1, montant_total=Decimal('5000'))
+        self.assertEqual(rattraper(lot=2), 5)
+        self.assertEqual(TacheQR.objects.count(), 5)
+
+    @override_settings(QR_IMAGES_STOCKEES=False)
+    def test_rattrapage_images_non_stockees(self):
+        Achat.objects.create(id_utilisateur=self.utilisateur, id_ticket=self.ticket, quantite=1, montant_total=Decimal('5000'))
+        self.assertEqual(rattraper(), 0)
+        self.assertFalse(TacheQR.objects.exists())
+        with self.assertRaises(CommandError):
+            call_command('generer_qr', '--rattrapage', stdout=StringIO())
+
+
+class ImagesQRTests(APITestCase):
+    """Images QR rendues à la demande, derrière le LRU mémoire et le cache disque"""
+
+    def setUp(self):
+        evenement = creer_evenements(1)[0]
+        ticket = Ticket.objects.get(id_evenement=evenement, type='Standard')
+        utilisateur, _ = creer_acheteur()
+        self.achat = Achat.objects.create(
+            id_utilisateur=utilisateur, id_ticket=ticket, quantite=1, montant_total=Decimal('5000'),
+            code_qr='0f8fad5b-d9cb-469f-a165-70867728950e',
+        )
+        dossier = tempfile.mkdtemp()
+        reglages = override_settings(QR_CACHE_DOSSIER=dossier)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+
+    def test_png_et_svg(self):
+        response = self.client.get(f'/api/achats/qr/{self.achat.code_qr}.png')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertTrue(response.content.startswith(b'\x89PNG'))
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertFalse(TacheQR.objects.exists())
+
+        response = self.client.get(f'/api/achats/qr/{self.achat.code_qr}.png', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(f'/api/achats/qr/{self.achat.code_qr}.svg?correction=m&taille=4')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+        self.assertIn(b'<svg', response.content)
+
+        response = self.client.get(f'/api/achats/qr/{self.achat.code_qr}/')
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].endswith(f'/api/achats/qr/{self.achat.code_qr}.png'))
+
+    def test_erreurs(self):
+        self.assertEqual(self.client.get('/api/achats/qr/00000000-0000-0000-0000-000000000000.png').status_code, 404)
+        self.assertEqual(self.client.get(f'/api/achats/qr/{self.achat.code_qr}.png?correction=Z').status_code, 400)
+        self.assertEqual(self.client.get(f'/api/achats/qr/{self.achat.code_qr}.png?taille=99').status_code, 400)
+
+    def test_cache_disque(self):
+        premiere = self.client.get(f'/api/achats/qr/{self.achat.code_qr}.png').content
+        self.achat.delete()  # servie depuis le cache, sans relire la base
+        self.assertEqual(self.client.get(f'/api/achats/qr/{self.achat.code_qr}.png').content, premiere)
+
+        disque = CacheDisque(tempfile.mkdtemp(), capacite=100)
+        for i in range(4):
+            disque.set(f'cle{i}', b'x' * 40)
+        self.assertLessEqual(disque.taille, 90)
+        self.assertIsNone(disque.get('cle0'))
+        self.assertEqual(disque.get('cle3'), b'x' * 40)
+
+    def test_lru_memoire(self):
+        memoire = CacheMemoire(capacite=10)
+        memoire.set('a', b'12345')
+        memoire.set('b', b'12345')
+        memoire.get('a')
+        memoire.set('c', b'12345')
+        self.assertIsNone(memoire.get('b'))
+        self.assertEqual(memoire.get('a'), b'12345')
+        self.assertEqual(memoire.taille, 10)
+
+
+class AnnulationTests(APITestCase):
+    """Annulation d'un événement : remboursements par lots, reprenables, avec Transactions"""
+
+    def setUp(self):
+        self.evenement, autre = creer_evenements(2)
+        self.standard = Ticket.objects.get(id_evenement=self.evenement, type='Standard')
+        self.vip = Ticket.objects.get(id_evenement=self.evenement, type='VIP')
+        self.session = self.evenement.sessions.first()
+        self.utilisateurs = [
+            creer_acheteur(email=f'u{i}@example.com')[0] for i in range(3)
+        ]
+        for i, utilisateur in enumerate(self.utilisateurs):
+            for ticket in (self.standard, self.vip):
+                Achat.objects.create(
+                    id_utilisateur=utilisateur, id_ticket=ticket, quantite=2, montant_total=ticket.prix * 2,
+                    session=self.session if i == 0 else None,
+                )
+        # Achat d'un autre événement : intact
+        Achat.objects.create(
+            id_utilisateur=self.utilisateurs[0], id_ticket=Ticket.objects.get(id_evenement=autre, type='VIP'),
+            quantite=1, montant_total=Decimal('15000'),
+        )
+        self.auth = creer_admin()
+
+    def test_annulation_par_lots(self):
+        url = f'/api/evenements/{self.evenement.id_evenement}/annuler/'
+        self.assertEqual(self.client.post(url, {'motif': 'Intempéries'}, format='json').status_code, 401)
+        response = self.client.post(url, {'motif': 'Intempéries'}, format='json', **self.auth)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['annulation']['achats_total'], 6)
+        # Doublon : l'annulation en cours est renvoyée
+        response = self.client.post(url, {}, format='json', **self.auth)
+        self.assertEqual(Annulation.objects.count(), 1)
+
+        progressions = []
+        id_annulation = Annulation.objects.get().pk
+        # Un lot : une requête par utilisateur, aucune par achat (stock non remis en vente)
+        with self.assertNumQueries(14):
+            annulation, nombre = traiter_lot_annulation(id_annulation, 4)
+        # Worker arrêté après ce lot : la reprise rembourse le reste
+        self.assertEqual((nombre, annulation.statut), (4, Annulation.EN_COURS))
+        self.assertEqual(traiter_annulations(lot=4, progression=progressions.append), 2)
+        self.assertEqual([a.achats_rembourses for a in progressions], [6])
+
+        annulation = Annulation.objects.get()
+        self.assertEqual(annulation.statut, Annulation.TERMINEE)
+        self.assertEqual(annulation.montant_rembourse, Decimal('120000'))
+        self.assertEqual(Achat.objects.count(), 1)
+        for utilisateur in self.utilisateurs:
+            utilisateur.refresh_from_db()
+            self.assertEqual(utilisateur.solde, Decimal('40000'))
+        self.standard.refresh_from_db()
+        self.vip.refresh_from_db()
+        self.assertEqual((self.standard.stock, self.vip.stock), (0, 0))
+        remboursements = Transaction.objects.filter(type_transaction='remboursement')
+        self.assertEqual(remboursements.count(), 6)
+        self.assertEqual(len({t.reference for t in remboursements}), 6)
+        historique = self.client.get('/api/transactions/historique/', **auth_utilisateur(self.utilisateurs[1])).data
+        self.assertEqual((historique['total_depots'], historique['total_remboursements']), (0, 40000))
+
+        response = self.client.get(f'/api/evenements/{self.evenement.id_evenement}/annulations/', **self.auth)
+        self.assertEqual(response.data['results'][0]['progression'], 100)
+
+    def test_annulation_session(self):
+        autre_session = Session.objects.exclude(pk=self.session.pk).exclude(evenement=self.evenement).first()
+        url = f'/api/evenements/{self.evenement.id_evenement}/annuler/'
+        response = self.client.post(url, {'session': autre_session.pk}, format='json', **self.auth)
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post(url, {'session': self.session.pk}, format='json', **self.auth)
+        self.assertEqual(response.data['annulation']['achats_total'], 2)
+        self.assertEqual(traiter_annulations(), 2)
+        self.assertEqual(Achat.objects.count(), 5)
+        self.assertEqual(Utilisateur.objects.get(pk=self.utilisateurs[0].pk).solde, Decimal('40000'))
+        self.standard.refresh_from_db()
+        self.assertEqual(self.standard.stock, 100)  # places de la session annulée pas remises en vente
+
+        # Panier sur la session annulée refusé, les autres sessions restent ouvertes
+        utilisateur = self.utilisateurs[1]
+        auth = auth_utilisateur(utilisateur)
+        Utilisateur.objects.filter(pk=utilisateur.pk).update(solde=Decimal('20000'))
+        ligne = {'id_ticket': self.standard.id_ticket, 'quantite': 1}
+        response = self.client.post('/api/achats/panier/', {'lignes': [{**ligne, 'session': self.session.pk}]}, format='json', **auth)
+        self.assertEqual(response.status_code, 400)
+        autre = self.evenement.sessions.exclude(pk=self.session.pk).get()
+        response = self.client.post('/api/achats/panier/', {'lignes': [{**ligne, 'session': autre.pk}]}, format='json', **auth)
+        self.assertEqual(response.status_code, 201)
+
+    def test_evenement_ferme(self):
+        utilisateur = self.utilisateurs[1]
+        Utilisateur.objects.filter(pk=utilisateur.pk).update(solde=Decimal('50000'))
+        auth = auth_utilisateur(utilisateur)
+        reservation = self.client.post('/api/reservations/', {'id_ticket': self.vip.id_ticket}, format='json', **auth).data['reservation']
+        commande = Commande.objects.create(id_utilisateur=utilisateur, id_ticket=self.standard, quantite=1)
+
+        annulation, creee = annuler(self.evenement)
+        self.assertTrue(creee)
+        self.assertEqual(annuler(self.evenement), (annulation, False))
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Annulation.objects.create(evenement=self.evenement)
+        self.assertTrue(Evenement.objects.get(pk=self.evenement.pk).est_annule)
+        self.assertEqual(Commande.objects.get(pk=commande.pk).statut, Commande.REFUSEE)
+        self.assertEqual(Ticket.objects.get(pk=self.vip.pk).stock, 0)  # place réservée non rendue
+
+        for url, donnees in (
+            ('/api/achats/', {'id_ticket': self.standard.id_ticket}),
+            ('/api/achats/', {'id_reservation': reservation['id_reservation']}),
+            ('/api/reservations/', {'id_ticket': self.standard.id_ticket}),
+        ):
+            response = self.client.post(url, donnees, format='json', **auth)
+            self.assertEqual(response.status_code, 400, url)
+        response = self.client.post('/api/achats/', {'id_ticket': self.standard.id_ticket}, format='json', HTTP_PREFER='respond-async', **auth)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Achat.objects.filter(id_utilisateur=utilisateur).count(), 2)
+
+    def test_annulation_unitaire_transaction(self):
+        achat = Achat.objects.filter(id_utilisateur=self.utilisateurs[1]).first()
+        response = self.client.delete(f'/api/achats/{achat.id_achat}/', **auth_utilisateur(self.utilisateurs[1]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['nouveau_solde'], str(achat.montant_total))
+        transaction_remboursement = Transaction.objects.get(type_transaction='remboursement')
+        self.assertEqual(transaction_remboursement.montant, achat.montant_total)
+
+
+class JetonQRTests(APITestCase):
+    """Jetons signés des QR codes, vérifiables sans accès à la base"""
+
+    def setUp(self):
+        evenement = creer_evenements(1)[0]
+        self.session = evenement.sessions.last()
+        utilisateur, _ = creer_acheteur()
+        self.achat = Achat.objects.create(
+            id_utilisateur=utilisateur, id_ticket=Ticket.objects.get(id_evenement=evenement, type='VIP'),
+            quantite=3, montant_total=Decimal('45000'), session=self.session,
+        )
+
+    def test_signer_verifier(self):
+        jeton = signer(self.achat)
+        with self.assertNumQueries(0):
+            contenu = verifier(jeton)
+        self.assertEqual(contenu['id_achat'], self.achat.id_achat)
+        self.assertEqual(contenu['id_evenement'], self.achat.id_ticket.id_evenement_id)
+        self.assertEqual(contenu['id_session'], self.session.id_session)
+        self.assertEqual(contenu['quantite'], 3)
+        self.assertEqual(contenu['code_qr'], self.achat.code_qr)
+        self.assertGreater(contenu['expiration'], self.session.date_heure)
+
+        url = contenu_qr(self.achat, 'http://testserver')
+        self.assertTrue(url.startswith(f'http://testserver/api/achats/scan/{self.achat.code_qr}/?t='))
+        self.assertEqual(extraire_jeton(url), jeton)
+
+        falsifie = jeton[:20] + ('A' if jeton[20] != 'A' else 'B') + jeton[21:]
+        for invalide, options in ((falsifie, {}), (jeton, {'cles': {}}), (jeton[:-4], {}),
+                                  (jeton, {'maintenant': contenu['expiration']})):
+            with self.assertRaises(JetonInvalide):
+                verifier(invalide, **options)
+
+    def test_endpoints(self):
+        cles = self.client.get('/api/achats/jeton/cle/').data
+        self.assertEqual(cles['algorithme'], 'Ed25519')
+        self.assertEqual([cle['id'] for cle in cles['cles']], [cles['courante']])
+
+        url = contenu_qr(self.achat, 'http://testserver')
+        with self.assertNumQueries(0):
+            response = self.client.post('/api/achats/jeton/verifier/', {'jeton': url}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['valide'])
+        self.assertEqual(response.data['jeton']['id_achat'], self.achat.id_achat)
+
+        response = self.client.post('/api/achats/jeton/verifier/', {
+            'jeton': url, 'id_evenement': self.achat.id_ticket.id_evenement_id + 1
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.data['valide'])
+        response = self.client.post('/api/achats/jeton/verifier/', {'jeton': 'abc'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ValidationLotTests(APITestCase):
+    """Synchronisation des passages des scanners de porte, en une mise à jour ensembliste"""
+
+    def setUp(self):
+        self.evenement, autre = creer_evenements(2)
+        utilisateur, _ = creer_acheteur()
+        ticket = Ticket.objects.get(id_evenement=self.evenement, type='Standard')
+        self.achats = [
+            Achat.objects.create(id_utilisateur=utilisateur, id_ticket=ticket, quantite=1, montant_total=Decimal('5000'))
+            for _ in range(3)
+        ]
+        self.autre = Achat.objects.create(
+            id_utilisateur=utilisateur, id_ticket=Ticket.objects.get(id_evenement=autre, type='VIP'),
+            quantite=1, montant_total=Decimal('15000'),
+        )
+        self.auth = creer_admin()
+
+    def test_lot(self):
+        a, b, c = (achat.code_qr for achat in self.achats)
+        corps = {'id_evenement': self.evenement.id_evenement, 'passages': [
+            {'code_qr': a, 'scanned_at': '2026-03-01T18:00:05Z', 'gate_id': 'A1'},
+            {'code_qr': b, 'scanned_at': '2026-03-01T18:00:06Z', 'gate_id': 'A1'},
+            {'code_qr': a, 'scanned_at': '2026-03-01T18:00:01Z', 'gate_id': 'B2'},  # plus ancien : gagne
+            {'code_qr': '00000000-0000-0000-0000-000000000000', 'gate_id': 'A1'},
+            {'code_qr': self.autre.code_qr, 'gate_id': 'A1'},
+            {'code_qr': c},
+        ]}
+        self.assertEqual(self.client.post('/api/achats/validate/batch/', corps, format='json').status_code, 401)
+        response = self.client.post('/api/achats/validate/batch/', corps, format='json', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        statuts = [r['statut'] for r in response.data['resultats']]
+        self.assertEqual(statuts, ['deja_utilise', 'valide', 'valide', 'inconnu', 'autre_evenement', 'invalide'])
+        self.assertEqual(response.data['resultats'][0]['porte_gagnante'], 'B2')
+        self.assertEqual(response.data['totaux']['valide'], 2)
+
+        achat = Achat.objects.get(code_qr=a)
+        self.assertTrue(achat.est_utilise)
+        self.assertEqual((achat.porte_validation, achat.date_utilisation.second), ('B2', 1))
+        self.assertFalse(Achat.objects.get(pk=self.autre.pk).est_utilise)
+        self.assertFalse(Achat.objects.get(code_qr=c).est_utilise)
+
+        # Lot renvoyé (réponse perdue) : mêmes résultats
+        response = self.client.post('/api/achats/validate/batch/', corps, format='json', **self.auth)
+        self.assertEqual([r['statut'] for r in response.data['resultats']], statuts)
+
+    def test_deux_portes(self):
+        code = self.achats[0].code_qr
+        passage = {'code_qr': code, 'scanned_at': timezone.now() - timedelta(seconds=3), 'gate_id': 'A1'}
+        with self.assertNumQueries(2):
+            premier = valider_lot([passage])
+        self.assertEqual(premier[0]['statut'], 'valide')
+        # Une autre porte synchronise plus tard le même billet, scanné plus tôt : trop tard
+        second = valider_lot([{'code_qr': code, 'scanned_at': timezone.now() - timedelta(seconds=10), 'gate_id': 'C7'}])
+        self.assertEqual(second[0]['statut'], 'deja_utilise')
+        self.assertEqual(second[0]['porte_gagnante'], 'A1')
+
+
+class ValidationConcurrenteTests(APITransactionTestCase):
+    """Un billet scanné au même instant à plusieurs portes n'est admis qu'une fois"""
+
+    def setUp(self):
+        evenement = creer_evenements(1)[0]
+        utilisateur, _ = creer_acheteur()
+        self.achat = Achat.objects.create(
+            id_utilisateur=utilisateur, id_ticket=Ticket.objects.get(id_evenement=evenement, type='Standard'),
+            quantite=1, montant_total=Decimal('5000'),
+        )
+
+    def test_un_seul_passage(self):
+        portes = 8
+        depart = threading.Barrier(portes)
+        statuts = []
+
+        def scanner(porte):
+            try:
+                depart.wait()
+                statuts.append(valider_billet(code_qr=self.achat.code_qr, porte=porte)[0])
+            finally:
+                connection.close()
+
+        fils = [threading.Thread(target=scanner, args=(f'P{i}',)) for i in range(portes)]
+        # Bascule entre threads très fréquente : lectures et écritures des portes s'entrelacent
+        intervalle = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        self.addCleanup(sys.setswitchinterval, intervalle)
+        for fil in fils:
+            fil.start()
+        for fil in fils:
+            fil.join()
+
+        self.assertEqual(sorted(statuts), ['deja_utilise'] * (portes - 1) + ['valide'])
+        achat = Achat.objects.get(pk=self.achat.pk)
+        self.assertTrue(achat.est_utilise)
+        self.assertIsNotNone(achat.date_utilisation)
+
+    def test_endpoints(self):
+        response = self.client.post(f'/api/achats/validate/{self.achat.code_qr}/', {'gate_id': 'A1'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Achat.objects.get(pk=self.achat.pk).porte_validation, 'A1')
+        self.assertEqual(self.client.post(f'/api/achats/validate/{self.achat.code_qr}/').status_code, 400)
+
+        self.client.credentials(**auth_utilisateur(self.achat.id_utilisateur))
+        response = self.client.post('/api/achats/valider/', {'id_achat': self.achat.id_achat}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertIsNotNone(response.data['achat']['date_utilisation'])
+        self.assertEqual(self.client.post('/api/achats/valider/', {'id_achat': 999}, format='json').status_code, 404)
+
+
+@override_settings(CATALOGUE_CACHE_ENABLED=False)
+class CacheScanTests(APITestCase):
+    """Scans d'un événement préchauffé : sans requête SQL, écriture différée en base"""
+
+    def setUp(self):
+        cache.clear()
+        cache_scan.vider_memoire()
+        self.addCleanup(cache.clear)
+        self.addCleanup(cache_scan.vider_memoire)
+        # Un seul processus de test : son locmem est partagé par toutes les « portes »
+        partage = patch('tickets.utils.cache_scan.cache_partage', return_value=True)
+        partage.start()
+        self.addCleanup(partage.stop)
+        self.evenement = creer_evenements(1)[0]
+        self.utilisateur, _ = creer_acheteur()
+        self.ticket = Ticket.objects.get(id_evenement=self.evenement, type='Standard')
+        self.achats = [
+            Achat.objects.create(id_utilisateur=self.utilisateur, id_ticket=self.ticket, quantite=1, montant_total=Decimal('5000'))
+            for _ in range(3)
+        ]
+        valider_billet(code_qr=self.achats[2].code_qr, porte='Z9')  # déjà passé avant le préchauffage
+        self.auth = creer_admin()
+
+    def prechauffer(self):
+        url = f'/api/evenements/{self.evenement.id_evenement}/prechauffer_scan/'
+        self.assertEqual(self.client.post(url).status_code, 401)
+        response = self.client.post(url, {'duree': 3600}, format='json', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['billets'], 3)
+        cache_scan.vider_memoire()  # copie locale rechargée depuis le cache partagé au premier scan
+
+    def test_cache_non_partage(self):
+        with patch('tickets.utils.cache_scan.cache_partage', return_value=False):
+            response = self.client.post(
+                f'/api/evenements/{self.evenement.id_evenement}/prechauffer_scan/', format='json', **self.auth
+            )
+            self.assertEqual(response.status_code, 503)
+            with self.assertRaises(CommandError):
+                call_command('prechauffer_scan', self.evenement.id_evenement, stdout=StringIO())
+        self.assertIsNone(cache_scan.consulter(self.achats[0].code_qr))
+
+    def test_scans_sans_base(self):
+        self.prechauffer()
+        code = self.achats[0].code_qr
+        with self.assertNumQueries(0):
+            details = self.client.get(f'/api/achats/details/{code}/')
+            premier = self.client.post(f'/api/achats/validate/{code}/', {'gate_id': 'A1'}, format='json')
+            second = self.client.post(f'/api/achats/validate/{code}/', {'gate_id': 'B2'}, format='json')
+            deja = self.client.post(f'/api/achats/validate/{self.achats[2].code_qr}/')
+        self.assertEqual(details.data['achat']['utilisateur'], 'Acheteur Test')
+        self.assertFalse(details.data['achat']['est_utilise'])
+        self.assertEqual(premier.status_code, 200)
+        self.assertEqual(premier.data['achat']['evenement'], self.evenement.titre_evenement)
+        self.assertEqual((second.status_code, deja.status_code), (400, 400))
+
+        # Écriture différée : la base est à jour après le passage du worker, une seule fois
+        self.assertFalse(Achat.objects.get(code_qr=code).est_utilise)
+        self.assertEqual(cache_scan.ecrire_passages(), (2, 0))
+        achat = Achat.objects.get(code_qr=code)
+        self.assertEqual((achat.est_utilise, achat.porte_validation), (True, 'A1'))
+        self.assertEqual(cache_scan.ecrire_passages(), (0, 0))
+
+    def test_validation_en_base_et_remboursement(self):
+        self.prechauffer()
+        a, b = self.achats[0], self.achats[1]
+        self.client.post(f'/api/achats/validate/{a.code_qr}/', {'gate_id': 'A1'}, format='json')
+        # Validation par id avant l'écriture différée : le passage du cache reste le seul admis
+        response = self.client.post(
+            '/api/achats/valider/', {'id_achat': a.id_achat}, format='json', **auth_utilisateur(self.utilisateur)
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Achat.objects.get(pk=a.pk).porte_validation, 'A1')
+        self.assertEqual(cache_scan.ecrire_passages(), (2, 0))
+
+        # Synchronisation hors ligne : reportée dans le cache
+        valider_lot([{'code_qr': b.code_qr, 'scanned_at': timezone.now(), 'gate_id': 'C3'}])
+        self.assertEqual(self.client.post(f'/api/achats/validate/{b.code_qr}/').status_code, 400)
+
+        # Achat remboursé : plus admis aux portes
+        with self.captureOnCommitCallbacks(execute=True):
+            Achat.objects.filter(pk=a.pk).delete()
+        self.assertEqual(self.client.get(f'/api/achats/details/{a.code_qr}/').status_code, 404)
+
+        # Achat postérieur au préchauffage : validé en base
+        nouveau = Achat.objects.create(id_utilisateur=self.utilisateur, id_ticket=self.ticket, quantite=1, montant_total=Decimal('5000'))
+        self.assertEqual(self.client.post(f'/api/achats/validate/{nouveau.code_qr}/').status_code, 200)
+        self.assertTrue(Achat.objects.get(pk=nouveau.pk).est_utilise)
+
+
+@override_settings(CATALOGUE_CACHE_ENABLED=False, FREQUENTATION_ECRITURE=0)
+class FrequentationTests(APITestCase):
+    """Compteurs de fréquentation tenus par les chemins d'achat et de validation"""
+
+    def setUp(self):
+        cache.clear()
+        frequentation.vider_memoire()
+        self.addCleanup(cache.clear)
+        self.addCleanup(frequentation.vider_memoire)
+        self.evenement = creer_evenements(1)[0]
+        self.session = self.evenement.sessions.order_by('date_heure').first()
+        self.ticket = Ticket.objects.get(id_evenement=self.evenement, type='Standard')
+        self.utilisateur, _ = creer_acheteur('50000')
+        self.achats = [
+            Achat.objects.create(id_utilisateur=self.utilisateur, id_ticket=self.ticket, quantite=1, montant_total=Decimal('5000'))
+            for _ in range(3)
+        ] + [Achat.objects.create(
+            id_utilisateur=self.utilisateur, id_ticket=self.ticket, session=self.session, quantite=2, montant_total=Decimal('10000'),
+        )]
+        self.auth = creer_admin()
+        self.url = f'/api/evenements/{self.evenement.id_evenement}/frequentation/'
+
+    def test_compteurs(self):
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+        response = self.client.get(self.url, **self.auth)  # amorçage : une requête groupée
+        self.assertEqual((response.data['vendus'], response.data['admis'], response.data['restants']), (5, 0, 5))
+
+        for achat in self.achats[2:]:
+            self.client.post(f'/api/achats/validate/{achat.code_qr}/', {'gate_id': 'A1'}, format='json')
+        self.client.post(f'/api/achats/validate/{self.achats[3].code_qr}/', {'gate_id': 'B2'}, format='json')
+        valider_lot([{'code_qr': self.achats[0].code_qr, 'scanned_at': timezone.now(), 'gate_id': 'B2'}])
+
+        with self.assertNumQueries(2):  # administrateur et événement, pas les achats
+            response = self.client.get(self.url, **self.auth)
+        self.assertEqual((response.data['vendus'], response.data['admis'], response.data['restants']), (5, 4, 1))
+        scans = {porte['porte']: sum(porte['minutes']) for porte in response.data['portes']}
+        self.assertEqual(scans, {'A1': 2, 'B2': 2})
+        self.assertEqual(response.data['latence']['mesures'], 3)  # scans unitaires
+        self.assertIsNotNone(response.data['latence']['p99_ms'])
+
+        # Lot rejoué : rien de plus
+        valider_lot([{'code_qr': self.achats[0].code_qr, 'scanned_at': Achat.objects.get(pk=self.achats[0].pk).date_utilisation, 'gate_id': 'B2'}])
+        response = self.client.get(f'{self.url}?session={self.session.pk}', **self.auth)
+        self.assertEqual((response.data['vendus'], response.data['admis']), (2, 2))
+        self.assertEqual(self.client.get(self.url, **self.auth).data['admis'], 4)
+        self.assertEqual(self.client.get(f'{self.url}?session=999', **self.auth).status_code, 400)
+
+    def test_achat_et_remboursement(self):
+        self.client.get(self.url, **self.auth)
+        auth = auth_utilisateur(self.utilisateur)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/achats/', {'id_ticket': self.ticket.id_ticket, 'quantite': 3}, format='json', **auth,
+            )
+        self.assertEqual(self.client.get(self.url, **self.auth).data['vendus'], 8)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f"/api/achats/{response.data['achat']['id_achat']}/", **auth)
+        self.assertEqual(self.client.get(self.url, **self.auth).data['vendus'], 5)
+
+    @override_settings(FREQUENTATION_FLUX_DUREE=0)
+    def test_flux(self):
+        self.client.post(f'/api/achats/validate/{self.achats[0].code_qr}/', {'gate_id': 'A1'}, format='json')
+        response = self.client.get(f'{self.url}flux/', HTTP_ACCEPT='text/event-stream', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        evenements = b''.join(response.streaming_content).decode().split('\n\n')
+        self.assertTrue(evenements[0].startswith('retry: '))
+        donnees = json.loads(evenements[1].removeprefix('data: '))
+        self.assertEqual((donnees['vendus'], donnees['admis']), (5, 1))
+        self.assertEqual(self.client.get(f'{self.url}flux/', HTTP_ACCEPT='text/event-stream').status_code, 401)
+
+
+@override_settings(CATALOGUE_CACHE_ENABLED=False, FREQUENTATION_ECRITURE=3600)
+class FrequentationWorkersTests(APITransactionTestCase):
+    """Les ventes d'un worker de commandes sont reportées avant la fin du processus"""
+
+    def setUp(self):
+        cache.clear()
+        frequentation.vider_memoire()
+        self.addCleanup(cache.clear)
+        self.addCleanup(frequentation.vider_memoire)
+        self.evenement = creer_evenements(1)[0]
+        self.ticket = Ticket.objects.get(id_evenement=self.evenement, type='Standard')
+        utilisateur, _ = creer_acheteur('50000')
+        Commande.objects.create(id_utilisateur=utilisateur, id_ticket=self.ticket, quantite=2)
+
+    def test_vente_en_worker(self):
+        self.assertEqual(frequentation.compteurs(self.evenement.id_evenement)['vendus'], 0)  # amorçage
+        frequentation.ecrire()  # dernière écriture récente : pas de report au fil des ventes
+        self.assertEqual(traiter_commandes(), (1, 0))
+        frequentation.vider_memoire()  # fin du worker : ce qui restait en mémoire est perdu
+        compteurs = frequentation.compteurs(self.evenement.id_evenement)
+        self.assertEqual((compteurs['vendus'], compteurs['restants']), (2, 2))
+
+    @override_settings(FREQUENTATION_ECRITURE=0.05)
+    def test_processus_inactif(self):
+        frequentation.ecrire()
+        frequentation.scan(self.evenement.id_evenement, None, 'A1')
+        self.assertIsNotNone(frequentation._minuterie[0])
+        frequentation._minuterie[0].join(1)  # aucun autre scan : la minuterie reporte le delta
+        frequentation.vider_memoire()
+        portes = frequentation.compteurs(self.evenement.id_evenement)['portes']
+        self.assertEqual([(porte['porte'], sum(porte['minutes'])) for porte in portes], [('A1', 1)])
@@ -19,6 +19,15 @@ urlpatterns = [
     # Gestion des achats
     path('', include('tickets.urls.achat_urls')),
     
+    # Commandes asynchrones (POST /api/achats/ avec Prefer: respond-async)
+    path('', include('tickets.urls.commande_urls')),
+    
+    # Réservations de places (panier)
+    path('', include('tickets.urls.reservation_urls')),
+    
+    # Salle d'attente des mises en vente
+    path('', include('tickets.urls.file_attente_urls')),
+    
     # Gestion des favoris
     path('', include('tickets.urls.favori_urls')),
     
@@ -1,4 +1,4 @@
-from django.urls import path, include
+from django.urls import path, include, re_path
 from rest_framework.routers import DefaultRouter
 from ..views.gestion_achat import AchatViewSet
 
@@ -6,6 +6,12 @@ router = DefaultRouter()
 router.register(r'achats', AchatViewSet, basename='achat')
 
 urlpatterns = [
+    # Images QR rendues à la demande (sans barre finale : extension du fichier)
+    re_path(
+        r'^achats/qr/(?P<code_qr>[^/.]+)\.(?P<extension>png|svg)$',
+        AchatViewSet.as_view({'get': 'image_qr'}),
+        name='achat-image-qr'
+    ),
     path('', include(router.urls)),
 ]
 
@@ -18,3 +24,7 @@ urlpatterns = [
 # GET    /api/achats/par_evenement/?id_evenement=1  - Achats pour un événement
 # GET    /api/achats/recents/                       - Achats récents (< 24h)
 # GET    /api/achats/statistiques/                  - Statistiques d'achats
+# GET    /api/achats/qr/{code_qr}.png|.svg          - Image QR rendue à la demande (?correction=H&taille=10)
+# GET    /api/achats/jeton/cle/                     - Clés publiques des jetons QR signés
+# POST   /api/achats/jeton/verifier/                - Vérifier un jeton QR sans accès à la base
+# POST   /api/achats/validate/batch/                - Passages synchronisés par les scanners (admin)
@@ -0,0 +1,14 @@
+from django.urls import path, include
+from rest_framework.routers import DefaultRouter
+from ..views.gestion_commande import CommandeViewSet
+
+router = DefaultRouter()
+router.register(r'commandes', CommandeViewSet, basename='commande')
+
+urlpatterns = [
+    path('', include(router.urls)),
+]
+
+# Routes générées automatiquement par le router:
+# GET    /api/commandes/                       - Commandes asynchrones de l'utilisateur (?statut=en_attente)
+# GET    /api/commandes/{id}/                  - Statut d'une commande (achat créé une fois acceptée)
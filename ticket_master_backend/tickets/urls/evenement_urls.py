@@ -22,4 +22,11 @@ urlpatterns = [
 # GET    /api/evenements/passes/                - Liste les événements passés
 # GET    /api/evenements/{id}/tickets/          - Liste les tickets d'un événement
 # GET    /api/evenements/par_type/?type=concert - Filtre par type d'événement
-# GET    /api/evenements/rechercher/?q=text     - Rechercher des événements
+# GET    /api/evenements/rechercher/?q=text     - Rechercher des événements (plein texte, par pertinence)
+# GET    /api/evenements/filtrer/?type=&lieu=&prix_min=... - Filtres combinés avec nombres par facette
+# GET    /api/evenements/suggest/?q=text        - Autocomplétion (id, titre, type)
+# GET    /api/evenements/proches/?lat=&lon=&rayon_km= - Événements proches, triés par distance
+# GET    /api/evenements/clusters/?bbox=&zoom=  - Clusters de marqueurs pour la carte
+# GET    /api/evenements/snapshot/?ids=1,2      - Snapshot admin (tickets, sessions, ventes)
+# POST   /api/evenements/{id}/annuler/          - Annuler l'événement (ou une session), remboursements par lots
+# GET    /api/evenements/{id}/annulations/      - Progression des annulations de l'événement
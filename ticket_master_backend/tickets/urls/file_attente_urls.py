@@ -0,0 +1,17 @@
+from django.urls import path, include
+from rest_framework.routers import DefaultRouter
+from ..views.gestion_file_attente import FileAttenteViewSet
+
+router = DefaultRouter()
+router.register(r'file-attente', FileAttenteViewSet, basename='file-attente')
+
+urlpatterns = [
+    path('', include(router.urls)),
+]
+
+# Routes générées automatiquement par le router:
+# GET    /api/file-attente/{id_evenement}/             - Configuration et compteurs (admin)
+# POST   /api/file-attente/{id_evenement}/activer/     - Activer la file {debit, rafale} (admin)
+# POST   /api/file-attente/{id_evenement}/desactiver/  - Désactiver la file (admin)
+# POST   /api/file-attente/{id_evenement}/rejoindre/   - Obtenir un jeton de file
+# GET    /api/file-attente/statut/?jeton=...           - Position et admission (sans authentification)
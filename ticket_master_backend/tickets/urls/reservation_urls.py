@@ -0,0 +1,16 @@
+from django.urls import path, include
+from rest_framework.routers import DefaultRouter
+from ..views.gestion_reservation import ReservationViewSet
+
+router = DefaultRouter()
+router.register(r'reservations', ReservationViewSet, basename='reservation')
+
+urlpatterns = [
+    path('', include(router.urls)),
+]
+
+# Routes générées automatiquement par le router:
+# GET    /api/reservations/                    - Réservations de l'utilisateur (?statut=active)
+# POST   /api/reservations/                    - Réserver des places (stock retiré pendant RESERVATION_DUREE)
+# GET    /api/reservations/{id}/               - Détail d'une réservation
+# DELETE /api/reservations/{id}/               - Annuler une réservation active (places remises en stock)
@@ -0,0 +1,160 @@
+"""
+Remboursement des achats : annulation unitaire (DELETE /api/achats/<id>/) et annulation
+d'un événement ou d'une session entière (POST /api/evenements/<id>/annuler/).
+
+rembourser_achats() traite un ensemble d'achats dans la transaction de l'appelant :
+    1. achats verrouillés et relus : un achat déjà remboursé par une requête simultanée
+       (annulation unitaire pendant celle de l'événement) n'est plus là, il n'est pas
+       remboursé deux fois ;
+    2. stock : un UPDATE relatif par ticket (ordre des ids de ticket), sauf pour les achats
+       d'un événement ou d'une session annulés (places qui ne seront plus vendues) ;
+    3. soldes : un UPDATE solde = solde + total par utilisateur (ordre des ids) ;
+    4. une Transaction 'remboursement' par achat (bulk_create), puis suppression des achats.
+
+annuler() ferme la portée dans la transaction qui crée l'Annulation : événement (ou
+session) marqué est_annule, ce que refusent achats, réservations et commandes. Pour tout
+l'événement, le stock des tickets est en plus mis à zéro, les réservations actives
+annulées et les commandes en attente refusées : un achat concurrent échoue sur son
+UPDATE conditionnel (stock, réservation) au lieu de passer après le recensement.
+
+Une annulation d'événement est traitée par le worker traiter_annulations, lot par lot :
+chaque lot (remboursements et compteurs de l'Annulation) est validé d'un bloc. Un worker
+arrêté n'a rien laissé à moitié : la reprise repart des achats restants.
+"""
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from ..models.achat import Achat
+from ..models.annulation import Annulation
+from ..models.commande import Commande
+from ..models.fraction_stock import FractionStock
+from ..models.reservation import Reservation
+from ..models.ticket import Ticket
+from ..models.transaction import Transaction
+from ..signals import invalider_ticket
+from . import frequentation
+from .inventaire import avec_reprises, crediter_solde, incrementer_stock
+
+LOT = 500
+
+EVENEMENT_ANNULE = "Cet événement est annulé."
+SESSION_ANNULEE = "Cette session est annulée."
+
+
+def rembourser_achats(achats, motif):
+    """
+    Rembourser et supprimer les achats du queryset `achats` (dans une transaction) ;
+    (nombre d'achats remboursés, montant total)
+    """
+    achats = list(achats.select_for_update(of=('self',)).select_related('id_ticket__id_evenement', 'session'))
+    if not achats:
+        return 0, Decimal('0')
+
+    quantites, tickets, montants = defaultdict(int), {}, defaultdict(Decimal)
+    for achat in achats:
+        montants[achat.id_utilisateur_id] += achat.montant_total
+        if achat.id_ticket.id_evenement.est_annule or (achat.session and achat.session.est_annule):
+            continue  # portée annulée : places pas remises en vente
+        quantites[achat.id_ticket_id] += achat.quantite
+        tickets[achat.id_ticket_id] = achat.id_ticket
+    for id_ticket in sorted(quantites):
+        incrementer_stock(tickets[id_ticket], quantites[id_ticket])
+    for id_utilisateur in sorted(montants):
+        crediter_solde(id_utilisateur, montants[id_utilisateur])
+
+    # bulk_create n'appelle pas Transaction.save() : référence générée ici
+    Transaction.objects.bulk_create([
+        Transaction(
+            id_utilisateur_id=achat.id_utilisateur_id,
+            montant=achat.montant_total,
+            type_transaction='remboursement',
+            reference=f"REM-{uuid.uuid4().hex[:10].upper()}",
+            description=f"Remboursement de l'achat {achat.id_achat} ({achat.quantite} x {achat.id_ticket.type}) : {motif}",
+        )
+        for achat in achats
+    ])
+    Achat.objects.filter(pk__in=[achat.pk for achat in achats]).delete()
+    frequentation.rembourser(achats)
+    return len(achats), sum(montants.values(), Decimal('0'))
+
+
+def _fermer_evenement(evenement):
+    """Plus de places à vendre : stock à zéro, réservations actives annulées, commandes refusées"""
+    maintenant = timezone.now()
+    tickets = list(Ticket.objects.filter(id_evenement=evenement).order_by('pk').values_list('pk', flat=True))
+    Ticket.objects.filter(pk__in=tickets).update(stock=0, date_modification=maintenant)
+    FractionStock.objects.filter(ticket_id__in=tickets).update(stock=0, date_modification=maintenant)
+    for id_ticket in tickets:
+        invalider_ticket(id_ticket, evenement.id_evenement)
+    Reservation.objects.filter(id_ticket__in=tickets, statut=Reservation.ACTIVE).update(statut=Reservation.ANNULEE)
+    Commande.objects.filter(id_ticket__in=tickets, statut=Commande.EN_ATTENTE).update(
+        statut=Commande.REFUSEE, motif=EVENEMENT_ANNULE, date_traitement=maintenant
+    )
+
+
+def annuler(evenement, session=None, motif=''):
+    """Annuler un événement (ou une session) et créer son Annulation ; (annulation, créée)"""
+    en_cours = Annulation.objects.filter(evenement=evenement, session=session, statut=Annulation.EN_COURS)
+    existante = en_cours.first()
+    if existante:
+        return existante, False
+    try:
+        with transaction.atomic():
+            cible = session or evenement
+            cible.est_annule = True
+            cible.save(update_fields=['est_annule', 'date_modification'])
+            if session is None:
+                _fermer_evenement(evenement)
+            annulation = Annulation(evenement=evenement, session=session, motif=motif)
+            annulation.achats_total = Achat.objects.filter(annulation.filtre_achats()).count()
+            annulation.save()
+    except IntegrityError:
+        # Annulation identique créée par une requête simultanée (contrainte d'unicité)
+        return en_cours.get(), False
+    return annulation, True
+
+
+@avec_reprises
+def _traiter_lot(id_annulation, lot):
+    verrou = {'skip_locked': True} if connection.features.has_select_for_update_skip_locked else {}
+    annulation = Annulation.objects.select_for_update(**verrou).filter(
+        pk=id_annulation, statut=Annulation.EN_COURS
+    ).first()
+    if annulation is None:
+        return None, 0  # terminée, ou lot en cours dans un autre worker
+
+    motif = f"annulation de l'événement {annulation.evenement_id}" + (f" ({annulation.motif})" if annulation.motif else '')
+    ids = list(Achat.objects.filter(annulation.filtre_achats()).order_by('id_achat').values_list('pk', flat=True)[:lot])
+    nombre, montant = rembourser_achats(Achat.objects.filter(pk__in=ids), motif)
+    annulation.achats_rembourses += nombre
+    annulation.montant_rembourse += montant
+    if len(ids) < lot:
+        annulation.statut = Annulation.TERMINEE
+        annulation.date_fin = timezone.now()
+    annulation.save(update_fields=['achats_rembourses', 'montant_rembourse', 'statut', 'date_fin'])
+    return annulation, nombre
+
+
+def traiter_annulations(lot=LOT, progression=None):
+    """
+    Rembourser les achats des annulations en cours, lot par lot ; nombre d'achats remboursés.
+    `progression(annulation)` est appelée après chaque lot.
+    """
+    total = 0
+    en_cours = Annulation.objects.filter(statut=Annulation.EN_COURS).order_by('id_annulation')
+    for id_annulation in en_cours.values_list('pk', flat=True):
+        while True:
+            annulation, nombre = _traiter_lot(id_annulation, lot)
+            frequentation.ecrire()  # remboursements du lot validé
+            if annulation is None:
+                break
+            total += nombre
+            if progression:
+                progression(annulation)
+            if annulation.statut == Annulation.TERMINEE:
+                break
+    return total
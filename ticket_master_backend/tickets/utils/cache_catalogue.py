@@ -0,0 +1,168 @@
+"""
+Cache versionné des réponses publiques du catalogue (événements, tickets).
+
+Chaque réponse mise en cache dépend d'une ou plusieurs "portées" (ex. 'catalogue',
+'evenement:12', 'ticket:7'). Chaque portée a un numéro de version stocké dans le cache :
+les signaux de tickets/signals.py incrémentent les versions concernées à chaque
+sauvegarde/suppression, ce qui rend obsolètes uniquement les réponses qui en dépendent.
+
+Les réponses sont stockées sans `is_favorite` (valeur anonyme) : pour un utilisateur
+connecté, `is_favorite` est recalculé à partir de son ensemble de favoris, lui-même
+mis en cache et invalidé à chaque modification d'un Favori.
+
+Protection contre l'effet de meute : un seul worker reconstruit une réponse expirée
+(verrou via cache.add) ; les autres servent l'ancienne version si elle existe, sinon
+attendent brièvement la reconstruction.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+from ..models.favori import Favori
+from ..models.utilisateurs import Utilisateur
+
+PREFIXE = 'catalogue'
+VERROU_TIMEOUT = 10  # secondes
+ATTENTE_MAX = 2.0  # secondes d'attente d'une reconstruction en cours
+ATTENTE_PAS = 0.05
+
+
+def _cle_version(portee):
+    return f'{PREFIXE}:version:{portee}'
+
+
+def _cle_favoris(id_utilisateur):
+    return f'{PREFIXE}:favoris:{id_utilisateur}'
+
+
+def get_versions(portees):
+    """Retourner l'étiquette de version courante pour une liste de portées (un aller-retour)"""
+    cles = [_cle_version(portee) for portee in portees]
+    versions = cache.get_many(cles)
+    manquantes = [cle for cle in cles if cle not in versions]
+    for cle in manquantes:
+        # Base horodatée : si une version est évincée, elle ne retombe pas sur une ancienne valeur
+        cache.add(cle, int(time.time() * 1000), timeout=None)
+    if manquantes:
+        versions.update(cache.get_many(manquantes))
+    return ':'.join(str(versions.get(cle, 0)) for cle in cles)
+
+
+def invalider(*portees):
+    """Incrémenter la version des portées données"""
+    for portee in portees:
+        cle = _cle_version(portee)
+        try:
+            cache.incr(cle)
+        except ValueError:
+            cache.add(cle, int(time.time() * 1000), timeout=None)
+
+
+def invalider_favoris(id_utilisateur):
+    """Oublier l'ensemble de favoris mis en cache d'un utilisateur"""
+    cache.delete(_cle_favoris(id_utilisateur))
+
+
+def get_favoris_utilisateur(utilisateur):
+    """Ensemble des id_evenement favoris d'un utilisateur, mis en cache"""
+    cle = _cle_favoris(utilisateur.id_utilisateur)
+    favoris = cache.get(cle)
+    if favoris is None:
+        favoris = set(
+            Favori.objects.filter(utilisateur=utilisateur).values_list('evenement_id', flat=True)
+        )
+        cache.set(cle, favoris, settings.CATALOGUE_CACHE_TIMEOUT)
+    return favoris
+
+
+def appliquer_favoris(data, favoris):
+    """Positionner `is_favorite` dans toute structure contenant des événements sérialisés"""
+    if isinstance(data, dict):
+        if 'is_favorite' in data and 'id_evenement' in data:
+            data['is_favorite'] = data['id_evenement'] in favoris
+        for valeur in data.values():
+            if isinstance(valeur, (dict, list)):
+                appliquer_favoris(valeur, favoris)
+    elif isinstance(data, list):
+        for element in data:
+            appliquer_favoris(element, favoris)
+    return data
+
+
+def _cle_reponse(nom, request):
+    # L'URI absolue couvre les paramètres, la pagination et l'hôte des URLs d'images
+    digest = hashlib.sha1(request.build_absolute_uri().encode('utf-8')).hexdigest()
+    return f'{PREFIXE}:reponse:{nom}:{digest}'
+
+
+def _reponse(data, favoris, etat):
+    if favoris is not None:
+        appliquer_favoris(data, favoris)
+    response = Response(data)
+    response['X-Cache'] = etat
+    return response
+
+
+def cache_catalogue(nom, portees):
+    """
+    Décorateur pour les actions de lecture d'un ViewSet.
+
+    nom : identifiant de la vue (partie de la clé de cache)
+    portees : callable(kwargs) -> liste des portées dont dépend la réponse
+    """
+    def decorateur(methode):
+        @wraps(methode)
+        def wrapper(self, request, *args, **kwargs):
+            if not getattr(settings, 'CATALOGUE_CACHE_ENABLED', True):
+                return methode(self, request, *args, **kwargs)
+
+            utilisateur = request.user if isinstance(request.user, Utilisateur) else None
+            cle = _cle_reponse(nom, request)
+            version = get_versions(portees(kwargs))
+
+            entree = cache.get(cle)
+            if entree is not None and entree[0] == version:
+                favoris = get_favoris_utilisateur(utilisateur) if utilisateur else None
+                return _reponse(entree[1], favoris, 'HIT')
+
+            cle_verrou = f'{cle}:verrou'
+            verrou = cache.add(cle_verrou, 1, VERROU_TIMEOUT)
+            if not verrou:
+                # Une reconstruction est en cours ailleurs
+                if entree is not None:
+                    favoris = get_favoris_utilisateur(utilisateur) if utilisateur else None
+                    return _reponse(entree[1], favoris, 'STALE')
+                limite = time.monotonic() + ATTENTE_MAX
+                while time.monotonic() < limite:
+                    time.sleep(ATTENTE_PAS)
+                    entree = cache.get(cle)
+                    if entree is not None and entree[0] == version:
+                        favoris = get_favoris_utilisateur(utilisateur) if utilisateur else None
+                        return _reponse(entree[1], favoris, 'HIT')
+
+            try:
+                response = methode(self, request, *args, **kwargs)
+                if response.status_code == 200:
+                    # Version partagée : is_favorite à la valeur anonyme
+                    partage = appliquer_favoris(_copie(response.data), set())
+                    cache.set(cle, (version, partage), settings.CATALOGUE_CACHE_TIMEOUT)
+                    response['X-Cache'] = 'MISS'
+                return response
+            finally:
+                if verrou:
+                    cache.delete(cle_verrou)
+        return wrapper
+    return decorateur
+
+
+def _copie(data):
+    """Copie profonde des types produits par les serializers (dict, list, valeurs simples)"""
+    if isinstance(data, dict):
+        return {cle: _copie(valeur) for cle, valeur in data.items()}
+    if isinstance(data, list):
+        return [_copie(valeur) for valeur in data]
+    return data
@@ -0,0 +1,152 @@
+"""
+Rendu des QR codes à la demande (GET /api/achats/qr/<code>.png|.svg), sans fichier par achat.
+
+Une image ne dépend que de l'URL encodée, du format, du niveau de correction et de la
+taille des modules : elle est rendue à la première demande puis servie depuis
+    1. un LRU en mémoire du processus (QR_CACHE_MEMOIRE octets) ;
+    2. un cache disque borné (QR_CACHE_DISQUE octets sous QR_CACHE_DOSSIER), partagé par
+       les workers d'un hôte : au-delà de la limite, les fichiers servis le moins
+       récemment sont supprimés.
+L'achat (pour son jeton signé, voir jeton_qr.py) n'est lu en base qu'au rendu. Les réponses portent
+Cache-Control: immutable : navigateurs et CDN ne redemandent plus la même image.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from ..models.achat import Achat
+from .jeton_qr import cle_publique_brute, id_cle
+from .qr_generator import contenu_qr, rendre_png, rendre_svg
+
+RENDUS = {'png': rendre_png, 'svg': rendre_svg}
+
+
+class CacheMemoire:
+    """LRU borné par la taille totale des valeurs (octets)"""
+
+    def __init__(self, capacite):
+        self.capacite = capacite
+        self.taille = 0
+        self._entrees = OrderedDict()
+        self._verrou = threading.Lock()
+
+    def get(self, cle):
+        with self._verrou:
+            valeur = self._entrees.get(cle)
+            if valeur is not None:
+                self._entrees.move_to_end(cle)
+            return valeur
+
+    def set(self, cle, valeur):
+        if len(valeur) > self.capacite:
+            return
+        with self._verrou:
+            ancienne = self._entrees.pop(cle, None)
+            if ancienne is not None:
+                self.taille -= len(ancienne)
+            self._entrees[cle] = valeur
+            self.taille += len(valeur)
+            while self.taille > self.capacite:
+                _, evincee = self._entrees.popitem(last=False)
+                self.taille -= len(evincee)
+
+
+class CacheDisque:
+    """
+    Fichiers sous `dossier`, date de modification = dernier service. L'éviction (des plus
+    anciens jusqu'à 90 % de la capacité) recompte le dossier : l'estimation de chaque
+    processus est ainsi recalée sur les écritures des autres.
+    """
+
+    def __init__(self, dossier, capacite):
+        self.dossier = dossier
+        self.capacite = capacite
+        self.taille = None
+
+    def _chemin(self, cle):
+        return os.path.join(self.dossier, cle[:2], cle)
+
+    def get(self, cle):
+        chemin = self._chemin(cle)
+        try:
+            with open(chemin, 'rb') as fichier:
+                valeur = fichier.read()
+            os.utime(chemin)
+            return valeur
+        except FileNotFoundError:
+            return None
+
+    def set(self, cle, valeur):
+        chemin = self._chemin(cle)
+        os.makedirs(os.path.dirname(chemin), exist_ok=True)
+        temporaire = f'{chemin}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporaire, 'wb') as fichier:
+            fichier.write(valeur)
+        os.replace(temporaire, chemin)  # jamais de fichier partiel visible
+        if self.taille is None:
+            self.evincer()
+        else:
+            self.taille += len(valeur)
+            if self.taille > self.capacite:
+                self.evincer()
+
+    def evincer(self):
+        fichiers = []
+        for racine, _, noms in os.walk(self.dossier):
+            for nom in noms:
+                if nom.endswith('.tmp'):
+                    continue
+                chemin = os.path.join(racine, nom)
+                try:
+                    infos = os.stat(chemin)
+                except FileNotFoundError:
+                    continue
+                fichiers.append((infos.st_mtime, infos.st_size, chemin))
+        taille = sum(f[1] for f in fichiers)
+        if taille > self.capacite:
+            for _, octets, chemin in sorted(fichiers):
+                if taille <= self.capacite * 0.9:
+                    break
+                try:
+                    os.remove(chemin)
+                except FileNotFoundError:
+                    pass
+                taille -= octets
+        self.taille = taille
+
+
+_caches = {}
+
+
+def _cache(classe, *parametres):
+    cle = (classe, *parametres)
+    if cle not in _caches:
+        _caches[cle] = classe(*parametres)
+    return _caches[cle]
+
+
+def image_qr(code_qr, extension, correction, taille, base):
+    """
+    (cle, octets) de l'image QR d'un achat, None si aucun achat n'a ce code.
+    `cle` identifie le contenu (ETag).
+    """
+    # Le contenu ne dépend que de l'achat (immuable) et de la clé de signature courante
+    empreinte = f'{code_qr}|{base}|{id_cle(cle_publique_brute())}|{correction}|{taille}'
+    cle = f"{hashlib.sha256(empreinte.encode('utf-8')).hexdigest()[:40]}.{extension}"
+    memoire = _cache(CacheMemoire, settings.QR_CACHE_MEMOIRE)
+    disque = _cache(CacheDisque, settings.QR_CACHE_DOSSIER, settings.QR_CACHE_DISQUE)
+
+    contenu = memoire.get(cle)
+    if contenu is None:
+        contenu = disque.get(cle)
+        if contenu is None:
+            achat = Achat.objects.select_related('id_ticket__id_evenement', 'session').filter(code_qr=code_qr).first()
+            if achat is None:
+                return None
+            contenu = RENDUS[extension](contenu_qr(achat, base), correction, taille)
+            disque.set(cle, contenu)
+        memoire.set(cle, contenu)
+    return cle, contenu
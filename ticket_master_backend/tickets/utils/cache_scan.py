@@ -0,0 +1,309 @@
+"""
+Cache des billets d'un événement (ou d'une session) pour les scans aux portes, préchauffé
+avant l'ouverture (POST /api/evenements/<id>/prechauffer_scan/ ou commande prechauffer_scan).
+
+À l'ouverture des portes, des milliers de scans relisent en quelques minutes les mêmes
+achats d'un événement. prechauffer() les lit une fois en base et range dans le cache
+partagé (cache Django, Redis en production) :
+    - la table des billets : {code_qr (UUID, 16 octets): résumé affiché}, d'un bloc ;
+    - l'état des billets déjà utilisés : une clé par billet, (date_utilisation, porte).
+Chaque worker recopie la table dans sa mémoire au premier scan : details/<code_qr>/ et
+validate/<code_qr>/ trouvent le résumé par un accès à un dictionnaire, sans requête SQL.
+Seul l'état d'usage reste lu dans le cache partagé, car il est commun à toutes les portes :
+    - validation : cache.add() de la clé d'état (atomique sur tous les caches Django) ;
+      d'un billet présenté à deux portes, une seule ajoute la clé et l'admet ;
+    - écriture différée : le worker ecrire_passages reporte les admissions en base par
+      valider_lot() (un UPDATE ensembliste par lot, sans effet si rejoué).
+Les validations faites en base (valider/, validate/batch/) marquent l'état dans le cache
+(marquer()) : pour un billet préchauffé, la clé d'état reste l'unique arbitre. Un achat
+remboursé est marqué annulé. Un billet absent du cache (code antérieur aux UUID, achat
+postérieur au préchauffage) suit le chemin en base.
+
+Le cache doit être partagé entre les workers, avec un add() atomique (CACHE_BACKEND=redis,
+sans éviction : une admission évincée avant son écriture en base serait perdue) :
+prechauffer() refuse sinon (CachePartageRequis). Avec locmem, chaque processus aurait ses
+propres admissions, que le worker ecrire_passages ne verrait jamais ; file n'a pas d'add()
+atomique.
+"""
+import time
+import uuid
+from typing import NamedTuple
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.db import DatabaseCache
+from django.core.cache.backends.memcached import BaseMemcachedCache
+from django.core.cache.backends.redis import RedisCache
+from django.utils import timezone
+
+from ..models.achat import Achat
+from . import frequentation, validation
+
+PREFIXE = 'scan'
+ANNULE = 'annule'
+MARGE = 60  # la copie locale expire avant les clés partagées : pas d'admission sans état
+RAFRAICHISSEMENT = 1.0  # secondes entre deux lectures de l'index des portées (billet absent)
+
+
+class CachePartageRequis(Exception):
+    """Le cache par défaut n'est pas partagé entre les processus (ou son add() n'est pas atomique)"""
+
+
+def cache_partage(alias='default'):
+    """Vrai si le cache peut arbitrer les admissions de tous les workers"""
+    return isinstance(caches[alias], (RedisCache, BaseMemcachedCache, DatabaseCache))
+
+
+class Billet(NamedTuple):
+    id_achat: int
+    id_evenement: int
+    id_session: int
+    utilisateur: str
+    email: str
+    tel: str
+    evenement: str
+    type_ticket: str
+    quantite: int
+    total: str
+    date_achat: datetime
+    portee: str
+
+    def resume(self, etat):
+        """Détails affichés au scan, comme ceux lus en base ; `etat` : (date, porte) ou None"""
+        utilise = isinstance(etat, tuple)
+        return {
+            'id_achat': self.id_achat,
+            'utilisateur': self.utilisateur,
+            'email': self.email,
+            'tel': self.tel,
+            'evenement': self.evenement,
+            'type_ticket': self.type_ticket,
+            'quantite': self.quantite,
+            'total': self.total,
+            'date_achat': self.date_achat,
+            'est_utilise': utilise,
+            'date_utilisation': etat[0] if utilise else None,
+        }
+
+
+# Copie locale (par processus) : billets des portées chargées et fin de validité de chaque portée
+_billets = {}
+_portees = {}
+_verifie = [0.0]
+
+# Mémoire du worker d'écriture : (expiration, compteur d'admissions) vus par portée, billets écrits
+_compteurs = {}
+_ecrits = set()
+
+
+def _cle(*parties):
+    return ':'.join([PREFIXE, *map(str, parties)])
+
+
+def portee(id_evenement, id_session=None):
+    return f'{id_evenement}:{id_session or 0}'
+
+
+def _octets(code_qr):
+    try:
+        return uuid.UUID(str(code_qr)).bytes
+    except ValueError:
+        return None
+
+
+def _cle_etat(octets):
+    return _cle('etat', octets.hex())
+
+
+def _incrementer(cle, duree):
+    cache.add(cle, 0, duree)
+    try:
+        return cache.incr(cle)
+    except ValueError:  # expirée entre add() et incr()
+        cache.add(cle, 0, duree)
+        return cache.incr(cle)
+
+
+def vider_memoire():
+    """Oublier la copie locale (rechargée au prochain scan) et la mémoire du worker d'écriture"""
+    _billets.clear()
+    _portees.clear()
+    _verifie[0] = 0.0
+    _compteurs.clear()
+    _ecrits.clear()
+
+
+def prechauffer(evenement, session=None, duree=None):
+    """
+    Charger les billets d'un événement (ou d'une session) dans le cache ; (nombre de
+    billets, expiration). `duree` en secondes, au plus SCAN_CACHE_DUREE.
+    CachePartageRequis si le cache n'est pas partagé.
+    """
+    if not cache_partage():
+        raise CachePartageRequis(
+            'Le cache des scans exige un cache partagé entre les workers (CACHE_BACKEND=redis).'
+        )
+    duree = min(duree or settings.SCAN_CACHE_DUREE, settings.SCAN_CACHE_DUREE)
+    id_evenement = getattr(evenement, 'pk', evenement)
+    achats = Achat.objects.filter(id_ticket__id_evenement=id_evenement)
+    if session is not None:
+        achats = achats.filter(session=session)
+
+    billets, etats = {}, {}
+    for (code_qr, id_achat, id_session, prenom, nom, email, tel, titre, type_ticket, quantite, total, date_achat,
+         est_utilise, date_utilisation, porte) in achats.values_list(
+            'code_qr', 'id_achat', 'session_id', 'id_utilisateur__prenom', 'id_utilisateur__nom', 'id_utilisateur__email',
+            'id_utilisateur__tel', 'id_ticket__id_evenement__titre_evenement', 'id_ticket__type', 'quantite',
+            'montant_total', 'date_achat', 'est_utilise', 'date_utilisation', 'porte_validation',
+    ).iterator(chunk_size=2000):
+        octets = _octets(code_qr)
+        if octets is None:
+            continue  # code antérieur aux UUID : chemin en base
+        billets[octets] = (id_achat, id_evenement, id_session, f'{prenom} {nom}', email, tel, titre, type_ticket, quantite, str(total), date_achat)
+        if est_utilise:
+            etats[_cle_etat(octets)] = (date_utilisation, porte)
+
+    cle_portee = portee(id_evenement, getattr(session, 'pk', session))
+    expiration = time.time() + duree
+    # Nouveau préchauffage : les états déjà dans le cache (admissions pas encore écrites) priment
+    etats.update(cache.get_many([_cle_etat(octets) for octets in billets]))
+    cache.set_many(etats, duree)
+    cache.set(_cle('billets', cle_portee), {'expiration': expiration, 'billets': billets}, duree)
+    index = {p: fin for p, fin in (cache.get(_cle('portees')) or {}).items() if fin > time.time()}
+    index[cle_portee] = expiration
+    cache.set(_cle('portees'), index, None)
+    _charger(cle_portee)
+    frequentation.amorcer(id_evenement)  # compteurs de fréquentation : vendus et admis
+    return len(billets), datetime.fromtimestamp(expiration, tz=dt_timezone.utc)
+
+
+def _charger(cle_portee):
+    table = cache.get(_cle('billets', cle_portee))
+    if table is None:
+        return
+    _billets.update((octets, Billet(*valeurs, cle_portee)) for octets, valeurs in table['billets'].items())
+    _portees[cle_portee] = table['expiration'] - MARGE
+
+
+def _rafraichir():
+    """Charger les portées préchauffées depuis la dernière lecture de l'index (au plus une fois par seconde)"""
+    maintenant = time.time()
+    if maintenant - _verifie[0] < RAFRAICHISSEMENT:
+        return
+    _verifie[0] = maintenant
+    expirees = {cle_portee for cle_portee, fin in _portees.items() if fin <= maintenant}
+    if expirees:
+        for octets in [octets for octets, billet in _billets.items() if billet.portee in expirees]:
+            del _billets[octets]
+        for cle_portee in expirees:
+            del _portees[cle_portee]
+    for cle_portee, expiration in (cache.get(_cle('portees')) or {}).items():
+        if expiration - MARGE > maintenant and _portees.get(cle_portee) != expiration - MARGE:
+            _charger(cle_portee)
+
+
+def _trouver(code_qr):
+    """(octets, Billet) d'un billet préchauffé encore valide, sinon (octets, None)"""
+    octets = _octets(code_qr)
+    if octets is None:
+        return None, None
+    billet = _billets.get(octets)
+    if billet is None:
+        _rafraichir()
+        billet = _billets.get(octets)
+    if billet is None or _portees.get(billet.portee, 0) <= time.time():
+        return octets, None
+    return octets, billet
+
+
+def _duree_restante(billet):
+    return max(1, int(_portees[billet.portee] + MARGE - time.time()))
+
+
+def consulter(code_qr):
+    """
+    (Billet, état) d'un billet préchauffé, état None (non utilisé), (date, porte) ou ANNULE ;
+    None si le billet n'est pas dans le cache
+    """
+    octets, billet = _trouver(code_qr)
+    if billet is None:
+        return None
+    return billet, cache.get(_cle_etat(octets))
+
+
+def admettre(code_qr, porte=''):
+    """
+    Valider un billet préchauffé : (VALIDE | DEJA_UTILISE | INCONNU, Billet, état) ;
+    None si le billet n'est pas dans le cache (validation en base)
+    """
+    debut = time.perf_counter()
+    octets, billet = _trouver(code_qr)
+    if billet is None:
+        return None
+    etat, cle = (timezone.now(), porte), _cle_etat(octets)
+    duree = _duree_restante(billet)
+    if cache.add(cle, etat, duree):
+        _incrementer(_cle('admissions', billet.portee), duree)
+        frequentation.scan(billet.id_evenement, billet.id_session, porte, billet.quantite, time.perf_counter() - debut)
+        return validation.VALIDE, billet, etat
+    existant = cache.get(cle)
+    if existant is None:
+        return None  # expirée entre-temps
+    if existant == ANNULE:
+        return validation.INCONNU, billet, None
+    frequentation.scan(billet.id_evenement, billet.id_session, porte, 0, time.perf_counter() - debut)
+    return validation.DEJA_UTILISE, billet, existant
+
+
+def marquer(code_qr, date_utilisation, porte):
+    """
+    Reporter dans le cache une validation faite en base. None si elle est retenue (ou si le
+    billet n'est pas préchauffé) ; sinon l'état qui l'a devancée dans le cache - admission
+    pas encore écrite en base, ou ANNULE.
+    """
+    octets, billet = _trouver(code_qr)
+    if billet is None:
+        return None
+    etat, cle = (date_utilisation, porte), _cle_etat(octets)
+    if cache.add(cle, etat, _duree_restante(billet)):
+        return None
+    existant = cache.get(cle)
+    return None if existant in (None, etat) else existant
+
+
+def annuler_billet(code_qr):
+    """Achat remboursé : ne plus l'admettre aux portes"""
+    octets = _octets(code_qr)
+    if octets is not None:
+        cache.set(_cle_etat(octets), ANNULE, settings.SCAN_CACHE_DUREE)
+
+
+def ecrire_passages(lot=validation.LOT_MAX):
+    """
+    Écriture différée : reporter en base les admissions du cache, par lots ;
+    (passages écrits, conflits). Conflit : billet déjà validé en base autrement.
+    """
+    ecrits = conflits = 0
+    maintenant = time.time()
+    for cle_portee, expiration in (cache.get(_cle('portees')) or {}).items():
+        compteur = cache.get(_cle('admissions', cle_portee))
+        if expiration <= maintenant or not compteur or _compteurs.get(cle_portee) == (expiration, compteur):
+            continue
+        table = cache.get(_cle('billets', cle_portee))
+        if table is None:
+            continue
+        codes = {_cle_etat(octets): octets for octets in table['billets'] if octets not in _ecrits}
+        passages = [
+            {'code_qr': str(uuid.UUID(bytes=codes[cle])), 'scanned_at': etat[0], 'gate_id': etat[1]}
+            for cle, etat in cache.get_many(list(codes)).items() if isinstance(etat, tuple)
+        ]
+        for debut in range(0, len(passages), lot):
+            for resultat in validation.valider_lot(passages[debut:debut + lot], marquer=False):
+                if resultat['statut'] == validation.DEJA_UTILISE:
+                    conflits += 1
+                if resultat['statut'] in (validation.VALIDE, validation.DEJA_UTILISE):
+                    ecrits += 1
+                _ecrits.add(uuid.UUID(resultat['code_qr']).bytes)
+        _compteurs[cle_portee] = (expiration, compteur)
+    return ecrits, conflits
@@ -0,0 +1,114 @@
+"""
+Regroupement des événements à venir en clusters pour la carte.
+
+Chaque tuile Web Mercator (zoom, x, y) est découpée en CELLULES x CELLULES cases ; une
+requête groupée (fonctions de fenêtre) renvoie par case le nombre d'événements, leur
+centroïde et l'événement représentatif (le plus proche dans le temps).
+
+Le résultat est mis en cache par tuile, sous la portée 'tuile:<zoom>:<x>:<y>' : les
+signaux invalident, à tous les zooms, les tuiles de l'ancienne et de la nouvelle position
+d'un événement modifié. Après un update() en masse des coordonnées, appeler
+invalider_position() pour chaque position concernée.
+"""
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, F, Value, Window
+from django.db.models.functions import Floor, RowNumber
+
+from ..models.evenements import Evenement
+from .cache_catalogue import PREFIXE, get_versions, invalider
+from .geo import bornes_tuile, tuile
+
+ZOOM_MAX = 20
+CELLULES = 8  # par côté de tuile : cases de 32 px pour des tuiles de 256 px
+TUILES_MAX = 64
+
+
+def _portee(zoom, x, y):
+    return f'tuile:{zoom}:{x}:{y}'
+
+
+def invalider_position(latitude, longitude):
+    """Invalider les tuiles contenant une position, à tous les niveaux de zoom"""
+    if latitude is None or longitude is None:
+        return
+    invalider(*[_portee(zoom, *tuile(latitude, longitude, zoom)) for zoom in range(ZOOM_MAX + 1)])
+
+
+def clusters_tuile(zoom, x, y, aujourdhui=None):
+    """Clusters d'une tuile (une requête SQL)"""
+    aujourdhui = aujourdhui or date.today()
+    lon_ouest, lat_sud, lon_est, lat_nord = bornes_tuile(zoom, x, y)
+    largeur = (lon_est - lon_ouest) / CELLULES
+    hauteur = (lat_nord - lat_sud) / CELLULES
+
+    evenements = Evenement.objects.filter(
+        date__gte=aujourdhui,
+        latitude__gte=lat_sud, latitude__lt=lat_nord,
+        longitude__gte=lon_ouest,
+    )
+    # La dernière colonne de tuiles inclut le méridien 180
+    if x == 2 ** zoom - 1:
+        evenements = evenements.filter(longitude__lte=lon_est)
+    else:
+        evenements = evenements.filter(longitude__lt=lon_est)
+
+    case = [
+        Floor((F('longitude') - Value(lon_ouest)) / Value(largeur)),
+        Floor((F('latitude') - Value(lat_sud)) / Value(hauteur)),
+    ]
+    lignes = evenements.annotate(
+        rang=Window(RowNumber(), partition_by=case, order_by=[F('date').asc(), F('id_evenement').asc()]),
+        nombre=Window(Count('id_evenement'), partition_by=case),
+        latitude_moyenne=Window(Avg('latitude'), partition_by=case),
+        longitude_moyenne=Window(Avg('longitude'), partition_by=case),
+    ).filter(rang=1).values(
+        'id_evenement', 'titre_evenement', 'type_evenement', 'date',
+        'nombre', 'latitude_moyenne', 'longitude_moyenne',
+    )
+
+    return sorted((
+        {
+            'nombre': ligne['nombre'],
+            'latitude': ligne['latitude_moyenne'],
+            'longitude': ligne['longitude_moyenne'],
+            'evenement': {
+                'id_evenement': ligne['id_evenement'],
+                'titre_evenement': ligne['titre_evenement'],
+                'type_evenement': ligne['type_evenement'],
+                'date': ligne['date'].isoformat(),
+            },
+        }
+        for ligne in lignes
+    ), key=lambda cluster: (-cluster['nombre'], cluster['evenement']['id_evenement']))
+
+
+def clusters_tuiles(zoom, tuiles):
+    """
+    Clusters de plusieurs tuiles : versions et contenus lus en deux allers-retours
+    de cache, seules les tuiles absentes ou obsolètes sont recalculées.
+    """
+    aujourdhui = date.today()
+    if not getattr(settings, 'CATALOGUE_CACHE_ENABLED', True):
+        return [cluster for x, y in tuiles for cluster in clusters_tuile(zoom, x, y, aujourdhui)]
+
+    versions = get_versions([_portee(zoom, x, y) for x, y in tuiles]).split(':')
+    cles = {
+        (x, y): f'{PREFIXE}:clusters:{zoom}:{x}:{y}:{version}:{aujourdhui.isoformat()}'
+        for (x, y), version in zip(tuiles, versions)
+    }
+    en_cache = cache.get_many(list(cles.values()))
+
+    resultat = []
+    manquants = {}
+    for position, cle in cles.items():
+        contenu = en_cache.get(cle)
+        if contenu is None:
+            contenu = clusters_tuile(zoom, *position, aujourdhui)
+            manquants[cle] = contenu
+        resultat.extend(contenu)
+    if manquants:
+        cache.set_many(manquants, settings.CATALOGUE_CACHE_TIMEOUT)
+    return resultat
@@ -0,0 +1,155 @@
+"""
+Achats asynchrones pour les mises en vente sous très forte charge.
+
+POST /api/achats/ avec l'en-tête `Prefer: respond-async` n'exécute plus la transaction
+d'achat : il insère une Commande 'en_attente' et répond 202 avec son URL
+(GET /api/commandes/<id>/). Le coût d'une requête se réduit à cet INSERT.
+
+Les workers (commande traiter_commandes) vident la file par lots, dans l'ordre d'arrivée.
+Pour un lot, dans une seule transaction :
+    1. soldes lus une fois : les commandes qu'un solde ne couvrirait pas sont refusées ;
+    2. stock : un UPDATE conditionnel par ticket pour le total des commandes servies
+       (ordre des ids de ticket), celles qui ne tiennent plus dans le stock sont refusées ;
+    3. soldes : un UPDATE conditionnel par utilisateur pour le total de ses commandes ;
+    4. Achat (et leurs rendus QR, voir taches_qr.py) créés par bulk_create, commandes
+       mises à jour par bulk_update.
+Les UPDATE conditionnels (voir inventaire.py) restent l'arbitre face aux achats
+synchrones simultanés. Les lots sont verrouillés FOR UPDATE SKIP LOCKED (PostgreSQL) :
+plusieurs workers se partagent la file ; un worker arrêté en plein lot n'a rien validé,
+le lot sera repris.
+"""
+import uuid
+from collections import defaultdict
+
+from django.db import connection
+from django.utils import timezone
+
+from ..models.achat import Achat
+from ..models.commande import Commande
+from ..models.ticket import Ticket
+from . import frequentation
+from .annulations import EVENEMENT_ANNULE
+from .inventaire import REPRISES, avec_reprises, debiter_solde, decrementer_stock, incrementer_stock
+from .taches_qr import planifier
+
+LOT = 200
+
+STOCK_INSUFFISANT = 'Stock insuffisant. Les derniers tickets viennent d\'être vendus.'
+SOLDE_INSUFFISANT = 'Solde insuffisant.'
+COMPTE_INACTIF = "Votre compte est inactif. Veuillez contacter l'administrateur."
+
+
+def enfiler(utilisateur, ticket, quantite):
+    """Mettre une intention d'achat en file (traitée par traiter_commandes)"""
+    return Commande.objects.create(id_utilisateur=utilisateur, id_ticket=ticket, quantite=quantite)
+
+
+def _stock(ticket):
+    return Ticket.objects.avec_stock().only('stock', 'nombre_fractions').get(pk=ticket.pk).stock_disponible
+
+
+def _servir_stock(ticket, commandes):
+    """Commandes du ticket servies (un seul UPDATE de stock si possible), dans l'ordre d'arrivée"""
+    for _ in range(REPRISES):
+        disponible = _stock(ticket)
+        servies, total = [], 0
+        for commande in commandes:
+            if total + commande.quantite <= disponible:
+                servies.append(commande)
+                total += commande.quantite
+        if not servies or decrementer_stock(ticket, total):
+            return servies
+    # Stock disputé par des achats synchrones à chaque essai : une commande à la fois
+    return [commande for commande in commandes if decrementer_stock(ticket, commande.quantite)]
+
+
+@avec_reprises
+def _traiter_lot(lot):
+    verrou = {'skip_locked': True} if connection.features.has_select_for_update_skip_locked else {}
+    commandes = list(
+        Commande.objects.select_for_update(of=('self',), **verrou)
+        .select_related('id_ticket__id_evenement', 'id_utilisateur')
+        .filter(statut=Commande.EN_ATTENTE).order_by('id_commande')[:lot]
+    )
+    refus = {}
+
+    # 1. Soldes (lecture du lot) : écarter ce que le solde ne couvrira pas
+    soldes = {}
+    candidates = []
+    for commande in commandes:
+        utilisateur = commande.id_utilisateur
+        montant = commande.id_ticket.prix * commande.quantite
+        reste = soldes.setdefault(utilisateur.pk, utilisateur.solde)
+        if utilisateur.statut != 'actif':
+            refus[commande.pk] = COMPTE_INACTIF
+        elif commande.id_ticket.id_evenement.est_annule:
+            refus[commande.pk] = EVENEMENT_ANNULE
+        elif reste < montant:
+            refus[commande.pk] = SOLDE_INSUFFISANT
+        else:
+            soldes[utilisateur.pk] = reste - montant
+            candidates.append(commande)
+
+    # 2. Stock : un UPDATE par ticket, dans l'ordre des clés (ordre de verrouillage stable)
+    par_ticket = defaultdict(list)
+    for commande in candidates:
+        par_ticket[commande.id_ticket_id].append(commande)
+    servies = set()
+    for id_ticket in sorted(par_ticket):
+        servies.update(c.pk for c in _servir_stock(par_ticket[id_ticket][0].id_ticket, par_ticket[id_ticket]))
+    for commande in candidates:
+        if commande.pk not in servies:
+            refus[commande.pk] = STOCK_INSUFFISANT
+
+    # 3. Soldes : un UPDATE par utilisateur ; si un achat simultané l'a fait baisser,
+    # commande par commande, le stock des commandes refusées est rendu
+    par_utilisateur = defaultdict(list)
+    for commande in candidates:
+        if commande.pk in servies:
+            par_utilisateur[commande.id_utilisateur_id].append(commande)
+    for id_utilisateur in sorted(par_utilisateur):
+        siennes = par_utilisateur[id_utilisateur]
+        if debiter_solde(id_utilisateur, sum(c.id_ticket.prix * c.quantite for c in siennes)):
+            continue
+        for commande in siennes:
+            if not debiter_solde(id_utilisateur, commande.id_ticket.prix * commande.quantite):
+                refus[commande.pk] = SOLDE_INSUFFISANT
+                incrementer_stock(commande.id_ticket, commande.quantite)
+
+    # 4. Écritures groupées
+    acceptees = [commande for commande in commandes if commande.pk not in refus]
+    achats = Achat.objects.bulk_create([
+        Achat(
+            id_utilisateur_id=commande.id_utilisateur_id,
+            id_ticket=commande.id_ticket,
+            quantite=commande.quantite,
+            montant_total=commande.id_ticket.prix * commande.quantite,
+            code_qr=str(uuid.uuid4()),
+        )
+        for commande in acceptees
+    ])
+    planifier(achats)
+    frequentation.vendre(achats)
+    maintenant = timezone.now()
+    for commande, achat in zip(acceptees, achats):
+        commande.statut = Commande.ACCEPTEE
+        commande.id_achat = achat
+    for commande in commandes:
+        commande.date_traitement = maintenant
+        if commande.pk in refus:
+            commande.statut = Commande.REFUSEE
+            commande.motif = refus[commande.pk]
+    Commande.objects.bulk_update(commandes, ['statut', 'motif', 'id_achat', 'date_traitement'])
+    return commandes, achats
+
+
+def traiter_commandes(lot=LOT):
+    """Traiter les commandes en attente, lot par lot : (nombre acceptées, nombre refusées)"""
+    acceptees = refusees = 0
+    while True:
+        commandes, achats = _traiter_lot(lot)
+        frequentation.ecrire()  # ventes du lot validé : visibles sans attendre une prochaine écriture
+        acceptees += len(achats)
+        refusees += len(commandes) - len(achats)
+        if len(commandes) < lot:
+            return acceptees, refusees
@@ -0,0 +1,102 @@
+"""
+Requêtes GET conditionnelles (ETag / Last-Modified / 304).
+
+Les validateurs sont calculés avant toute sérialisation : si le client présente un
+If-None-Match encore valide, la vue répond 304 sans charger ni sérialiser les objets.
+    - catalogue, sur un cache partagé : versions des portées du cache (voir
+      cache_catalogue.py), incrémentées par les signaux ; aucune requête, un HIT du cache
+      reste sans accès à la base. Pas de Last-Modified (les versions ne sont pas des dates) ;
+    - catalogue sur un cache par processus (locmem), achats, favoris : une requête
+      d'agrégation (MAX(date_modification), COUNT(*)). Les versions d'un cache locmem ne
+      voient pas les écritures des autres processus (workers de commandes, d'annulations...).
+"""
+import hashlib
+from functools import wraps
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from ..models.favori import Favori
+from ..models.utilisateurs import Utilisateur
+from .cache_catalogue import get_favoris_utilisateur, get_versions
+from .cache_scan import cache_partage
+
+
+def reponse_conditionnelle(validateurs):
+    """
+    Décorateur pour les actions GET d'un ViewSet.
+
+    validateurs : callable(view, request, kwargs) -> liste de valeurs qui changent dès que
+    la réponse change (dates de modification, nombres de lignes...). Les datetimes de la
+    liste servent aussi à calculer Last-Modified.
+    """
+    def decorateur(methode):
+        @wraps(methode)
+        def wrapper(self, request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return methode(self, request, *args, **kwargs)
+
+            try:
+                composantes = validateurs(self, request, kwargs)
+            except (ValueError, TypeError):
+                # Identifiant invalide : la vue répondra elle-même (400/404)
+                return methode(self, request, *args, **kwargs)
+            # L'URI complète distingue pages, filtres et hôte des URLs absolues
+            empreinte = repr((request.build_absolute_uri(), composantes)).encode('utf-8')
+            etag = quote_etag(hashlib.sha1(empreinte).hexdigest())
+            dates = [valeur for valeur in composantes if hasattr(valeur, 'timestamp')]
+            last_modified = int(max(dates).timestamp()) if dates else None
+
+            # Seul l'ETag décide du 304 : une suppression ne fait pas avancer MAX(date_modification),
+            # If-Modified-Since seul répondrait à tort "non modifié". Last-Modified reste informatif.
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = methode(self, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+            return response
+        return wrapper
+    return decorateur
+
+
+def validateurs_evenements(evenements):
+    """Validateurs d'un ensemble d'événements, de leurs tickets (stock) et sessions : une requête"""
+    agregats = evenements.order_by().aggregate(
+        evenements_max=Max('date_modification'),
+        evenements_nb=Count('id_evenement', distinct=True),
+        tickets_max=Max('ticket__date_modification'),
+        tickets_nb=Count('ticket', distinct=True),
+        fractions_max=Max('ticket__fractions_stock__date_modification'),
+        sessions_max=Max('sessions__date_modification'),
+        sessions_nb=Count('sessions', distinct=True),
+    )
+    return [agregats[cle] for cle in sorted(agregats)]
+
+
+def validateurs_favoris(request):
+    """Validateurs de l'ensemble de favoris de l'utilisateur (is_favorite), vide pour les anonymes"""
+    if not isinstance(request.user, Utilisateur):
+        return []
+    agregats = Favori.objects.filter(utilisateur=request.user).aggregate(
+        favoris_max=Max('date_ajout'),
+        favoris_nb=Count('id_favori'),
+    )
+    return [request.user.id_utilisateur, agregats['favoris_max'], agregats['favoris_nb']]
+
+
+def validateurs_catalogue(portees, request, evenements):
+    """
+    Validateurs d'une réponse du catalogue et des favoris de l'utilisateur (is_favorite) :
+    versions de ses portées lues dans le cache s'il est partagé, sinon agrégats des
+    `evenements` (queryset) en base
+    """
+    if not cache_partage():
+        return validateurs_evenements(evenements) + validateurs_favoris(request)
+    composantes = [get_versions(portees)]
+    if isinstance(request.user, Utilisateur):
+        composantes += [request.user.id_utilisateur, sorted(get_favoris_utilisateur(request.user))]
+    return composantes
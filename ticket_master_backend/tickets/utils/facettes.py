@@ -0,0 +1,198 @@
+"""
+Filtrage à facettes des événements (écran Explorer).
+
+Filtres : période (date_debut / date_fin), type, lieu, fourchette de prix (prix_min /
+prix_max, un ticket au moins dans la fourchette), en_stock, moment de la journée d'une
+session. type, lieu et moment acceptent plusieurs valeurs séparées par des virgules (OU).
+
+Les nombres par facette sont calculés par une seule requête groupée : chaque événement
+de la période est réduit à ses attributs de facette (type, lieu, booléens en stock /
+dans la fourchette / par moment / par tranche de prix), la requête renvoie le nombre
+d'événements par combinaison, et les facettes sont dérivées de ce petit cube en Python.
+Le nombre affiché pour une valeur tient compte de tous les filtres sauf celui de sa
+propre dimension, comme des puces à sélection multiple.
+"""
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Count, Exists, OuterRef, Q
+
+from ..models.session import Session
+from ..models.ticket import Ticket
+
+# Heures locales [début, fin)
+MOMENTS = {
+    'matin': (5, 12),
+    'apres_midi': (12, 18),
+    'soir': (18, 24),
+    'nuit': (0, 5),
+}
+
+# Tranches de prix (FCFA) [min, max)
+TRANCHES_PRIX = {
+    '0-5000': (Decimal('0'), Decimal('5000')),
+    '5000-15000': (Decimal('5000'), Decimal('15000')),
+    '15000-50000': (Decimal('15000'), Decimal('50000')),
+    '50000+': (Decimal('50000'), None),
+}
+
+
+def _liste(params, nom):
+    return [valeur.strip() for valeur in params.get(nom, '').split(',') if valeur.strip()]
+
+
+def _session_au_moment(moment):
+    debut, fin = MOMENTS[moment]
+    return Exists(Session.objects.filter(
+        evenement=OuterRef('pk'), date_heure__hour__gte=debut, date_heure__hour__lt=fin,
+    ))
+
+
+def _ticket_entre(prix_min, prix_max):
+    tickets = Ticket.objects.filter(id_evenement=OuterRef('pk'))
+    if prix_min is not None:
+        tickets = tickets.filter(prix__gte=prix_min)
+    if prix_max is not None:
+        tickets = tickets.filter(prix__lte=prix_max)
+    return Exists(tickets)
+
+
+class FiltresEvenements:
+    """Filtres lus dans les paramètres de requête ; ValueError (message utilisateur) si invalides"""
+
+    def __init__(self, params):
+        self.date_debut = self._date(params, 'date_debut')
+        self.date_fin = self._date(params, 'date_fin')
+        self.types = _liste(params, 'type')
+        self.lieux = _liste(params, 'lieu')
+        self.moments = _liste(params, 'moment')
+        inconnus = set(self.moments) - set(MOMENTS)
+        if inconnus:
+            raise ValueError(f"Le paramètre moment accepte : {', '.join(MOMENTS)}.")
+        self.prix_min = self._decimal(params, 'prix_min')
+        self.prix_max = self._decimal(params, 'prix_max')
+        en_stock = params.get('en_stock', '').lower()
+        if en_stock not in ('', 'true', 'false', '1', '0'):
+            raise ValueError('Le paramètre en_stock doit valoir true ou false.')
+        self.en_stock = {'': None, 'true': True, '1': True, 'false': False, '0': False}[en_stock]
+
+    @staticmethod
+    def _date(params, nom):
+        valeur = params.get(nom)
+        if not valeur:
+            return None
+        try:
+            return date.fromisoformat(valeur)
+        except ValueError:
+            raise ValueError(f'Le paramètre {nom} doit être une date au format AAAA-MM-JJ.')
+
+    @staticmethod
+    def _decimal(params, nom):
+        valeur = params.get(nom)
+        if not valeur:
+            return None
+        try:
+            resultat = Decimal(valeur)
+        except InvalidOperation:
+            raise ValueError(f'Le paramètre {nom} doit être un nombre.')
+        if not resultat.is_finite() or resultat < 0:
+            raise ValueError(f'Le paramètre {nom} doit être un nombre positif.')
+        return resultat
+
+    @property
+    def filtre_prix(self):
+        return self.prix_min is not None or self.prix_max is not None
+
+    def periode(self, queryset):
+        """Filtre commun à toutes les facettes"""
+        if self.date_debut:
+            queryset = queryset.filter(date__gte=self.date_debut)
+        if self.date_fin:
+            queryset = queryset.filter(date__lte=self.date_fin)
+        return queryset
+
+    def appliquer(self, queryset):
+        """Tous les filtres, en SQL (liste de résultats)"""
+        queryset = self.periode(queryset)
+        if self.types:
+            queryset = queryset.filter(type_evenement__in=self.types)
+        if self.lieux:
+            queryset = queryset.filter(lieu__in=self.lieux)
+        if self.filtre_prix:
+            queryset = queryset.filter(_ticket_entre(self.prix_min, self.prix_max))
+        if self.en_stock is not None:
+            en_stock = Exists(Ticket.objects.filter(id_evenement=OuterRef('pk')).en_stock())
+            queryset = queryset.filter(en_stock if self.en_stock else ~en_stock)
+        if self.moments:
+            filtre = Q()
+            for moment in self.moments:
+                filtre |= Q(_session_au_moment(moment))
+            queryset = queryset.filter(filtre)
+        return queryset
+
+    def correspond(self, ligne, sauf=None):
+        """Une ligne du cube passe-t-elle les filtres, hors dimension `sauf` ?"""
+        if sauf != 'type_evenement' and self.types and ligne['type_evenement'] not in self.types:
+            return False
+        if sauf != 'lieu' and self.lieux and ligne['lieu'] not in self.lieux:
+            return False
+        if sauf != 'prix' and self.filtre_prix and not ligne['dans_fourchette']:
+            return False
+        if sauf != 'en_stock' and self.en_stock is not None and ligne['en_stock'] != self.en_stock:
+            return False
+        if sauf != 'moment' and self.moments and not any(ligne[f'moment_{m}'] for m in self.moments):
+            return False
+        return True
+
+
+def calculer_facettes(evenements, filtres):
+    """
+    Nombres par valeur de facette pour les événements de la période (une requête).
+    evenements : queryset de base (sans annotations d'agrégat)
+    """
+    attributs = {
+        'en_stock': Exists(Ticket.objects.filter(id_evenement=OuterRef('pk')).en_stock()),
+        **{f'moment_{moment}': _session_au_moment(moment) for moment in MOMENTS},
+        **{f'tranche_{nom}': _ticket_entre(bas, None if haut is None else haut - Decimal('0.01'))
+           for nom, (bas, haut) in TRANCHES_PRIX.items()},
+    }
+    if filtres.filtre_prix:
+        attributs['dans_fourchette'] = _ticket_entre(filtres.prix_min, filtres.prix_max)
+
+    cube = list(
+        filtres.periode(evenements).order_by()
+        .annotate(**attributs)
+        .values('type_evenement', 'lieu', *attributs)
+        .annotate(nombre=Count('id_evenement'))
+    )
+
+    def compter(dimension, valeurs_de):
+        nombres = {}
+        for ligne in cube:
+            if filtres.correspond(ligne, sauf=dimension):
+                for valeur in valeurs_de(ligne):
+                    nombres[valeur] = nombres.get(valeur, 0) + ligne['nombre']
+        return nombres
+
+    def par_nombre(nombres):
+        return [
+            {'valeur': valeur, 'nombre': nombre}
+            for valeur, nombre in sorted(nombres.items(), key=lambda item: (-item[1], item[0]))
+        ]
+
+    def ordre_fixe(nombres, valeurs):
+        return [{'valeur': valeur, 'nombre': nombres.get(valeur, 0)} for valeur in valeurs]
+
+    return {
+        'type_evenement': par_nombre(compter('type_evenement', lambda ligne: [ligne['type_evenement']])),
+        'lieu': par_nombre(compter('lieu', lambda ligne: [ligne['lieu']])),
+        'prix': ordre_fixe(
+            compter('prix', lambda ligne: [nom for nom in TRANCHES_PRIX if ligne[f'tranche_{nom}']]),
+            TRANCHES_PRIX,
+        ),
+        'en_stock': ordre_fixe(compter('en_stock', lambda ligne: [ligne['en_stock']]), [True, False]),
+        'moment': ordre_fixe(
+            compter('moment', lambda ligne: [m for m in MOMENTS if ligne[f'moment_{m}']]),
+            MOMENTS,
+        ),
+    }
@@ -0,0 +1,321 @@
+"""
+Salle d'attente virtuelle pour les mises en vente très demandées.
+
+Pour un événement activé (POST /api/file-attente/<id_evenement>/ par un administrateur),
+les achats et réservations de ses tickets exigent un jeton de file admis, passé dans
+l'en-tête X-File-Attente ; sans lui la requête est refusée (429) avant toute lecture en
+base, authentification comprise.
+
+    1. POST /api/file-attente/<id>/rejoindre/ : jeton et position (compteur atomique)
+    2. GET  /api/file-attente/statut/?jeton=... : sondage sans base de données ; chaque
+       sondage fait avancer le seau à jetons de l'événement, qui admet au plus `debit`
+       acheteurs par seconde (pointes jusqu'à `rafale`) dans l'ordre des positions
+    3. admis : achats possibles pendant FILE_ATTENTE_FENETRE secondes
+
+L'état (configuration, compteurs, seau, jetons) vit dans un stockage partagé entre les
+workers et les nœuds, choisi par FILE_ATTENTE_STOCKAGE : StockageCache (cache Django,
+à configurer sur Redis en production) ou StockageRedis (client Redis direct). configurer()
+refuse un stockage qui ne l'est pas (CachePartageRequis) : sur un cache locmem, chaque
+worker aurait ses propres positions, admissions et seau.
+"""
+from abc import ABC, abstractmethod
+import json
+import math
+import secrets
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+PREFIXE = 'file_attente'
+DUREE_JETON = 2 * 3600
+
+
+class StockageFile(ABC):
+    """
+    Interface d'un stockage partagé. Les valeurs sont des types JSON ; duree en secondes,
+    None pour sans expiration.
+    """
+
+    partage = True  # visible de tous les workers et nœuds
+
+    @abstractmethod
+    def get(self, cle):
+        pass
+
+    @abstractmethod
+    def get_many(self, cles):
+        pass
+
+    @abstractmethod
+    def set(self, cle, valeur, duree=None):
+        pass
+
+    @abstractmethod
+    def delete(self, *cles):
+        pass
+
+    @abstractmethod
+    def incr(self, cle, duree=None):
+        """Incrémenter un compteur (créé à 0) et renvoyer sa nouvelle valeur, atomiquement"""
+
+    @abstractmethod
+    def transformer(self, cle, fonction, duree=None):
+        """Remplacer atomiquement la valeur par fonction(valeur) et renvoyer la nouvelle valeur"""
+
+
+class StockageCache(StockageFile):
+    """Cache Django : partagé si le cache l'est, avec un add() atomique (Redis, Memcached, base)"""
+
+    DUREE_VERROU = 2
+
+    def __init__(self, alias='default'):
+        self.alias = alias
+        self.cache = caches[alias]
+
+    @property
+    def partage(self):
+        from .cache_scan import cache_partage  # import circulaire : cache_scan -> frequentation -> file_attente
+        return cache_partage(self.alias)
+
+    def get(self, cle):
+        return self.cache.get(cle)
+
+    def get_many(self, cles):
+        return self.cache.get_many(cles)
+
+    def set(self, cle, valeur, duree=None):
+        self.cache.set(cle, valeur, duree)
+
+    def delete(self, *cles):
+        self.cache.delete_many(cles)
+
+    def incr(self, cle, duree=None):
+        self.cache.add(cle, 0, duree)
+        try:
+            return self.cache.incr(cle)
+        except ValueError:  # expirée entre add() et incr()
+            self.cache.add(cle, 0, duree)
+            return self.cache.incr(cle)
+
+    def transformer(self, cle, fonction, duree=None):
+        # Verrou par add() (atomique sur tous les caches Django) ; s'il est pris, un autre
+        # worker fait la mise à jour : on renvoie la valeur courante.
+        verrou = f'{cle}:verrou'
+        if not self.cache.add(verrou, 1, self.DUREE_VERROU):
+            return self.cache.get(cle)
+        try:
+            valeur = fonction(self.cache.get(cle))
+            self.cache.set(cle, valeur, duree)
+            return valeur
+        finally:
+            self.cache.delete(verrou)
+
+
+class StockageRedis(StockageFile):
+    """Redis direct (FILE_ATTENTE_REDIS_URL) : transactions optimistes WATCH / MULTI"""
+
+    def __init__(self, url=None):
+        import redis
+        self.client = redis.Redis.from_url(url or getattr(settings, 'FILE_ATTENTE_REDIS_URL', 'redis://127.0.0.1:6379/2'))
+
+    @staticmethod
+    def _decoder(brut):
+        return None if brut is None else json.loads(brut)
+
+    def get(self, cle):
+        return self._decoder(self.client.get(cle))
+
+    def get_many(self, cles):
+        return {cle: self._decoder(brut) for cle, brut in zip(cles, self.client.mget(cles)) if brut is not None}
+
+    def set(self, cle, valeur, duree=None):
+        self.client.set(cle, json.dumps(valeur), ex=duree)
+
+    def delete(self, *cles):
+        if cles:
+            self.client.delete(*cles)
+
+    def incr(self, cle, duree=None):
+        with self.client.pipeline() as pipe:
+            pipe.incr(cle)
+            if duree:
+                pipe.expire(cle, duree, nx=True)
+            return pipe.execute()[0]
+
+    def transformer(self, cle, fonction, duree=None):
+        import redis
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(cle)
+                    valeur = fonction(self._decoder(pipe.get(cle)))
+                    pipe.multi()
+                    pipe.set(cle, json.dumps(valeur), ex=duree)
+                    pipe.execute()
+                    return valeur
+                except redis.WatchError:
+                    continue
+
+
+_stockage = None
+
+
+def get_stockage():
+    global _stockage
+    if _stockage is None:
+        _stockage = import_string(getattr(settings, 'FILE_ATTENTE_STOCKAGE', 'tickets.utils.file_attente.StockageCache'))()
+    return _stockage
+
+
+def _cle(*parties):
+    return ':'.join([PREFIXE, *map(str, parties)])
+
+
+# Configuration (administrateur)
+
+def configurer(evenement, debit, rafale, ids_tickets):
+    """
+    Activer la file d'un événement : `debit` admissions par seconde, pointes jusqu'à `rafale`.
+    CachePartageRequis si le stockage n'est pas partagé entre les workers.
+    """
+    from .cache_scan import CachePartageRequis
+
+    stockage = get_stockage()
+    if not stockage.partage:
+        raise CachePartageRequis(
+            "La file d'attente exige un stockage partagé entre les workers "
+            "(CACHE_BACKEND=redis ou FILE_ATTENTE_STOCKAGE=tickets.utils.file_attente.StockageRedis)."
+        )
+    stockage.set(_cle(evenement, 'config'), {'debit': debit, 'rafale': rafale})
+    for id_ticket in ids_tickets:
+        stockage.set(_cle('ticket', id_ticket), evenement)
+
+
+def desactiver(evenement, ids_tickets):
+    """Désactiver la file (les compteurs sont remis à zéro)"""
+    get_stockage().delete(
+        _cle(evenement, 'config'), _cle(evenement, 'entrees'), _cle(evenement, 'seau'),
+        *[_cle('ticket', id_ticket) for id_ticket in ids_tickets],
+    )
+
+
+def ajouter_ticket(evenement, id_ticket):
+    """Nouveau ticket d'un événement dont la file est active"""
+    stockage = get_stockage()
+    if stockage.get(_cle(evenement, 'config')) is not None:
+        stockage.set(_cle('ticket', id_ticket), evenement)
+
+
+def configuration(evenement):
+    """Configuration et compteurs de la file, ou None si elle est inactive"""
+    stockage = get_stockage()
+    valeurs = stockage.get_many([_cle(evenement, 'config'), _cle(evenement, 'entrees'), _cle(evenement, 'seau')])
+    config = valeurs.get(_cle(evenement, 'config'))
+    if config is None:
+        return None
+    return {
+        **config,
+        'entrees': valeurs.get(_cle(evenement, 'entrees')) or 0,
+        'admis': (valeurs.get(_cle(evenement, 'seau')) or {}).get('admis', 0),
+    }
+
+
+def evenement_du_ticket(id_ticket):
+    """Événement dont la file protège ce ticket, ou None (aucune lecture en base)"""
+    return get_stockage().get(_cle('ticket', id_ticket))
+
+
+# File
+
+def rejoindre(evenement, id_utilisateur):
+    """Nouveau jeton en fin de file : dict {jeton, position}, None si la file est inactive"""
+    stockage = get_stockage()
+    if stockage.get(_cle(evenement, 'config')) is None:
+        return None
+    position = stockage.incr(_cle(evenement, 'entrees'))
+    jeton = secrets.token_urlsafe(24)
+    stockage.set(_cle('jeton', jeton), {
+        'evenement': evenement, 'utilisateur': id_utilisateur, 'position': position, 'admis_jusqu_a': None,
+    }, DUREE_JETON)
+    return {'jeton': jeton, 'position': position}
+
+
+def _avancer_seau(evenement, config, entrees, maintenant):
+    """Seau à jetons : admettre les positions suivantes au débit configuré ; seuil d'admission"""
+    def remplir(seau):
+        seau = seau or {'admis': 0, 'jetons': config['rafale'], 'dernier': maintenant}
+        jetons = min(config['rafale'], seau['jetons'] + (maintenant - seau['dernier']) * config['debit'])
+        nombre = max(0, min(int(jetons), entrees - seau['admis']))
+        return {'admis': seau['admis'] + nombre, 'jetons': jetons - nombre, 'dernier': maintenant}
+
+    return (get_stockage().transformer(_cle(evenement, 'seau'), remplir) or {}).get('admis', 0)
+
+
+def statut(jeton):
+    """
+    État d'un jeton (sondage des clients) : position, personnes devant, admission.
+    None si le jeton est inconnu ou expiré. 'utilisateur' est à usage interne.
+    """
+    stockage = get_stockage()
+    donnees = stockage.get(_cle('jeton', jeton))
+    if donnees is None:
+        return None
+    evenement = donnees['evenement']
+    maintenant = time.time()
+    valeurs = stockage.get_many([_cle(evenement, 'config'), _cle(evenement, 'entrees')])
+    config = valeurs.get(_cle(evenement, 'config'))
+    if config is None:
+        # File désactivée entre-temps : achats libres
+        return {'evenement': evenement, 'utilisateur': donnees['utilisateur'], 'position': donnees['position'],
+                'devant': 0, 'admis': True, 'admis_jusqu_a': None, 'attente_estimee': 0}
+
+    admis_jusqu_a = donnees['admis_jusqu_a']
+    devant = 0
+    if admis_jusqu_a is None:
+        seuil = _avancer_seau(evenement, config, valeurs.get(_cle(evenement, 'entrees')) or 0, maintenant)
+        devant = max(0, donnees['position'] - seuil)
+        if not devant:
+            admis_jusqu_a = maintenant + settings.FILE_ATTENTE_FENETRE
+            stockage.set(_cle('jeton', jeton), {**donnees, 'admis_jusqu_a': admis_jusqu_a}, DUREE_JETON)
+    admis = admis_jusqu_a is not None and admis_jusqu_a > maintenant
+    return {
+        'evenement': evenement,
+        'utilisateur': donnees['utilisateur'],
+        'position': donnees['position'],
+        'devant': devant,
+        'admis': admis,
+        'admis_jusqu_a': admis_jusqu_a,
+        'attente_estimee': math.ceil(devant / config['debit']) if devant else 0,
+    }
+
+
+class NonAdmis(Exception):
+    """Achat refusé par la file d'attente (message pour l'utilisateur)"""
+
+    def __init__(self, message, evenement, attente=None):
+        super().__init__(message)
+        self.evenement = evenement
+        self.attente = attente
+
+
+def controler_admission(id_ticket, jeton):
+    """
+    Contrôle d'entrée des achats, sans lecture en base. Renvoie None si le ticket n'est
+    pas protégé, l'id de l'utilisateur du jeton s'il est admis (à comparer à l'utilisateur
+    authentifié) ; lève NonAdmis sinon.
+    """
+    evenement = evenement_du_ticket(id_ticket)
+    if evenement is None:
+        return None
+    if not jeton:
+        raise NonAdmis("File d'attente active pour cet événement : rejoignez-la pour acheter.", evenement)
+    etat = statut(jeton)
+    if etat is None or etat['evenement'] != evenement:
+        raise NonAdmis("Jeton de file d'attente invalide ou expiré.", evenement)
+    if not etat['admis']:
+        raise NonAdmis(
+            f"Pas encore votre tour : {etat['devant']} personne(s) devant vous.", evenement, etat['attente_estimee']
+        )
+    return etat['utilisateur']
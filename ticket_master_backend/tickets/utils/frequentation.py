@@ -0,0 +1,271 @@
+"""
+Compteurs de fréquentation en direct par événement et par session, pour les responsables
+des portes (GET /api/evenements/<id>/frequentation/ et son flux SSE .../frequentation/flux/).
+
+    - vendus, admis, restants (vendus - admis) : billets (quantités des achats) ;
+    - scans par minute et par porte (validations et refus 'déjà utilisé') ;
+    - latence de validation p50 / p99 (scans unitaires, temps de la décision côté serveur).
+
+Aucune agrégation sur la table des achats à la lecture : les compteurs sont tenus à jour
+par les chemins qui les modifient - achats (après commit), remboursements, validations
+(valider_billet, cache des scans, lots des scanners). Chaque processus les cumule en
+mémoire et reporte ses deltas dans le cache partagé au plus toutes les
+FREQUENTATION_ECRITURE secondes (incr : une écriture par clé modifiée, pas par scan) ;
+une minuterie reporte ceux d'un processus resté inactif, et les workers (commandes,
+annulations) appellent ecrire() après chaque lot.
+
+Dans le cache :
+    - vendus et admis : totaux amorcés une fois par une requête groupée (préchauffage des
+      scans ou première lecture), puis incrémentés ; un delta arrivé avant l'amorçage est
+      déjà compté par celui-ci ;
+    - scans et latences : compteurs par minute (par porte, par tranche de latence),
+      expirant après une heure ; la lecture additionne les FENETRE dernières minutes.
+Les latences sont rangées dans des tranches logarithmiques (rapport 2^(1/2)) : un
+quantile est donné au milieu géométrique de sa tranche, à ±20 % près.
+"""
+import bisect
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from ..models.achat import Achat
+from .file_attente import StockageCache
+
+PREFIXE = 'frequentation'
+FENETRE = 5  # minutes lues
+DUREE_MINUTE = 3600  # durée de vie des compteurs par minute
+DUREE_TOTAUX = 7 * 24 * 3600
+BORNES = [25 * 2 ** (i / 2) for i in range(40)]  # tranches de latence (microsecondes), jusqu'à ~18 s
+REINSCRIPTION = 60  # secondes : une porte est réinscrite (liste expirée ou évincée)
+
+# Deltas du processus, en attente d'écriture dans le cache partagé
+_verrou = threading.Lock()
+_totaux = defaultdict(int)
+_minutes = defaultdict(int)
+_portes = set()  # (portée, porte) en attente d'inscription
+_portes_inscrites = {}  # (portée, porte) -> instant de l'inscription
+_derniere_ecriture = [0.0]
+_minuterie = [None]  # report différé en attente
+
+
+def portee(id_evenement, id_session=None):
+    return f'{id_evenement}:{id_session or 0}'
+
+
+def _cle(*parties):
+    return ':'.join([PREFIXE, *map(str, parties)])
+
+
+def _portees(id_evenement, id_session):
+    """Un billet d'une session compte pour la session et pour l'événement"""
+    return [portee(id_evenement)] + ([portee(id_evenement, id_session)] if id_session else [])
+
+
+def _minute(instant=None):
+    return int((instant if instant is not None else time.time()) // 60)
+
+
+def vider_memoire():
+    """Oublier les deltas en attente et les portes inscrites par ce processus"""
+    with _verrou:
+        _totaux.clear()
+        _minutes.clear()
+        _portes.clear()
+        _portes_inscrites.clear()
+        minuterie, _minuterie[0] = _minuterie[0], None
+    if minuterie:
+        minuterie.cancel()
+
+
+def _apres_fork():
+    # La minuterie du parent n'existe pas dans l'enfant
+    _minuterie[0] = None
+
+
+os.register_at_fork(after_in_child=_apres_fork)
+
+
+def _ecrire_differe():
+    with _verrou:
+        _minuterie[0] = None
+    ecrire()
+
+
+def _noter():
+    if time.monotonic() - _derniere_ecriture[0] >= settings.FREQUENTATION_ECRITURE:
+        ecrire()
+        return
+    # Pas d'écriture maintenant : les deltas partiront au plus tard dans FREQUENTATION_ECRITURE
+    # secondes, même sans autre achat ni scan dans ce processus
+    with _verrou:
+        if _minuterie[0] is None:
+            _minuterie[0] = threading.Timer(settings.FREQUENTATION_ECRITURE, _ecrire_differe)
+            _minuterie[0].daemon = True
+            _minuterie[0].start()
+
+
+def ecrire():
+    """Reporter les deltas du processus dans le cache partagé"""
+    with _verrou:
+        totaux, minutes, portes = dict(_totaux), dict(_minutes), set(_portes)
+        _totaux.clear()
+        _minutes.clear()
+        _portes.clear()
+        _derniere_ecriture[0] = time.monotonic()
+
+    for cle, delta in totaux.items():
+        try:
+            cache.incr(cle, delta)
+        except ValueError:
+            pass  # pas encore amorcé : l'amorçage comptera ce delta
+    for cle, delta in minutes.items():
+        try:
+            cache.incr(cle, delta)
+        except ValueError:
+            if not cache.add(cle, delta, DUREE_MINUTE):
+                cache.incr(cle, delta)
+    stockage = StockageCache()
+    for cle_portee, porte in portes:
+        inscrites = stockage.transformer(
+            _cle(cle_portee, 'portes'), lambda liste: sorted(set(liste or []) | {porte}), DUREE_TOTAUX
+        ) or []
+        with _verrou:
+            if porte in inscrites:
+                _portes_inscrites[cle_portee, porte] = time.monotonic()
+            else:
+                _portes.add((cle_portee, porte))  # verrou pris par un autre worker : prochaine écriture
+
+
+def _billets(achats):
+    return [(achat.id_ticket.id_evenement_id, achat.session_id, achat.quantite, achat.est_utilise) for achat in achats]
+
+
+def _compter(billets, signe):
+    with _verrou:
+        for id_evenement, id_session, quantite, est_utilise in billets:
+            for cle_portee in _portees(id_evenement, id_session):
+                _totaux[_cle(cle_portee, 'vendus')] += signe * quantite
+                if est_utilise:
+                    _totaux[_cle(cle_portee, 'admis')] += signe * quantite
+    _noter()
+
+
+def vendre(achats):
+    """Achats créés (à appeler dans leur transaction : comptés après le commit)"""
+    billets = _billets(achats)
+    transaction.on_commit(lambda: _compter(billets, 1))
+
+
+def rembourser(achats):
+    """Achats remboursés (à appeler dans la transaction qui les supprime)"""
+    billets = _billets(achats)
+    transaction.on_commit(lambda: _compter(billets, -1))
+
+
+def scan(id_evenement, id_session, porte, admis=0, duree=None, instant=None):
+    """
+    Un scan à une porte : `admis` billets admis (0 pour un refus), `duree` de la décision
+    en secondes (None : non mesurée), `instant` epoch du scan (par défaut maintenant)
+    """
+    minute = _minute(instant)
+    tranche = bisect.bisect_left(BORNES, duree * 1e6) if duree is not None else None
+    with _verrou:
+        for cle_portee in _portees(id_evenement, id_session):
+            _minutes[_cle(cle_portee, 'scans', minute, porte)] += 1
+            if admis:
+                _totaux[_cle(cle_portee, 'admis')] += admis
+            if tranche is not None:
+                _minutes[_cle(cle_portee, 'latence', minute, tranche)] += 1
+            if time.monotonic() - _portes_inscrites.get((cle_portee, porte), -REINSCRIPTION) >= REINSCRIPTION:
+                _portes.add((cle_portee, porte))
+    _noter()
+
+
+def amorcer(id_evenement):
+    """Amorcer vendus et admis de l'événement et de ses sessions (une requête groupée)"""
+    lignes = Achat.objects.filter(id_ticket__id_evenement_id=id_evenement).values('session_id').annotate(
+        vendus=Sum('quantite'), admis=Sum('quantite', filter=Q(est_utilise=True)),
+    ).order_by()
+    valeurs = defaultdict(int)
+    for ligne in lignes:
+        for cle_portee in _portees(id_evenement, ligne['session_id']):
+            valeurs[_cle(cle_portee, 'vendus')] += ligne['vendus'] or 0
+            valeurs[_cle(cle_portee, 'admis')] += ligne['admis'] or 0
+    valeurs.setdefault(_cle(portee(id_evenement), 'vendus'), 0)
+    valeurs.setdefault(_cle(portee(id_evenement), 'admis'), 0)
+    for cle, valeur in valeurs.items():
+        cache.add(cle, valeur, DUREE_TOTAUX)  # déjà amorcé : les increments font foi
+
+
+def _quantile(histogramme, total, q):
+    rang, cumul = q * total, 0
+    for tranche in sorted(histogramme):
+        cumul += histogramme[tranche]
+        if cumul >= rang:
+            haute = BORNES[min(tranche, len(BORNES) - 1)]
+            basse = BORNES[tranche - 1] if tranche else 0
+            return round(math.sqrt(max(basse, 1) * haute) / 1000, 3)  # millisecondes
+    return None
+
+
+def compteurs(id_evenement, id_session=None):
+    """Compteurs d'un événement (ou d'une session) : une lecture groupée du cache"""
+    ecrire()  # deltas de ce processus
+    cle_portee = portee(id_evenement, id_session)
+    totaux = cache.get_many([_cle(cle_portee, 'vendus'), _cle(cle_portee, 'admis'), _cle(cle_portee, 'portes')])
+    if _cle(cle_portee, 'vendus') not in totaux:
+        amorcer(id_evenement)
+        totaux.update(cache.get_many([_cle(cle_portee, 'vendus'), _cle(cle_portee, 'admis')]))
+    vendus = totaux.get(_cle(cle_portee, 'vendus')) or 0
+    admis = totaux.get(_cle(cle_portee, 'admis')) or 0
+    portes = totaux.get(_cle(cle_portee, 'portes')) or []
+
+    maintenant = time.time()
+    courante = _minute(maintenant)
+    minutes = list(range(courante - FENETRE + 1, courante + 1))
+    cles_scans = {(porte, minute): _cle(cle_portee, 'scans', minute, porte) for porte in portes for minute in minutes}
+    cles_latence = {
+        (tranche, minute): _cle(cle_portee, 'latence', minute, tranche)
+        for tranche in range(len(BORNES) + 1) for minute in minutes
+    }
+    valeurs = cache.get_many([*cles_scans.values(), *cles_latence.values()])
+
+    # Débit sur les 60 dernières secondes : minute courante et part restante de la précédente
+    part = 1 - (maintenant % 60) / 60
+    par_porte = []
+    for porte in portes:
+        serie = [valeurs.get(cles_scans[porte, minute], 0) for minute in minutes]
+        par_porte.append({
+            'porte': porte,
+            'scans_par_minute': round(serie[-1] + serie[-2] * part, 1),
+            'minutes': serie,
+        })
+
+    histogramme = defaultdict(int)
+    for (tranche, _), cle in cles_latence.items():
+        histogramme[tranche] += valeurs.get(cle, 0)
+    mesures = sum(histogramme.values())
+    return {
+        'evenement': id_evenement,
+        'session': id_session,
+        'vendus': vendus,
+        'admis': admis,
+        'restants': max(0, vendus - admis),
+        'scans_par_minute': round(sum(porte['scans_par_minute'] for porte in par_porte), 1),
+        'portes': par_porte,
+        'latence': {
+            'mesures': mesures,
+            'p50_ms': _quantile(histogramme, mesures, 0.5) if mesures else None,
+            'p99_ms': _quantile(histogramme, mesures, 0.99) if mesures else None,
+        },
+        'fenetre_minutes': FENETRE,
+        'horodatage': timezone.now(),
+    }
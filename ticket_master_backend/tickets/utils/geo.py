@@ -0,0 +1,98 @@
+"""
+Calculs géographiques sur Evenement.latitude / longitude.
+
+Les recherches par distance se font en deux temps : une boîte englobante du cercle
+(intervalles de latitude et longitude, couverts par l'index evenement_coords_idx) écarte
+l'essentiel des lignes, puis la distance exacte (haversine) est calculée par la base
+sur les seuls candidats, en une expression SQL ensembliste.
+"""
+import math
+
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import ASin, Cos, Least, Power, Radians, Sin, Sqrt
+
+RAYON_TERRE_KM = 6371.0088
+KM_PAR_DEGRE = math.pi * RAYON_TERRE_KM / 180
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Distance orthodromique en km entre deux points (degrés)"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * RAYON_TERRE_KM * math.asin(math.sqrt(min(1.0, a)))
+
+
+def boites_englobantes(lat, lon, rayon_km):
+    """
+    Rectangles (lat_min, lat_max, lon_min, lon_max) couvrant le cercle.
+    Deux rectangles si le cercle traverse l'antiméridien ; toutes longitudes près des pôles.
+    """
+    delta_lat = rayon_km / KM_PAR_DEGRE
+    lat_min, lat_max = lat - delta_lat, lat + delta_lat
+    if lat_min <= -90 or lat_max >= 90:
+        return [(max(lat_min, -90.0), min(lat_max, 90.0), -180.0, 180.0)]
+
+    # Largeur maximale du cercle en longitude (à la latitude du point de tangence)
+    delta_lon = math.degrees(math.asin(min(1.0, math.sin(rayon_km / RAYON_TERRE_KM) / math.cos(math.radians(lat)))))
+    lon_min, lon_max = lon - delta_lon, lon + delta_lon
+    if lon_min < -180:
+        return [(lat_min, lat_max, lon_min + 360, 180.0), (lat_min, lat_max, -180.0, lon_max)]
+    if lon_max > 180:
+        return [(lat_min, lat_max, lon_min, 180.0), (lat_min, lat_max, -180.0, lon_max - 360)]
+    return [(lat_min, lat_max, lon_min, lon_max)]
+
+
+def filtre_boite(lat, lon, rayon_km):
+    """Q de présélection par boîte englobante"""
+    filtre = Q()
+    for lat_min, lat_max, lon_min, lon_max in boites_englobantes(lat, lon, rayon_km):
+        filtre |= Q(latitude__range=(lat_min, lat_max), longitude__range=(lon_min, lon_max))
+    return filtre
+
+
+def expression_haversine(lat, lon):
+    """Expression ORM : distance en km entre (latitude, longitude) de la ligne et le point donné"""
+    moitie_dlat = Radians(F('latitude') - Value(lat)) / Value(2.0)
+    moitie_dlon = Radians(F('longitude') - Value(lon)) / Value(2.0)
+    a = (
+        Power(Sin(moitie_dlat), 2)
+        + Value(math.cos(math.radians(lat))) * Cos(Radians(F('latitude'))) * Power(Sin(moitie_dlon), 2)
+    )
+    return Value(2 * RAYON_TERRE_KM) * ASin(Sqrt(Least(Value(1.0), a)), output_field=FloatField())
+
+
+# Tuiles "slippy map" (Web Mercator), comme les fonds de carte du mobile
+
+LATITUDE_MAX_MERCATOR = 85.05112878
+
+
+def tuile(lat, lon, zoom):
+    """(x, y) de la tuile contenant le point au niveau de zoom donné"""
+    n = 2 ** zoom
+    lat = max(-LATITUDE_MAX_MERCATOR, min(LATITUDE_MAX_MERCATOR, lat))
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def bornes_tuile(zoom, x, y):
+    """(lon_ouest, lat_sud, lon_est, lat_nord) d'une tuile"""
+    n = 2 ** zoom
+
+    def latitude(rang):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * rang / n))))
+
+    return x / n * 360.0 - 180.0, latitude(y + 1), (x + 1) / n * 360.0 - 180.0, latitude(y)
+
+
+def tuiles_couvrant(lon_min, lat_min, lon_max, lat_max, zoom):
+    """Tuiles (x, y) couvrant une bbox ; lon_min > lon_max pour une bbox traversant l'antiméridien"""
+    n = 2 ** zoom
+    x_ouest, y_nord = tuile(lat_max, lon_min, zoom)
+    x_est, y_sud = tuile(lat_min, lon_max, zoom)
+    if x_ouest <= x_est:
+        colonnes = list(range(x_ouest, x_est + 1))
+    else:
+        colonnes = list(range(x_ouest, n)) + list(range(0, x_est + 1))
+    return [(x, y) for x in colonnes for y in range(y_nord, y_sud + 1)]
@@ -0,0 +1,145 @@
+"""
+Requêtes POST idempotentes (en-tête Idempotency-Key).
+
+Un client mobile qui n'a pas reçu la réponse d'un achat ou d'un dépôt le renvoie avec la
+même clé : au lieu de refaire la transaction (et de débiter deux fois), le serveur rejoue
+la réponse enregistrée, sans toucher au stock ni aux soldes.
+
+Une seule transaction pour la clé, le travail de la requête et sa réponse :
+    1. la première requête insère sa clé (contrainte unique portée + clé) ;
+    2. elle s'exécute (débit, stock...) puis enregistre statut, corps et en-têtes de sa
+       réponse, et tout est validé d'un bloc ;
+    3. un doublon trouve la clé validée : réponse rejouée (en-tête Idempotent-Replayed).
+       Pendant la requête d'origine, son INSERT attend sur l'index unique (sur PostgreSQL
+       au plus IDEMPOTENCE_ATTENTE secondes, puis 409) la validation ou l'annulation.
+
+Une clé visible a donc toujours sa réponse et n'est jamais effacée tant qu'elle n'a pas
+expiré. Les erreurs 5xx et les exceptions annulent la transaction entière : ni clé ni
+travail validés, un nouvel essai est exécuté normalement. Une clé réutilisée pour une
+autre requête est refusée (422). Les réponses sont conservées IDEMPOTENCE_DUREE secondes
+(purge : purger_idempotence).
+"""
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from ..models.cle_idempotence import CleIdempotence
+from .inventaire import avec_reprises
+
+ENTETE = 'Idempotency-Key'
+ENTETES_CONSERVES = ('Location', 'Retry-After', 'Preference-Applied')
+
+
+def _portee(user):
+    return f'{type(user).__name__.lower()}:{user.pk}'
+
+
+def _empreinte(request):
+    corps = json.dumps(request.data, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(f'{request.method} {request.path}\n{corps}'.encode('utf-8')).hexdigest()
+
+
+def _inserer(**champs):
+    """INSERT de la clé ; sur PostgreSQL, attente d'une requête d'origine bornée par lock_timeout"""
+    if connection.vendor != 'postgresql':
+        return CleIdempotence.objects.create(**champs)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT current_setting('lock_timeout')")
+        precedent = cursor.fetchone()[0]
+        cursor.execute("SELECT set_config('lock_timeout', %s, true)", [f'{int(settings.IDEMPOTENCE_ATTENTE * 1000)}ms'])
+    entree = CleIdempotence.objects.create(**champs)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT set_config('lock_timeout', %s, true)", [precedent])
+    return entree
+
+
+def _reserver(portee, cle, empreinte):
+    """
+    Insérer la clé dans la transaction de la requête : (entrée, True) si elle est nouvelle,
+    (entrée validée, False) sinon, (None, False) si la requête d'origine dure encore
+    """
+    while True:
+        maintenant = timezone.now()
+        try:
+            with transaction.atomic():
+                return _inserer(
+                    portee=portee, cle=cle, empreinte=empreinte,
+                    date_expiration=maintenant + timedelta(seconds=settings.IDEMPOTENCE_DUREE),
+                ), True
+        except IntegrityError:
+            entree = CleIdempotence.objects.filter(portee=portee, cle=cle).first()
+            if entree is None:
+                continue  # requête d'origine annulée entre-temps
+            if entree.date_expiration <= maintenant:
+                CleIdempotence.objects.filter(pk=entree.pk, date_creation=entree.date_creation).delete()
+                continue
+            return entree, False
+        except OperationalError as e:
+            if getattr(e.__cause__, 'pgcode', None) != '55P03':  # lock_timeout
+                raise
+            return None, False
+
+
+def _rejouer(entree, empreinte):
+    if entree is None:
+        return Response(
+            {'error': 'La requête d\'origine est encore en cours : réessayez.'},
+            status=status.HTTP_409_CONFLICT,
+            headers={'Retry-After': '1'}
+        )
+    if entree.empreinte != empreinte:
+        return Response(
+            {'error': f'Cette clé {ENTETE} a déjà servi pour une autre requête.'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    response = Response(entree.reponse, status=entree.statut, headers=entree.entetes)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(methode):
+    """Décorateur des actions POST d'un ViewSet : honore l'en-tête Idempotency-Key"""
+    @wraps(methode)
+    def wrapper(self, request, *args, **kwargs):
+        cle = request.headers.get(ENTETE)
+        if not cle or not request.user or not request.user.is_authenticated:
+            return methode(self, request, *args, **kwargs)
+        if len(cle) > 255:
+            return Response(
+                {'error': f'{ENTETE} : 255 caractères au maximum.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return _executer(methode, self, request, cle, *args, **kwargs)
+    return wrapper
+
+
+@avec_reprises
+def _executer(methode, vue, request, cle, *args, **kwargs):
+    """Clé, travail de la requête et réponse enregistrée : une transaction (rejouée si transitoire)"""
+    empreinte = _empreinte(request)
+    entree, nouvelle = _reserver(_portee(request.user), cle, empreinte)
+    if not nouvelle:
+        return _rejouer(entree, empreinte)
+    response = methode(vue, request, *args, **kwargs)  # exception : transaction annulée
+    if response.status_code >= 500:
+        transaction.set_rollback(True)
+        return response
+    entree.statut = response.status_code
+    entree.reponse = json.loads(json.dumps(response.data, cls=DjangoJSONEncoder))
+    entree.entetes = {nom: response[nom] for nom in ENTETES_CONSERVES if response.has_header(nom)}
+    entree.save(update_fields=['statut', 'reponse', 'entetes'])
+    return response
+
+
+def purger_expirees():
+    """Supprimer les réponses enregistrées expirées ; nombre de clés supprimées"""
+    return CleIdempotence.objects.filter(date_expiration__lte=timezone.now()).delete()[0]
@@ -0,0 +1,169 @@
+"""
+Écritures concurrentes sur le stock des tickets et le solde des utilisateurs.
+
+Chaque mouvement est un UPDATE conditionnel unique :
+    UPDATE ticket SET stock = stock - q WHERE id = :id AND stock >= q
+La base vérifie et décrémente sous le même verrou de ligne : deux achats simultanés ne
+peuvent plus lire le même stock puis écrire chacun le leur (mise à jour perdue, survente).
+0 ligne modifiée = stock (ou solde) insuffisant, l'appelant rejette l'opération.
+
+Ordre des verrous dans une transaction : ticket puis utilisateur, partout, pour éviter
+les interblocages. update() ne déclenche pas les signaux : les fonctions de stock
+invalident elles-mêmes le cache du catalogue.
+
+Stock fractionné (Ticket.nombre_fractions = N > 0) : pour un ticket très demandé, le stock
+est réparti sur N lignes FractionStock et Ticket.stock ne garde que la réserve non
+répartie (0 après repartir_stock). Un achat décrémente une fraction tirée au hasard, puis
+les fractions sœurs qui ont encore assez de places ; en dernier recours (stock morcelé,
+aucune fraction ne suffit seule), il prélève sur plusieurs fractions verrouillées dans
+l'ordre de leur numéro. Les lectures passent par Ticket.stock_disponible.
+"""
+import random
+import time
+from functools import wraps
+
+from django.db import OperationalError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from ..models.fraction_stock import FractionStock
+from ..models.ticket import Ticket
+from ..models.utilisateurs import Utilisateur
+from ..signals import invalider_ticket
+
+REPRISES = 3
+
+
+def decrementer_stock(ticket, quantite):
+    """Retirer `quantite` du stock si disponible ; False sinon (rien n'est modifié)"""
+    if ticket.nombre_fractions:
+        preleve = _prelever_fractions(ticket, quantite)
+    else:
+        preleve = Ticket.objects.filter(pk=ticket.pk, stock__gte=quantite).update(
+            stock=F('stock') - quantite, date_modification=timezone.now()
+        ) == 1
+    if preleve:
+        invalider_ticket(ticket.pk, ticket.id_evenement_id)
+    return preleve
+
+
+def incrementer_stock(ticket, quantite):
+    """Remettre `quantite` en stock (dans une fraction au hasard si le ticket est fractionné)"""
+    remis = ticket.nombre_fractions and FractionStock.objects.filter(
+        ticket_id=ticket.pk, numero=random.randrange(ticket.nombre_fractions)
+    ).update(stock=F('stock') + quantite, date_modification=timezone.now())
+    if not remis:
+        Ticket.objects.filter(pk=ticket.pk).update(
+            stock=F('stock') + quantite, date_modification=timezone.now()
+        )
+    invalider_ticket(ticket.pk, ticket.id_evenement_id)
+
+
+def _prelever_fractions(ticket, quantite):
+    fractions = FractionStock.objects.filter(ticket_id=ticket.pk)
+
+    def prelever(numero):
+        return fractions.filter(numero=numero, stock__gte=quantite).update(
+            stock=F('stock') - quantite, date_modification=timezone.now()
+        ) == 1
+
+    tiree = random.randrange(ticket.nombre_fractions)
+    if prelever(tiree):
+        return True
+    # Fraction vide : les sœurs, les mieux pourvues d'abord (lecture sans verrou)
+    stocks = dict(fractions.values_list('numero', 'stock'))
+    for numero in sorted(stocks, key=stocks.get, reverse=True):
+        if numero != tiree and stocks[numero] >= quantite and prelever(numero):
+            return True
+    if sum(stocks.values()) < quantite:
+        return False
+    return _prelever_plusieurs(ticket, quantite)
+
+
+def _prelever_plusieurs(ticket, quantite):
+    """Stock morcelé : prélever sur plusieurs fractions, verrouillées par numéro croissant"""
+    lignes = list(FractionStock.objects.select_for_update().filter(ticket_id=ticket.pk).order_by('numero'))
+    if sum(ligne.stock for ligne in lignes) < quantite:
+        return False
+    reste = quantite
+    for ligne in lignes:
+        part = min(ligne.stock, reste)
+        if part:
+            ligne.stock -= part
+            ligne.save(update_fields=['stock', 'date_modification'])
+            reste -= part
+        if not reste:
+            return True
+
+
+def repartir_stock(ticket, nombre_fractions, stock=None):
+    """
+    Passer un ticket en stock fractionné sur `nombre_fractions` lignes (0 : ligne unique)
+    et répartir à parts égales son stock total (ou `stock` s'il est donné).
+    Sert à activer le mode, à le désactiver, à rééquilibrer et à fixer le stock d'un
+    ticket fractionné. Verrouille le ticket puis ses fractions : les achats en cours
+    terminent d'abord, les suivants voient la nouvelle répartition.
+    """
+    with transaction.atomic():
+        ticket = Ticket.objects.select_for_update().get(pk=ticket.pk)
+        lignes = {
+            ligne.numero: ligne
+            for ligne in FractionStock.objects.select_for_update().filter(ticket=ticket).order_by('numero')
+        }
+        if stock is None:
+            stock = ticket.stock + sum(ligne.stock for ligne in lignes.values())
+
+        FractionStock.objects.filter(ticket=ticket, numero__gte=nombre_fractions).delete()
+        if nombre_fractions:
+            part, reste = divmod(stock, nombre_fractions)
+            maintenant = timezone.now()
+            a_creer, a_modifier = [], []
+            for numero in range(nombre_fractions):
+                ligne = lignes.get(numero) or FractionStock(ticket=ticket, numero=numero)
+                ligne.stock = part + (1 if numero < reste else 0)
+                ligne.date_modification = maintenant
+                (a_modifier if ligne.pk else a_creer).append(ligne)
+            FractionStock.objects.bulk_create(a_creer)
+            FractionStock.objects.bulk_update(a_modifier, ['stock', 'date_modification'])
+            ticket.stock = 0
+        else:
+            ticket.stock = stock
+        ticket.nombre_fractions = nombre_fractions
+        ticket.save(update_fields=['stock', 'nombre_fractions', 'date_modification'])
+    return ticket
+
+
+def debiter_solde(id_utilisateur, montant):
+    """Débiter `montant` si le solde suffit ; False sinon (rien n'est modifié)"""
+    return Utilisateur.objects.filter(pk=id_utilisateur, solde__gte=montant).update(
+        solde=F('solde') - montant
+    ) == 1
+
+
+def crediter_solde(id_utilisateur, montant):
+    Utilisateur.objects.filter(pk=id_utilisateur).update(solde=F('solde') + montant)
+
+
+def _est_transitoire(erreur):
+    """Interblocage / sérialisation (PostgreSQL) ou base verrouillée (SQLite) : réessayable"""
+    code = getattr(getattr(erreur, '__cause__', None), 'pgcode', None) or getattr(erreur, 'pgcode', None)
+    return code in ('40001', '40P01') or 'database is locked' in str(erreur)
+
+
+def avec_reprises(fonction):
+    """
+    Exécuter `fonction` dans une transaction, rejouée (avec attente aléatoire croissante)
+    si la base l'a annulée pour un conflit transitoire. Les refus métier (stock, solde)
+    ne sont pas rejoués.
+    """
+    @wraps(fonction)
+    def wrapper(*args, **kwargs):
+        for tentative in range(REPRISES):
+            try:
+                with transaction.atomic():
+                    return fonction(*args, **kwargs)
+            except OperationalError as e:
+                if tentative == REPRISES - 1 or not _est_transitoire(e) or transaction.get_connection().in_atomic_block:
+                    raise
+                time.sleep(random.uniform(0, 0.05 * 2 ** tentative))
+    return wrapper
@@ -0,0 +1,143 @@
+"""
+Jetons signés encodés dans les QR codes : un scanner de porte vérifie un billet sans réseau.
+
+Le QR code d'un achat encode l'URL de scan suivie de ?t=<jeton>. Le jeton (base64url,
+136 caractères) porte, en binaire compact :
+    version (1 octet) | id de clé (2) | id_achat (4) | id_evenement (4) | id_session (4, 0 : aucune)
+    | quantite (2) | expiration (4, secondes epoch UTC) | code_qr (16, UUID)
+suivis d'une signature Ed25519 (64 octets) de ces 37 octets.
+
+Seul le serveur détient la clé privée (QR_JETON_CLE) ; les scanners récupèrent la clé
+publique (GET /api/achats/jeton/cle/) avant l'ouverture des portes, vérifient localement
+avec verifier() - aucune requête en base - et synchronisent les passages plus tard.
+Rotation : l'ancienne clé publique reste acceptée via QR_JETON_CLES_PRECEDENTES.
+
+Un jeton prouve l'authenticité de l'achat, pas qu'il n'a pas déjà servi ni été annulé :
+l'usage unique reste arbitré par la base à la synchronisation.
+"""
+import base64
+import hashlib
+import struct
+import uuid
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from functools import lru_cache
+from urllib.parse import parse_qs, urlsplit
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+from django.conf import settings
+from django.utils import timezone
+
+VERSION = 1
+FORMAT = struct.Struct('>BHIIIHI16s')
+SIGNATURE = 64
+
+
+class JetonInvalide(ValueError):
+    """Jeton mal formé, signé par une clé inconnue, falsifié ou expiré"""
+
+
+def _b64(octets):
+    return base64.urlsafe_b64encode(octets).rstrip(b'=').decode('ascii')
+
+
+def _de_b64(texte):
+    return base64.urlsafe_b64decode(texte + '=' * (-len(texte) % 4))
+
+
+def id_cle(cle_publique):
+    """Identifiant (2 octets) d'une clé publique brute : le scanner choisit la clé sans essais"""
+    return int.from_bytes(hashlib.sha256(cle_publique).digest()[:2], 'big')
+
+
+@lru_cache(maxsize=4)
+def _cle_privee(graine):
+    if graine:
+        return Ed25519PrivateKey.from_private_bytes(base64.b64decode(graine))
+    # Développement : clé dérivée de SECRET_KEY (stable d'un redémarrage à l'autre)
+    return Ed25519PrivateKey.from_private_bytes(hashlib.sha256(f'qr:{settings.SECRET_KEY}'.encode('utf-8')).digest())
+
+
+def cle_privee():
+    return _cle_privee(settings.QR_JETON_CLE)
+
+
+def cle_publique_brute():
+    """Clé publique courante (32 octets)"""
+    return cle_privee().public_key().public_bytes(Encoding.Raw, PublicFormat.Raw)
+
+
+def cles_publiques():
+    """{id de clé: clé publique brute} acceptées par le serveur (courante et précédentes)"""
+    cles = [cle_publique_brute()] + [base64.b64decode(cle) for cle in settings.QR_JETON_CLES_PRECEDENTES]
+    return {id_cle(cle): cle for cle in cles}
+
+
+def expiration(achat):
+    """Fin de validité : fin du jour de la session (ou de l'événement), plus QR_JETON_MARGE"""
+    jour = timezone.localtime(achat.session.date_heure).date() if achat.session_id else achat.id_ticket.id_evenement.date
+    fin = timezone.make_aware(datetime.combine(jour + timedelta(days=1), time.min))
+    return fin + timedelta(seconds=settings.QR_JETON_MARGE)
+
+
+def signer(achat):
+    """Jeton signé d'un achat (ticket, événement et session lus sur l'instance)"""
+    cle = cle_privee()
+    donnees = FORMAT.pack(
+        VERSION,
+        id_cle(cle_publique_brute()),
+        achat.id_achat,
+        achat.id_ticket.id_evenement_id,
+        achat.session_id or 0,
+        achat.quantite,
+        int(expiration(achat).timestamp()),
+        uuid.UUID(achat.code_qr).bytes,
+    )
+    return _b64(donnees + cle.sign(donnees))
+
+
+def extraire_jeton(texte):
+    """Jeton d'un texte scanné : URL du QR code (paramètre t) ou jeton seul"""
+    if '://' in texte:
+        return parse_qs(urlsplit(texte).query).get('t', [''])[0]
+    return texte.strip()
+
+
+def verifier(jeton, cles=None, maintenant=None):
+    """
+    Contenu d'un jeton authentique et non expiré, sans accès à la base :
+    {id_achat, id_evenement, id_session, quantite, expiration, code_qr}.
+    `cles` : {id de clé: clé publique brute} (par défaut cles_publiques()).
+    JetonInvalide sinon.
+    """
+    try:
+        octets = _de_b64(jeton)
+    except (ValueError, TypeError):
+        raise JetonInvalide('Jeton mal formé.')
+    if len(octets) != FORMAT.size + SIGNATURE:
+        raise JetonInvalide('Jeton mal formé.')
+    donnees, signature = octets[:FORMAT.size], octets[FORMAT.size:]
+    version, kid, id_achat, id_evenement, id_session, quantite, fin, code = FORMAT.unpack(donnees)
+    if version != VERSION:
+        raise JetonInvalide('Version de jeton non prise en charge.')
+
+    cle = (cles if cles is not None else cles_publiques()).get(kid)
+    if cle is None:
+        raise JetonInvalide('Jeton signé par une clé inconnue.')
+    try:
+        Ed25519PublicKey.from_public_bytes(cle).verify(signature, donnees)
+    except InvalidSignature:
+        raise JetonInvalide('Signature invalide.')
+
+    fin = datetime.fromtimestamp(fin, tz=dt_timezone.utc)
+    if fin <= (maintenant or timezone.now()):
+        raise JetonInvalide('Jeton expiré.')
+    return {
+        'id_achat': id_achat,
+        'id_evenement': id_evenement,
+        'id_session': id_session or None,
+        'quantite': quantite,
+        'expiration': fin,
+        'code_qr': str(uuid.UUID(bytes=code)),
+    }
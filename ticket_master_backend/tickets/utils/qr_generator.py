@@ -2,51 +2,91 @@
 Utilitaire de génération de QR codes pour les achats de tickets
 """
 import qrcode
+from qrcode.image.svg import SvgPathImage
 from io import BytesIO
 from django.core.files import File
 from django.conf import settings
 
+from .jeton_qr import signer
 
-def generate_qr_code(achat, request=None):
-  
+
+def url_base(request=None):
+    """Hôte des URLs de vérification encodées dans les QR codes"""
     if request:
-        base_url = request.build_absolute_uri('/')[:-1]
-    else:
-        # Fallback si pas de request
-        base_url = getattr(settings, 'SITE_URL', 'http://0.0.0.0:8000')
-    
- 
-    verification_url = f"{base_url}/api/achats/scan/{achat.code_qr}/"
-    
+        return request.build_absolute_uri('/')[:-1]
+    # Fallback si pas de request
+    return getattr(settings, 'SITE_URL', 'http://0.0.0.0:8000')
+
+
+CORRECTIONS = {
+    'L': qrcode.constants.ERROR_CORRECT_L,
+    'M': qrcode.constants.ERROR_CORRECT_M,
+    'Q': qrcode.constants.ERROR_CORRECT_Q,
+    'H': qrcode.constants.ERROR_CORRECT_H,  # Haute correction d'erreur
+}
+
+
+def _qr(verification_url, correction, box_size):
     qr = qrcode.QRCode(
-        version=1,  
-        error_correction=qrcode.constants.ERROR_CORRECT_H,  # Haute correction d'erreur
-        box_size=10, 
+        version=1,
+        error_correction=CORRECTIONS[correction],
+        box_size=box_size,
         border=4,
     )
     qr.add_data(verification_url)
     qr.make(fit=True)
-    
+    return qr
+
+
+def rendre_png(verification_url, correction='H', box_size=10):
+    """Image PNG (octets) du QR code d'une URL - calcul pur, exécutable dans un autre processus"""
     # Générer l'image du QR code
-    img = qr.make_image(fill_color="black", back_color="white")
-    
+    img = _qr(verification_url, correction, box_size).make_image(fill_color="black", back_color="white")
+
     # Sauvegarder dans un buffer en mémoire
     buffer = BytesIO()
     img.save(buffer, format='PNG')
-    buffer.seek(0)
-    
+    return buffer.getvalue()
+
+
+def rendre_svg(verification_url, correction='H', box_size=10):
+    """Image SVG (octets) du QR code d'une URL : vectorielle, nette à toute taille d'impression"""
+    img = _qr(verification_url, correction, box_size).make_image(image_factory=SvgPathImage)
+    buffer = BytesIO()
+    img.save(buffer)
+    return buffer.getvalue()
+
+
+def contenu_qr(achat, base):
+    """
+    Texte encodé dans le QR code : URL de la page de scan, suivie du jeton signé que les
+    scanners vérifient hors ligne (voir jeton_qr.py)
+    """
+    url = f"{base}/api/achats/scan/{achat.code_qr}/"
+    try:
+        return f"{url}?t={signer(achat)}"
+    except ValueError:  # code_qr antérieur aux UUID : URL seule
+        return url
+
+
+def generate_qr_code(achat, request=None):
+    verification_url = contenu_qr(achat, url_base(request))
+
     # Créer un fichier Django à partir du buffer
     filename = f'qr_{achat.code_qr}.png'
-    achat.qr_image.save(filename, File(buffer), save=False)
-    
+    achat.qr_image.save(filename, File(BytesIO(rendre_png(verification_url))), save=False)
+
     return achat
 
 
 def get_qr_url(achat, request=None):
-    if not achat.qr_image:
+    """
+    URL de l'image QR : rendu à la demande /api/achats/qr/<code>.png (voir cache_qr.py),
+    ou le fichier stocké si QR_IMAGES_STOCKEES
+    """
+    if settings.QR_IMAGES_STOCKEES and achat.qr_image:
+        return request.build_absolute_uri(achat.qr_image.url) if request else achat.qr_image.url
+    if not achat.code_qr:
         return None
-    
-    if request:
-        return request.build_absolute_uri(achat.qr_image.url)
-    
-    return achat.qr_image.url
+    chemin = f'/api/achats/qr/{achat.code_qr}.png'
+    return request.build_absolute_uri(chemin) if request else chemin
@@ -0,0 +1,219 @@
+"""
+Recherche plein texte des événements, classée par pertinence.
+
+PostgreSQL : colonne tsvector `recherche` (titre poids A, type B, lieu C) indexée en GIN,
+configuration `fr_unaccent` (french_stem précédé de unaccent : "Lomé" = "lome").
+SQLite : table virtuelle FTS5 `tickets_evenement_fts` (tokenizer unicode61 sans
+diacritiques), classement bm25 pondéré de la même façon.
+
+Dans les deux cas l'index est tenu à jour par des triggers de la base : chaque
+INSERT / UPDATE (des colonnes indexées) / DELETE ne recalcule que la ligne concernée,
+y compris pour bulk_create() et update(). Les triggers SQLite disparaissant lorsqu'une
+migration reconstruit la table, assurer_index_recherche() les réinstalle après chaque
+migrate. Autres moteurs : icontains sans classement.
+"""
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+TABLE = 'tickets_evenement'
+TABLE_FTS = 'tickets_evenement_fts'
+CONFIGURATION = 'fr_unaccent'
+MOTS_MAX = 8
+_MOT = re.compile(r'\w+')
+
+# Poids des colonnes : titre > type > lieu
+_VECTEUR_PG = (
+    "setweight(to_tsvector('{config}', coalesce({p}titre_evenement, '')), 'A') || "
+    "setweight(to_tsvector('{config}', coalesce({p}type_evenement, '')), 'B') || "
+    "setweight(to_tsvector('{config}', coalesce({p}lieu, '')), 'C')"
+)
+_POIDS_BM25 = '10.0, 5.0, 2.0'  # ordre des colonnes de la table FTS5
+
+_INSTALLATION = {
+    'postgresql': [
+        'CREATE EXTENSION IF NOT EXISTS unaccent',
+        f"""
+        DO $$ BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = '{CONFIGURATION}') THEN
+                CREATE TEXT SEARCH CONFIGURATION {CONFIGURATION} (COPY = french);
+                ALTER TEXT SEARCH CONFIGURATION {CONFIGURATION}
+                    ALTER MAPPING FOR hword, hword_part, word WITH unaccent, french_stem;
+            END IF;
+        END $$
+        """,
+        f'ALTER TABLE {TABLE} ADD COLUMN IF NOT EXISTS recherche tsvector',
+        f"""
+        CREATE OR REPLACE FUNCTION {TABLE}_recherche_maj() RETURNS trigger AS $$
+        BEGIN
+            NEW.recherche := {_VECTEUR_PG.format(config=CONFIGURATION, p='NEW.')};
+            RETURN NEW;
+        END $$ LANGUAGE plpgsql
+        """,
+        f'DROP TRIGGER IF EXISTS {TABLE}_recherche_ai ON {TABLE}',
+        f"""
+        CREATE TRIGGER {TABLE}_recherche_ai BEFORE INSERT ON {TABLE}
+        FOR EACH ROW EXECUTE FUNCTION {TABLE}_recherche_maj()
+        """,
+        f'DROP TRIGGER IF EXISTS {TABLE}_recherche_au ON {TABLE}',
+        f"""
+        CREATE TRIGGER {TABLE}_recherche_au BEFORE UPDATE OF titre_evenement, type_evenement, lieu ON {TABLE}
+        FOR EACH ROW WHEN (
+            OLD.titre_evenement IS DISTINCT FROM NEW.titre_evenement
+            OR OLD.type_evenement IS DISTINCT FROM NEW.type_evenement
+            OR OLD.lieu IS DISTINCT FROM NEW.lieu
+        ) EXECUTE FUNCTION {TABLE}_recherche_maj()
+        """,
+        f'CREATE INDEX IF NOT EXISTS {TABLE}_recherche_gin ON {TABLE} USING gin (recherche)',
+    ],
+    'sqlite': [
+        f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE_FTS} USING fts5(
+            titre_evenement, type_evenement, lieu,
+            content='{TABLE}', content_rowid='id_evenement',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+        """,
+        # Colonne cachée `rank` = bm25 pondéré ; contrairement à bm25(), elle reste lisible
+        # dans une requête groupée (annotations de avec_catalogue)
+        f"INSERT INTO {TABLE_FTS}({TABLE_FTS}, rank) VALUES ('rank', 'bm25({_POIDS_BM25})')",
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {TABLE_FTS}_ai AFTER INSERT ON {TABLE} BEGIN
+            INSERT INTO {TABLE_FTS}(rowid, titre_evenement, type_evenement, lieu)
+            VALUES (new.id_evenement, new.titre_evenement, new.type_evenement, new.lieu);
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {TABLE_FTS}_ad AFTER DELETE ON {TABLE} BEGIN
+            INSERT INTO {TABLE_FTS}({TABLE_FTS}, rowid, titre_evenement, type_evenement, lieu)
+            VALUES ('delete', old.id_evenement, old.titre_evenement, old.type_evenement, old.lieu);
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {TABLE_FTS}_au AFTER UPDATE OF titre_evenement, type_evenement, lieu ON {TABLE} BEGIN
+            INSERT INTO {TABLE_FTS}({TABLE_FTS}, rowid, titre_evenement, type_evenement, lieu)
+            VALUES ('delete', old.id_evenement, old.titre_evenement, old.type_evenement, old.lieu);
+            INSERT INTO {TABLE_FTS}(rowid, titre_evenement, type_evenement, lieu)
+            VALUES (new.id_evenement, new.titre_evenement, new.type_evenement, new.lieu);
+        END
+        """,
+    ],
+}
+
+_RECONSTRUCTION = {
+    'postgresql': f'UPDATE {TABLE} SET recherche = {_VECTEUR_PG.format(config=CONFIGURATION, p="")}',
+    'sqlite': f"INSERT INTO {TABLE_FTS}({TABLE_FTS}) VALUES ('rebuild')",
+}
+
+_DESINSTALLATION = {
+    'postgresql': [
+        f'DROP INDEX IF EXISTS {TABLE}_recherche_gin',
+        f'DROP TRIGGER IF EXISTS {TABLE}_recherche_au ON {TABLE}',
+        f'DROP TRIGGER IF EXISTS {TABLE}_recherche_ai ON {TABLE}',
+        f'DROP FUNCTION IF EXISTS {TABLE}_recherche_maj()',
+        f'ALTER TABLE {TABLE} DROP COLUMN IF EXISTS recherche',
+    ],
+    'sqlite': [
+        f'DROP TRIGGER IF EXISTS {TABLE_FTS}_au',
+        f'DROP TRIGGER IF EXISTS {TABLE_FTS}_ad',
+        f'DROP TRIGGER IF EXISTS {TABLE_FTS}_ai',
+        f'DROP TABLE IF EXISTS {TABLE_FTS}',
+    ],
+}
+
+_TRIGGERS = {
+    'postgresql': (
+        "SELECT COUNT(*) FROM pg_trigger WHERE tgname IN (%s, %s)",
+        [f'{TABLE}_recherche_ai', f'{TABLE}_recherche_au'],
+    ),
+    'sqlite': (
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name IN (%s, %s, %s)",
+        [f'{TABLE_FTS}_ai', f'{TABLE_FTS}_ad', f'{TABLE_FTS}_au'],
+    ),
+}
+
+
+def est_supporte(connection):
+    return connection.vendor in _INSTALLATION
+
+
+def installer(connection, forcer=False):
+    """
+    Créer l'index et ses triggers s'ils manquent, puis reconstruire l'index.
+    Retourne True si l'index a été (re)construit.
+    """
+    if not est_supporte(connection):
+        return False
+    with connection.cursor() as cursor:
+        if not forcer:
+            sql, params = _TRIGGERS[connection.vendor]
+            cursor.execute(sql, params)
+            if cursor.fetchone()[0] == len(params):
+                return False
+        for sql in _INSTALLATION[connection.vendor]:
+            cursor.execute(sql)
+        cursor.execute(_RECONSTRUCTION[connection.vendor])
+    return True
+
+
+def desinstaller(connection):
+    if not est_supporte(connection):
+        return
+    with connection.cursor() as cursor:
+        for sql in _DESINSTALLATION[connection.vendor]:
+            cursor.execute(sql)
+
+
+def assurer_index_recherche(sender, using='default', **kwargs):
+    """Receiver post_migrate : réinstaller les triggers perdus lors d'une reconstruction de table"""
+    connection = connections[using]
+    if TABLE in connection.introspection.table_names():
+        installer(connection)
+
+
+def termes(texte):
+    """Mots de la requête utilisateur, sans aucun caractère de syntaxe tsquery / FTS5"""
+    return _MOT.findall(texte.lower())[:MOTS_MAX]
+
+
+def rechercher_evenements(queryset, texte):
+    """
+    Filtrer un queryset d'événements sur `texte` et l'annoter de `pertinence`
+    (plus grand = plus pertinent), trié par pertinence puis date.
+    Chaque mot doit apparaître (ET) ; le dernier mot d'une saisie peut être incomplet,
+    tous les mots sont donc cherchés en préfixe.
+    """
+    mots = termes(texte)
+    if not mots:
+        return queryset.none()
+    vendor = connections[queryset.db].vendor
+
+    if vendor == 'postgresql':
+        tsquery = f"to_tsquery('{CONFIGURATION}', %s)"
+        expression = ' & '.join(f'{mot}:*' for mot in mots)
+        correspond = RawSQL(f'{TABLE}.recherche @@ {tsquery}', [expression], output_field=BooleanField())
+        pertinence = RawSQL(f'ts_rank_cd({TABLE}.recherche, {tsquery})', [expression], output_field=FloatField())
+    elif vendor == 'sqlite':
+        # Jointure avec la table FTS5 : le rang n'est calculé qu'une fois par ligne trouvée
+        # (une sous-requête corrélée relancerait le MATCH pour chaque ligne), ce que l'ORM
+        # ne sait pas exprimer sur une table virtuelle, d'où extra().
+        expression = ' '.join(f'"{mot}"*' for mot in mots)
+        return queryset.extra(
+            select={'pertinence': f'-{TABLE_FTS}.rank'},
+            tables=[TABLE_FTS],
+            where=[f'{TABLE_FTS}.rowid = {TABLE}.id_evenement', f'{TABLE_FTS} MATCH %s'],
+            params=[expression],
+        ).order_by('-pertinence', '-date', 'id_evenement')
+    else:
+        filtre = Q()
+        for mot in mots:
+            filtre &= Q(titre_evenement__icontains=mot) | Q(lieu__icontains=mot) | Q(type_evenement__icontains=mot)
+        return queryset.filter(filtre).annotate(
+            pertinence=Value(0.0, output_field=FloatField())
+        ).order_by('-date', 'id_evenement')
+
+    return queryset.filter(correspond).annotate(pertinence=pertinence).order_by(
+        '-pertinence', '-date', 'id_evenement'
+    )
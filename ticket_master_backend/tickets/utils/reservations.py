@@ -0,0 +1,142 @@
+"""
+Réservations de places à durée limitée (panier).
+
+POST /api/reservations/ retire la quantité du stock (UPDATE conditionnel, voir
+inventaire.py) et crée une Reservation active jusqu'à date_expiration : le stock affiché
+par le catalogue exclut donc déjà les places réservées. L'achat convertit la réservation
+sans toucher au stock : l'écriture disputée a lieu à la réservation, l'achat final ne
+débite plus que le solde.
+
+Pour qu'un compte ne puisse pas bloquer le stock sans pouvoir payer, une réservation est
+refusée (ReservationRefusee) au-delà de RESERVATION_ACTIVES_MAX réservations actives, ou
+si le solde ne couvre pas ses réservations actives plus la nouvelle. Vérifié sous le
+verrou de la ligne utilisateur (après celui du ticket, ordre de inventaire.py) : deux
+réservations simultanées du même compte ne passent pas toutes les deux.
+
+Les réservations expirées sont rendues au stock par liberer_expirees(), par lots : une
+seule instruction UPDATE ... RETURNING fait passer un lot au statut 'expiree' et renvoie
+les quantités à rendre, de sorte qu'une réservation convertie ou annulée au même moment
+n'est jamais rendue deux fois. Balayage périodique : commande liberer_reservations.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, DecimalField, F, Sum
+from django.utils import timezone
+
+from ..models.reservation import Reservation
+from ..models.ticket import Ticket
+from ..models.utilisateurs import Utilisateur
+from .inventaire import decrementer_stock, incrementer_stock
+
+LOT = 500
+
+
+class ReservationRefusee(Exception):
+    """Plafond de réservations actives atteint, ou solde insuffisant pour les payer"""
+
+
+def _plafonner(utilisateur, ticket, quantite):
+    """Refuser la réservation si le compte (verrouillé) en a trop ou ne pourrait pas les payer"""
+    solde = Utilisateur.objects.select_for_update().values_list('solde', flat=True).get(pk=utilisateur.pk)
+    actives = Reservation.objects.filter(
+        id_utilisateur=utilisateur, statut=Reservation.ACTIVE, date_expiration__gt=timezone.now()
+    ).aggregate(
+        nombre=Count('pk'),
+        montant=Sum(F('quantite') * F('id_ticket__prix'), output_field=DecimalField(max_digits=14, decimal_places=2)),
+    )
+    if actives['nombre'] >= settings.RESERVATION_ACTIVES_MAX:
+        raise ReservationRefusee(
+            f'{settings.RESERVATION_ACTIVES_MAX} réservations actives au maximum : achetez ou annulez-en une.'
+        )
+    necessaire = (actives['montant'] or 0) + ticket.prix * quantite
+    if solde < necessaire:
+        raise ReservationRefusee(
+            f'Solde insuffisant pour vos réservations. Nécessaire: {necessaire}, Disponible: {solde}'
+        )
+
+
+def reserver(utilisateur, ticket, quantite):
+    """
+    Réservation active de `quantite` places, ou None si le stock ne suffit pas ;
+    ReservationRefusee si le compte ne peut pas la prendre (rien n'est retiré du stock)
+    """
+    with transaction.atomic():
+        if not decrementer_stock(ticket, quantite):
+            # Des réservations expirées pas encore balayées peuvent libérer les places
+            if not liberer_expirees(ticket=ticket) or not decrementer_stock(ticket, quantite):
+                return None
+        _plafonner(utilisateur, ticket, quantite)
+        return Reservation.objects.create(
+            id_utilisateur=utilisateur,
+            id_ticket=ticket,
+            quantite=quantite,
+            date_expiration=timezone.now() + timedelta(seconds=settings.RESERVATION_DUREE),
+        )
+
+
+def annuler(reservation):
+    """Rendre au stock une réservation active ; False si elle ne l'était plus"""
+    with transaction.atomic():
+        if not Reservation.objects.filter(pk=reservation.pk, statut=Reservation.ACTIVE).update(
+            statut=Reservation.ANNULEE
+        ):
+            return False
+        incrementer_stock(reservation.id_ticket, reservation.quantite)
+    return True
+
+
+def convertir(id_reservation, utilisateur):
+    """
+    Marquer convertie une réservation active et non expirée de l'utilisateur (à appeler
+    dans la transaction de l'achat). Renvoie la réservation, ou None.
+    """
+    if not Reservation.objects.filter(
+        pk=id_reservation, id_utilisateur=utilisateur,
+        statut=Reservation.ACTIVE, date_expiration__gt=timezone.now(),
+    ).update(statut=Reservation.CONVERTIE):
+        return None
+    return Reservation.objects.select_related('id_ticket').get(pk=id_reservation)
+
+
+def _expirer_lot(maintenant, lot, ticket):
+    """Passer un lot de réservations expirées au statut 'expiree' : [(id_ticket, quantite)]"""
+    table = connection.ops.quote_name(Reservation._meta.db_table)
+    condition = 'statut = %s AND date_expiration <= %s'
+    parametres = [Reservation.ACTIVE, maintenant]
+    if ticket is not None:
+        condition += ' AND id_ticket_id = %s'
+        parametres.append(ticket.pk)
+    # Lignes verrouillées par un autre balayeur ou une conversion : ignorées (PostgreSQL)
+    verrou = ' FOR UPDATE SKIP LOCKED' if connection.features.has_select_for_update_skip_locked else ''
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} SET statut = %s WHERE statut = %s AND id_reservation IN ('
+            f'SELECT id_reservation FROM {table} WHERE {condition} '
+            f'ORDER BY date_expiration LIMIT %s{verrou}'
+            f') RETURNING id_ticket_id, quantite',
+            [Reservation.EXPIREE, Reservation.ACTIVE, *parametres, lot],
+        )
+        return cursor.fetchall()
+
+
+def liberer_expirees(lot=LOT, ticket=None):
+    """Rendre au stock les réservations expirées, lot par lot ; nombre de réservations libérées"""
+    maintenant = timezone.now()
+    total = 0
+    while True:
+        with transaction.atomic():
+            lignes = _expirer_lot(maintenant, lot, ticket)
+            quantites = defaultdict(int)
+            for id_ticket, quantite in lignes:
+                quantites[id_ticket] += quantite
+            tickets = Ticket.objects.only('id_evenement', 'nombre_fractions').in_bulk(quantites)
+            # Une mise à jour par ticket, dans l'ordre des clés (ordre de verrouillage stable)
+            for id_ticket in sorted(quantites):
+                if id_ticket in tickets:
+                    incrementer_stock(tickets[id_ticket], quantites[id_ticket])
+        total += len(lignes)
+        if len(lignes) < lot:
+            return total
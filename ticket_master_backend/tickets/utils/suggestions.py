@@ -0,0 +1,326 @@
+"""
+Suggestions de saisie (autocomplétion) sur les titres d'événements.
+
+Réponse minimale (id, titre, type) pour /api/evenements/suggest/, appelée à chaque frappe.
+Chaque mot saisi est cherché en préfixe, sans accents ; le dernier mot (en cours de
+frappe) tolère une faute de frappe.
+
+PostgreSQL : pg_trgm, index GIN trigrammes sur le titre normalisé (unaccent + lower) ;
+LIKE préfixe et word_similarity() pour les fautes.
+Autres moteurs : trie de préfixes en mémoire, construit par processus sur le vocabulaire
+des titres et reconstruit lorsque la portée de cache 'suggestions' change de version
+(signal de sauvegarde / suppression d'un Evenement). La reconstruction a lieu dans un
+thread, une à la fois : l'ancien index continue de servir les frappes, puis le nouveau
+le remplace d'un bloc. Seule la première construction du processus est synchrone.
+"""
+import heapq
+import itertools
+import threading
+import unicodedata
+from datetime import date
+
+from django.db import connections
+
+from ..models.evenements import Evenement
+from .cache_catalogue import get_versions
+from .recherche import termes
+
+PORTEE = 'suggestions'
+LIMITE_DEFAUT = 8
+LIMITE_MAX = 20
+LONGUEUR_MIN = 2
+LONGUEUR_FAUTE = 4  # pas de tolérance aux fautes en dessous (trop de bruit)
+SIMILARITE_MIN = 0.5
+CANDIDATS_MAX = 2000
+
+_INSTALLATION_PG = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE EXTENSION IF NOT EXISTS unaccent',
+    # unaccent() n'est pas IMMUTABLE : enveloppe indexable à dictionnaire explicite
+    """
+    CREATE OR REPLACE FUNCTION tickets_normaliser(texte text) RETURNS text AS $$
+        SELECT lower(public.unaccent('public.unaccent'::regdictionary, texte))
+    $$ LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS tickets_evenement_titre_trgm
+    ON tickets_evenement USING gin (tickets_normaliser(titre_evenement) gin_trgm_ops)
+    """,
+]
+
+_DESINSTALLATION_PG = [
+    'DROP INDEX IF EXISTS tickets_evenement_titre_trgm',
+    'DROP FUNCTION IF EXISTS tickets_normaliser(text)',
+]
+
+# Préfixe du titre > préfixe d'un mot > similarité (fautes), puis événements à venir d'abord
+_SQL_PG = """
+    SELECT id_evenement, titre_evenement, type_evenement FROM (
+        SELECT id_evenement, titre_evenement, type_evenement, date,
+               CASE WHEN titre LIKE %(prefixe)s THEN 2
+                    WHEN titre LIKE %(mot)s THEN 1
+                    ELSE 0 END AS rang,
+               word_similarity(%(requete)s, titre) AS similarite
+        FROM (SELECT *, tickets_normaliser(titre_evenement) AS titre FROM tickets_evenement) e
+        WHERE titre LIKE %(contient)s OR %(requete)s <%% titre
+    ) candidats
+    WHERE rang > 0 OR similarite >= %(similarite)s
+    ORDER BY rang DESC, similarite DESC, date < %(aujourdhui)s, abs(date - %(aujourdhui)s), id_evenement
+    LIMIT %(limite)s
+"""
+
+
+def installer(connection):
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            for sql in _INSTALLATION_PG:
+                cursor.execute(sql)
+
+
+def desinstaller(connection):
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            for sql in _DESINSTALLATION_PG:
+                cursor.execute(sql)
+
+
+def normaliser(texte):
+    """Minuscules sans accents (équivalent Python de tickets_normaliser)"""
+    decompose = unicodedata.normalize('NFKD', texte.lower())
+    return ''.join(c for c in decompose if not unicodedata.combining(c))
+
+
+def suggerer(texte, limite=LIMITE_DEFAUT, using='default'):
+    """Liste de dicts {id_evenement, titre_evenement, type_evenement}, au plus `limite`"""
+    mots = [normaliser(mot).replace('_', '') for mot in termes(texte)]
+    mots = [mot for mot in mots if mot]
+    if not mots or len(''.join(mots)) < LONGUEUR_MIN:
+        return []
+    if connections[using].vendor == 'postgresql':
+        return _suggerer_postgres(mots, limite, using)
+    return get_index().chercher(mots, limite)
+
+
+def _suggerer_postgres(mots, limite, using):
+    requete = ' '.join(mots)
+    with connections[using].cursor() as cursor:
+        cursor.execute(_SQL_PG, {
+            'requete': requete,
+            'prefixe': f'{requete}%',
+            'mot': f'% {requete}%',
+            'contient': f'%{requete}%',
+            'similarite': SIMILARITE_MIN,
+            'aujourdhui': date.today(),
+            'limite': limite,
+        })
+        return [
+            {'id_evenement': id_evenement, 'titre_evenement': titre, 'type_evenement': type_evenement}
+            for id_evenement, titre, type_evenement in cursor.fetchall()
+        ]
+
+
+class _Noeud:
+    __slots__ = ('enfants', 'ids', 'meilleurs', 'taille')
+
+    def __init__(self):
+        self.enfants = {}
+        self.ids = []
+        self.meilleurs = ()
+        self.taille = 0
+
+
+class IndexPrefixes:
+    """
+    Trie sur le vocabulaire normalisé des titres. Chaque nœud garde les LIMITE_MAX
+    meilleurs événements de son sous-arbre : un préfixe seul se résout sans parcours.
+    Plusieurs mots : parcours du sous-arbre du mot le plus sélectif, filtré par les autres.
+    """
+
+    def __init__(self, evenements):
+        aujourdhui = date.today()
+        self.evenements = {}
+        self.racine = _Noeud()
+        for id_evenement, titre, type_evenement, jour in evenements:
+            mots = tuple(normaliser(titre).split())
+            # À venir d'abord (les plus proches), puis passés (les plus récents)
+            ordre = (jour < aujourdhui, abs((jour - aujourdhui).days), id_evenement)
+            self.evenements[id_evenement] = (titre, type_evenement, mots, ordre)
+            for mot in set(mots):
+                noeud = self.racine
+                for caractere in mot:
+                    noeud = noeud.enfants.setdefault(caractere, _Noeud())
+                noeud.ids.append(id_evenement)
+        self._calculer_meilleurs(self.racine)
+
+    def _calculer_meilleurs(self, racine):
+        # Parcours postfixe itératif (profondeur des mots non bornée)
+        pile = [(racine, False)]
+        while pile:
+            noeud, visite = pile.pop()
+            if not visite:
+                pile.append((noeud, True))
+                pile.extend((enfant, False) for enfant in noeud.enfants.values())
+                continue
+            noeud.ids.sort(key=self._ordre)
+            candidats = set(noeud.ids)
+            noeud.taille = len(noeud.ids)
+            for enfant in noeud.enfants.values():
+                candidats.update(enfant.meilleurs)
+                noeud.taille += enfant.taille
+            noeud.meilleurs = tuple(heapq.nsmallest(LIMITE_MAX, candidats, key=self._ordre))
+
+    def _ordre(self, id_evenement):
+        return self.evenements[id_evenement][3]
+
+    def _noeud(self, prefixe):
+        noeud = self.racine
+        for caractere in prefixe:
+            noeud = noeud.enfants.get(caractere)
+            if noeud is None:
+                return None
+        return noeud
+
+    def _parcours(self, noeud):
+        """
+        Ids du sous-arbre dans l'ordre de classement : fusion paresseuse des listes
+        (triées à la construction), on s'arrête dès qu'assez d'ids ont passé les filtres.
+        Au plus CANDIDATS_MAX ids examinés.
+        """
+        listes, pile = [], [noeud]
+        while pile:
+            courant = pile.pop()
+            if courant.ids:
+                listes.append(courant.ids)
+            pile.extend(courant.enfants.values())
+        return itertools.islice(heapq.merge(*listes, key=self._ordre), CANDIDATS_MAX)
+
+    def _approches(self, mot, distance_max=1):
+        """Chemins du trie à distance d'édition <= distance_max de `mot` (nœud, chemin)"""
+        trouves = []
+        premiere = list(range(len(mot) + 1))
+        pile = [(enfant, caractere, premiere) for caractere, enfant in self.racine.enfants.items()]
+        while pile:
+            noeud, chemin, precedente = pile.pop()
+            caractere = chemin[-1]
+            ligne = [precedente[0] + 1]
+            for i in range(1, len(mot) + 1):
+                cout = 0 if mot[i - 1] == caractere else 1
+                ligne.append(min(ligne[i - 1] + 1, precedente[i] + 1, precedente[i - 1] + cout))
+            if ligne[-1] <= distance_max:
+                trouves.append((noeud, chemin))
+            elif min(ligne) <= distance_max:
+                pile.extend((enfant, chemin + c, ligne) for c, enfant in noeud.enfants.items())
+        return trouves
+
+    @staticmethod
+    def _premiers(ids, nombre, exclus=()):
+        """Les `nombre` premiers ids distincts d'un flux déjà ordonné"""
+        vus = set(exclus)
+        premiers = []
+        for i in ids:
+            if i not in vus:
+                vus.add(i)
+                premiers.append(i)
+                if len(premiers) == nombre:
+                    break
+        return premiers
+
+    def chercher(self, mots, limite):
+        *complets, dernier = mots
+        exacts = self._noeud(dernier)
+        noeuds_complets = [self._noeud(mot) for mot in complets]
+        if None in noeuds_complets:
+            return []
+        # Sous-arbre de départ des recherches à plusieurs mots
+        base = min(noeuds_complets, key=lambda noeud: noeud.taille) if complets else None
+
+        if exacts is None:
+            trouves = []
+        elif not complets:
+            # Cas courant (un seul mot) : lecture directe des meilleurs du nœud
+            trouves = list(exacts.meilleurs)
+        else:
+            depart = exacts if exacts.taille < base.taille else base
+            trouves = self._premiers((i for i in self._parcours(depart) if self._contient(i, mots)), LIMITE_MAX)
+
+        if len(trouves) < limite and len(dernier) >= LONGUEUR_FAUTE:
+            approches = self._approches(dernier)
+            if not complets:
+                candidats = sorted({i for noeud, _ in approches for i in noeud.meilleurs}, key=self._ordre)
+            else:
+                chemins = tuple(chemin for _, chemin in approches)
+                candidats = (
+                    i for i in self._parcours(base)
+                    if self._contient(i, complets) and self._contient_un(i, chemins)
+                )
+            trouves.extend(self._premiers(candidats, LIMITE_MAX, exclus=trouves))
+
+        # Titre commençant par la saisie en tête, ordre stable sinon
+        debut = ' '.join(mots)
+        trouves.sort(key=lambda i: not ' '.join(self.evenements[i][2]).startswith(debut))
+        return [
+            {'id_evenement': i, 'titre_evenement': self.evenements[i][0], 'type_evenement': self.evenements[i][1]}
+            for i in trouves[:limite]
+        ]
+
+    def _contient(self, id_evenement, prefixes):
+        mots = self.evenements[id_evenement][2]
+        return all(any(mot.startswith(prefixe) for mot in mots) for prefixe in prefixes)
+
+    def _contient_un(self, id_evenement, prefixes):
+        return any(mot.startswith(prefixes) for mot in self.evenements[id_evenement][2])
+
+
+_etat = (None, None)  # (index, version de la portée) : remplacé d'un bloc
+_verrou = threading.Lock()  # une reconstruction à la fois
+
+
+def construire():
+    return IndexPrefixes(
+        Evenement.objects.values_list('id_evenement', 'titre_evenement', 'type_evenement', 'date')
+        .iterator(chunk_size=5000)
+    )
+
+
+def reconstruire(version=None):
+    """Construire l'index et le mettre en service (version lue avant la lecture des titres)"""
+    global _etat
+    version = version or get_versions([PORTEE])
+    _etat = (construire(), version)
+    return _etat[0]
+
+
+def _lancer(reconstruction):
+    """Reconstruction en arrière-plan, sur les connexions propres à son thread"""
+    def cible():
+        try:
+            reconstruction()
+        finally:
+            connections.close_all()
+    threading.Thread(target=cible, name='suggestions', daemon=True).start()
+
+
+def get_index():
+    """
+    Index du processus. Si la portée 'suggestions' a changé de version, la reconstruction
+    est lancée en arrière-plan et l'index courant sert en attendant.
+    """
+    version = get_versions([PORTEE])
+    index, version_index = _etat
+    if index is None:
+        with _verrou:
+            if _etat[0] is None:
+                reconstruire(version)
+        return _etat[0]
+    if version_index != version and _verrou.acquire(blocking=False):
+        def reconstruction():
+            try:
+                reconstruire(version)
+            finally:
+                _verrou.release()
+        try:
+            _lancer(reconstruction)
+        except BaseException:
+            _verrou.release()
+            raise
+    return _etat[0]
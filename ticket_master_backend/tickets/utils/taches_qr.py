@@ -0,0 +1,120 @@
+"""
+Rendu des images QR hors du chemin de la requête d'achat, quand elles sont stockées
+(QR_IMAGES_STOCKEES ; par défaut elles sont rendues à la demande, voir cache_qr.py).
+
+L'achat n'écrit qu'une ligne TacheQR dans sa propre transaction (file durable : pas de
+tâche perdue si un worker s'arrête) et répond aussitôt avec code_qr ; qr_code_url pointe
+vers le fichier une fois rendu.
+
+La commande generer_qr traite la file par lots : tâches verrouillées FOR UPDATE SKIP
+LOCKED (plusieurs workers possibles sur PostgreSQL), rendu PNG réparti sur un pool de
+processus (calcul pur, sans accès à la base), puis fichiers écrits et lignes mises à jour
+par bulk_update. Une tâche en erreur est retentée jusqu'à TENTATIVES fois.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from ..models.achat import Achat
+from ..models.tache_qr import TacheQR
+from .qr_generator import contenu_qr, rendre_png, url_base as url_base_par_defaut
+
+LOT = 100
+TENTATIVES = 3
+
+
+def planifier(achats, url_base=''):
+    """Mettre en file le rendu QR des achats (à appeler dans leur transaction)"""
+    if not settings.QR_IMAGES_STOCKEES:
+        return  # images rendues à la demande (voir cache_qr.py)
+    TacheQR.objects.bulk_create(
+        [TacheQR(id_achat=achat, url_base=url_base) for achat in achats], ignore_conflicts=True
+    )
+
+
+def _rendre(contenu):
+    try:
+        return rendre_png(contenu), None
+    except Exception as e:
+        return None, f'{type(e).__name__}: {e}'[:255]
+
+
+def traiter_lot(lot=LOT, executeur=None):
+    """Rendre un lot de QR codes ; nombre de tâches traitées"""
+    verrou = {'skip_locked': True} if connection.features.has_select_for_update_skip_locked else {}
+    with transaction.atomic():
+        taches = list(
+            TacheQR.objects.select_for_update(of=('self',), **verrou)
+            .select_related('id_achat__id_ticket__id_evenement', 'id_achat__session')
+            .filter(statut=TacheQR.EN_ATTENTE).order_by('id_tache')[:lot]
+        )
+        if not taches:
+            return 0
+        travaux = [contenu_qr(tache.id_achat, tache.url_base or url_base_par_defaut()) for tache in taches]
+        resultats = executeur.map(_rendre, travaux, chunksize=8) if executeur else map(_rendre, travaux)
+
+        maintenant = timezone.now()
+        achats = []
+        for tache, (png, erreur) in zip(taches, resultats):
+            tache.date_traitement = maintenant
+            if png is None:
+                tache.tentatives += 1
+                tache.erreur = erreur
+                if tache.tentatives >= TENTATIVES:
+                    tache.statut = TacheQR.ECHEC
+                continue
+            achat = tache.id_achat
+            nom = f'qr_codes/qr_{achat.code_qr}.png'
+            achat.qr_image.storage.delete(nom)  # reprise d'un lot interrompu : même nom
+            achat.qr_image.save(nom.split('/')[-1], ContentFile(png), save=False)
+            achats.append(achat)
+            tache.statut = TacheQR.TERMINEE
+            tache.erreur = ''
+        Achat.objects.bulk_update(achats, ['qr_image'])
+        TacheQR.objects.bulk_update(taches, ['statut', 'tentatives', 'erreur', 'date_traitement'])
+    return len(taches)
+
+
+def traiter_taches(lot=LOT, executeur=None):
+    """Vider la file des rendus QR (rendu dans `executeur` s'il est donné) ; nombre de tâches traitées"""
+    total = 0
+    while True:
+        nombre = traiter_lot(lot, executeur)
+        total += nombre
+        if nombre < lot:
+            return total
+
+
+def pool_rendu(processus):
+    """Pool de processus de rendu (None pour un rendu dans le processus courant)"""
+    if processus <= 1:
+        return None
+    connections.close_all()  # les processus de rendu n'utilisent pas la base
+    return ProcessPoolExecutor(processus, mp_context=multiprocessing.get_context('fork'))
+
+
+def rattraper(lot=1000):
+    """
+    Planifier le rendu des achats sans image QR ni tâche (achats antérieurs) ; nombre planifié.
+    Parcours par clé (id_achat croissant) : chaque achat n'est lu qu'une fois.
+    """
+    if not settings.QR_IMAGES_STOCKEES:
+        return 0  # rien n'est stocké : aucune tâche à planifier
+    achats = Achat.objects.filter(
+        Q(qr_image='') | Q(qr_image__isnull=True), tache_qr__isnull=True, code_qr__isnull=False
+    ).only('id_achat').order_by('id_achat')
+    total, dernier = 0, 0
+    while True:
+        morceau = list(achats.filter(id_achat__gt=dernier)[:lot])
+        if not morceau:
+            return total
+        planifier(morceau)
+        total += len(morceau)
+        dernier = morceau[-1].id_achat
+        if len(morceau) < lot:
+            return total
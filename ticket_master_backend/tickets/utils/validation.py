@@ -0,0 +1,165 @@
+"""
+Validation des billets aux portes (passage d'un achat à est_utilise).
+
+Billet scanné en ligne (validate/<code_qr>/ et valider/) : valider_billet(), un UPDATE
+conditionnel unique, comme les mouvements de stock (voir inventaire.py) :
+    UPDATE achat SET est_utilise = true, date_utilisation = ..., porte_validation = ...
+    WHERE code_qr = ... AND est_utilise = false
+1 ligne modifiée : ce scan a admis le billet ; 0 : déjà utilisé (ou inconnu). Deux portes
+qui scannent le même billet au même instant ne peuvent plus l'admettre toutes les deux
+(lecture de est_utilise puis save() de toute la ligne, l'une après l'autre).
+
+Les scanners vérifient les billets hors ligne (voir jeton_qr.py), gardent leurs passages
+en mémoire et les synchronisent par lots (POST /api/achats/validate/batch/). Un lot est
+appliqué en deux requêtes, quel que soit son nombre de passages :
+    1. un UPDATE conditionnel ensembliste, joint aux passages (PostgreSQL, SQLite >= 3.33) :
+           UPDATE achat SET est_utilise = true, date_utilisation = v.column2, porte_validation = v.column3
+           FROM (VALUES (code_qr, scanned_at, gate_id), ...) AS v
+           WHERE achat.code_qr = v.column1 AND achat.est_utilise = false
+       la base arbitre : d'un billet passé à deux portes, une seule écriture aboutit ;
+    2. une lecture de l'état final des achats du lot.
+Un passage est 'valide' si l'achat porte ensuite sa porte et son heure : renvoyer le même
+lot (réponse perdue) redonne donc les mêmes résultats. Sinon 'deja_utilise', avec la porte
+et l'heure du premier passage. Dans un lot, un billet scanné deux fois est attribué au
+passage le plus ancien.
+
+Billets d'un événement préchauffé (voir cache_scan.py) : le cache partagé arbitre leurs
+validations, écrites en base après coup. Une validation faite ici y est donc reportée ;
+si le cache avait déjà admis le billet, c'est son passage qui est retenu.
+
+Chaque décision alimente les compteurs de fréquentation (voir frequentation.py) ; un lot
+rejoué n'y compte pas deux fois ses billets.
+"""
+import time
+
+from django.db import connection
+from django.utils import timezone
+
+from ..models.achat import Achat
+from ..models.ticket import Ticket
+from . import cache_scan, frequentation
+
+LOT_MAX = 1000
+
+VALIDE = 'valide'
+DEJA_UTILISE = 'deja_utilise'
+INCONNU = 'inconnu'
+AUTRE_EVENEMENT = 'autre_evenement'
+
+
+def valider_billet(porte='', **filtre):
+    """
+    Valider le billet désigné par `filtre` (code_qr=... ou id_achat=...) :
+    (VALIDE | DEJA_UTILISE | INCONNU, achat chargé avec utilisateur, ticket et événement ou None)
+    """
+    debut = time.perf_counter()
+    maintenant = timezone.now()
+    valide = Achat.objects.filter(est_utilise=False, **filtre).update(
+        est_utilise=True, date_utilisation=maintenant, porte_validation=porte, date_modification=maintenant
+    ) == 1
+    achat = Achat.objects.select_related('id_utilisateur', 'id_ticket__id_evenement').filter(**filtre).first()
+    if achat is None:
+        return INCONNU, None
+    if valide:
+        autre = cache_scan.marquer(achat.code_qr, maintenant, porte)
+        if autre is not None:
+            valide = False
+            if autre != cache_scan.ANNULE:
+                _retenir(achat, autre)
+    frequentation.scan(
+        achat.id_ticket.id_evenement_id, achat.session_id, porte, achat.quantite if valide else 0,
+        time.perf_counter() - debut,
+    )
+    return (VALIDE if valide else DEJA_UTILISE), achat
+
+
+def _retenir(achat, etat):
+    """Le passage admis par le cache devance celui écrit en base : le conserver"""
+    achat.date_utilisation, achat.porte_validation = etat
+    Achat.objects.filter(pk=achat.pk).update(date_utilisation=achat.date_utilisation, porte_validation=achat.porte_validation)
+
+
+def _appliquer(passages, id_evenement, maintenant):
+    """Un seul UPDATE joint aux passages (un CASE du ORM coûterait une expression par passage)"""
+    table = connection.ops.quote_name(Achat._meta.db_table)
+    tickets = connection.ops.quote_name(Ticket._meta.db_table)
+    valeurs, parametres = [], [True, connection.ops.adapt_datetimefield_value(maintenant)]
+    for passage in passages:
+        valeurs.append('(%s, %s, %s)')
+        parametres += [
+            passage['code_qr'], connection.ops.adapt_datetimefield_value(passage['scanned_at']), passage['gate_id']
+        ]
+    condition = f'{table}.code_qr = v.column1 AND {table}.est_utilise = %s'
+    parametres.append(False)
+    if id_evenement is not None:
+        condition += f' AND {table}.id_ticket_id IN (SELECT id_ticket FROM {tickets} WHERE id_evenement_id = %s)'
+        parametres.append(id_evenement)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} SET est_utilise = %s, date_modification = %s, '
+            f'date_utilisation = v.column2, porte_validation = v.column3 '
+            f'FROM (VALUES {", ".join(valeurs)}) AS v WHERE {condition}',
+            parametres,
+        )
+
+
+def valider_lot(passages, id_evenement=None, marquer=True):
+    """
+    Appliquer des passages {code_qr, scanned_at, gate_id} ; un résultat par passage, dans
+    l'ordre reçu. Avec `id_evenement`, les billets d'autres événements sont refusés.
+    `marquer` : reporter les passages validés dans le cache des scans et les compter dans la
+    fréquentation (faux pour l'écriture différée des passages qui en viennent, déjà comptés).
+    """
+    # Premier passage de chaque billet (heure de scan, puis ordre reçu)
+    premiers = {}
+    for passage in sorted(passages, key=lambda p: p['scanned_at']):
+        premiers.setdefault(passage['code_qr'], passage)
+
+    maintenant = timezone.now()
+    if premiers:
+        _appliquer(premiers.values(), id_evenement, maintenant)
+
+    achats = Achat.objects.filter(code_qr__in=list(premiers))
+    etats = {
+        etat['code_qr']: etat
+        for etat in achats.values(
+            'code_qr', 'id_achat', 'date_utilisation', 'porte_validation', 'date_modification', 'quantite',
+            'session_id', 'id_ticket__id_evenement_id',
+        )
+    }
+    if marquer:
+        for code_qr, passage in premiers.items():
+            etat = etats.get(code_qr)
+            if etat and etat['porte_validation'] == passage['gate_id'] and etat['date_utilisation'] == passage['scanned_at']:
+                autre = cache_scan.marquer(code_qr, passage['scanned_at'], passage['gate_id'])
+                if autre is not None and autre != cache_scan.ANNULE:
+                    achat = Achat(pk=etat['id_achat'])
+                    _retenir(achat, autre)
+                    etat.update(date_utilisation=autre[0], porte_validation=autre[1])
+                elif etat['date_modification'] == maintenant:  # admis par ce lot (pas un lot rejoué)
+                    frequentation.scan(
+                        etat['id_ticket__id_evenement_id'], etat['session_id'], passage['gate_id'], etat['quantite'],
+                        instant=passage['scanned_at'].timestamp(),
+                    )
+
+    resultats = []
+    for passage in passages:
+        etat = etats.get(passage['code_qr'])
+        resultat = {'code_qr': passage['code_qr'], 'gate_id': passage['gate_id']}
+        if etat is None:
+            resultat['statut'] = INCONNU
+        elif id_evenement is not None and etat['id_ticket__id_evenement_id'] != id_evenement:
+            resultat.update(statut=AUTRE_EVENEMENT, id_achat=etat['id_achat'])
+        elif (premiers[passage['code_qr']] is passage
+              and etat['porte_validation'] == passage['gate_id']
+              and etat['date_utilisation'] == passage['scanned_at']):
+            resultat.update(statut=VALIDE, id_achat=etat['id_achat'], date_utilisation=etat['date_utilisation'])
+        else:
+            resultat.update(
+                statut=DEJA_UTILISE,
+                id_achat=etat['id_achat'],
+                porte_gagnante=etat['porte_validation'],
+                date_utilisation=etat['date_utilisation'],
+            )
+        resultats.append(resultat)
+    return resultats
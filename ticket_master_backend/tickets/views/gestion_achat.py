@@ -2,39 +2,98 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from django.db.models import Sum
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified, HttpResponseRedirect
 from django.shortcuts import render
-from django.utils import timezone
+from django.utils.http import quote_etag
+from collections import Counter
 from datetime import datetime, timedelta
+import base64
 
 from ..models.achat import Achat
 from ..models.utilisateurs import Utilisateur
-from ..models.ticket import Ticket
 from ..serializers.achat_serializers import (
     AchatSerializer,
     AchatCreateSerializer,
     AchatListSerializer,
     AchatDetailSerializer,
+    PanierSerializer,
+    ValidationLotSerializer,
 )
-from ..utils.qr_generator import generate_qr_code
-class AchatViewSet(viewsets.ModelViewSet):
-    queryset = Achat.objects.all().order_by('-id_achat')  # Tri décroissant : plus récent en premier
+from ..serializers.commande_serializers import CommandeSerializer, CommandeCreateSerializer
+from ..utils.qr_generator import CORRECTIONS, get_qr_url, url_base
+from ..utils.cache_qr import image_qr
+from ..utils.validation import DEJA_UTILISE, INCONNU, valider_billet
+from ..utils import cache_scan
+from ..utils.jeton_qr import JetonInvalide, cles_publiques, cle_publique_brute, extraire_jeton, id_cle, verifier
+from ..utils.conditionnel import reponse_conditionnelle
+from ..utils.idempotence import idempotent
+from ..utils.annulations import rembourser_achats
+from ..utils import commandes
+from .gestion_file_attente import ControleFileAttenteMixin
+from ..pagination import KeysetPagination, reponse_paginee
+from ..permission import IsAdministrateur
+
+
+def _validateurs_par_utilisateur(view, request, kwargs):
+    """Achats de l'utilisateur, ainsi que les tickets et événements qu'ils affichent"""
+    id_utilisateur = request.query_params.get('id_utilisateur')
+    if not id_utilisateur:
+        return []
+    agregats = Achat.objects.filter(id_utilisateur=id_utilisateur).aggregate(
+        achats_max=Max('date_modification'),
+        achats_nb=Count('id_achat'),
+        tickets_max=Max('id_ticket__date_modification'),
+        evenements_max=Max('id_ticket__id_evenement__date_modification'),
+    )
+    utilisateur = list(Utilisateur.objects.filter(id_utilisateur=id_utilisateur).values_list('prenom', 'nom'))
+    return [agregats[cle] for cle in sorted(agregats)] + utilisateur
+
+
+def _details_achat(achat):
+    """Détails d'un achat affichés au scan (mêmes clés que cache_scan.Billet.resume)"""
+    return {
+        'id_achat': achat.id_achat,
+        'utilisateur': f"{achat.id_utilisateur.prenom} {achat.id_utilisateur.nom}",
+        'email': achat.id_utilisateur.email,
+        'tel': achat.id_utilisateur.tel,
+        'evenement': achat.id_ticket.id_evenement.titre_evenement,
+        'type_ticket': achat.id_ticket.type,
+        'quantite': achat.quantite,
+        'total': str(achat.montant_total),
+        'date_achat': achat.date_achat,
+        'est_utilise': achat.est_utilise,
+        'date_utilisation': achat.date_utilisation,
+    }
+
+
+class AchatViewSet(ControleFileAttenteMixin, viewsets.ModelViewSet):
+    queryset = Achat.objects.select_related(
+        'id_utilisateur', 'id_ticket', 'id_ticket__id_evenement'
+    ).order_by('-date_achat', '-id_achat')  # Tri décroissant : plus récent en premier
     serializer_class = AchatSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
     lookup_field = 'id_achat'
     ordering_fields = ['id_achat', 'date_achat', 'montant_total']
     ordering = '-id_achat'  # Ordre par défaut
+    actions_file_attente = ('create', 'panier')
     
     def get_permissions(self):
         # Endpoints publics pour le scan de QR code (pas d'authentification requise)
-        if self.action in ['scan_qr', 'validate_ticket', 'get_by_qr']:
+        if self.action in ['scan_qr', 'validate_ticket', 'get_by_qr', 'qr', 'image_qr', 'cle_jeton', 'verifier_jeton']:
             permission_classes = [AllowAny]
         elif self.action in ['list', 'retrieve']:
             permission_classes = [IsAuthenticated]
-        elif self.action in ['create', 'destroy', 'valider']:
+        elif self.action in ['create', 'panier', 'destroy', 'valider']:
             permission_classes = [IsAuthenticated]
         elif self.action in ['par_utilisateur', 'par_evenement', 'recents', 'statistiques']:
             permission_classes = [IsAuthenticated]
+        elif self.action == 'validate_batch':
+            # Synchronisation des scanners de porte
+            permission_classes = [IsAdministrateur]
         else:
             permission_classes = [IsAuthenticated]
         
@@ -49,18 +108,19 @@ class AchatViewSet(viewsets.ModelViewSet):
             return AchatDetailSerializer
         return AchatSerializer
     
+    @idempotent
     def create(self, request, *args, **kwargs):
+        # Mode asynchrone (mises en vente très chargées) : voir utils/commandes.py
+        if 'respond-async' in request.headers.get('Prefer', '') and 'id_reservation' not in request.data:
+            return self.creer_commande(request)
+        
         serializer = self.get_serializer(data=request.data)
         
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
-        # Créer l'achat
-        achat = serializer.save()
-        
-        # Générer le QR code automatiquement
-        achat = generate_qr_code(achat, request)
-        achat.save()
+        # Créer l'achat (l'image QR est rendue par le worker generer_qr)
+        achat = serializer.save(url_base=url_base(request))
         
         # Retourner la réponse avec les détails de l'achat et le QR code
         achat_data = AchatDetailSerializer(achat, context={'request': request}).data
@@ -75,6 +135,56 @@ class AchatViewSet(viewsets.ModelViewSet):
             status=status.HTTP_201_CREATED
         )
     
+    def creer_commande(self, request):
+        """
+        POST /api/achats/ avec l'en-tête `Prefer: respond-async`
+        Réponse 202 : la commande est en file, son résultat se lit sur GET /api/commandes/{id}/
+        """
+        serializer = CommandeCreateSerializer(data=request.data, context={'request': request})
+        
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        commande = commandes.enfiler(
+            request.user, serializer.validated_data['id_ticket'], serializer.validated_data['quantite']
+        )
+        url = request.build_absolute_uri(f'/api/commandes/{commande.id_commande}/')
+        return Response(
+            {
+                'message': 'Commande enregistrée, traitement en cours.',
+                'commande': CommandeSerializer(commande, context={'request': request}).data,
+                'statut_url': url,
+            },
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': url, 'Retry-After': '1', 'Preference-Applied': 'respond-async'}
+        )
+    
+    @action(detail=False, methods=['post'])
+    @idempotent
+    def panier(self, request):
+        """
+        Endpoint: POST /api/achats/panier/
+        Body: {"lignes": [{"id_ticket": 1, "quantite": 2, "session": 3}, {"id_ticket": 2, "quantite": 3}]}
+        Toutes les lignes en une transaction (tout ou rien), solde débité une seule fois
+        """
+        serializer = PanierSerializer(data=request.data, context={'request': request})
+        
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        achats = serializer.save(url_base=url_base(request))
+        
+        achats = self.queryset.filter(id_achat__in=[achat.id_achat for achat in achats]).order_by('id_achat')
+        return Response(
+            {
+                'message': f'{len(achats)} achat(s) effectué(s) avec succès.',
+                'montant_total': str(serializer.validated_data['montant_total']),
+                'nouveau_solde': str(request.user.solde),
+                'achats': AchatListSerializer(achats, many=True, context={'request': request}).data,
+            },
+            status=status.HTTP_201_CREATED
+        )
+    
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
         ticket = instance.id_ticket
@@ -89,16 +199,13 @@ class AchatViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Restaurer le stock
-        ticket.stock += quantite
-        ticket.save()
-        
-        # Refund le solde de l'utilisateur
-        utilisateur.solde += montant_total
-        utilisateur.save()
-        
         id_achat = instance.id_achat
-        self.perform_destroy(instance)
+        # Stock et solde par UPDATE relatifs, Transaction de remboursement (voir utils/annulations.py)
+        with transaction.atomic():
+            rembourses, _ = rembourser_achats(Achat.objects.filter(pk=id_achat), "annulation par l'utilisateur")
+        if not rembourses:
+            return Response({'error': 'Achat déjà annulé.'}, status=status.HTTP_404_NOT_FOUND)
+        utilisateur.refresh_from_db(fields=['solde'])
         
         return Response(
             {
@@ -124,31 +231,26 @@ class AchatViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        try:
-            achat = Achat.objects.get(id_achat=id_achat)
-        except Achat.DoesNotExist:
+        statut, achat = valider_billet(id_achat=id_achat)
+        if achat is None:
             return Response(
                 {'error': 'Achat non trouvé.'},
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        # Vérifier si le ticket est déjà utilisé
-        if achat.est_utilise:
+        if statut == DEJA_UTILISE:
             return Response(
                 {
                     'error': 'Ce ticket a déjà été utilisé/validé.',
                     'achat': {
                         'id_achat': achat.id_achat,
-                        'date_validation': 'Ticket déjà consommé.'
+                        'date_validation': 'Ticket déjà consommé.',
+                        'date_utilisation': achat.date_utilisation
                     }
                 },
                 status=status.HTTP_409_CONFLICT
             )
         
-        # Marquer le ticket comme utilisé
-        achat.est_utilise = True
-        achat.save()
-        
         return Response(
             {
                 'message': 'Ticket validé avec succès.',
@@ -158,6 +260,7 @@ class AchatViewSet(viewsets.ModelViewSet):
         )
     
     @action(detail=False, methods=['get'])
+    @reponse_conditionnelle(_validateurs_par_utilisateur)
     def par_utilisateur(self, request):
         id_utilisateur = request.query_params.get('id_utilisateur')
         
@@ -175,14 +278,11 @@ class AchatViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        achats = self.queryset.filter(id_utilisateur=id_utilisateur).order_by('-date_achat')
-        serializer = AchatListSerializer(achats, many=True)
-        
-        return Response({
-            'utilisateur': f"{utilisateur.prenom} {utilisateur.nom}",
-            'count': achats.count(),
-            'achats': serializer.data
-        })
+        achats = self.queryset.filter(id_utilisateur=id_utilisateur).order_by('-date_achat', '-id_achat')
+        return reponse_paginee(
+            self, achats, AchatListSerializer, cle='achats',
+            utilisateur=f"{utilisateur.prenom} {utilisateur.nom}"
+        )
     
     @action(detail=False, methods=['get'])
     def par_evenement(self, request):
@@ -199,26 +299,16 @@ class AchatViewSet(viewsets.ModelViewSet):
         
         achats = self.queryset.filter(
             id_ticket__id_evenement=id_evenement
-        ).order_by('-date_achat')
-        
-        serializer = AchatListSerializer(achats, many=True)
+        ).order_by('-date_achat', '-id_achat')
         
-        return Response({
-            'count': achats.count(),
-            'achats': serializer.data
-        })
+        return reponse_paginee(self, achats, AchatListSerializer, cle='achats')
     
     @action(detail=False, methods=['get'])
     def recents(self, request):
         date_limite = datetime.now() - timedelta(hours=24)
-        achats = self.queryset.filter(date_achat__gte=date_limite).order_by('-date_achat')
-        
-        serializer = AchatListSerializer(achats, many=True)
+        achats = self.queryset.filter(date_achat__gte=date_limite).order_by('-date_achat', '-id_achat')
         
-        return Response({
-            'count': achats.count(),
-            'achats': serializer.data
-        })
+        return reponse_paginee(self, achats, AchatListSerializer, cle='achats')
     
     @action(detail=False, methods=['get'])
     def statistiques(self, request):
@@ -294,55 +384,137 @@ class AchatViewSet(viewsets.ModelViewSet):
                 'error': 'QR Code invalide ou ticket non trouvé'
             })
     
+    @action(detail=False, methods=['post'], url_path='validate/batch')
+    def validate_batch(self, request):
+        """
+        POST /api/achats/validate/batch/ (admin, scanners de porte)
+        Body: {"id_evenement": 1, "passages": [{"code_qr": "...", "scanned_at": "...", "gate_id": "A3"}, ...]}
+        Passages appliqués en une mise à jour ensembliste (voir utils/validation.py) ; un
+        résultat par passage : valide, deja_utilise (porte_gagnante), inconnu, autre_evenement, invalide
+        """
+        serializer = ValidationLotSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        resultats = serializer.save()
+        statuts = Counter(resultat['statut'] for resultat in resultats)
+        return Response({
+            'count': len(resultats),
+            'totaux': dict(statuts),
+            'resultats': resultats
+        }, status=status.HTTP_200_OK)
+    
     @action(detail=False, methods=['post'], url_path='validate/(?P<code_qr>[^/.]+)', permission_classes=[AllowAny])
     def validate_ticket(self, request, code_qr=None):
         """
         API appelée pour marquer le ticket comme utilisé
-        POST /api/achats/validate/{code_qr}/
+        POST /api/achats/validate/{code_qr}/  Body (optionnel): {"gate_id": "A3"}
         Appelée depuis la page de scan après confirmation
         """
-        try:
-            achat = Achat.objects.select_related(
-                'id_utilisateur', 
-                'id_ticket', 
-                'id_ticket__id_evenement'
-            ).get(code_qr=code_qr)
-            
-            if achat.est_utilise:
-                return Response({
-                    'success': False,
-                    'error': 'Ce ticket a déjà été utilisé',
-                    'date_utilisation': achat.date_utilisation
-                }, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Marquer comme utilisé
-            achat.est_utilise = True
-            achat.date_utilisation = timezone.now()
-            achat.save()
-            
-            return Response({
-                'success': True,
-                'message': 'Ticket validé avec succès',
-                'achat': {
-                    'id_achat': achat.id_achat,
-                    'utilisateur': f"{achat.id_utilisateur.prenom} {achat.id_utilisateur.nom}",
-                    'email': achat.id_utilisateur.email,
-                    'tel': achat.id_utilisateur.tel,
-                    'evenement': achat.id_ticket.id_evenement.titre_evenement,
-                    'type_ticket': achat.id_ticket.type,
-                    'quantite': achat.quantite,
-                    'total': str(achat.montant_total),
-                    'date_achat': achat.date_achat,
-                    'date_utilisation': achat.date_utilisation,
-                    'est_utilise': True
-                }
-            }, status=status.HTTP_200_OK)
-            
-        except Achat.DoesNotExist:
+        porte = str(request.data.get('gate_id', ''))[:50]
+        # Événement préchauffé : billet lu en mémoire, admission arbitrée par le cache partagé
+        admission = cache_scan.admettre(code_qr, porte)
+        if admission is not None:
+            statut, billet, etat = admission
+            details = billet.resume(etat)
+        else:
+            statut, achat = valider_billet(code_qr=code_qr, porte=porte)
+            details = _details_achat(achat) if achat else None
+        if statut == INCONNU:
             return Response({
                 'success': False,
                 'error': 'QR Code invalide'
             }, status=status.HTTP_404_NOT_FOUND)
+        
+        if statut == DEJA_UTILISE:
+            return Response({
+                'success': False,
+                'error': 'Ce ticket a déjà été utilisé',
+                'date_utilisation': details['date_utilisation']
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'success': True,
+            'message': 'Ticket validé avec succès',
+            'achat': details
+        }, status=status.HTTP_200_OK)
+    
+    @action(detail=False, methods=['get'], url_path='jeton/cle', permission_classes=[AllowAny])
+    def cle_jeton(self, request):
+        """
+        GET /api/achats/jeton/cle/ : clés publiques Ed25519 des jetons QR (voir utils/jeton_qr.py),
+        à charger dans les scanners avant l'ouverture des portes
+        """
+        response = Response({
+            'algorithme': 'Ed25519',
+            'courante': id_cle(cle_publique_brute()),
+            'cles': [
+                {'id': kid, 'cle_publique': base64.b64encode(cle).decode('ascii')}
+                for kid, cle in cles_publiques().items()
+            ]
+        })
+        response['Cache-Control'] = 'public, max-age=3600'
+        return response
+    
+    @action(detail=False, methods=['post'], url_path='jeton/verifier', permission_classes=[AllowAny])
+    def verifier_jeton(self, request):
+        """
+        POST /api/achats/jeton/verifier/  Body: {"jeton": "<jeton ou URL scannée>", "id_evenement": 1}
+        Authenticité et validité du jeton d'un QR code, sans accès à la base : ne dit pas si
+        le billet a déjà servi (voir validate/{code_qr}/)
+        """
+        try:
+            contenu = verifier(extraire_jeton(str(request.data.get('jeton', ''))))
+        except JetonInvalide as e:
+            return Response({'valide': False, 'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        for champ, erreur in (('id_evenement', 'Billet d\'un autre événement.'), ('id_session', 'Billet d\'une autre session.')):
+            attendu = request.data.get(champ)
+            if attendu not in (None, '') and str(contenu[champ]) != str(attendu):
+                return Response({'valide': False, 'error': erreur, 'jeton': contenu}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'valide': True, 'jeton': contenu})
+    
+    @action(detail=False, methods=['get'], url_path='qr/(?P<code_qr>[^/.]+)', permission_classes=[AllowAny])
+    def qr(self, request, code_qr=None):
+        """
+        GET /api/achats/qr/{code_qr}/ : ancienne URL des images QR, redirige vers le fichier
+        stocké s'il existe, sinon vers le rendu à la demande /api/achats/qr/{code_qr}.png
+        """
+        achat = Achat.objects.filter(code_qr=code_qr).only('code_qr', 'qr_image').first()
+        if achat is None:
+            return Response({'error': 'QR Code invalide'}, status=status.HTTP_404_NOT_FOUND)
+        if achat.qr_image:
+            return HttpResponseRedirect(request.build_absolute_uri(achat.qr_image.url))
+        return HttpResponseRedirect(request.build_absolute_uri(f'/api/achats/qr/{code_qr}.png'))
+    
+    def image_qr(self, request, code_qr=None, extension=None):
+        """
+        GET /api/achats/qr/{code_qr}.png | .svg (?correction=L|M|Q|H&taille=1..40)
+        Rendu à la demande derrière un LRU en mémoire et un cache disque (voir utils/cache_qr.py)
+        """
+        correction = request.query_params.get('correction', settings.QR_CORRECTION).upper()
+        try:
+            taille = int(request.query_params.get('taille', settings.QR_TAILLE))
+        except ValueError:
+            taille = 0
+        if correction not in CORRECTIONS or not 1 <= taille <= 40:
+            return Response(
+                {'error': 'correction doit valoir L, M, Q ou H et taille être compris entre 1 et 40.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        image = image_qr(code_qr, extension, correction, taille, url_base(request))
+        if image is None:
+            return Response({'error': 'QR Code invalide'}, status=status.HTTP_404_NOT_FOUND)
+        cle, contenu = image
+        etag = quote_etag(cle)
+        if etag in request.headers.get('If-None-Match', ''):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(contenu, content_type='image/png' if extension == 'png' else 'image/svg+xml')
+        response['ETag'] = etag
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+        return response
     
     @action(detail=False, methods=['get'], url_path='details/(?P<code_qr>[^/.]+)', permission_classes=[AllowAny])
     def get_by_qr(self, request, code_qr=None):
@@ -350,6 +522,20 @@ class AchatViewSet(viewsets.ModelViewSet):
         Récupère les détails d'un achat via son QR code (sans le marquer comme utilisé)
         GET /api/achats/details/{code_qr}/
         """
+        consultation = cache_scan.consulter(code_qr)
+        if consultation is not None:
+            billet, etat = consultation
+            if etat == cache_scan.ANNULE:
+                return Response({
+                    'error': 'QR Code invalide'
+                }, status=status.HTTP_404_NOT_FOUND)
+            return Response({
+                'achat': {
+                    **billet.resume(etat),
+                    'qr_code_url': request.build_absolute_uri(f'/api/achats/qr/{code_qr}.png')
+                }
+            }, status=status.HTTP_200_OK)
+        
         try:
             achat = Achat.objects.select_related(
                 'id_utilisateur', 
@@ -359,22 +545,12 @@ class AchatViewSet(viewsets.ModelViewSet):
             
             return Response({
                 'achat': {
-                    'id_achat': achat.id_achat,
-                    'utilisateur': f"{achat.id_utilisateur.prenom} {achat.id_utilisateur.nom}",
-                    'email': achat.id_utilisateur.email,
-                    'tel': achat.id_utilisateur.tel,
-                    'evenement': achat.id_ticket.id_evenement.titre_evenement,
-                    'type_ticket': achat.id_ticket.type,
-                    'quantite': achat.quantite,
-                    'total': str(achat.montant_total),
-                    'date_achat': achat.date_achat,
-                    'est_utilise': achat.est_utilise,
-                    'date_utilisation': achat.date_utilisation,
-                    'qr_code_url': request.build_absolute_uri(achat.qr_image.url) if achat.qr_image else None
+                    **_details_achat(achat),
+                    'qr_code_url': get_qr_url(achat, request)
                 }
             }, status=status.HTTP_200_OK)
             
         except Achat.DoesNotExist:
             return Response({
                 'error': 'QR Code invalide'
-            }, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+            }, status=status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,34 @@
+from rest_framework import viewsets
+from rest_framework.permissions import IsAuthenticated
+
+from ..models.commande import Commande
+from ..serializers.commande_serializers import CommandeSerializer
+from ..pagination import KeysetPagination
+
+
+class CommandeViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Commandes asynchrones de l'utilisateur (voir utils/commandes.py) : créées par
+    POST /api/achats/ avec `Prefer: respond-async`, sondées ici jusqu'à leur traitement.
+    """
+    serializer_class = CommandeSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    lookup_field = 'id_commande'
+    
+    def get_queryset(self):
+        """Commandes de l'utilisateur authentifié (?statut=en_attente|acceptee|refusee)"""
+        queryset = Commande.objects.filter(id_utilisateur=self.request.user).select_related(
+            'id_achat__id_utilisateur', 'id_achat__id_ticket__id_evenement'
+        ).order_by('-date_creation', '-id_commande')
+        statut = self.request.query_params.get('statut')
+        if statut:
+            queryset = queryset.filter(statut=statut)
+        return queryset
+    
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        response['Cache-Control'] = 'no-store'
+        if response.data['statut'] == Commande.EN_ATTENTE:
+            response['Retry-After'] = '1'
+        return response
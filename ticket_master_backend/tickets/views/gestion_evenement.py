@@ -2,18 +2,76 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
-from django.db.models import Q
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_control
 from datetime import date
+import json
+import time
 from ..serializers.ticket_serializers import TicketListSerializer
 from ..models.evenements import Evenement
+from ..models.ticket import Ticket
 from ..serializers import EvenementSerializer
+from ..serializers.annulation_serializers import AnnulationSerializer, AnnulationCreateSerializer
+from ..serializers.scan_serializers import PrechauffageScanSerializer
 from ..serializers.evenement_serializers import (
     EvenementCreateSerializer,
     EvenementUpdateSerializer,
     EvenementListSerializer,
-    EvenementDetailSerializer
+    EvenementDetailSerializer,
+    EvenementSnapshotSerializer,
+    EvenementProcheSerializer
 )
 from ..permission import IsAdministrateur
+from ..utils.cache_catalogue import cache_catalogue
+from ..pagination import KeysetPagination, reponse_paginee
+from ..utils.conditionnel import reponse_conditionnelle, validateurs_catalogue
+from ..utils.recherche import rechercher_evenements
+from ..utils.suggestions import LIMITE_DEFAUT, LIMITE_MAX, suggerer
+from ..utils.geo import expression_haversine, filtre_boite, tuiles_couvrant
+from ..utils.clusters import TUILES_MAX, ZOOM_MAX, clusters_tuiles
+from ..utils.facettes import FiltresEvenements, calculer_facettes
+from ..utils.annulations import annuler
+from ..utils.cache_scan import CachePartageRequis, prechauffer
+from ..utils.frequentation import compteurs
+
+
+RAYON_DEFAUT_KM = 10
+RAYON_MAX_KM = 500
+
+
+# Mêmes portées que le cache_catalogue de chaque vue
+def _validateurs_liste(view, request, kwargs):
+    evenements = view.filtrer_par_type(Evenement.objects.all())
+    return validateurs_catalogue(['catalogue'], request, evenements)
+
+
+def _validateurs_a_venir(view, request, kwargs):
+    evenements = Evenement.objects.filter(date__gte=date.today())
+    return [date.today()] + validateurs_catalogue(['catalogue'], request, evenements)
+
+
+def _validateurs_passes(view, request, kwargs):
+    evenements = Evenement.objects.filter(date__lt=date.today())
+    return [date.today()] + validateurs_catalogue(['catalogue'], request, evenements)
+
+
+def _validateurs_detail(view, request, kwargs):
+    evenements = Evenement.objects.filter(id_evenement=kwargs['id_evenement'])
+    return validateurs_catalogue([f"evenement:{kwargs['id_evenement']}"], request, evenements)
+
+
+class RenduEvenementsServeur(BaseRenderer):
+    """Accept: text/event-stream (EventSource) ; le flux lui-même est un StreamingHttpResponse"""
+    media_type = 'text/event-stream'
+    format = 'sse'
+    
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, cls=DjangoJSONEncoder)  # réponses d'erreur
 
 
 class EvenementViewSet(viewsets.ModelViewSet):
@@ -22,13 +80,40 @@ class EvenementViewSet(viewsets.ModelViewSet):
     lookup_field = 'id_evenement'
     
     def get_permissions(self):
-        if self.action in ['create', 'update',  'destroy']:
+        if self.action in ['create', 'update',  'destroy', 'snapshot', 'annuler', 'annulations', 'prechauffer_scan',
+                           'frequentation', 'frequentation_flux']:
             permission_classes = [IsAdministrateur]
         else:
             permission_classes = [AllowAny]
         
         return [permission() for permission in permission_classes]
     
+    @property
+    def paginator(self):
+        """Pagination keyset (date, id) pour a_venir/passes, par numéro de page ailleurs"""
+        if not hasattr(self, '_paginator'):
+            if self.action in ['a_venir', 'passes']:
+                self._paginator = KeysetPagination()
+            else:
+                self._paginator = super().paginator
+        return self._paginator
+    
+    def get_queryset(self):
+        """
+        Les actions de lecture du catalogue s'exécutent en un nombre fixe de requêtes :
+        stock et nombre de tickets annotés, sessions (et tickets en détail) préchargés.
+        """
+        queryset = super().get_queryset()
+        if self.action in ['list', 'a_venir', 'passes', 'rechercher', 'filtrer', 'proches', 'retrieve', 'snapshot']:
+            queryset = queryset.avec_catalogue()
+        if self.action == 'retrieve':
+            queryset = queryset.prefetch_related(Prefetch('ticket_set', queryset=Ticket.objects.avec_stock()))
+        elif self.action == 'snapshot':
+            queryset = queryset.prefetch_related(
+                Prefetch('ticket_set', queryset=Ticket.objects.avec_ventes().avec_stock().order_by('id_ticket'))
+            )
+        return queryset
+    
     def get_serializer_class(self):
         if self.action == 'create':
             return EvenementCreateSerializer
@@ -40,14 +125,29 @@ class EvenementViewSet(viewsets.ModelViewSet):
             return EvenementDetailSerializer
         return EvenementSerializer
     
-    def list(self, request, *args, **kwargs):
-        """Lister les événements avec filtrage optionnel par type_evenement"""
-        queryset = self.filter_queryset(self.get_queryset())
-        
-        # Filtrage par type_evenement
-        type_filter = request.query_params.get('type', None)
+    def filtrer_par_type(self, queryset):
+        """Filtrage optionnel par type_evenement (?type=)"""
+        type_filter = self.request.query_params.get('type', None)
         if type_filter:
             queryset = queryset.filter(type_evenement__icontains=type_filter)
+        return queryset
+    
+    def filtrer_par_periode(self, queryset):
+        """Fenêtre de dates optionnelle (?date_debut=&date_fin=, AAAA-MM-JJ) ; ValueError si invalide"""
+        for param, lookup in (('date_debut', 'date__gte'), ('date_fin', 'date__lte')):
+            valeur = self.request.query_params.get(param)
+            if valeur:
+                try:
+                    queryset = queryset.filter(**{lookup: date.fromisoformat(valeur)})
+                except ValueError:
+                    raise ValueError(f'Le paramètre {param} doit être une date au format AAAA-MM-JJ.')
+        return queryset
+    
+    @reponse_conditionnelle(_validateurs_liste)
+    @cache_catalogue('evenements:list', lambda kwargs: ['catalogue'])
+    def list(self, request, *args, **kwargs):
+        """Lister les événements avec filtrage optionnel par type_evenement"""
+        queryset = self.filtrer_par_type(self.filter_queryset(self.get_queryset()))
         
         page = self.paginate_queryset(queryset)
         if page is not None:
@@ -57,6 +157,11 @@ class EvenementViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(queryset, many=True, context={'request': request})
         return Response(serializer.data)
     
+    @reponse_conditionnelle(_validateurs_detail)
+    @cache_catalogue('evenements:retrieve', lambda kwargs: [f"evenement:{kwargs['id_evenement']}"])
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+    
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         
@@ -112,34 +217,32 @@ class EvenementViewSet(viewsets.ModelViewSet):
         )
     
     @action(detail=False, methods=['get'])
+    @reponse_conditionnelle(_validateurs_a_venir)
+    @cache_catalogue('evenements:a_venir', lambda kwargs: ['catalogue'])
     def a_venir(self, request):
-        evenements = self.queryset.filter(date__gte=date.today()).order_by('date')
-        serializer = EvenementListSerializer(evenements, many=True)
-        return Response({
-            'count': evenements.count(),
-            'results': serializer.data
-        })
+        evenements = self.get_queryset().filter(date__gte=date.today()).order_by('date', 'id_evenement')
+        return reponse_paginee(self, evenements, EvenementListSerializer)
     
     @action(detail=False, methods=['get'])
+    @reponse_conditionnelle(_validateurs_passes)
+    @cache_catalogue('evenements:passes', lambda kwargs: ['catalogue'])
     def passes(self, request):
-        evenements = self.queryset.filter(date__lt=date.today()).order_by('-date')
-        serializer = EvenementListSerializer(evenements, many=True)
-        return Response({
-            'count': evenements.count(),
-            'results': serializer.data
-        })
+        evenements = self.get_queryset().filter(date__lt=date.today()).order_by('-date', '-id_evenement')
+        return reponse_paginee(self, evenements, EvenementListSerializer)
     
     @action(detail=True, methods=['get'])
     def tickets(self, request, id_evenement=None):
         evenement = self.get_object()
-        tickets = evenement.ticket_set.all()
-        
+        # L'événement est déjà chargé : on l'attache aux tickets pour éviter une requête par ticket
+        tickets = list(evenement.ticket_set.avec_stock())
+        for ticket in tickets:
+            ticket.id_evenement = evenement
         
         serializer = TicketListSerializer(tickets, many=True)
         
         return Response({
             'evenement': evenement.titre_evenement,
-            'count': tickets.count(),
+            'count': len(tickets),
             'tickets': serializer.data
         })
     
@@ -147,7 +250,8 @@ class EvenementViewSet(viewsets.ModelViewSet):
     def rechercher(self, request):
         """
         Endpoint: GET /api/evenements/rechercher/?q=query
-        Recherche les événements par titre, lieu ou catégorie
+        Recherche plein texte par titre, lieu ou catégorie, insensible aux accents,
+        résultats classés par pertinence (voir utils/recherche.py)
         Si q est vide, retourne tous les événements
         """
         query = request.query_params.get('q', '').strip()
@@ -156,12 +260,7 @@ class EvenementViewSet(viewsets.ModelViewSet):
             # Si pas de query, retourner tous les événements
             evenements = self.get_queryset()
         else:
-            # Rechercher dans titre, lieu et type_evenement
-            evenements = self.get_queryset().filter(
-                Q(titre_evenement__icontains=query) |
-                Q(lieu__icontains=query) |
-                Q(type_evenement__icontains=query)
-            )
+            evenements = rechercher_evenements(self.get_queryset(), query)
         
         # Pagination
         page = self.paginate_queryset(evenements)
@@ -177,4 +276,269 @@ class EvenementViewSet(viewsets.ModelViewSet):
             'query': query,
             'count': evenements.count(),
             'results': serializer.data
-        })
\ No newline at end of file
+        })
+    
+    @action(detail=False, methods=['get'])
+    @cache_catalogue('evenements:filtrer', lambda kwargs: ['catalogue'])
+    def filtrer(self, request):
+        """
+        Endpoint: GET /api/evenements/filtrer/?type=Concert,Festival&lieu=Lomé&prix_min=0&prix_max=10000
+                      &en_stock=true&moment=soir,nuit&date_debut=2026-01-01&date_fin=2026-12-31
+        Filtres combinés, résultats paginés et nombres par facette (type_evenement, lieu, prix,
+        en_stock, moment) calculés en une seule requête groupée (voir utils/facettes.py)
+        """
+        try:
+            filtres = FiltresEvenements(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        facettes = calculer_facettes(Evenement.objects.all(), filtres)
+        evenements = filtres.appliquer(self.get_queryset()).order_by('date', 'id_evenement')
+        return reponse_paginee(self, evenements, EvenementListSerializer, facettes=facettes)
+    
+    @action(detail=False, methods=['get'])
+    @method_decorator(cache_control(public=True, max_age=60))
+    @cache_catalogue('evenements:suggest', lambda kwargs: ['suggestions'])
+    def suggest(self, request):
+        """
+        Endpoint: GET /api/evenements/suggest/?q=query&limit=8
+        Autocomplétion : id, titre et type des événements dont les mots commencent par
+        la saisie (accents ignorés, une faute tolérée sur le dernier mot)
+        """
+        query = request.query_params.get('q', '').strip()
+        try:
+            limite = min(max(int(request.query_params.get('limit', LIMITE_DEFAUT)), 1), LIMITE_MAX)
+        except ValueError:
+            limite = LIMITE_DEFAUT
+        
+        return Response({'query': query, 'suggestions': suggerer(query, limite)})
+    
+    @action(detail=False, methods=['get'])
+    @cache_catalogue('evenements:proches', lambda kwargs: ['catalogue'])
+    def proches(self, request):
+        """
+        Endpoint: GET /api/evenements/proches/?lat=6.13&lon=1.22&rayon_km=10&type=concert&date_debut=&date_fin=
+        Événements dans un rayon autour d'une position, triés par distance (distance_km), paginés.
+        Présélection par boîte englobante (index latitude/longitude), puis distance exacte
+        (haversine) calculée par la base sur les seuls candidats.
+        """
+        try:
+            lat = float(request.query_params['lat'])
+            lon = float(request.query_params['lon'])
+            rayon_km = float(request.query_params.get('rayon_km', RAYON_DEFAUT_KM))
+        except (KeyError, ValueError):
+            return Response(
+                {'error': 'Les paramètres lat et lon sont requis, lat, lon et rayon_km doivent être des nombres.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            return Response({'error': 'Coordonnées hors limites.'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0 < rayon_km <= RAYON_MAX_KM:
+            return Response(
+                {'error': f'Le paramètre rayon_km doit être compris entre 0 et {RAYON_MAX_KM}.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            evenements = self.filtrer_par_periode(self.filtrer_par_type(self.get_queryset()))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        evenements = evenements.filter(filtre_boite(lat, lon, rayon_km)).annotate(
+            distance_km=expression_haversine(lat, lon)
+        ).filter(distance_km__lte=rayon_km).order_by('distance_km', 'date', 'id_evenement')
+        
+        return reponse_paginee(
+            self, evenements, EvenementProcheSerializer,
+            position={'lat': lat, 'lon': lon, 'rayon_km': rayon_km},
+        )
+    
+    @action(detail=False, methods=['get'])
+    @method_decorator(cache_control(public=True, max_age=60))
+    def clusters(self, request):
+        """
+        Endpoint: GET /api/evenements/clusters/?bbox=lon_min,lat_min,lon_max,lat_max&zoom=7
+        Clusters de marqueurs des événements à venir pour la carte : nombre, centroïde et
+        événement représentatif par case de grille, calculés et mis en cache par tuile
+        """
+        try:
+            lon_min, lat_min, lon_max, lat_max = [float(v) for v in request.query_params['bbox'].split(',')]
+            zoom = int(request.query_params['zoom'])
+        except (KeyError, ValueError):
+            return Response(
+                {'error': 'Les paramètres bbox (lon_min,lat_min,lon_max,lat_max) et zoom sont requis.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not 0 <= zoom <= ZOOM_MAX:
+            return Response(
+                {'error': f'Le paramètre zoom doit être compris entre 0 et {ZOOM_MAX}.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not (-180 <= lon_min <= 180 and -180 <= lon_max <= 180 and -90 <= lat_min <= lat_max <= 90):
+            return Response({'error': 'bbox invalide.'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        tuiles = tuiles_couvrant(lon_min, lat_min, lon_max, lat_max, zoom)
+        if len(tuiles) > TUILES_MAX:
+            return Response(
+                {'error': 'Zone trop grande pour ce niveau de zoom.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        clusters = clusters_tuiles(zoom, tuiles)
+        return Response({
+            'zoom': zoom,
+            'count': sum(cluster['nombre'] for cluster in clusters),
+            'clusters': clusters
+        })
+    
+    @action(detail=False, methods=['get'])
+    def snapshot(self, request):
+        """
+        Endpoint: GET /api/evenements/snapshot/?ids=1,2,3&date_debut=2026-01-01&date_fin=2026-12-31
+        Catalogue complet pour le tableau de bord admin en une seule requête HTTP :
+        événements avec tickets, stock, sessions et totaux de ventes.
+        Construit en trois requêtes SQL (événements, sessions, tickets avec ventes).
+        """
+        evenements = self.get_queryset()
+        
+        ids = request.query_params.get('ids', '').strip()
+        if ids:
+            try:
+                evenements = evenements.filter(id_evenement__in=[int(i) for i in ids.split(',') if i.strip()])
+            except ValueError:
+                return Response(
+                    {'error': 'Le paramètre ids doit être une liste d\'entiers séparés par des virgules.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        try:
+            evenements = self.filtrer_par_periode(evenements)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        serializer = EvenementSnapshotSerializer(evenements, many=True, context={'request': request})
+        return Response({
+            'count': len(serializer.data),
+            'results': serializer.data
+        })
+    
+    @action(detail=True, methods=['post'])
+    def annuler(self, request, id_evenement=None):
+        """
+        Endpoint: POST /api/evenements/{id}/annuler/  Body: {"session": 3, "motif": "..."}
+        Annuler l'événement (ou une seule session) : ses achats sont remboursés par lots par
+        le worker traiter_annulations. Réponse 202 ; progression sur GET .../annulations/.
+        """
+        evenement = self.get_object()
+        serializer = AnnulationCreateSerializer(data=request.data, context={'evenement': evenement})
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        annulation, creee = annuler(evenement, **serializer.validated_data)
+        return Response(
+            {
+                'message': 'Annulation enregistrée : remboursements en cours.' if creee
+                           else 'Une annulation identique est déjà en cours.',
+                'annulation': AnnulationSerializer(annulation).data
+            },
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': request.build_absolute_uri(f'/api/evenements/{evenement.id_evenement}/annulations/')}
+        )
+    
+    @action(detail=True, methods=['get'])
+    def annulations(self, request, id_evenement=None):
+        """
+        Endpoint: GET /api/evenements/{id}/annulations/
+        Annulations de l'événement et progression de leurs remboursements
+        """
+        evenement = self.get_object()
+        annulations = evenement.annulations.order_by('-id_annulation')
+        response = Response({
+            'count': len(annulations),
+            'results': AnnulationSerializer(annulations, many=True).data
+        })
+        response['Cache-Control'] = 'no-store'
+        return response
+    
+    @action(detail=True, methods=['post'])
+    def prechauffer_scan(self, request, id_evenement=None):
+        """
+        Endpoint: POST /api/evenements/{id}/prechauffer_scan/  Body: {"session": 3, "duree": 14400}
+        Charger les billets de l'événement (ou d'une session) dans le cache des scans avant
+        l'ouverture des portes (voir utils/cache_scan.py) ; à relancer pour y ajouter les
+        achats faits depuis.
+        """
+        evenement = self.get_object()
+        serializer = PrechauffageScanSerializer(data=request.data, context={'evenement': evenement})
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        session = serializer.validated_data.get('session')
+        try:
+            nombre, expiration = prechauffer(evenement, session, serializer.validated_data.get('duree'))
+        except CachePartageRequis as e:
+            return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response({
+            'message': f'{nombre} billet(s) chargé(s) dans le cache des scans.',
+            'evenement': evenement.id_evenement,
+            'session': session.pk if session else None,
+            'billets': nombre,
+            'expiration': expiration
+        }, status=status.HTTP_200_OK)
+    
+    def _portee_frequentation(self, request):
+        """(id_evenement, id_session) demandés, ou une réponse d'erreur"""
+        evenement = self.get_object()
+        session = request.query_params.get('session')
+        if not session:
+            return evenement.id_evenement, None
+        if not session.isdigit() or not evenement.sessions.filter(pk=session).exists():
+            return Response(
+                {'error': "Cette session n'appartient pas à l'événement."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return evenement.id_evenement, int(session)
+    
+    @action(detail=True, methods=['get'])
+    def frequentation(self, request, id_evenement=None):
+        """
+        Endpoint: GET /api/evenements/{id}/frequentation/?session=3
+        Compteurs en direct (voir utils/frequentation.py) : vendus, admis, restants, scans
+        par minute et par porte, latence de validation p50/p99 ; lus dans le cache, sans
+        agrégation sur les achats
+        """
+        portee = self._portee_frequentation(request)
+        if isinstance(portee, Response):
+            return portee
+        response = Response(compteurs(*portee))
+        response['Cache-Control'] = 'no-store'
+        return response
+    
+    @action(detail=True, methods=['get'], url_path='frequentation/flux',
+            renderer_classes=[JSONRenderer, RenduEvenementsServeur])
+    def frequentation_flux(self, request, id_evenement=None):
+        """
+        Endpoint: GET /api/evenements/{id}/frequentation/flux/?session=3
+        Les mêmes compteurs en flux SSE (text/event-stream), toutes les
+        FREQUENTATION_FLUX_INTERVALLE secondes ; le flux se ferme après
+        FREQUENTATION_FLUX_DUREE secondes et le client se reconnecte (retry).
+        Le flux occupe un thread du serveur tant qu'il est ouvert : serveur threadé
+        ou ASGI requis ; sinon, sonder frequentation/
+        """
+        portee = self._portee_frequentation(request)
+        if isinstance(portee, Response):
+            return portee
+        
+        def flux():
+            fin = time.monotonic() + settings.FREQUENTATION_FLUX_DUREE
+            yield f'retry: {int(settings.FREQUENTATION_FLUX_INTERVALLE * 1000)}\n\n'
+            while True:
+                yield f'data: {json.dumps(compteurs(*portee), cls=DjangoJSONEncoder)}\n\n'
+                if time.monotonic() >= fin:
+                    return
+                time.sleep(settings.FREQUENTATION_FLUX_INTERVALLE)
+        
+        response = StreamingHttpResponse(flux(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-store'
+        response['X-Accel-Buffering'] = 'no'  # pas de mise en tampon par un proxy nginx
+        return response
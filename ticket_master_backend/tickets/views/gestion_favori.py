@@ -3,10 +3,23 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.shortcuts import get_object_or_404
+from django.db.models import Count, Max
 
 from ..models.favori import Favori
 from ..models.evenements import Evenement
 from ..serializers.favori_serializers import FavoriSerializer, FavoriListSerializer, FavoriDetailSerializer
+from ..utils.conditionnel import reponse_conditionnelle
+from ..pagination import KeysetPagination, reponse_paginee
+
+
+def _validateurs_favoris(view, request, kwargs):
+    """Favoris de l'utilisateur et événements affichés"""
+    agregats = view.get_queryset().aggregate(
+        favoris_max=Max('date_ajout'),
+        favoris_nb=Count('id_favori'),
+        evenements_max=Max('evenement__date_modification'),
+    )
+    return [agregats[cle] for cle in sorted(agregats)]
 
 
 class FavoriViewSet(viewsets.ModelViewSet):
@@ -15,6 +28,7 @@ class FavoriViewSet(viewsets.ModelViewSet):
     serializer_class = FavoriSerializer
     permission_classes = [IsAuthenticated]
     lookup_field = 'id_favori'
+    pagination_class = KeysetPagination
     
     def get_serializer_class(self):
         if self.action == 'list':
@@ -25,7 +39,11 @@ class FavoriViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         """Retourner seulement les favoris de l'utilisateur authentifié"""
-        return Favori.objects.filter(utilisateur=self.request.user)
+        return Favori.objects.filter(utilisateur=self.request.user).select_related('evenement')
+    
+    @reponse_conditionnelle(_validateurs_favoris)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
     
     @action(detail=False, methods=['post'])
     def toggle(self, request):
@@ -93,5 +111,4 @@ class FavoriViewSet(viewsets.ModelViewSet):
         Retourne tous les favoris de l'utilisateur authentifié
         """
         favoris = self.get_queryset()
-        serializer = FavoriListSerializer(favoris, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return reponse_paginee(self, favoris, FavoriListSerializer)
@@ -0,0 +1,156 @@
+from rest_framework import viewsets, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import APIException, PermissionDenied, ValidationError
+from rest_framework.response import Response
+from rest_framework.permissions import AllowAny
+
+from ..models.evenements import Evenement
+from ..models.ticket import Ticket
+from ..permission import IsAdministrateur, IsUtilisateur
+from ..utils import file_attente
+from ..utils.cache_scan import CachePartageRequis
+
+
+class FileAttenteRefus(APIException):
+    status_code = status.HTTP_429_TOO_MANY_REQUESTS
+    default_code = 'file_attente'
+
+
+class ControleFileAttenteMixin:
+    """
+    Salle d'attente devant les actions `actions_file_attente` d'un viewset : le jeton
+    (en-tête X-File-Attente) est vérifié dans le stockage partagé avant l'authentification,
+    une requête non admise est refusée sans aucune lecture en base.
+    """
+    actions_file_attente = ('create',)
+    
+    def initial(self, request, *args, **kwargs):
+        id_utilisateur = None
+        if self.action in self.actions_file_attente:
+            try:
+                for id_ticket in _ids_tickets(request.data):
+                    id_utilisateur = file_attente.controler_admission(
+                        id_ticket, request.headers.get('X-File-Attente')
+                    ) or id_utilisateur
+            except file_attente.NonAdmis as e:
+                refus = FileAttenteRefus({
+                    'error': str(e),
+                    'file_attente': f'/api/file-attente/{e.evenement}/rejoindre/',
+                })
+                refus.wait = e.attente or 5
+                raise refus
+        super().initial(request, *args, **kwargs)
+        # Le jeton admis est personnel
+        if id_utilisateur is not None and getattr(request.user, 'id_utilisateur', None) != id_utilisateur:
+            raise PermissionDenied("Ce jeton de file d'attente appartient à un autre utilisateur.")
+
+
+def _ids_tickets(donnees):
+    """
+    Tickets visés par la requête : id_ticket, ou ceux des lignes d'un panier. Convertis en
+    entiers comme le fera le serializer ("5" et 5 : même clé de file) ; une valeur non
+    convertible est refusée, elle ne doit pas passer la salle d'attente sans contrôle.
+    """
+    if not isinstance(donnees, dict):
+        return set()
+    valeurs = [donnees.get('id_ticket')]
+    lignes = donnees.get('lignes')
+    if isinstance(lignes, list):
+        valeurs += [ligne.get('id_ticket') for ligne in lignes if isinstance(ligne, dict)]
+    ids = set()
+    for valeur in valeurs:
+        if valeur is None:
+            continue
+        try:
+            if isinstance(valeur, bool):
+                raise TypeError
+            ids.add(int(valeur))
+        except (TypeError, ValueError):
+            raise ValidationError({'id_ticket': 'Identifiant de ticket invalide.'})
+    return ids
+
+
+class FileAttenteViewSet(viewsets.ViewSet):
+    """Salle d'attente virtuelle des mises en vente (voir utils/file_attente.py)"""
+    lookup_field = 'id_evenement'
+    lookup_value_regex = r'\d+'  # int(id_evenement) dans les actions : /abc/ répond 404
+    permission_classes = [IsAdministrateur]
+    
+    def _ids_tickets(self, id_evenement):
+        return list(Ticket.objects.filter(id_evenement=id_evenement).values_list('id_ticket', flat=True))
+    
+    def retrieve(self, request, id_evenement=None):
+        """
+        Endpoint: GET /api/file-attente/{id_evenement}/ (administrateur)
+        Configuration et compteurs (entrées, admis) de la file
+        """
+        configuration = file_attente.configuration(int(id_evenement))
+        return Response({'id_evenement': int(id_evenement), 'active': configuration is not None, **(configuration or {})})
+    
+    @action(detail=True, methods=['post'])
+    def activer(self, request, id_evenement=None):
+        """
+        Endpoint: POST /api/file-attente/{id_evenement}/activer/ (administrateur)
+        Body: {"debit": 20, "rafale": 100} - admissions par seconde, pointe maximale
+        """
+        if not Evenement.objects.filter(id_evenement=id_evenement).exists():
+            return Response({'error': 'Événement non trouvé.'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            debit = float(request.data.get('debit', 10))
+            rafale = int(request.data.get('rafale', max(1, int(debit))))
+        except (TypeError, ValueError):
+            return Response({'error': 'debit et rafale doivent être des nombres.'}, status=status.HTTP_400_BAD_REQUEST)
+        if debit <= 0 or rafale < 1:
+            return Response(
+                {'error': 'debit doit être positif et rafale au moins 1.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            file_attente.configurer(int(id_evenement), debit, rafale, self._ids_tickets(id_evenement))
+        except CachePartageRequis as e:
+            return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response({
+            'message': f"File d'attente activée : {debit:g} acheteur(s) admis par seconde.",
+            **file_attente.configuration(int(id_evenement)),
+        })
+    
+    @action(detail=True, methods=['post'])
+    def desactiver(self, request, id_evenement=None):
+        """Endpoint: POST /api/file-attente/{id_evenement}/desactiver/ (administrateur)"""
+        file_attente.desactiver(int(id_evenement), self._ids_tickets(id_evenement))
+        return Response({'message': "File d'attente désactivée."})
+    
+    @action(detail=True, methods=['post'], permission_classes=[IsUtilisateur])
+    def rejoindre(self, request, id_evenement=None):
+        """
+        Endpoint: POST /api/file-attente/{id_evenement}/rejoindre/
+        Response: {"jeton", "position", "devant", "admis", "admis_jusqu_a", "attente_estimee"}
+        Le jeton se passe ensuite dans l'en-tête X-File-Attente des achats et réservations.
+        """
+        entree = file_attente.rejoindre(int(id_evenement), request.user.id_utilisateur)
+        if entree is None:
+            return Response(
+                {'error': "Aucune file d'attente active pour cet événement : achat libre."},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(
+            {'jeton': entree['jeton'], **_public(file_attente.statut(entree['jeton']))},
+            status=status.HTTP_201_CREATED
+        )
+    
+    @action(detail=False, methods=['get'], authentication_classes=[], permission_classes=[AllowAny])
+    def statut(self, request):
+        """
+        Endpoint: GET /api/file-attente/statut/?jeton=...
+        Sondage des clients en attente : ni authentification ni base de données.
+        """
+        etat = file_attente.statut(request.query_params.get('jeton', ''))
+        if etat is None:
+            return Response({'error': 'Jeton inconnu ou expiré.'}, status=status.HTTP_404_NOT_FOUND)
+        response = Response(_public(etat))
+        response['Cache-Control'] = 'no-store'
+        return response
+
+
+def _public(etat):
+    return {cle: valeur for cle, valeur in etat.items() if cle != 'utilisateur'}
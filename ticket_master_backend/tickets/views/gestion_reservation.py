@@ -0,0 +1,75 @@
+from rest_framework import viewsets, status
+from rest_framework.response import Response
+from rest_framework.permissions import IsAuthenticated
+
+from ..models.reservation import Reservation
+from ..serializers.reservation_serializers import ReservationSerializer, ReservationCreateSerializer
+from .gestion_file_attente import ControleFileAttenteMixin
+from ..pagination import KeysetPagination
+from ..utils import reservations
+
+
+class ReservationViewSet(ControleFileAttenteMixin, viewsets.ModelViewSet):
+    """
+    Réservations de places de l'utilisateur (voir utils/reservations.py).
+    L'achat d'une réservation passe par POST /api/achats/ {"id_reservation": ...}.
+    """
+    serializer_class = ReservationSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    lookup_field = 'id_reservation'
+    http_method_names = ['get', 'post', 'delete', 'head', 'options']
+    
+    def get_queryset(self):
+        """Réservations de l'utilisateur authentifié (?statut=active|convertie|expiree|annulee)"""
+        queryset = Reservation.objects.filter(id_utilisateur=self.request.user).select_related(
+            'id_ticket', 'id_ticket__id_evenement'
+        ).order_by('-date_creation', '-id_reservation')
+        statut = self.request.query_params.get('statut')
+        if statut:
+            queryset = queryset.filter(statut=statut)
+        return queryset
+    
+    def get_serializer_class(self):
+        if self.action == 'create':
+            return ReservationCreateSerializer
+        return ReservationSerializer
+    
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        ticket = serializer.validated_data['id_ticket']
+        quantite = serializer.validated_data['quantite']
+        try:
+            reservation = reservations.reserver(request.user, ticket, quantite)
+        except reservations.ReservationRefusee as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if reservation is None:
+            return Response(
+                {'quantite': [f'Stock insuffisant. Seulement {ticket.stock_disponible} ticket(s) disponible(s).']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response(
+            {
+                'message': f'{quantite} ticket(s) réservé(s) jusqu\'à {reservation.date_expiration.isoformat()}.',
+                'reservation': ReservationSerializer(reservation, context={'request': request}).data
+            },
+            status=status.HTTP_201_CREATED
+        )
+    
+    def destroy(self, request, *args, **kwargs):
+        reservation = self.get_object()
+        if not reservations.annuler(reservation):
+            reservation.refresh_from_db(fields=['statut'])  # convertie ou expirée entre-temps
+            return Response(
+                {'error': f'La réservation est déjà {reservation.get_statut_display().lower()}.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(
+            {'message': f'Réservation {reservation.id_reservation} annulée. {reservation.quantite} ticket(s) remis dans le stock.'},
+            status=status.HTTP_200_OK
+        )
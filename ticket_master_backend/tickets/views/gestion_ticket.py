@@ -5,6 +5,8 @@ from rest_framework.permissions import AllowAny
 from ..models.evenements import Evenement
 from ..models.ticket import Ticket
 from ..permission import IsAdministrateur
+from ..utils.cache_catalogue import cache_catalogue
+from ..utils.inventaire import repartir_stock
 from ..serializers.ticket_serializers import (
     TicketSerializer,
     TicketCreateSerializer,
@@ -35,6 +37,22 @@ class TicketViewSet(viewsets.ModelViewSet):
         
         return [permission() for permission in permission_classes]
     
+    def get_queryset(self):
+        """Charger l'événement avec le ticket (et ses sessions/tickets pour le serializer détaillé)"""
+        queryset = super().get_queryset().select_related('id_evenement')
+        if self.action in ['list', 'retrieve']:
+            queryset = queryset.avec_stock()
+        if self.get_serializer_class() is TicketSerializer:
+            queryset = queryset.prefetch_related('id_evenement__sessions', 'id_evenement__ticket_set')
+        return queryset
+    
+    @cache_catalogue('tickets:list', lambda kwargs: ['tickets'])
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
+    @cache_catalogue('tickets:retrieve', lambda kwargs: [f"ticket:{kwargs['id_ticket']}"])
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
     
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -104,18 +122,22 @@ class TicketViewSet(viewsets.ModelViewSet):
             )
         
         try:
-            ticket.stock = int(new_stock)
-            if ticket.stock < 0:
+            new_stock = int(new_stock)
+            if new_stock < 0:
                 return Response(
                     {'error': 'Le stock ne peut pas être négatif.'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            ticket.save()
+            if ticket.nombre_fractions:
+                ticket = repartir_stock(ticket, ticket.nombre_fractions, stock=new_stock)
+            else:
+                ticket.stock = new_stock
+                ticket.save()
             return Response(
                 {
                     'message': 'Stock mis à jour avec succès.',
                     'id_ticket': ticket.id_ticket,
-                    'stock': ticket.stock
+                    'stock': ticket.stock_disponible
                 },
                 status=status.HTTP_200_OK
             )
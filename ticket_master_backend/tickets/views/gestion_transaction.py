@@ -3,6 +3,7 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.db import transaction as db_transaction
+from django.db.models import Count, Q, Sum
 
 from ..models.transaction import Transaction
 from ..models.utilisateurs import Utilisateur
@@ -12,12 +13,16 @@ from ..serializers.transaction_serializers import (
     TransactionListSerializer,
     TransactionDetailSerializer
 )
+from ..pagination import KeysetPagination, reponse_paginee
+from ..utils.inventaire import crediter_solde
+from ..utils.idempotence import idempotent
 
 
 class TransactionViewSet(viewsets.ModelViewSet):
     queryset = Transaction.objects.all()
     serializer_class = TransactionSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
     
     def get_serializer_class(self):
         if self.action == 'list':
@@ -32,6 +37,7 @@ class TransactionViewSet(viewsets.ModelViewSet):
         return Transaction.objects.filter(id_utilisateur=user_id).select_related('id_utilisateur', 'id_achat')
     
     @action(detail=False, methods=['post'])
+    @idempotent
     def depot(self, request):
         serializer = DepotSerializer(data=request.data)
         if not serializer.is_valid():
@@ -52,8 +58,8 @@ class TransactionViewSet(viewsets.ModelViewSet):
                 )
                 
                 # Mettre à jour le solde
-                utilisateur.solde += montant
-                utilisateur.save(update_fields=['solde'])
+                crediter_solde(utilisateur.pk, montant)
+            utilisateur.refresh_from_db(fields=['solde'])
             
             return Response({
                 'message': 'Dépôt effectué avec succès',
@@ -75,28 +81,28 @@ class TransactionViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def historique(self, request):
         utilisateur_id = request.user.id_utilisateur
-        transactions = Transaction.objects.filter(id_utilisateur=utilisateur_id).order_by('-date_transaction')
+        transactions = Transaction.objects.filter(
+            id_utilisateur=utilisateur_id
+        ).select_related('id_utilisateur').order_by('-date_transaction', '-id_transaction')
     
         type_filter = request.query_params.get('type', None)
         if type_filter:
             transactions = transactions.filter(type_transaction=type_filter)
-        serializer = TransactionListSerializer(transactions, many=True)
         
-        # Calculer les totaux
-        total_depots = sum(
-            t.montant for t in transactions 
-            if t.type_transaction in ['depot', 'bonus_parrainage']
+        # Calculer les totaux sur tout l'historique (une requête d'agrégation)
+        totaux = transactions.aggregate(
+            count=Count('id_transaction'),
+            total_depots=Sum('montant', filter=Q(type_transaction__in=['depot', 'bonus_parrainage'])),
+            total_debits=Sum('montant', filter=Q(type_transaction__in=['achat', 'retrait'])),
+            total_remboursements=Sum('montant', filter=Q(type_transaction='remboursement')),
         )
-        total_debits = sum(
-            t.montant for t in transactions 
-            if t.type_transaction in ['achat', 'retrait']
+        return reponse_paginee(
+            self, transactions, TransactionListSerializer, cle='transactions',
+            count=totaux['count'],
+            total_depots=float(totaux['total_depots'] or 0),
+            total_debits=float(totaux['total_debits'] or 0),
+            total_remboursements=float(totaux['total_remboursements'] or 0),
         )
-        return Response({
-            'count': transactions.count(),
-            'total_depots': float(total_depots),
-            'total_debits': float(total_debits),
-            'transactions': serializer.data
-        }, status=status.HTTP_200_OK)
     
     @action(detail=False, methods=['get'])
     def solde(self, request):
@@ -17,12 +17,16 @@ from ..serializers import (
     UtilisateurRegisterResponseSerializer
 )
 from ..utils.authentication import generate_jwt_token
+from ..utils.inventaire import crediter_solde
+from ..utils.idempotence import idempotent
+from ..pagination import KeysetPagination
 
 
 class UtilisateurViewSet(viewsets.ModelViewSet):
-    queryset = Utilisateur.objects.all()
+    queryset = Utilisateur.objects.all().order_by('id_utilisateur')
     serializer_class = UtilisateurSerializer
     permission_classes = [AllowAny]
+    pagination_class = KeysetPagination
     lookup_field = 'id_utilisateur'
     
     def get_permissions(self):
@@ -201,6 +205,7 @@ class UtilisateurViewSet(viewsets.ModelViewSet):
         })
     
     @action(detail=True, methods=['post'])
+    @idempotent
     def recharger(self, request, id_utilisateur=None):
         from django.db import transaction
         
@@ -228,9 +233,9 @@ class UtilisateurViewSet(viewsets.ModelViewSet):
         
         # CRITICAL: Wrap in atomic transaction to prevent race conditions (Bug #2 fix)
         with transaction.atomic():
-            ancien_solde = utilisateur.solde
-            utilisateur.solde += montant
-            utilisateur.save()
+            crediter_solde(utilisateur.pk, montant)
+            utilisateur.refresh_from_db(fields=['solde'])
+            ancien_solde = utilisateur.solde - montant
         
         return Response(
             {
@@ -5,6 +5,7 @@ import 'package:event_app/data/event_model.dart';
 import 'package:event_app/data/ticket_model.dart';
 import 'package:event_app/data/achat_model.dart';
 import 'package:shared_preferences/shared_preferences.dart';
+import 'package:uuid/uuid.dart';
 
 class ApiService {
   final DioClient _dioClient = DioClient();
@@ -14,6 +15,22 @@ class ApiService {
   // CRITICAL: Store current user globally for access across all methods
   UserModel? _currentUser;
 
+  /// POST carrying an Idempotency-Key, retried once with the same key on network failure:
+  /// the server replays its first response instead of charging twice
+  Future<Response> _postIdempotent(String path, Object? data) async {
+    final options = Options(headers: {'Idempotency-Key': const Uuid().v4()});
+    try {
+      return await _dio.post(path, data: data, options: options);
+    } on DioException catch (e) {
+      if (e.type != DioExceptionType.connectionError &&
+          e.type != DioExceptionType.connectionTimeout &&
+          e.type != DioExceptionType.receiveTimeout) {
+        rethrow;
+      }
+      return _dio.post(path, data: data, options: options);
+    }
+  }
+
   /// Get the currently authenticated user (cached)
   UserModel? get currentUser => _currentUser;
 
@@ -278,6 +295,68 @@ class ApiService {
     }
   }
 
+  /// Fetch events around a position, sorted by distance (server side)
+  /// GET /api/evenements/proches/?lat={lat}&lon={lon}&rayon_km={radiusKm}
+  Future<List<EventModel>> fetchNearbyEvents({
+    required double latitude,
+    required double longitude,
+    double radiusKm = 10,
+    String? type,
+    int page = 1,
+  }) async {
+    try {
+      final response = await _dio.get(
+        '/evenements/proches/',
+        queryParameters: {
+          'lat': latitude,
+          'lon': longitude,
+          'rayon_km': radiusKm,
+          if (type != null) 'type': type,
+          'page': page,
+        },
+      );
+
+      final dynamic data = response.data;
+      final List<dynamic> eventsJson =
+          data is Map<String, dynamic> && data.containsKey('results')
+              ? data['results'] as List<dynamic>
+              : [];
+
+      return eventsJson.map((json) => EventModel.fromJson(json)).toList();
+    } on DioException catch (e) {
+      throw _handleError(e, 'Failed to load nearby events');
+    }
+  }
+
+  /// Fetch map marker clusters for a viewport (server-side aggregation per tile)
+  /// GET /api/evenements/clusters/?bbox={west},{south},{east},{north}&zoom={zoom}
+  /// Each cluster: {nombre, latitude, longitude, evenement: {id_evenement, titre_evenement, type_evenement, date}}
+  Future<List<Map<String, dynamic>>> fetchEventClusters({
+    required double west,
+    required double south,
+    required double east,
+    required double north,
+    required int zoom,
+  }) async {
+    try {
+      final response = await _dio.get(
+        '/evenements/clusters/',
+        queryParameters: {
+          'bbox': '$west,$south,$east,$north',
+          'zoom': zoom,
+        },
+      );
+
+      final dynamic data = response.data;
+      if (data is Map<String, dynamic> && data['clusters'] is List) {
+        return (data['clusters'] as List).cast<Map<String, dynamic>>();
+      }
+      return [];
+    } on DioException catch (e) {
+      throw _handleError(e, 'Failed to load map clusters');
+    }
+  }
+
   /// Fetch events by category
   /// GET /api/evenements/?type_evenement={category}
   Future<List<EventModel>> fetchEventsByCategory(String category) async {
@@ -409,9 +488,9 @@ class ApiService {
         throw Exception('Session expiré.Veuillez vous reconnecter.');
       }
 
-      final response = await _dio.post(
+      final response = await _postIdempotent(
         '/utilisateurs/$userId/recharger/',
-        data: {
+        {
           'montant': amount,
           'moyen_paiement': moyenPaiement ?? 'mobile_money',
           'description': description ?? 'Rechargement de compte',
@@ -492,10 +571,7 @@ class ApiService {
         requestData['id_session'] = idSession;
       }
 
-      final response = await _dio.post(
-        '/achats/',
-        data: requestData,
-      );
+      final response = await _postIdempotent('/achats/', requestData);
 
       // CRITICAL: Django wraps response in {"message": "...", "achat": {...}}
       // Unwrap the 'achat' object before parsing
@@ -537,6 +613,91 @@ class ApiService {
     }
   }
 
+  /// Hold seats while the user tops up the wallet
+  /// POST /api/reservations/
+  /// Returns {"id_reservation", "date_expiration", ...}: seats leave the stock until then
+  Future<Map<String, dynamic>> reserveTicket({
+    required int idTicket,
+    required int quantite,
+  }) async {
+    try {
+      final response = await _dio.post(
+        '/reservations/',
+        data: {'id_ticket': idTicket, 'quantite': quantite},
+      );
+      return response.data['reservation'] as Map<String, dynamic>;
+    } on DioException catch (e) {
+      throw _handleError(e, 'Failed to reserve ticket');
+    }
+  }
+
+  /// Release a hold (seats go back to the stock)
+  /// DELETE /api/reservations/{id}/
+  Future<void> cancelReservation(int idReservation) async {
+    try {
+      await _dio.delete('/reservations/$idReservation/');
+    } on DioException catch (e) {
+      throw _handleError(e, 'Failed to cancel reservation');
+    }
+  }
+
+  /// Purchase the seats of a live hold (only the wallet is debited)
+  /// POST /api/achats/ {"id_reservation": id}
+  Future<AchatModel> purchaseReservation(int idReservation) async {
+    try {
+      final response = await _dio.post(
+        '/achats/',
+        data: {'id_reservation': idReservation},
+      );
+      return AchatModel.fromJson(response.data['achat'] as Map<String, dynamic>);
+    } on DioException catch (e) {
+      throw _handleError(e, 'Failed to purchase reservation');
+    }
+  }
+
+  /// Buy several ticket types at once, all or nothing (wallet debited once)
+  /// POST /api/achats/panier/ {"lignes": [{"id_ticket", "quantite", "session"}]}
+  Future<List<AchatModel>> purchaseBasket(List<Map<String, dynamic>> lignes) async {
+    try {
+      final response = await _dio.post('/achats/panier/', data: {'lignes': lignes});
+      return (response.data['achats'] as List<dynamic>)
+          .map((json) => AchatModel.fromJson(json as Map<String, dynamic>))
+          .toList();
+    } on DioException catch (e) {
+      throw _handleError(e, 'Failed to purchase basket');
+    }
+  }
+
+  /// Queue a purchase during a high-demand on-sale (answered 202 before processing)
+  /// POST /api/achats/ with "Prefer: respond-async"
+  /// Returns the order {"id_commande", "statut": "en_attente", ...}: poll it with fetchCommande
+  Future<Map<String, dynamic>> purchaseTicketAsync({
+    required int idTicket,
+    required int quantite,
+  }) async {
+    try {
+      final response = await _dio.post(
+        '/achats/',
+        data: {'id_ticket': idTicket, 'quantite': quantite},
+        options: Options(headers: {'Prefer': 'respond-async'}),
+      );
+      return response.data['commande'] as Map<String, dynamic>;
+    } on DioException catch (e) {
+      throw _handleError(e, 'Failed to queue purchase');
+    }
+  }
+
+  /// Order status: "en_attente", "acceptee" (with "achat") or "refusee" (with "motif")
+  /// GET /api/commandes/{id}/
+  Future<Map<String, dynamic>> fetchCommande(int idCommande) async {
+    try {
+      final response = await _dio.get('/commandes/$idCommande/');
+      return response.data as Map<String, dynamic>;
+    } on DioException catch (e) {
+      throw _handleError(e, 'Failed to fetch order');
+    }
+  }
+
   /// Fetch user's purchases (achats)
   /// GET /api/achats/
   Future<List<AchatModel>> fetchUserAchats() async {
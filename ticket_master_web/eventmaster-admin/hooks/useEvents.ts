@@ -12,7 +12,8 @@ export const useEvents = (isAuthenticated: boolean) => {
     setLoading(true);
     try {
       const token = localStorage.getItem('authToken');
-      const response = await fetch('http://localhost:8000/api/evenements/', {
+      // Un seul appel : événements avec tickets, sessions et ventes intégrés
+      const response = await fetch('http://localhost:8000/api/evenements/snapshot/', {
         headers: {
           'Authorization': `Bearer ${token}`
         }
@@ -23,49 +24,31 @@ export const useEvents = (isAuthenticated: boolean) => {
       }
 
       const data = await response.json();
-      
-      // Charger les tickets pour chaque événement en parallèle
-      const eventsWithTickets = await Promise.all(
-        data.results.map(async (event: any) => {
-          // Charger les tickets de cet événement
-          let ticketTypes = [];
-          try {
-            const ticketsResponse = await fetch(`http://localhost:8000/api/evenements/${event.id_evenement}/tickets/`, {
-              headers: {
-                'Authorization': `Bearer ${token}`
-              }
-            });
 
-            if (ticketsResponse.ok) {
-              const ticketsData = await ticketsResponse.json();
-              ticketTypes = (ticketsData.tickets || []).map((ticket: any) => ({
-                id: ticket.id_ticket?.toString() || '',
-                name: ticket.type || '',
-                price: ticket.prix || 0,
-                quantityTotal: ticket.stock || 0,
-                quantitySold: 0
-              }));
-            }
-          } catch (error) {
-            console.error(`Erreur lors du chargement des tickets pour l'événement ${event.id_evenement}:`, error);
-          }
+      const eventsWithTickets = data.results.map((event: any) => {
+        const ticketTypes = (event.tickets || []).map((ticket: any) => ({
+          id: ticket.id_ticket?.toString() || '',
+          name: ticket.type || '',
+          price: Number(ticket.prix) || 0,
+          quantityTotal: (ticket.stock || 0) + (ticket.quantite_vendue || 0),
+          quantitySold: ticket.quantite_vendue || 0
+        }));
 
-          return {
-            id: event.id_evenement?.toString() || '',
-            title: event.titre_evenement || '',
-            date: event.date || '',
-            startTime: event.heure_debut || '',
-            endTime: event.heure_fin || '',
-            location: event.lieu || '',
-            eventType: event.type_evenement || 'Autre',
-            imageUrl: event.image || 'https://via.placeholder.com/800x400',
-            status: 'published' as EventStatus,
-            ticketsValidated: 0,
-            ticketTypes: ticketTypes,
-            description: event.description || ''
-          };
-        })
-      );
+        return {
+          id: event.id_evenement?.toString() || '',
+          title: event.titre_evenement || '',
+          date: event.date || '',
+          startTime: event.heure_debut || '',
+          endTime: event.heure_fin || '',
+          location: event.lieu || '',
+          eventType: event.type_evenement || 'Autre',
+          imageUrl: event.image || 'https://via.placeholder.com/800x400',
+          status: 'published' as EventStatus,
+          ticketsValidated: event.quantite_validee || 0,
+          ticketTypes: ticketTypes,
+          description: event.description || ''
+        };
+      });
 
       setEvents(eventsWithTickets);
     } catch (error) {